@@ -0,0 +1,119 @@
+#!/usr/bin/env python2.7
+"""
+Measure how long L{txaws.ec2.client.Parser} takes to parse large
+I{DescribeInstances}, I{DescribeSecurityGroups} and I{DescribeVolumes}
+responses.
+
+The responses are built from the recorded samples in
+L{txaws.testing.payload} by repeating their items with distinct ids.  The
+security group response has one group with many rules, each granting access
+to many other groups, most of which are granted by other rules too.
+
+For each response this reports the best of several runs, both for building
+the element tree and for the whole parse, so that the time spent extracting
+models can be told apart from the time spent in the XML parser.
+
+Usage::
+
+    python -m admin.benchmarks.ec2_parser [count]
+"""
+
+import sys
+from timeit import repeat
+
+from txaws.ec2.client import Parser
+from txaws.testing import payload
+from txaws.util import XML
+
+
+def _between(text, start, end):
+    """
+    Split C{text} around the part from the end of the first C{start} up to
+    the last C{end}.
+    """
+    head, rest = text.split(start, 1)
+    body, tail = rest.rsplit(end, 1)
+    return head + start, body, end + tail
+
+
+def instances(count):
+    head, item, tail = _between(
+        payload.sample_describe_instances_result,
+        b"<reservationSet>", b"</reservationSet>",
+    )
+    return head + b"".join(
+        item.replace(b"r-cf24b1a6", b"r-%08x" % (n,)).replace(
+            b"i-abcdef01", b"i-%08x" % (n,))
+        for n in xrange(count)
+    ) + tail
+
+
+def volumes(count):
+    head, item, tail = _between(
+        payload.sample_describe_volumes_result,
+        b"<volumeSet>", b"</volumeSet>",
+    )
+    return head + b"".join(
+        item.replace(b"vol-4282672b", b"vol-%08x" % (n,))
+        for n in xrange(count)
+    ) + tail
+
+
+def security_groups(count, groups_per_rule=20):
+    rule = (
+        b"<item><ipProtocol>tcp</ipProtocol>"
+        b"<fromPort>%(port)d</fromPort><toPort>%(port)d</toPort>"
+        b"<groups>%(groups)s</groups>"
+        b"<ipRanges><item><cidrIp>10.%(a)d.%(b)d.0/24</cidrIp></item>"
+        b"</ipRanges></item>"
+    )
+    pair = (
+        b"<item><userId>123456789012</userId>"
+        b"<groupName>peer-%d</groupName></item>"
+    )
+    rules = b"".join(
+        rule % {
+            b"port": 1024 + n, b"a": n // 256 % 256, b"b": n % 256,
+            b"groups": b"".join(
+                pair % ((n + k) % (count // 4 + 1),)
+                for k in xrange(groups_per_rule)
+            ),
+        }
+        for n in xrange(count)
+    )
+    return (
+        b'<?xml version="1.0"?>'
+        b"<DescribeSecurityGroupsResponse><securityGroupInfo><item>"
+        b"<ownerId>123456789012</ownerId><groupId>sg-a1a1a1</groupId>"
+        b"<groupName>WebServers</groupName>"
+        b"<groupDescription>Web Servers</groupDescription>"
+        b"<ipPermissions>" + rules + b"</ipPermissions>"
+        b"</item></securityGroupInfo></DescribeSecurityGroupsResponse>"
+    )
+
+
+def best(f, runs=3):
+    return min(repeat(f, number=1, repeat=runs))
+
+
+def main(count=10000):
+    parser = Parser()
+    cases = [
+        (u"instances", instances(count), parser.describe_instances),
+        (u"volumes", volumes(count), parser.describe_volumes),
+        (u"sg rules", security_groups(count),
+         parser.describe_security_groups),
+    ]
+    print(u"%-12s %8s %12s %12s %12s" % (
+        u"response", u"items", u"tree ms", u"parse ms", u"us/item",
+    ))
+    for name, xml_bytes, parse in cases:
+        tree = best(lambda: XML(xml_bytes))
+        total = best(lambda: parse(xml_bytes))
+        print(u"%-12s %8d %12.1f %12.1f %12.1f" % (
+            name, count, tree * 1000, total * 1000, total * 1e6 / count,
+        ))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python2.7
+"""
+Measure the memory used by large numbers of the model objects the clients
+parse out of listings.
+
+For each model this builds a population of objects the way the parsers do
+and reports the bytes per object, counting every distinct object reachable
+through the attributes once.  The "dict" figures come from equivalent
+classes which keep a per-instance C{__dict__} and hold a separate copy of
+every string, which is how the models were stored before they used slots and
+L{txaws.util.intern_text}.
+
+Usage::
+
+    python -m admin.benchmarks.model_memory [count]
+"""
+
+import sys
+from datetime import datetime
+
+import attr
+
+from txaws.ec2.model import Instance
+from txaws.s3.model import BucketItem, ItemOwner
+from txaws.route53.model import Name, RRSet, A
+from txaws.util import intern_text
+
+from ipaddress import IPv4Address
+
+
+def _copy(text):
+    """
+    Return a new string object equal to C{text}, as a parser which does not
+    intern would produce.
+    """
+    if text is None:
+        return None
+    return text[:1] + text[1:]
+
+
+def _dict_class(cls):
+    """
+    Make a class with the same attributes as C{cls} but which stores them in
+    a per-instance dictionary.
+    """
+    if attr.has(cls):
+        names = list(a.name for a in attr.fields(cls))
+    else:
+        names = list(cls.__slots__)
+    return attr.make_class(cls.__name__ + "WithDict", names, slots=False)
+
+
+def footprint(objects):
+    """
+    Sum the sizes of C{objects} and everything reachable from their
+    attributes, counting shared objects once.
+    """
+    seen = set()
+    total = 0
+    pending = list(objects)
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or obj is None:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, (list, tuple, set, frozenset)):
+            pending.extend(obj)
+            continue
+        state = getattr(obj, "__dict__", None)
+        if state is not None:
+            seen.add(id(state))
+            total += sys.getsizeof(state)
+            pending.extend(state.values())
+        for name in getattr(type(obj), "__slots__", ()):
+            pending.append(getattr(obj, name, None))
+    return total
+
+
+def bucket_items(count, item, owner, text):
+    when = datetime(2017, 1, 1)
+    return list(
+        item(
+            u"photos/%08d.jpg" % (n,), when, b'"%032x"' % (n,), b"%d" % (n,),
+            text(b"STANDARD"),
+            owner(text(b"bcaf1ffd86f41caff1a493dc2ad8c2c281e37522a640e161ca5fb"
+                       b"16fd081034f"), text(b"webfile")),
+        )
+        for n in range(count)
+    )
+
+
+def instances(count, instance, text):
+    return list(
+        instance(
+            b"i-%08x" % (n,), text(b"running"), text(b"m4.large"),
+            text(b"ami-12345678"), b"ip-10-0-%d-%d.ec2.internal" % divmod(
+                n % 65536, 256),
+            b"", b"10.0.%d.%d" % divmod(n % 65536, 256), b"", text(b"deploy"),
+            b"0", b"2017-01-01T00:00:00.000Z", text(b"us-east-1a"), [],
+            None, None, None,
+        )
+        for n in range(count)
+    )
+
+
+def rrsets(count, rrset, text):
+    return list(
+        rrset(
+            Name(u"host%d.example.invalid" % (n,)), text(u"A"), 300,
+            {A(IPv4Address(u"10.0.%d.%d" % divmod(n % 65536, 256)))},
+        )
+        for n in range(count)
+    )
+
+
+def main(count=100000):
+    cases = [
+        (u"BucketItem",
+         lambda: bucket_items(
+             count, _dict_class(BucketItem), _dict_class(ItemOwner), _copy),
+         lambda: bucket_items(count, BucketItem, ItemOwner, intern_text)),
+        (u"Instance",
+         lambda: instances(count, _dict_class(Instance), _copy),
+         lambda: instances(count, Instance, intern_text)),
+        (u"RRSet",
+         lambda: rrsets(count, _dict_class(RRSet), _copy),
+         lambda: rrsets(count, RRSet, intern_text)),
+    ]
+    print(u"%-12s %14s %14s" % (u"model", u"dict B/obj", u"slots B/obj"))
+    for name, before, after in cases:
+        print(u"%-12s %14.1f %14.1f" % (
+            name,
+            footprint(before()) / float(count),
+            footprint(after()) / float(count),
+        ))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python2.7
+"""
+Measure how long L{txaws.route53.client} takes to parse a large
+I{ListResourceRecordSets} response.
+
+The response holds the given number of rrsets, as Route53 would return
+them for a zone of that size if there were no page limit: a mix of I{A}
+rrsets with several addresses, I{CNAME}s, I{TXT}s and aliases, with many
+names having more than one type, and some internationalized names.
+
+This reports the best of several runs, both for building the element tree
+and for the whole parse, so that the time spent extracting rrsets can be
+told apart from the time spent in the XML parser.
+
+Usage::
+
+    python -m admin.benchmarks.route53_parser [count]
+"""
+
+import sys
+from timeit import repeat
+
+from txaws.route53.client import _Route53Client
+from txaws.util import XML
+
+
+_A = (
+    u"<ResourceRecordSet><Name>{name}</Name><Type>A</Type><TTL>300</TTL>"
+    u"<ResourceRecords>"
+    u"<ResourceRecord><Value>10.{a}.{b}.1</Value></ResourceRecord>"
+    u"<ResourceRecord><Value>10.{a}.{b}.2</Value></ResourceRecord>"
+    u"</ResourceRecords></ResourceRecordSet>"
+)
+
+_CNAME = (
+    u"<ResourceRecordSet><Name>{name}</Name><Type>CNAME</Type><TTL>300</TTL>"
+    u"<ResourceRecords><ResourceRecord><Value>lb-{b}.example.com.</Value>"
+    u"</ResourceRecord></ResourceRecords></ResourceRecordSet>"
+)
+
+_TXT = (
+    u"<ResourceRecordSet><Name>{name}</Name><Type>TXT</Type><TTL>300</TTL>"
+    u"<ResourceRecords><ResourceRecord>"
+    u"<Value>\"v=spf1 include:_spf.example.com ~all\"</Value>"
+    u"</ResourceRecord></ResourceRecords></ResourceRecordSet>"
+)
+
+_ALIAS = (
+    u"<ResourceRecordSet><Name>{name}</Name><Type>AAAA</Type><AliasTarget>"
+    u"<HostedZoneId>Z35SXDOTRQ7X7K</HostedZoneId>"
+    u"<DNSName>dualstack.lb-{b}.us-east-1.elb.amazonaws.com.</DNSName>"
+    u"<EvaluateTargetHealth>false</EvaluateTargetHealth>"
+    u"</AliasTarget></ResourceRecordSet>"
+)
+
+
+def rrsets(count):
+    """
+    Build a I{ListResourceRecordSets} response with C{count} rrsets.
+    """
+    items = []
+    for n in xrange(count):
+        if n % 10 == 9:
+            name = u"host{}.xn--bcher-kva.example.com.".format(n // 4)
+        else:
+            name = u"host{}.example.com.".format(n // 4)
+        template = [_A, _TXT, _ALIAS, _CNAME][n % 4]
+        items.append(template.format(name=name, a=n // 256 % 256, b=n % 256))
+    return (
+        u'<?xml version="1.0"?>\n'
+        u'<ListResourceRecordSetsResponse '
+        u'xmlns="https://route53.amazonaws.com/doc/2013-04-01/">'
+        u"<ResourceRecordSets>" + u"".join(items) + u"</ResourceRecordSets>"
+        u"<IsTruncated>false</IsTruncated><MaxItems>{}</MaxItems>"
+        u"</ListResourceRecordSetsResponse>"
+    ).format(count).encode("utf-8")
+
+
+def best(f, runs=3):
+    return min(repeat(f, number=1, repeat=runs))
+
+
+def main(count=10000):
+    client = _Route53Client(None, None, None, None, None)
+    xml_bytes = rrsets(count)
+    parse = client._handle_list_resource_record_sets_response
+    print(u"%-12s %8s %12s %12s %12s" % (
+        u"response", u"rrsets", u"tree ms", u"parse ms", u"us/rrset",
+    ))
+    tree = best(lambda: XML(xml_bytes))
+    total = best(lambda: parse(XML(xml_bytes)))
+    print(u"%-12s %8d %12.1f %12.1f %12.1f" % (
+        u"rrsets", count, tree * 1000, total * 1000, total * 1e6 / count,
+    ))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -38,6 +38,15 @@ class _ContainerOf(object):
 
     def __call__(self, inst, a, value):
         validators.instance_of(self.container_type)(inst, a, value)
+        try:
+            for element in value:
+                self.validator(inst, a, element)
+        except Exception:
+            # Only work out which element is at fault, which is slow, once
+            # there is a fault to report.
+            pass
+        else:
+            return
         for n, element in enumerate(sorted(value)):
             inner_identifier = u"sorted({})[{}]".format(a.name, n)
             # Create an Attribute with a name that refers to the
@@ -29,13 +29,14 @@ from twisted.python import failure
 from twisted.web import http
 from twisted.web.iweb import UNKNOWN_LENGTH, IBodyProducer
 from twisted.web.client import (
-    Agent, ProxyAgent, ResponseDone, FileBodyProducer,
+    Agent, ProxyAgent, ResponseDone, FileBodyProducer, ContentDecoderAgent,
+    GzipDecoder,
 )
 from twisted.web.http import OK, NO_CONTENT, PotentialDataLoss
 from twisted.web.http_headers import Headers
 from twisted.web.error import Error as TwistedWebError
 
-from txaws.util import parse
+from txaws.util import parse, incremental_XML
 from txaws.credentials import AWSCredentials
 from txaws.exception import AWSResponseParseError
 from txaws.service import AWSServiceEndpoint
@@ -162,6 +163,75 @@ class StreamingBodyReceiver(Protocol):
             d.errback(f)
 
 
+class StreamingXMLReceiver(Protocol):
+    """
+    Streaming HTTP response body receiver which parses the body as XML while
+    it is being received.
+
+    Rather than buffering the whole body and parsing it afterwards, each
+    chunk of bytes is fed to an incremental parser as it arrives.  Elements
+    with a particular tag are passed to a callable as soon as they are
+    complete and then discarded, so neither the raw body nor the complete
+    document is ever held in memory.
+
+    Like L{StreamingBodyReceiver}, the user must set C{finished} and
+    C{content_length} before any data is delivered.  C{finished} is called
+    back with the root element of the document (less the elements that were
+    already handed off) or errbacked if the body could not be received or
+    parsed.
+    """
+    finished = None
+    content_length = None
+
+    def __init__(self, tag, element_received):
+        """
+        @param tag: The tag (without namespace) of the elements to hand off.
+        @param element_received: A one-argument callable to call with each
+            complete element with a matching tag.
+        """
+        self._parser = incremental_XML(tag, element_received)
+        self._received = 0
+        self._failure = None
+
+    def dataReceived(self, bytes):
+        if self._failure is not None:
+            return
+        self._received += len(bytes)
+        streaming = self.content_length is UNKNOWN_LENGTH
+        if not streaming and (self._received > self.content_length):
+            self._failure = failure.Failure(StreamingError(
+                "Buffer overflow - received more data than "
+                "Content-Length dictated: %d" % self.content_length))
+        else:
+            try:
+                self._parser.feed(bytes)
+            except:
+                self._failure = failure.Failure()
+        if self._failure is not None:
+            self.transport.stopProducing()
+
+    def connectionLost(self, reason):
+        d = self.finished
+        self.finished = None
+        if self._failure is not None:
+            d.errback(self._failure)
+            return
+        if not reason.check(ResponseDone, PotentialDataLoss):
+            d.errback(reason)
+            return
+        streaming = self.content_length is UNKNOWN_LENGTH
+        if not streaming and (self._received != self.content_length):
+            d.errback(failure.Failure(StreamingError(
+                "Connection lost before receiving all data")))
+            return
+        try:
+            root = self._parser.close()
+        except:
+            d.errback()
+        else:
+            d.callback(root)
+
+
 class WebClientContextFactory(ClientContextFactory):
 
     def getContext(self, hostname, port):
@@ -403,6 +473,17 @@ def query(**kw):
     @param cooperator: A cooperator to use for large uploads or
         C{None} for the global cooperator (recommended).
     @type cooperator: L{Cooperator}.
+
+    @param receiver_factory: A one-argument callable which is called with
+        the L{IResponse} of a successful request and returns the protocol to
+        deliver the response body to, or C{None} to buffer the body with a
+        L{StreamingBodyReceiver}.  The protocol must accept C{finished} and
+        C{content_length} attributes like L{StreamingBodyReceiver} does.
+        Unsuccessful responses are always buffered.
+
+    @param decode_content: If C{True}, ask for the response body to be
+        compressed with gzip and transparently decompress it when it is.
+    @type decode_content: L{bool}
     """
     return _Query(**kw)
 
@@ -418,6 +499,8 @@ class _Query(object):
     _details = attr.ib()
     _reactor = attr.ib(default=attr.Factory(lambda: namedAny("twisted.internet.reactor")))
     _ok_status = attr.ib(default=(OK,), validator=validators.instance_of(tuple))
+    _receiver_factory = attr.ib(default=None)
+    _decode_content = attr.ib(default=False)
 
     def _canonical_request(self, headers):
         return _auth_v4._CanonicalRequest.from_request_components(
@@ -511,7 +594,8 @@ class _Query(object):
             stable timestamp for signing purposes.
 
         @return: A L{twisted.internet.defer.Deferred} that fires with
-            the response body (L{bytes}) on success or with a
+            the response body (L{bytes}, or whatever the receiver created
+            by this query's C{receiver_factory} produces) on success or with a
             L{twisted.python.failure.Failure} on error.  Most
             AWS-originated errors are represented as
             L{twisted.web.error.Error} instances.
@@ -526,6 +610,10 @@ class _Query(object):
 
         if agent is None:
             agent = _get_agent(url_context.scheme, url_context.get_encoded_host(), self._reactor)
+        if self._decode_content:
+            # The Accept-Encoding header this adds is not signed, so it does
+            # not matter that it is added after signing.
+            agent = ContentDecoderAgent(agent, [(b"gzip", GzipDecoder)])
         instant = utcnow()
 
         extra_headers = self._get_headers(
@@ -582,7 +670,11 @@ class _Query(object):
         return d
 
     def _handle_response(self, response):
-        receiver = StreamingBodyReceiver()
+        if (self._receiver_factory is None or
+                response.code not in self._ok_status):
+            receiver = StreamingBodyReceiver()
+        else:
+            receiver = self._receiver_factory(response)
         receiver.finished = d = Deferred()
         receiver.content_length = response.length
         response.deliverBody(receiver)
@@ -598,25 +690,25 @@ class _Query(object):
 # Something like this belongs in Twisted, perhaps.  At least, the
 # "give me an Agent and respect the OS conventions for proxy
 # configuration" logic.
-def _get_agent(scheme, host, reactor, contextFactory=None):
+def _get_agent(scheme, host, reactor, contextFactory=None, pool=None):
     if scheme == b"https":
         proxy_endpoint = os.environ.get("https_proxy")
         if proxy_endpoint:
             proxy_url = urlparse.urlparse(proxy_endpoint)
             endpoint = TCP4ClientEndpoint(reactor, proxy_url.hostname, proxy_url.port)
-            return ProxyAgent(endpoint)
+            return ProxyAgent(endpoint, pool=pool)
         else:
             if contextFactory is None:
                 contextFactory = WebVerifyingContextFactory(host)
-            return Agent(reactor, contextFactory)
+            return Agent(reactor, contextFactory, pool=pool)
     else:
         proxy_endpoint = os.environ.get("http_proxy")
         if proxy_endpoint:
             proxy_url = urlparse.urlparse(proxy_endpoint)
             endpoint = TCP4ClientEndpoint(reactor, proxy_url.hostname, proxy_url.port)
-            return ProxyAgent(endpoint)
+            return ProxyAgent(endpoint, pool=pool)
         else:
-            return Agent(reactor)
+            return Agent(reactor, pool=pool)
 
 
 class FakeClient(object):
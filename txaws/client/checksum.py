@@ -0,0 +1,187 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Checksums of request and response bodies computed as the bytes stream.
+
+L{HashingBodyProducer} hashes a request body while it is sent, so the digest
+of a large upload is known without a separate pass over the data.
+L{VerifyingReceiver} hashes a response body while it is received and fails
+the response if the digest is not the expected one.
+
+S3 reports the MD5 digest of the data of an object (or of a part of a
+multipart upload) as its ETag, unless the object was uploaded in several
+parts or is encrypted with a customer-provided or KMS key.  L{etag_md5}
+extracts the digest from an ETag when it is one.
+"""
+
+__all__ = [
+    "ChecksumMismatch", "HashingBodyProducer", "VerifyingReceiver",
+    "etag_md5",
+]
+
+import hashlib
+import re
+
+from zope.interface import implementer
+
+from twisted.internet.protocol import Protocol
+from twisted.internet.defer import Deferred
+from twisted.web.iweb import IBodyProducer
+
+
+_MD5_HEX = re.compile(br"^[0-9a-f]{32}$")
+
+
+class ChecksumMismatch(Exception):
+    """
+    The digest of some data was not the expected one.
+
+    @ivar expected: The expected hex digest.
+    @ivar actual: The hex digest of the data.
+    """
+    def __init__(self, expected, actual):
+        super(ChecksumMismatch, self).__init__(
+            "Expected digest %s, got %s" % (expected, actual),
+        )
+        self.expected = expected
+        self.actual = actual
+
+
+def etag_md5(etag):
+    """
+    Get the MD5 digest of an object's data from its ETag.
+
+    @param etag: The ETag, with or without the surrounding quotes, or
+        C{None}.
+    @type etag: L{bytes}
+
+    @return: The lowercase hex digest, or C{None} if the ETag is not an MD5
+        digest.
+    """
+    if etag is None:
+        return None
+    etag = etag.strip(b'"').lower()
+    if _MD5_HEX.match(etag) is None:
+        return None
+    return etag
+
+
+class _HashingConsumer(object):
+    """
+    The consumer which a L{HashingBodyProducer} gives to the producer it
+    wraps.
+    """
+    def __init__(self, hashes, consumer):
+        self._hashes = hashes
+        self._consumer = consumer
+
+    def write(self, data):
+        for h in self._hashes:
+            h.update(data)
+        self._consumer.write(data)
+
+
+@implementer(IBodyProducer)
+class HashingBodyProducer(object):
+    """
+    An L{IBodyProducer} which computes digests of the output of another as
+    it is produced.
+
+    The digests are only complete once the L{Deferred} returned by
+    C{startProducing} has fired.
+
+    @ivar length: The length of the wrapped producer.
+    """
+    def __init__(self, producer, algorithms=("md5", "sha256")):
+        """
+        @param producer: The L{IBodyProducer} whose output to hash.
+        @param algorithms: The names of the L{hashlib} algorithms to compute.
+        """
+        self._producer = producer
+        self.length = producer.length
+        self._hashes = {
+            name: hashlib.new(name)
+            for name in algorithms
+        }
+
+    def hexdigest(self, algorithm="md5"):
+        """
+        @return: The hex digest of the bytes produced so far.
+        @rtype: L{bytes}
+        """
+        return self._hashes[algorithm].hexdigest()
+
+    def digest(self, algorithm="md5"):
+        """
+        @return: The digest of the bytes produced so far.
+        @rtype: L{bytes}
+        """
+        return self._hashes[algorithm].digest()
+
+    def startProducing(self, consumer):
+        return self._producer.startProducing(
+            _HashingConsumer(self._hashes.values(), consumer),
+        )
+
+    def pauseProducing(self):
+        self._producer.pauseProducing()
+
+    def resumeProducing(self):
+        self._producer.resumeProducing()
+
+    def stopProducing(self):
+        self._producer.stopProducing()
+
+
+class VerifyingReceiver(Protocol, object):
+    """
+    A response body protocol which hashes the bytes delivered to another and
+    fails the response if the digest is not the expected one.
+
+    The C{finished} L{Deferred} fires with the result of the wrapped
+    protocol, or fails with L{ChecksumMismatch}.  The C{content_length}
+    attribute is that of the wrapped protocol.
+    """
+    finished = None
+
+    def __init__(self, receiver, expected, algorithm="md5"):
+        """
+        @param receiver: The protocol to deliver the body to.  It must
+            accept C{finished} and C{content_length} attributes like
+            L{StreamingBodyReceiver} does.
+        @param expected: The expected hex digest of the body.
+        @param algorithm: The name of the L{hashlib} algorithm to use.
+        """
+        self._receiver = receiver
+        self._expected = expected.lower()
+        self._hash = hashlib.new(algorithm)
+
+    @property
+    def content_length(self):
+        return self._receiver.content_length
+
+    @content_length.setter
+    def content_length(self, value):
+        self._receiver.content_length = value
+
+    def makeConnection(self, transport):
+        self._receiver.makeConnection(transport)
+        Protocol.makeConnection(self, transport)
+
+    def dataReceived(self, data):
+        self._hash.update(data)
+        self._receiver.dataReceived(data)
+
+    def connectionLost(self, reason):
+        finished = self.finished
+        self.finished = None
+        self._receiver.finished = received = Deferred()
+        received.addCallback(self._verify)
+        received.chainDeferred(finished)
+        self._receiver.connectionLost(reason)
+
+    def _verify(self, result):
+        actual = self._hash.hexdigest()
+        if actual != self._expected:
+            raise ChecksumMismatch(self._expected, actual)
+        return result
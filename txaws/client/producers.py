@@ -0,0 +1,249 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+L{IBodyProducer} implementations for request bodies.
+"""
+
+__all__ = [
+    "MappedFile", "MappedBodyProducer", "GzipBodyProducer", "gzip_compress",
+]
+
+import os
+import zlib
+from mmap import mmap, ACCESS_READ
+
+from zope.interface import implementer
+
+from twisted.internet import defer, task
+from twisted.web.iweb import IBodyProducer, UNKNOWN_LENGTH
+
+# zlib produces the gzip container rather than the zlib one when 16 is added
+# to the window size.
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+class MappedFile(object):
+    """
+    A read-only memory map of a file from which any number of body producers
+    for ranges of the file can be made.
+
+    The producers share the one mapping, so the parts of a multipart upload
+    of a large file can be produced concurrently without a file handle and
+    seek position for each.
+
+    @ivar size: The size of the file in bytes.
+    @type size: L{int}
+    """
+    def __init__(self, path):
+        """
+        @param path: The path of the file to map.
+        """
+        with open(path, "rb") as f:
+            self.size = os.fstat(f.fileno()).st_size
+            if self.size:
+                self._mapped = mmap(f.fileno(), 0, access=ACCESS_READ)
+            else:
+                # Empty files cannot be mapped.
+                self._mapped = b""
+
+    def close(self):
+        """
+        Unmap the file.  Producers made from it must not be used afterwards.
+        """
+        if self.size:
+            self._mapped.close()
+
+    def producer(self, offset=0, length=None, **kwargs):
+        """
+        Make a producer for a range of the file.
+
+        @param offset: The offset of the first byte to produce.
+        @param length: The number of bytes to produce, or C{None} for all of
+            the rest of the file.
+        @param kwargs: Additional arguments for L{MappedBodyProducer}.
+
+        @rtype: L{MappedBodyProducer}
+        """
+        if length is None:
+            length = self.size - offset
+        if offset < 0 or length < 0 or offset + length > self.size:
+            raise ValueError(
+                "Range %d+%d is outside the file (%d bytes)" % (
+                    offset, length, self.size,
+                )
+            )
+        return MappedBodyProducer(self._mapped, offset, length, **kwargs)
+
+    def parts(self, part_size, **kwargs):
+        """
+        Make producers for consecutive ranges of the file, such as the parts
+        of a multipart upload.
+
+        @param part_size: The length of each range except the last, which
+            may be shorter.
+        @param kwargs: Additional arguments for L{MappedBodyProducer}.
+
+        @return: A L{list} of L{MappedBodyProducer}.
+        """
+        return list(
+            self.producer(offset, min(part_size, self.size - offset), **kwargs)
+            for offset in xrange(0, self.size, part_size)
+        )
+
+
+@implementer(IBodyProducer)
+class MappedBodyProducer(object):
+    """
+    L{MappedBodyProducer} produces a range of bytes from a memory map.
+
+    Unlike L{FileBodyProducer}, there is no read into a buffer: each chunk is
+    sliced directly from the mapped pages.  (Twisted's transports on Python 2
+    only accept L{bytes}, so the slice is still copied once into the string
+    handed to the transport.)
+
+    The chunk size adapts to the consumer.  It doubles, up to
+    C{max_chunk_size}, each time a chunk is written without the consumer
+    asking the producer to pause and halves, down to C{min_chunk_size}, each
+    time it does.
+
+    @ivar length: The number of bytes which will be produced.
+    """
+    def __init__(self, mapped, offset, length, cooperator=task,
+                 chunk_size=2 ** 16, min_chunk_size=2 ** 12,
+                 max_chunk_size=2 ** 20):
+        """
+        @param mapped: The memory map, or any other sliceable L{bytes}-like
+            object.
+        @param offset: The offset in C{mapped} of the first byte to produce.
+        @param length: See L{MappedBodyProducer.length}.
+        @param cooperator: An object like L{Cooperator} with a C{cooperate}
+            method which is used to schedule the writes.
+        @param chunk_size: The number of bytes to write first.
+        @param min_chunk_size: The smallest number of bytes to write at once.
+        @param max_chunk_size: The largest number of bytes to write at once.
+        """
+        self._mapped = mapped
+        self._offset = offset
+        self.length = length
+        self._cooperate = cooperator.cooperate
+        self._chunk_size = chunk_size
+        self._min_chunk_size = min_chunk_size
+        self._max_chunk_size = max_chunk_size
+        self._paused = False
+
+    def startProducing(self, consumer):
+        """
+        Start a cooperative task which writes the bytes to C{consumer}.
+
+        @return: A L{Deferred} which fires after all bytes have been written.
+        """
+        self._task = self._cooperate(self._writeloop(consumer))
+        d = self._task.whenDone()
+        def maybeStopped(reason):
+            reason.trap(task.TaskStopped)
+            return defer.Deferred()
+        d.addCallbacks(lambda ignored: None, maybeStopped)
+        return d
+
+    def _writeloop(self, consumer):
+        position = self._offset
+        end = self._offset + self.length
+        while position < end:
+            size = min(self._chunk_size, end - position)
+            self._paused = False
+            consumer.write(self._mapped[position:position + size])
+            position += size
+            if not self._paused:
+                self._chunk_size = min(
+                    self._chunk_size * 2, self._max_chunk_size,
+                )
+            yield None
+
+    def stopProducing(self):
+        """
+        Permanently stop writing bytes to the consumer.
+        """
+        self._task.stop()
+
+    def pauseProducing(self):
+        """
+        Temporarily stop writing bytes to the consumer, and write less at a
+        time when resumed.
+        """
+        self._paused = True
+        self._chunk_size = max(self._chunk_size // 2, self._min_chunk_size)
+        self._task.pause()
+
+    def resumeProducing(self):
+        """
+        Resume writing bytes to the consumer after L{pauseProducing}.
+        """
+        self._task.resume()
+
+
+def gzip_compress(data, level=6):
+    """
+    Compress some bytes into the gzip format.
+
+    @param data: The bytes to compress.
+    @type data: L{bytes}
+
+    @param level: The zlib compression level, from 1 (fastest) to 9 (best).
+
+    @rtype: L{bytes}
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _GZIP_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class _GzipConsumer(object):
+    """
+    The consumer which a L{GzipBodyProducer} gives to the producer it wraps.
+    """
+    def __init__(self, consumer, level):
+        self._consumer = consumer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, _GZIP_WBITS)
+
+    def write(self, data):
+        compressed = self._compressor.compress(data)
+        if compressed:
+            self._consumer.write(compressed)
+
+    def finish(self):
+        self._consumer.write(self._compressor.flush())
+
+
+@implementer(IBodyProducer)
+class GzipBodyProducer(object):
+    """
+    An L{IBodyProducer} which compresses the output of another into the gzip
+    format as it is produced.
+
+    The length of the compressed output is not known in advance, so
+    C{length} is always L{UNKNOWN_LENGTH}.
+    """
+    length = UNKNOWN_LENGTH
+
+    def __init__(self, producer, level=6):
+        """
+        @param producer: The L{IBodyProducer} whose output to compress.
+        @param level: The zlib compression level, from 1 (fastest) to 9
+            (best).
+        """
+        self._producer = producer
+        self._level = level
+
+    def startProducing(self, consumer):
+        gzip_consumer = _GzipConsumer(consumer, self._level)
+        d = self._producer.startProducing(gzip_consumer)
+        d.addCallback(lambda ignored: gzip_consumer.finish())
+        return d
+
+    def pauseProducing(self):
+        self._producer.pauseProducing()
+
+    def resumeProducing(self):
+        self._producer.resumeProducing()
+
+    def stopProducing(self):
+        self._producer.stopProducing()
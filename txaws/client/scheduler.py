@@ -0,0 +1,175 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Time-budgeted scheduling of request body production.
+
+Body producers such as L{FileBodyProducer} do their work in small steps
+scheduled by a L{Cooperator}.  The global cooperator runs steps for up to 10ms
+at a time, regardless of what else is waiting for the reactor, so a few large
+uploads can add noticeably to the latency of everything else.
+
+A L{ProducerScheduler} runs producer steps for no more than a fixed budget of
+time per reactor iteration.  Producers are assigned to I{lanes}; within a
+lane they take turns round-robin and lanes with a higher priority are run
+before those with a lower one.  A lane can be passed as the C{cooperator} of
+L{S3Client}, L{get_route53_client} or a body producer.
+"""
+
+__all__ = [
+    "ProducerScheduler", "SchedulerStats",
+]
+
+import attr
+
+from twisted.internet.task import Cooperator
+
+
+@attr.s
+class SchedulerStats(object):
+    """
+    Measurements of the work done by a L{ProducerScheduler}.
+
+    @ivar runs: The number of reactor iterations in which producer steps were
+        run.
+    @ivar busy: The total time, in seconds, spent running producer steps.
+    @ivar max_busy: The longest time, in seconds, spent running producer
+        steps in one reactor iteration.
+    @ivar lag: The total time, in seconds, between asking the reactor to run
+        producer steps and it doing so.  This grows when the reactor is kept
+        busy, by producers or anything else.
+    @ivar max_lag: The longest such time, in seconds.
+    """
+    runs = attr.ib(default=0)
+    busy = attr.ib(default=0.0)
+    max_busy = attr.ib(default=0.0)
+    lag = attr.ib(default=0.0)
+    max_lag = attr.ib(default=0.0)
+
+
+class _Lane(object):
+    """
+    A group of producers of equal priority, scheduled round-robin.
+    """
+    def __init__(self, scheduler, priority):
+        self.priority = priority
+        self._scheduler = scheduler
+        self._pending = None
+        self._cooperator = Cooperator(
+            terminationPredicateFactory=scheduler._termination_predicate,
+            scheduler=self._schedule,
+        )
+
+    def _schedule(self, f):
+        self._pending = f
+        self._scheduler._wake()
+        return _PendingLane(self)
+
+    def cooperate(self, iterator):
+        """
+        Start running steps of C{iterator} in this lane.
+
+        @see: L{Cooperator.cooperate}
+        """
+        return self._cooperator.cooperate(iterator)
+
+    def _run(self):
+        f = self._pending
+        self._pending = None
+        f()
+
+
+@attr.s
+class _PendingLane(object):
+    """
+    The handle a lane's L{Cooperator} uses to cancel its next run.
+    """
+    _lane = attr.ib()
+
+    def cancel(self):
+        self._lane._pending = None
+
+
+class ProducerScheduler(object):
+    """
+    Run the steps of body producers within a time budget per reactor
+    iteration.
+
+    Lanes are served in strict priority order: a lower priority lane only
+    runs in an iteration in which the budget was not used up by higher
+    priority lanes.
+
+    @ivar budget: The time, in seconds, that may be spent running producer
+        steps in one reactor iteration.  At least one step is always run.
+    @type budget: L{float}
+
+    @ivar stats: The L{SchedulerStats} for this scheduler.
+    """
+    def __init__(self, budget=0.002, clock=None):
+        """
+        @param budget: See L{ProducerScheduler.budget}.
+        @param clock: An L{IReactorTime} provider used to schedule and time
+            the work, or C{None} for the global reactor.
+        """
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self.budget = budget
+        self.stats = SchedulerStats()
+        self._clock = clock
+        self._lanes = []
+        self._deadline = None
+        self._delayed_run = None
+        self._scheduled_at = None
+
+    def lane(self, priority=0):
+        """
+        Get the lane for a priority, creating it if necessary.
+
+        @param priority: Lanes with greater priorities are run first.
+        @type priority: L{int}
+
+        @return: An object with a C{cooperate} method like
+            L{Cooperator.cooperate}.
+        """
+        for lane in self._lanes:
+            if lane.priority == priority:
+                return lane
+        lane = _Lane(self, priority)
+        self._lanes.append(lane)
+        self._lanes.sort(key=lambda lane: -lane.priority)
+        return lane
+
+    def _termination_predicate(self):
+        seconds = self._clock.seconds
+        deadline = self._deadline
+        return lambda: seconds() >= deadline
+
+    def _wake(self):
+        if self._delayed_run is None:
+            self._scheduled_at = self._clock.seconds()
+            self._delayed_run = self._clock.callLater(0, self._run)
+
+    def _run(self):
+        self._delayed_run = None
+        start = self._clock.seconds()
+        lag = start - self._scheduled_at
+        self._deadline = start + self.budget
+        ran = False
+        for lane in self._lanes:
+            if lane._pending is None:
+                continue
+            if ran and self._clock.seconds() >= self._deadline:
+                break
+            lane._run()
+            ran = True
+
+        if ran:
+            busy = self._clock.seconds() - start
+            stats = self.stats
+            stats.runs += 1
+            stats.busy += busy
+            stats.max_busy = max(stats.max_busy, busy)
+            stats.lag += lag
+            stats.max_lag = max(stats.max_lag, lag)
+
+        if any(lane._pending is not None for lane in self._lanes):
+            self._wake()
@@ -22,6 +22,7 @@ from twisted.python import log
 from twisted.python.filepath import FilePath
 from twisted.python.failure import Failure
 from twisted.test.test_sslverify import makeCertificate
+from twisted.test.proto_helpers import StringTransport
 from twisted.trial.unittest import TestCase
 from twisted.web import server, static
 from twisted.web.http_headers import Headers
@@ -35,10 +36,12 @@ from txaws.credentials import AWSCredentials
 from txaws.client import base, ssl
 from txaws.client.base import (
     RequestDetails, BaseClient, BaseQuery, error_wrapper,
-    StreamingBodyReceiver, _URLContext, url_context,
+    StreamingBodyReceiver, StreamingXMLReceiver, StreamingError,
+    _URLContext, url_context,
 )
 from txaws._auth_v4 import _CanonicalRequest
 from txaws.service import AWSServiceEndpoint
+from txaws.client.producers import gzip_compress
 from txaws.testing.producers import StringBodyProducer
 
 from zope.interface.verify import verifyClass
@@ -344,6 +347,88 @@ class StreamingBodyReceiverTestCase(TestCase):
 
 
 
+class StubTransport(object):
+    stopped = False
+
+    def stopProducing(self):
+        self.stopped = True
+
+
+class StreamingXMLReceiverTestCase(TestCase):
+    """
+    Tests for L{StreamingXMLReceiver}.
+    """
+    document = (
+        b"<Root><Name>x</Name>"
+        b"<Item><Key>a</Key></Item>"
+        b"<Item><Key>b</Key></Item>"
+        b"</Root>"
+    )
+
+    def receiver(self, content_length):
+        received = []
+        receiver = StreamingXMLReceiver(
+            "Item", lambda element: received.append(element.findtext("Key")),
+        )
+        receiver.finished = finished = Deferred()
+        receiver.content_length = content_length
+        receiver.transport = StubTransport()
+        return receiver, finished, received
+
+    def test_elements_received_incrementally(self):
+        """
+        Elements with the requested tag are delivered as soon as they are
+        complete and the C{finished} L{Deferred} fires with the root element,
+        which no longer contains them.
+        """
+        receiver, finished, received = self.receiver(len(self.document))
+        end_of_first = self.document.index(b"</Item>") + len(b"</Item>")
+        receiver.dataReceived(self.document[:end_of_first])
+        self.assertEqual([u"a"], received)
+        receiver.dataReceived(self.document[end_of_first:])
+        self.assertEqual([u"a", u"b"], received)
+        receiver.connectionLost(Failure(ResponseDone()))
+        root = self.successResultOf(finished)
+        self.assertEqual(
+            (u"x", []),
+            (root.findtext("Name"), root.findall("Item")),
+        )
+
+    def test_malformed(self):
+        """
+        If the body is not well-formed XML, the transport is told to stop
+        producing and C{finished} fails.
+        """
+        body = b"<Root><Item></Root>"
+        receiver, finished, received = self.receiver(len(body))
+        receiver.dataReceived(body)
+        self.assertTrue(receiver.transport.stopped)
+        receiver.connectionLost(Failure(ResponseDone()))
+        self.failureResultOf(finished)
+
+    def test_overflow(self):
+        """
+        If more data is received than C{content_length} allows, C{finished}
+        fails with L{StreamingError}.
+        """
+        receiver, finished, received = self.receiver(3)
+        receiver.dataReceived(self.document)
+        self.assertTrue(receiver.transport.stopped)
+        receiver.connectionLost(Failure(ResponseDone()))
+        self.failureResultOf(finished, StreamingError)
+
+    def test_truncated(self):
+        """
+        If the connection is lost before C{content_length} bytes are received,
+        C{finished} fails with L{StreamingError}.
+        """
+        receiver, finished, received = self.receiver(len(self.document) + 1)
+        receiver.dataReceived(self.document)
+        receiver.connectionLost(Failure(ResponseDone()))
+        self.failureResultOf(finished, StreamingError)
+
+
+
 @attr.s
 @implementer(IAgent)
 class StubAgent(object):
@@ -355,6 +440,21 @@ class StubAgent(object):
         return result
 
 
+@attr.s
+class StubResponse(object):
+    code = attr.ib()
+    headers = attr.ib()
+    body = attr.ib()
+    length = attr.ib(
+        default=attr.Factory(lambda self: len(self.body), takes_self=True),
+    )
+
+    def deliverBody(self, protocol):
+        protocol.makeConnection(StringTransport())
+        protocol.dataReceived(self.body)
+        protocol.connectionLost(Failure(ResponseDone()))
+
+
 class QueryTestCase(TestCase):
     """
     Tests for L{query}.
@@ -468,3 +568,51 @@ class QueryTestCase(TestCase):
         )
         # It's hard to make an assertion about the bodyProducer or I
         # would do that too.
+
+    def _decoding_query(self):
+        details = RequestDetails(
+            region=REGION_US_EAST_1,
+            service=b"s3",
+            method=b"GET",
+            url_context=base.url_context(
+                scheme=u"https", host=u"example.invalid", port=443, path=[],
+            ),
+            content_sha256=sha256(b"").hexdigest().decode("ascii"),
+        )
+        return base.query(
+            credentials=self.credentials,
+            details=details,
+            decode_content=True,
+        )
+
+    def test_submit_decode_content(self):
+        """
+        When the query is created with C{decode_content=True}, C{submit} asks
+        for a gzip-compressed response and delivers the response body
+        decompressed.
+        """
+        d = self._decoding_query().submit(self.agent, utcnow=self.utcnow)
+        [(_, _, headers, _, result)] = self.agent._requests
+        self.assertEqual(
+            [b"gzip"], headers.getRawHeaders(b"accept-encoding"),
+        )
+        result.callback(StubResponse(
+            code=200,
+            headers=Headers({b"content-encoding": [b"gzip"]}),
+            body=gzip_compress(b"hello, world"),
+        ))
+        response, body = self.successResultOf(d)
+        self.assertEqual(b"hello, world", body)
+
+    def test_submit_decode_content_uncompressed(self):
+        """
+        When the query is created with C{decode_content=True} and the response
+        is not compressed, the response body is delivered unchanged.
+        """
+        d = self._decoding_query().submit(self.agent, utcnow=self.utcnow)
+        [(_, _, _, _, result)] = self.agent._requests
+        result.callback(StubResponse(
+            code=200, headers=Headers(), body=b"hello, world",
+        ))
+        response, body = self.successResultOf(d)
+        self.assertEqual(b"hello, world", body)
@@ -0,0 +1,117 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.client.checksum}.
+"""
+
+from hashlib import md5, sha256
+
+from twisted.internet.defer import Deferred
+from twisted.python.failure import Failure
+from twisted.test.proto_helpers import StringTransport
+from twisted.trial.unittest import TestCase
+from twisted.web.client import ResponseDone
+from twisted.web.iweb import IBodyProducer
+
+from zope.interface.verify import verifyObject
+
+from txaws.client.base import StreamingBodyReceiver
+from txaws.client.checksum import (
+    ChecksumMismatch, HashingBodyProducer, VerifyingReceiver, etag_md5,
+)
+from txaws.testing.producers import StringBodyProducer
+
+
+class _Consumer(object):
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+
+class HashingBodyProducerTestCase(TestCase):
+    """
+    Tests for L{HashingBodyProducer}.
+    """
+    def test_digests(self):
+        """
+        L{HashingBodyProducer} passes on the output of the producer it wraps
+        and computes its digests.
+        """
+        producer = HashingBodyProducer(StringBodyProducer(b"some data"))
+        verifyObject(IBodyProducer, producer)
+        self.assertEqual(9, producer.length)
+
+        consumer = _Consumer()
+        self.successResultOf(producer.startProducing(consumer))
+        self.assertEqual([b"some data"], consumer.chunks)
+        self.assertEqual(md5(b"some data").hexdigest(), producer.hexdigest())
+        self.assertEqual(
+            sha256(b"some data").digest(), producer.digest("sha256"),
+        )
+
+    def test_algorithms(self):
+        """
+        L{HashingBodyProducer} computes only the digests it is asked for.
+        """
+        producer = HashingBodyProducer(
+            StringBodyProducer(b"some data"), ("sha1",),
+        )
+        self.successResultOf(producer.startProducing(_Consumer()))
+        self.assertRaises(KeyError, producer.hexdigest, "md5")
+
+
+class VerifyingReceiverTestCase(TestCase):
+    """
+    Tests for L{VerifyingReceiver}.
+    """
+    def receive(self, expected, chunks):
+        receiver = VerifyingReceiver(StreamingBodyReceiver(), expected)
+        receiver.finished = d = Deferred()
+        receiver.content_length = sum(map(len, chunks))
+        receiver.makeConnection(StringTransport())
+        for chunk in chunks:
+            receiver.dataReceived(chunk)
+        receiver.connectionLost(Failure(ResponseDone()))
+        return d
+
+    def test_match(self):
+        """
+        If the digest of the body is the expected one, C{finished} fires with
+        the result of the wrapped receiver.
+        """
+        d = self.receive(md5(b"some data").hexdigest(), [b"some ", b"data"])
+        self.assertEqual(b"some data", self.successResultOf(d))
+
+    def test_mismatch(self):
+        """
+        If the digest of the body is not the expected one, C{finished} fails
+        with L{ChecksumMismatch}.
+        """
+        expected = md5(b"some data").hexdigest()
+        d = self.receive(expected, [b"some ", b"date"])
+        failure = self.failureResultOf(d, ChecksumMismatch)
+        self.assertEqual(expected, failure.value.expected)
+        self.assertEqual(md5(b"some date").hexdigest(), failure.value.actual)
+
+
+class EtagMD5TestCase(TestCase):
+    """
+    Tests for L{etag_md5}.
+    """
+    def test_md5(self):
+        """
+        An ETag which is an MD5 digest is returned unquoted and in lowercase.
+        """
+        self.assertEqual(b"a" * 32, etag_md5(b'"%s"' % (b"A" * 32,)))
+        self.assertEqual(b"0" * 32, etag_md5(b"0" * 32))
+
+    def test_not_md5(self):
+        """
+        C{None} is returned for a missing ETag and for ETags which are not MD5
+        digests, such as those of multipart uploads.
+        """
+        self.assertIdentical(None, etag_md5(None))
+        self.assertIdentical(None, etag_md5(b'"%s-3"' % (b"a" * 32,)))
+        self.assertIdentical(None, etag_md5(b'"short"'))
@@ -0,0 +1,195 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.client.producers}.
+"""
+
+import zlib
+
+from twisted.internet.task import Cooperator
+from twisted.python.filepath import FilePath
+from twisted.trial.unittest import TestCase
+from twisted.web.iweb import IBodyProducer, UNKNOWN_LENGTH
+
+from zope.interface.verify import verifyObject
+
+from txaws.client.producers import (
+    MappedFile, GzipBodyProducer, gzip_compress,
+)
+
+
+class _Ticks(object):
+    """
+    A scheduler for a L{Cooperator} which runs iterations only when told to.
+    """
+    def __init__(self):
+        self._calls = []
+
+    def scheduler(self, f):
+        self._calls.append(f)
+        return self
+
+    def cancel(self):
+        pass
+
+    def run(self):
+        calls, self._calls = self._calls, []
+        for f in calls:
+            f()
+
+    def cooperator(self):
+        # Stop after each step so every chunk is one tick.
+        return Cooperator(
+            terminationPredicateFactory=lambda: lambda: True,
+            scheduler=self.scheduler,
+        )
+
+
+class _Consumer(object):
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+
+class MappedFileTestCase(TestCase):
+    """
+    Tests for L{MappedFile} and L{MappedBodyProducer}.
+    """
+    def setUp(self):
+        self.ticks = _Ticks()
+        self.path = FilePath(self.mktemp())
+        self.path.setContent(b"".join(chr(i % 256) for i in range(1000)))
+        self.mapped = MappedFile(self.path.path)
+        self.addCleanup(self.mapped.close)
+
+    def produce(self, producer):
+        consumer = _Consumer()
+        d = producer.startProducing(consumer)
+        while not d.called:
+            self.ticks.run()
+        self.successResultOf(d)
+        return consumer.chunks
+
+    def test_interface(self):
+        """
+        The producers provide L{IBodyProducer} and have the length of the
+        range they produce.
+        """
+        producer = self.mapped.producer(100, 50)
+        verifyObject(IBodyProducer, producer)
+        self.assertEqual(50, producer.length)
+        self.assertEqual(1000, self.mapped.producer().length)
+
+    def test_range(self):
+        """
+        A producer writes exactly the bytes in its range, in chunks which grow
+        while the consumer does not pause it.
+        """
+        producer = self.mapped.producer(
+            10, 100, cooperator=self.ticks.cooperator(),
+            chunk_size=8, max_chunk_size=32,
+        )
+        chunks = self.produce(producer)
+        self.assertEqual(self.path.getContent()[10:110], b"".join(chunks))
+        self.assertEqual([8, 16, 32, 32, 12], list(map(len, chunks)))
+
+    def test_pause_shrinks_chunks(self):
+        """
+        Pausing a producer halves the size of the chunks it writes.
+        """
+        producer = self.mapped.producer(
+            0, 100, cooperator=self.ticks.cooperator(),
+            chunk_size=32, min_chunk_size=4, max_chunk_size=32,
+        )
+        consumer = _Consumer()
+        producer.startProducing(consumer)
+        self.ticks.run()
+        producer.pauseProducing()
+        self.ticks.run()
+        self.assertEqual([32], list(map(len, consumer.chunks)))
+        producer.resumeProducing()
+        self.ticks.run()
+        self.assertEqual([32, 16], list(map(len, consumer.chunks)))
+
+    def test_parts(self):
+        """
+        L{MappedFile.parts} makes producers for consecutive ranges covering
+        the whole file, which can be run concurrently.
+        """
+        producers = self.mapped.parts(
+            300, cooperator=self.ticks.cooperator(),
+        )
+        self.assertEqual([300, 300, 300, 100], list(p.length for p in producers))
+        consumers = list(_Consumer() for p in producers)
+        ds = list(
+            p.startProducing(c) for (p, c) in zip(producers, consumers)
+        )
+        while not all(d.called for d in ds):
+            self.ticks.run()
+        self.assertEqual(
+            self.path.getContent(),
+            b"".join(b"".join(c.chunks) for c in consumers),
+        )
+
+    def test_out_of_range(self):
+        """
+        L{MappedFile.producer} raises L{ValueError} for a range which is not
+        within the file.
+        """
+        self.assertRaises(ValueError, self.mapped.producer, 900, 101)
+        self.assertRaises(ValueError, self.mapped.producer, -1, 10)
+
+    def test_empty(self):
+        """
+        An empty file can be mapped and produces no bytes.
+        """
+        path = FilePath(self.mktemp())
+        path.setContent(b"")
+        mapped = MappedFile(path.path)
+        producer = mapped.producer(cooperator=self.ticks.cooperator())
+        self.assertEqual([], self.produce(producer))
+
+
+def _gunzip(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+class GzipTestCase(TestCase):
+    """
+    Tests for L{GzipBodyProducer} and L{gzip_compress}.
+    """
+    def test_gzip_compress(self):
+        """
+        L{gzip_compress} returns the data compressed in the gzip format.
+        """
+        data = b"hello, world " * 100
+        compressed = gzip_compress(data)
+        self.assertTrue(compressed.startswith(b"\x1f\x8b"))
+        self.assertTrue(len(compressed) < len(data))
+        self.assertEqual(data, _gunzip(compressed))
+
+    def test_producer(self):
+        """
+        L{GzipBodyProducer} writes the output of the producer it wraps, in
+        chunks, compressed in the gzip format.  Its length is unknown.
+        """
+        ticks = _Ticks()
+        path = FilePath(self.mktemp())
+        path.setContent(b"".join(chr(i % 7) for i in range(100000)))
+        mapped = MappedFile(path.path)
+        self.addCleanup(mapped.close)
+
+        producer = GzipBodyProducer(
+            mapped.producer(cooperator=ticks.cooperator(), chunk_size=1000),
+        )
+        verifyObject(IBodyProducer, producer)
+        self.assertEqual(UNKNOWN_LENGTH, producer.length)
+
+        consumer = _Consumer()
+        d = producer.startProducing(consumer)
+        while not d.called:
+            ticks.run()
+        self.successResultOf(d)
+        self.assertEqual(path.getContent(), _gunzip(b"".join(consumer.chunks)))
@@ -0,0 +1,103 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.client.scheduler}.
+"""
+
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from txaws.client.scheduler import ProducerScheduler
+
+
+class ProducerSchedulerTestCase(TestCase):
+    """
+    Tests for L{ProducerScheduler}.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.scheduler = ProducerScheduler(budget=0.0025, clock=self.clock)
+        self.steps = []
+
+    def work(self, name, count, cost=0.001):
+        """
+        Make an iterator which records and takes C{cost} seconds for each of
+        C{count} steps.
+        """
+        for i in range(count):
+            self.steps.append(name)
+            # Move time on without running anything else which is due.
+            self.clock.rightNow += cost
+            yield None
+
+    def iterate(self):
+        """
+        Let the reactor run one iteration of the scheduler.
+        """
+        del self.steps[:]
+        # Unlike Clock.advance, leave calls scheduled by the ones which are
+        # run for the next iteration, as the reactor does.
+        due = list(
+            call for call in self.clock.getDelayedCalls()
+            if call.getTime() <= self.clock.seconds()
+        )
+        for call in due:
+            self.clock.calls.remove(call)
+            call.func(*call.args, **call.kw)
+        return list(self.steps)
+
+    def test_budget(self):
+        """
+        Steps are run until the budget for the reactor iteration is used up
+        and the rest are left for later iterations.
+        """
+        task = self.scheduler.lane().cooperate(self.work(u"a", 5))
+        self.assertEqual([u"a", u"a", u"a"], self.iterate())
+        self.assertEqual([u"a", u"a"], self.iterate())
+        self.successResultOf(task.whenDone())
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def test_round_robin(self):
+        """
+        The producers in a lane take turns.
+        """
+        lane = self.scheduler.lane()
+        lane.cooperate(self.work(u"a", 2))
+        lane.cooperate(self.work(u"b", 2))
+        self.assertEqual([u"a", u"b", u"a"], self.iterate())
+        self.assertEqual([u"b"], self.iterate())
+
+    def test_priority(self):
+        """
+        A lane only runs when the higher priority lanes have left some of the
+        budget unused.
+        """
+        self.scheduler.lane(priority=0).cooperate(self.work(u"low", 2))
+        self.scheduler.lane(priority=1).cooperate(self.work(u"high", 4))
+        self.assertEqual([u"high", u"high", u"high"], self.iterate())
+        self.assertEqual([u"high", u"low", u"low"], self.iterate())
+
+    def test_pause(self):
+        """
+        A paused task is not run until it is resumed.
+        """
+        task = self.scheduler.lane().cooperate(self.work(u"a", 2))
+        task.pause()
+        self.assertEqual([], self.iterate())
+        task.resume()
+        self.assertEqual([u"a", u"a"], self.iterate())
+
+    def test_stats(self):
+        """
+        L{ProducerScheduler.stats} records how long producers ran for and how
+        long the reactor took to get around to running them.
+        """
+        self.scheduler.lane().cooperate(self.work(u"a", 4))
+        self.clock.advance(0.5)
+        self.iterate()
+        stats = self.scheduler.stats
+        self.assertEqual(2, stats.runs)
+        self.assertAlmostEqual(0.004, stats.busy)
+        self.assertAlmostEqual(0.003, stats.max_busy)
+        self.assertAlmostEqual(0.5, stats.lag)
+        self.assertAlmostEqual(0.5, stats.max_lag)
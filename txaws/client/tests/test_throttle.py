@@ -0,0 +1,179 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.client.throttle}.
+"""
+
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from twisted.test.proto_helpers import StringTransport
+from twisted.trial.unittest import TestCase
+from twisted.web.client import ResponseDone
+
+from txaws.client.base import StreamingBodyReceiver
+from txaws.client.throttle import (
+    TokenBucket, ThrottledBodyProducer, ThrottledReceiver,
+)
+
+
+class TokenBucketTestCase(TestCase):
+    """
+    Tests for L{TokenBucket}.
+    """
+    def setUp(self):
+        self.clock = Clock()
+
+    def test_unlimited(self):
+        """
+        A bucket without a rate never asks for a wait.
+        """
+        bucket = TokenBucket(clock=self.clock)
+        self.assertEqual(0, bucket.consume(10 ** 9))
+
+    def test_debt(self):
+        """
+        Taking more tokens than there are asks for a wait long enough for the
+        debt to be repaid at the bucket's rate.
+        """
+        bucket = TokenBucket(100, clock=self.clock)
+        self.assertEqual(0, bucket.consume(100))
+        self.assertEqual(0.5, bucket.consume(50))
+        self.clock.advance(0.5)
+        self.assertEqual(0, bucket.consume(0))
+
+    def test_burst(self):
+        """
+        Tokens accumulate only up to the burst size.
+        """
+        bucket = TokenBucket(100, burst=150, clock=self.clock)
+        self.clock.advance(10)
+        self.assertEqual(1.0, bucket.consume(250))
+
+    def test_parent(self):
+        """
+        Bytes counted by a bucket are counted by its parent too and the
+        longer of the two waits is asked for.
+        """
+        parent = TokenBucket(100, clock=self.clock)
+        first = TokenBucket(1000, parent=parent, clock=self.clock)
+        second = TokenBucket(1000, parent=parent, clock=self.clock)
+        self.assertEqual(0, first.consume(100))
+        self.assertEqual(1.0, second.consume(100))
+
+    def test_set_rate(self):
+        """
+        L{TokenBucket.set_rate} changes the rate at which tokens are added.
+        """
+        bucket = TokenBucket(100, clock=self.clock)
+        bucket.consume(100)
+        bucket.set_rate(10)
+        self.assertEqual(1.0, bucket.consume(10))
+        bucket.set_rate(None)
+        self.assertEqual(0, bucket.consume(10 ** 9))
+
+
+class _Producer(object):
+    """
+    A producer which writes whatever it is told to.
+    """
+    length = 30
+    paused = False
+
+    def startProducing(self, consumer):
+        self.consumer = consumer
+        self.finished = Deferred()
+        return self.finished
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+
+    def stopProducing(self):
+        self.stopped = True
+
+
+class ThrottledBodyProducerTestCase(TestCase):
+    """
+    Tests for L{ThrottledBodyProducer}.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.producer = _Producer()
+        self.throttled = ThrottledBodyProducer(
+            self.producer, TokenBucket(10, clock=self.clock),
+        )
+        self.transport = StringTransport()
+        self.throttled.startProducing(self.transport)
+
+    def test_length(self):
+        """
+        The length is that of the wrapped producer.
+        """
+        self.assertEqual(30, self.throttled.length)
+
+    def test_throttled(self):
+        """
+        Once the bucket runs dry, the wrapped producer is paused until the
+        debt has been repaid.
+        """
+        self.producer.consumer.write(b"x" * 10)
+        self.assertFalse(self.producer.paused)
+        self.producer.consumer.write(b"x" * 5)
+        self.assertTrue(self.producer.paused)
+        self.clock.advance(0.5)
+        self.assertFalse(self.producer.paused)
+        self.assertEqual(b"x" * 15, self.transport.value())
+
+    def test_consumer_pause(self):
+        """
+        If the consumer pauses the producer, it stays paused until the
+        consumer resumes it, even if it is no longer throttled.
+        """
+        self.producer.consumer.write(b"x" * 15)
+        self.throttled.pauseProducing()
+        self.clock.advance(1)
+        self.assertTrue(self.producer.paused)
+        self.throttled.resumeProducing()
+        self.assertFalse(self.producer.paused)
+
+    def test_stop(self):
+        """
+        Stopping the throttled producer stops the wrapped one and cancels any
+        pending resume.
+        """
+        self.producer.consumer.write(b"x" * 15)
+        self.throttled.stopProducing()
+        self.assertTrue(self.producer.stopped)
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+
+class ThrottledReceiverTestCase(TestCase):
+    """
+    Tests for L{ThrottledReceiver}.
+    """
+    def test_throttled(self):
+        """
+        Once the bucket runs dry the transport is paused until the debt has
+        been repaid, and the body is delivered to the wrapped receiver.
+        """
+        clock = Clock()
+        receiver = ThrottledReceiver(
+            StreamingBodyReceiver(), TokenBucket(10, clock=clock),
+        )
+        receiver.finished = finished = Deferred()
+        receiver.content_length = 15
+        transport = StringTransport()
+        receiver.makeConnection(transport)
+
+        receiver.dataReceived(b"x" * 10)
+        self.assertEqual(u"producing", transport.producerState)
+        receiver.dataReceived(b"x" * 5)
+        self.assertEqual(u"paused", transport.producerState)
+        clock.advance(0.5)
+        self.assertEqual(u"producing", transport.producerState)
+
+        receiver.connectionLost(Failure(ResponseDone()))
+        self.assertEqual(b"x" * 15, self.successResultOf(finished))
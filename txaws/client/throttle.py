@@ -0,0 +1,239 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Bandwidth limits for request and response bodies.
+
+A L{TokenBucket} limits a rate in bytes per second.  Buckets can be nested so
+that, for example, each transfer has its own limit while all of the transfers
+of a client, or of the whole process, share another.
+
+L{ThrottledBodyProducer} applies a bucket to a request body and
+L{ThrottledReceiver} to a response body.  Neither sleeps: when a bucket runs
+dry, the body producer or the connection's transport is paused until there
+are enough tokens again.
+"""
+
+__all__ = [
+    "TokenBucket", "ThrottledBodyProducer", "ThrottledReceiver",
+]
+
+from zope.interface import implementer
+
+from twisted.internet.protocol import Protocol
+from twisted.web.iweb import IBodyProducer
+
+
+class TokenBucket(object):
+    """
+    A token bucket limiting a rate of bytes per second.
+
+    Each byte transferred takes a token.  Tokens are added at C{rate} per
+    second up to C{burst}.  A transfer may take more tokens than there are,
+    leaving the bucket in debt, and is then told how long to wait for the
+    debt to be repaid.
+
+    @ivar rate: The number of bytes per second allowed, or C{None} for no
+        limit.
+    @ivar burst: The largest number of tokens the bucket holds.
+    @ivar parent: Another L{TokenBucket} which all of the bytes counted by
+        this one are also counted by, or C{None}.
+    """
+    def __init__(self, rate=None, burst=None, parent=None, clock=None):
+        """
+        @param rate: See L{TokenBucket.rate}.
+        @param burst: See L{TokenBucket.burst}.  Defaults to one second's
+            worth of C{rate}.
+        @param parent: See L{TokenBucket.parent}.
+        @param clock: An L{IReactorTime} provider, or C{None} for the global
+            reactor.
+        """
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self.clock = clock
+        self.parent = parent
+        self.rate = None
+        self._tokens = 0
+        self._updated = clock.seconds()
+        self.set_rate(rate, burst)
+        if rate is not None:
+            self._tokens = self.burst
+
+    def set_rate(self, rate, burst=None):
+        """
+        Change the limit.  This takes effect for all bytes counted from now
+        on, including those of transfers already in progress.
+
+        @param rate: See L{TokenBucket.rate}.
+        @param burst: See L{TokenBucket.burst}.
+        """
+        self._refill()
+        self.rate = rate
+        if burst is None:
+            burst = rate
+        self.burst = burst
+        if rate is not None and self._tokens > burst:
+            self._tokens = burst
+
+    def _refill(self):
+        now = self.clock.seconds()
+        if self.rate is not None:
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate,
+            )
+        self._updated = now
+
+    def consume(self, amount):
+        """
+        Count some bytes which have been transferred.
+
+        @param amount: The number of bytes.
+        @type amount: L{int}
+
+        @return: The number of seconds to wait before transferring any more
+            to stay within the limit of this bucket and its parents.
+        @rtype: L{float}
+        """
+        self._refill()
+        delay = 0.0
+        if self.rate is not None:
+            self._tokens -= amount
+            if self._tokens < 0:
+                delay = -self._tokens / float(self.rate)
+        if self.parent is not None:
+            delay = max(delay, self.parent.consume(amount))
+        return delay
+
+
+class _ThrottlingConsumer(object):
+    """
+    The consumer which a L{ThrottledBodyProducer} gives to the producer it
+    wraps.
+    """
+    def __init__(self, throttled, consumer):
+        self._throttled = throttled
+        self._consumer = consumer
+
+    def write(self, data):
+        self._consumer.write(data)
+        self._throttled._written(len(data))
+
+
+@implementer(IBodyProducer)
+class ThrottledBodyProducer(object):
+    """
+    An L{IBodyProducer} which limits the rate at which another produces.
+
+    @ivar length: The length of the wrapped producer.
+    """
+    def __init__(self, producer, bucket):
+        """
+        @param producer: The L{IBodyProducer} to limit.
+        @param bucket: The L{TokenBucket} to count the bytes produced with.
+        """
+        self._producer = producer
+        self._bucket = bucket
+        self.length = producer.length
+        self._paused = False
+        self._throttled = False
+        self._producer_paused = False
+        self._delayed_resume = None
+
+    def startProducing(self, consumer):
+        return self._producer.startProducing(
+            _ThrottlingConsumer(self, consumer)
+        )
+
+    def _written(self, amount):
+        delay = self._bucket.consume(amount)
+        if delay > 0 and not self._throttled:
+            self._throttled = True
+            self._delayed_resume = self._bucket.clock.callLater(
+                delay, self._unthrottle,
+            )
+            self._update()
+
+    def _unthrottle(self):
+        self._delayed_resume = None
+        self._throttled = False
+        self._update()
+
+    def _update(self):
+        pause = self._paused or self._throttled
+        if pause and not self._producer_paused:
+            self._producer_paused = True
+            self._producer.pauseProducing()
+        elif not pause and self._producer_paused:
+            self._producer_paused = False
+            self._producer.resumeProducing()
+
+    def pauseProducing(self):
+        self._paused = True
+        self._update()
+
+    def resumeProducing(self):
+        self._paused = False
+        self._update()
+
+    def stopProducing(self):
+        if self._delayed_resume is not None:
+            self._delayed_resume.cancel()
+            self._delayed_resume = None
+        self._producer.stopProducing()
+
+
+class ThrottledReceiver(Protocol, object):
+    """
+    A response body protocol which limits the rate at which bytes are
+    delivered to another.
+
+    The C{finished} and C{content_length} attributes are those of the
+    wrapped protocol, so this can be used wherever L{StreamingBodyReceiver}
+    is.
+    """
+    def __init__(self, receiver, bucket):
+        """
+        @param receiver: The protocol to deliver the body to.
+        @param bucket: The L{TokenBucket} to count the bytes received with.
+        """
+        self._receiver = receiver
+        self._bucket = bucket
+        self._delayed_resume = None
+
+    @property
+    def finished(self):
+        return self._receiver.finished
+
+    @finished.setter
+    def finished(self, value):
+        self._receiver.finished = value
+
+    @property
+    def content_length(self):
+        return self._receiver.content_length
+
+    @content_length.setter
+    def content_length(self, value):
+        self._receiver.content_length = value
+
+    def makeConnection(self, transport):
+        self._receiver.makeConnection(transport)
+        Protocol.makeConnection(self, transport)
+
+    def dataReceived(self, data):
+        self._receiver.dataReceived(data)
+        delay = self._bucket.consume(len(data))
+        if delay > 0 and self._delayed_resume is None:
+            self.transport.pauseProducing()
+            self._delayed_resume = self._bucket.clock.callLater(
+                delay, self._resume,
+            )
+
+    def _resume(self):
+        self._delayed_resume = None
+        self.transport.resumeProducing()
+
+    def connectionLost(self, reason):
+        if self._delayed_resume is not None:
+            self._delayed_resume.cancel()
+            self._delayed_resume = None
+        self._receiver.connectionLost(reason)
@@ -0,0 +1,185 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Coalescing of concurrent single-resource EC2 lookups into batched requests.
+
+Many independent callers each asking for one instance cost one
+I{DescribeInstances} request each.  A L{DescribeBatcher} collects the ids
+asked for within a short window, or until a batch is full, and describes them
+all with one request, giving each caller the model for its id.
+"""
+
+__all__ = [
+    "DescribeBatcher",
+]
+
+from twisted.internet.defer import Deferred
+
+from txaws.ec2.exception import bad_id, named_ids
+
+
+class _Coalescer(object):
+    """
+    Batch lookups of one kind of resource.
+
+    @ivar requests: The number of describe requests made.
+    """
+    def __init__(self, describe, key, window, max_batch_size, clock):
+        """
+        @param describe: A callable like L{EC2Client.describe_instances},
+            taking ids as positional arguments.
+        @param key: A one-argument callable returning the id of a model.
+        """
+        self._describe = describe
+        self._key = key
+        self._window = window
+        self._max_batch_size = max_batch_size
+        self._clock = clock
+        self._pending = {}
+        self._delayed_flush = None
+        self.requests = 0
+
+    def get(self, id):
+        d = Deferred()
+        self._pending.setdefault(id, []).append(d)
+        if len(self._pending) >= self._max_batch_size:
+            self.flush()
+        elif self._delayed_flush is None:
+            self._delayed_flush = self._clock.callLater(
+                self._window, self.flush,
+            )
+        return d
+
+    def flush(self):
+        if self._delayed_flush is not None:
+            if self._delayed_flush.active():
+                self._delayed_flush.cancel()
+            self._delayed_flush = None
+        pending, self._pending = self._pending, {}
+        if pending:
+            self._request(pending)
+
+    def _request(self, pending):
+        self.requests += 1
+        d = self._describe(*pending)
+        d.addCallbacks(self._described, self._failed, (pending,), {},
+                       (pending,), {})
+
+    def _described(self, models, pending):
+        by_id = {}
+        for model in models:
+            by_id[self._key(model)] = model
+        for id, waiters in pending.iteritems():
+            model = by_id.get(id)
+            for d in waiters:
+                d.callback(model)
+
+    def _failed(self, reason, pending):
+        if len(pending) > 1 and bad_id(reason):
+            # EC2 fails the whole request if any one of the ids does not
+            # exist or is malformed, and names those ids in its message.
+            # Only their callers see the error and the other ids are
+            # described again together.
+            named = named_ids(reason, pending)
+            if named:
+                self._errback(
+                    dict((id, pending[id]) for id in named), reason,
+                )
+                rest = dict(
+                    (id, waiters) for id, waiters in pending.iteritems()
+                    if id not in named
+                )
+                if rest:
+                    self._request(rest)
+            else:
+                # The ids at fault are unknown, so find them by halves.
+                ids = sorted(pending)
+                middle = len(ids) // 2
+                for half in (ids[:middle], ids[middle:]):
+                    self._request(dict((id, pending[id]) for id in half))
+            return
+        # Any other error, such as throttling, concerns the request rather
+        # than any of its ids.
+        self._errback(pending, reason)
+
+    def _errback(self, pending, reason):
+        for waiters in pending.itervalues():
+            for d in waiters:
+                d.errback(reason)
+
+
+class DescribeBatcher(object):
+    """
+    Describe single instances, volumes and snapshots, combining lookups made
+    close together into one request per kind of resource.
+
+    Each lookup fires with the model for its id, or with C{None} if the
+    response did not include one.  If a batched request fails because some
+    of its ids do not exist or are malformed, only the callers of those ids
+    get the error and the others are described again in one request.  Any
+    other error is given to every caller in the batch.
+    """
+    def __init__(self, client, window=0.005, max_batch_size=100, clock=None):
+        """
+        @param client: An L{EC2Client} or another object with the same
+            interface.
+        @param window: The number of seconds to wait for more lookups after
+            the first of a batch.
+        @param max_batch_size: The largest number of distinct ids to describe
+            in one request.  A batch is sent as soon as it is full.
+        @param clock: An L{IReactorTime} provider, or C{None} for the global
+            reactor.
+        """
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self._instances = _Coalescer(
+            client.describe_instances, lambda instance: instance.instance_id,
+            window, max_batch_size, clock,
+        )
+        self._volumes = _Coalescer(
+            client.describe_volumes, lambda volume: volume.id,
+            window, max_batch_size, clock,
+        )
+        self._snapshots = _Coalescer(
+            client.describe_snapshots, lambda snapshot: snapshot.id,
+            window, max_batch_size, clock,
+        )
+
+    @property
+    def requests(self):
+        """
+        The number of describe requests made so far.
+        """
+        return (
+            self._instances.requests + self._volumes.requests +
+            self._snapshots.requests
+        )
+
+    def describe_instance(self, instance_id):
+        """
+        @return: A L{Deferred} that fires with the L{Instance} with the given
+            id.
+        """
+        return self._instances.get(instance_id)
+
+    def describe_volume(self, volume_id):
+        """
+        @return: A L{Deferred} that fires with the L{Volume} with the given
+            id.
+        """
+        return self._volumes.get(volume_id)
+
+    def describe_snapshot(self, snapshot_id):
+        """
+        @return: A L{Deferred} that fires with the L{Snapshot} with the given
+            id.
+        """
+        return self._snapshots.get(snapshot_id)
+
+    def flush(self):
+        """
+        Send all pending lookups now instead of at the end of the window.
+        """
+        self._instances.flush()
+        self._volumes.flush()
+        self._snapshots.flush()
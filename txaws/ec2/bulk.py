@@ -0,0 +1,216 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Launching and terminating large numbers of instances.
+
+L{EC2Client.terminate_instances} sends every id in one request and
+L{EC2Client.run_instances} makes one request per call.  A L{BulkExecutor}
+splits a large operation into requests within EC2's limits, makes several at
+once without exceeding a request rate, retries those which fail for
+transient reasons and combines the results.
+"""
+
+__all__ = [
+    "BulkExecutor", "BulkResult",
+]
+
+from uuid import uuid4
+
+import attr
+
+from twisted.internet.defer import (
+    DeferredList, DeferredSemaphore, maybeDeferred,
+)
+from twisted.internet.task import deferLater
+
+from txaws.client.throttle import TokenBucket
+from txaws.ec2.exception import EC2Error, transient
+
+
+# EC2 error codes which mean that some of the instance ids in a request are
+# at fault, so that the others may succeed without them.
+_BAD_ID_CODES = frozenset([
+    "InvalidInstanceID.NotFound", "InvalidInstanceID.Malformed",
+])
+
+
+def _has_code(reason, codes):
+    """
+    Determine whether a failure is an L{EC2Error} with one of some codes.
+    """
+    if not reason.check(EC2Error):
+        return False
+    return any(
+        error.get("Code") in codes for error in reason.value.errors
+    )
+
+
+@attr.s
+class BulkResult(object):
+    """
+    The combined outcome of a bulk operation.
+
+    @ivar succeeded: The results of the requests which succeeded, in the
+        order they completed: L{Instance}s for L{BulkExecutor.run_instances}
+        or C{(instance_id, previous_state, current_state)} tuples for
+        L{BulkExecutor.terminate_instances}.
+    @ivar failed: C{(item, failure)} tuples for the parts of the operation
+        which failed: an instance id for
+        L{BulkExecutor.terminate_instances} or the number of instances a
+        request asked for for L{BulkExecutor.run_instances}.
+    """
+    succeeded = attr.ib(default=attr.Factory(list))
+    failed = attr.ib(default=attr.Factory(list))
+
+
+class BulkExecutor(object):
+    """
+    Run bulk operations with an L{EC2Client}.
+
+    Requests which fail with a transient error are retried after a delay
+    which doubles with each attempt.  A termination request which fails
+    because some of its ids do not exist or are malformed is split in two
+    and each half is tried again, so that only the ids at fault are reported
+    as failed.  Each launch request is made with its own client token, so
+    that retrying one which succeeded without its response arriving does
+    not launch its instances twice.
+    """
+    def __init__(self, client, max_ids=1000, max_launch=100, concurrency=4,
+                 rate=None, retries=3, retry_delay=1.0, clock=None):
+        """
+        @param client: An L{EC2Client} or another object with the same
+            interface.
+        @param max_ids: The largest number of instance ids to send in one
+            request.
+        @param max_launch: The largest number of instances to launch with one
+            request.
+        @param concurrency: The largest number of requests to have in flight
+            at once.
+        @param rate: The largest number of requests to start per second, or
+            C{None} for no limit.
+        @param retries: The number of times to retry a request which failed
+            with a transient error.
+        @param retry_delay: The number of seconds to wait before the first
+            retry.
+        @param clock: An L{IReactorTime} provider, or C{None} for the global
+            reactor.
+        """
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self._client = client
+        self._max_ids = max_ids
+        self._max_launch = max_launch
+        self._semaphore = DeferredSemaphore(concurrency)
+        self._bucket = TokenBucket(rate, burst=1, clock=clock)
+        self._retries = retries
+        self._retry_delay = retry_delay
+        self._clock = clock
+
+    def _request(self, f, *args, **kwargs):
+        """
+        Make a request once the rate limit allows, holding one of the
+        concurrency slots while it is in flight.
+        """
+        def start():
+            delay = self._bucket.consume(1)
+            if delay > 0:
+                return deferLater(
+                    self._clock, delay, f, *args, **kwargs
+                )
+            return maybeDeferred(f, *args, **kwargs)
+        return self._semaphore.run(start)
+
+    def _retrying(self, f, *args, **kwargs):
+        """
+        Make a request, retrying it while it fails with a transient error.
+        """
+        def attempt(number):
+            d = self._request(f, *args, **kwargs)
+            d.addErrback(failed, number)
+            return d
+
+        def failed(reason, number):
+            if number >= self._retries or not transient(reason):
+                return reason
+            return deferLater(
+                self._clock, self._retry_delay * 2 ** number,
+                attempt, number + 1,
+            )
+
+        return attempt(0)
+
+    def _gather(self, calls, result):
+        d = DeferredList(calls, fireOnOneErrback=True, consumeErrors=True)
+        d.addCallback(lambda ignored: result)
+        return d
+
+    def terminate_instances(self, instance_ids):
+        """
+        Terminate instances, with as few requests as EC2's limits allow.
+
+        @param instance_ids: The ids of the instances to terminate.
+
+        @return: A L{Deferred} that fires with a L{BulkResult} once every id
+            has been terminated or has failed.
+        """
+        result = BulkResult()
+
+        def terminate(ids):
+            d = self._retrying(self._client.terminate_instances, *ids)
+            d.addCallbacks(result.succeeded.extend, failed, errbackArgs=(ids,))
+            return d
+
+        def failed(reason, ids):
+            if len(ids) == 1 or not _has_code(reason, _BAD_ID_CODES):
+                result.failed.extend((id, reason) for id in ids)
+                return None
+            middle = len(ids) // 2
+            return DeferredList(
+                [terminate(ids[:middle]), terminate(ids[middle:])],
+                fireOnOneErrback=True, consumeErrors=True,
+            )
+
+        instance_ids = list(instance_ids)
+        return self._gather(
+            list(
+                terminate(instance_ids[start:start + self._max_ids])
+                for start in xrange(0, len(instance_ids), self._max_ids)
+            ),
+            result,
+        )
+
+    def run_instances(self, image_id, count, **kwargs):
+        """
+        Launch instances, with as few requests as EC2's limits allow.
+
+        Each request asks for exactly its share of C{count}, so the instances
+        launched are either all of those asked for or are reported as failed
+        in the L{BulkResult}.
+
+        @param image_id: The id of the image to launch.
+        @param count: The number of instances to launch.
+        @param kwargs: Further arguments for L{EC2Client.run_instances}.
+
+        @return: A L{Deferred} that fires with a L{BulkResult} once every
+            request has completed.
+        """
+        result = BulkResult()
+
+        def launch(number):
+            d = self._retrying(
+                self._client.run_instances, image_id, number, number,
+                client_token=unicode(uuid4()), **kwargs
+            )
+            d.addCallbacks(
+                result.succeeded.extend,
+                lambda reason: result.failed.append((number, reason)),
+            )
+            return d
+
+        return self._gather(
+            list(
+                launch(min(self._max_launch, count - start))
+                for start in xrange(0, count, self._max_launch)
+            ),
+            result,
+        )
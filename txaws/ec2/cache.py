@@ -0,0 +1,284 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+A time-limited cache of EC2 instance and volume descriptions.
+
+L{CachingEC2Client} wraps an L{EC2Client}.  Descriptions of instances and
+volumes are kept, by id, for a fixed time so that repeated polling of state
+which rarely changes does not cost a request each time.  Changes made
+through the same wrapper invalidate the entries they affect.
+"""
+
+__all__ = [
+    "CachingEC2Client", "CacheStats",
+]
+
+import attr
+
+from twisted.internet.defer import succeed, fail
+
+from txaws.ec2.exception import not_found
+
+
+@attr.s
+class CacheStats(object):
+    """
+    Counts of the lookups made through a L{CachingEC2Client}.
+
+    @ivar hits: The number of ids found in the cache.
+    @ivar misses: The number of ids which had to be requested, counting a
+        description of all resources of a kind as one id.
+    @ivar negative_hits: The number of ids found in the cache to not exist.
+    @ivar invalidations: The number of entries discarded because of changes
+        made through the cache.
+    """
+    hits = attr.ib(default=0)
+    misses = attr.ib(default=0)
+    negative_hits = attr.ib(default=0)
+    invalidations = attr.ib(default=0)
+
+
+@attr.s(frozen=True)
+class _Entry(object):
+    """
+    A cached description of one resource, or of its absence.
+
+    @ivar expires: The time after which the entry is stale.
+    @ivar model: The model describing the resource, or C{None}.
+    @ivar failure: The L{Failure} reporting that the resource does not
+        exist, or C{None}.
+    """
+    expires = attr.ib()
+    model = attr.ib(default=None)
+    failure = attr.ib(default=None)
+
+
+class _ResourceCache(object):
+    """
+    The cached descriptions of one kind of resource.
+    """
+    def __init__(self, describe, key, ttl, negative_ttl, clock, stats):
+        self._describe = describe
+        self._key = key
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._clock = clock
+        self._stats = stats
+        self._entries = {}
+        # An _Entry whose model is the list of all of the resources.
+        self._all = None
+        # Incremented by each invalidation, so that responses to requests
+        # started before one are not cached.
+        self._generation = 0
+
+    def describe(self, ids):
+        now = self._clock.seconds()
+        generation = self._generation
+        if not ids:
+            return self._describe_all(now, generation)
+
+        found = {}
+        missing = []
+        for id in ids:
+            entry = self._entries.get(id)
+            if entry is not None and entry.expires > now:
+                found[id] = entry
+            elif id not in missing:
+                missing.append(id)
+        self._stats.hits += len(found)
+        self._stats.misses += len(missing)
+        for entry in found.itervalues():
+            if entry.failure is not None:
+                # Like EC2, fail the whole lookup if any id does not exist.
+                self._stats.negative_hits += 1
+                return fail(entry.failure)
+        if not missing:
+            return succeed(list(found[id].model for id in ids))
+
+        def described(models):
+            for model in models:
+                entry = _Entry(expires=now + self._ttl, model=model)
+                found[self._key(model)] = entry
+                if generation == self._generation:
+                    self._entries[self._key(model)] = entry
+            return list(found[id].model for id in ids if id in found)
+
+        def failed(reason):
+            if (
+                len(missing) == 1 and self._negative_ttl and
+                not_found(reason) and generation == self._generation
+            ):
+                self._entries[missing[0]] = _Entry(
+                    expires=now + self._negative_ttl, failure=reason,
+                )
+            return reason
+
+        d = self._describe(*missing)
+        d.addCallbacks(described, failed)
+        return d
+
+    def _describe_all(self, now, generation):
+        if self._all is not None and self._all.expires > now:
+            self._stats.hits += 1
+            return succeed(list(self._all.model))
+        self._stats.misses += 1
+
+        def described(models):
+            if generation != self._generation:
+                return models
+            expires = now + self._ttl
+            self._all = _Entry(expires=expires, model=list(models))
+            for model in models:
+                self._entries[self._key(model)] = _Entry(
+                    expires=expires, model=model,
+                )
+            return models
+
+        d = self._describe()
+        d.addCallback(described)
+        return d
+
+    def invalidate(self, ids=()):
+        """
+        Discard the entries for C{ids}, all negative entries and the
+        description of all of the resources.  Responses to requests in
+        flight are not cached, since they may describe the resources as
+        they were before the change.
+        """
+        self._generation += 1
+        discard = set(ids)
+        for id, entry in self._entries.iteritems():
+            if entry.failure is not None:
+                discard.add(id)
+        for id in discard:
+            if self._entries.pop(id, None) is not None:
+                self._stats.invalidations += 1
+        if self._all is not None:
+            self._all = None
+            self._stats.invalidations += 1
+
+    def clear(self):
+        """
+        Discard every entry.
+        """
+        self.invalidate(list(self._entries))
+
+
+class CachingEC2Client(object):
+    """
+    An L{EC2Client} wrapper which caches descriptions of instances and
+    volumes.
+
+    C{describe_instances} and C{describe_volumes} are answered from the cache
+    for ids described less than C{ttl} seconds ago, and only the other ids
+    are requested.  A description of all instances or volumes is cached as a
+    whole.
+
+    When an id is looked up on its own and EC2 reports that it does not
+    exist, that error is cached for C{negative_ttl} seconds.
+
+    C{run_instances}, C{terminate_instances}, C{create_volume},
+    C{delete_volume}, C{attach_volume}, C{detach_volume},
+    C{associate_address} and C{disassociate_address} invalidate the entries
+    they affect, along with all negative entries and the descriptions of all
+    resources of the kind.  Descriptions requested before an invalidation
+    are not cached when they arrive.  All other methods are passed straight
+    to the wrapped client.
+
+    @ivar stats: The L{CacheStats} for this cache.
+    """
+    def __init__(self, client, ttl=30.0, negative_ttl=5.0, clock=None):
+        """
+        @param client: The L{EC2Client} to wrap.
+        @param ttl: The number of seconds for which descriptions are used.
+        @param negative_ttl: The number of seconds for which errors reporting
+            that a resource does not exist are used, or C{0} to not cache
+            them.
+        @param clock: An L{IReactorTime} provider, or C{None} for the global
+            reactor.
+        """
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self._client = client
+        self.stats = CacheStats()
+        self._instances = _ResourceCache(
+            client.describe_instances, lambda instance: instance.instance_id,
+            ttl, negative_ttl, clock, self.stats,
+        )
+        self._volumes = _ResourceCache(
+            client.describe_volumes, lambda volume: volume.id,
+            ttl, negative_ttl, clock, self.stats,
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def describe_instances(self, *instance_ids):
+        return self._instances.describe(instance_ids)
+
+    def describe_volumes(self, *volume_ids):
+        return self._volumes.describe(volume_ids)
+
+    def invalidate(self):
+        """
+        Discard every cached description, such as after changes made other
+        than through this wrapper.
+        """
+        self._instances.clear()
+        self._volumes.clear()
+
+    def _invalidating(self, result, cache, ids=()):
+        cache.invalidate(ids)
+        return result
+
+    def _clearing(self, result, cache):
+        cache.clear()
+        return result
+
+    def run_instances(self, *args, **kwargs):
+        d = self._client.run_instances(*args, **kwargs)
+        d.addBoth(self._invalidating, self._instances)
+        return d
+
+    def terminate_instances(self, *instance_ids):
+        d = self._client.terminate_instances(*instance_ids)
+        d.addBoth(self._invalidating, self._instances, instance_ids)
+        return d
+
+    def create_volume(self, *args, **kwargs):
+        d = self._client.create_volume(*args, **kwargs)
+        d.addBoth(self._invalidating, self._volumes)
+        return d
+
+    def delete_volume(self, volume_id):
+        d = self._client.delete_volume(volume_id)
+        d.addBoth(self._invalidating, self._volumes, (volume_id,))
+        return d
+
+    def attach_volume(self, volume_id, instance_id, device):
+        d = self._client.attach_volume(volume_id, instance_id, device)
+        d.addBoth(self._invalidating, self._volumes, (volume_id,))
+        d.addBoth(self._invalidating, self._instances, (instance_id,))
+        return d
+
+    def detach_volume(self, volume_id, instance_id=None, device=None,
+                      force=False):
+        d = self._client.detach_volume(volume_id, instance_id, device, force)
+        d.addBoth(self._invalidating, self._volumes, (volume_id,))
+        if instance_id is None:
+            # The instance is whichever the volume was attached to.
+            d.addBoth(self._clearing, self._instances)
+        else:
+            d.addBoth(self._invalidating, self._instances, (instance_id,))
+        return d
+
+    def associate_address(self, instance_id, address):
+        d = self._client.associate_address(instance_id, address)
+        d.addBoth(self._invalidating, self._instances, (instance_id,))
+        return d
+
+    def disassociate_address(self, address):
+        d = self._client.disassociate_address(address)
+        # The address may have belonged to any instance.
+        d.addBoth(self._clearing, self._instances)
+        return d
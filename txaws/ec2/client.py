@@ -6,35 +6,233 @@
 """EC2 client support."""
 
 from datetime import datetime
-from urllib import quote
+from urllib import quote, urlencode
 from base64 import b64encode
+from hashlib import sha256
+from io import BytesIO
+from operator import itemgetter
 
 from dateutil.parser import parse as parse_timestamp
 
+from twisted.internet.defer import maybeDeferred
+from twisted.web.client import FileBodyProducer, HTTPConnectionPool
+from twisted.web.http_headers import Headers
+
 from txaws import version
-from txaws.client.base import BaseClient, BaseQuery, error_wrapper
+from txaws.client.base import (
+    BaseClient, BaseQuery, RequestDetails, WebClientContextFactory,
+    error_wrapper, query, url_context, _get_agent,
+)
 from txaws.ec2 import model
 from txaws.ec2.exception import EC2Error
-from txaws.util import iso8601time, XML
+from txaws.ec2.waiters import Waiters
+from txaws.service import REGION_US_EAST_1
+from txaws.util import iso8601time, intern_text, XML
 
 
-__all__ = ["EC2Client", "Query", "Parser"]
+__all__ = ["EC2Client", "Query", "Parser", "walk_pages"]
 
 
 def ec2_error_wrapper(error):
     error_wrapper(error, EC2Error)
 
 
+def _filter_params(filters):
+    """
+    Encode I{Describe} filters as C{Filter.N} parameters.
+
+    @param filters: A C{dict} mapping filter names to a value or a C{list}
+        of values, or C{None}.
+    @return: A C{dict} of query parameters.
+    """
+    params = {}
+    if not filters:
+        return params
+    for pos, name in enumerate(sorted(filters)):
+        values = filters[name]
+        if isinstance(values, (bytes, unicode)):
+            values = [values]
+        prefix = "Filter.%d." % (pos + 1)
+        params[prefix + "Name"] = name
+        for value_pos, value in enumerate(values):
+            params[prefix + "Value.%d" % (value_pos + 1)] = value
+    return params
+
+
+def _ip_permissions_params(permissions):
+    """
+    Encode IP permissions as C{IpPermissions.N} parameters, combining the
+    CIDR ranges of permissions with the same protocol and ports.  Ports
+    which are C{None}, as they are for protocol C{-1}, are left out.
+
+    @param permissions: An iterable of L{model.IPPermission}.
+    @return: A C{dict} of query parameters.
+    """
+    def port(value):
+        if value is None:
+            return None
+        return str(value)
+
+    ranges = {}
+    for permission in permissions:
+        key = (
+            permission.ip_protocol, port(permission.from_port),
+            port(permission.to_port),
+        )
+        ranges.setdefault(key, []).append(permission.cidr_ip)
+    params = {}
+    for pos, key in enumerate(sorted(ranges)):
+        prefix = "IpPermissions.%d." % (pos + 1)
+        ip_protocol, from_port, to_port = key
+        params[prefix + "IpProtocol"] = ip_protocol
+        if from_port is not None:
+            params[prefix + "FromPort"] = from_port
+        if to_port is not None:
+            params[prefix + "ToPort"] = to_port
+        for range_pos, cidr_ip in enumerate(ranges[key]):
+            params[prefix + "IpRanges.%d.CidrIp" % (range_pos + 1)] = cidr_ip
+    return params
+
+
+def walk_pages(describe_page, page_received, page_size=None, **kwargs):
+    """
+    Describe every page of a resource, one request at a time.
+
+    @param describe_page: One of the C{describe_*_page} methods of an
+        L{EC2Client}.
+    @param page_received: A one-argument callable which is called with the
+        C{items} of each L{Page} as it is received.  If it returns a
+        L{Deferred}, the next page is not requested until that fires.
+    @param page_size: If given, the maximum number of results to request in
+        each page.
+    @param kwargs: Further arguments for C{describe_page}, such as
+        C{filters}.
+
+    @return: A L{Deferred} that fires with C{None} after the last page has
+        been received.
+    """
+    def get_page(next_token):
+        d = describe_page(
+            max_results=page_size, next_token=next_token, **kwargs
+        )
+        d.addCallback(got_page)
+        return d
+
+    def got_page(page):
+        d = maybeDeferred(page_received, page.items)
+        if page.next_token is not None:
+            d.addCallback(lambda ignored: get_page(page.next_token))
+        else:
+            d.addCallback(lambda ignored: None)
+        return d
+
+    return get_page(None)
+
+
 class EC2Client(BaseClient):
-    """A client for EC2."""
+    """A client for EC2.
+
+    Unless a C{query_factory} is given, requests are signed with AWS
+    Signature Version 4 and issued with C{agent}.
+
+    @ivar agent: The L{IAgent} provider requests are issued with.  By
+        default, one is created on first use which keeps connections to the
+        endpoint open for reuse.
+    """
 
     def __init__(self, creds=None, endpoint=None, query_factory=None,
-                 parser=None):
+                 parser=None, agent=None, reactor=None):
+        """
+        @param query_factory: A callable like L{Query} which is used to make
+            requests, or C{None} to use the Signature Version 4 query.
+        @param agent: See L{EC2Client.agent}.
+        @param reactor: The reactor to use for the default C{agent} and for
+            timeouts, or C{None} for the global reactor.
+        """
         if query_factory is None:
-            query_factory = Query
+            query_factory = self._query
         if parser is None:
             parser = Parser()
         super(EC2Client, self).__init__(creds, endpoint, query_factory, parser)
+        self.agent = agent
+        self._reactor = reactor
+        self._waiters = None
+
+    def _get_reactor(self):
+        if self._reactor is None:
+            from twisted.internet import reactor
+            self._reactor = reactor
+        return self._reactor
+
+    def _get_agent(self):
+        if self.agent is None:
+            reactor = self._get_reactor()
+            if self.endpoint.ssl_hostname_verification:
+                context_factory = None
+            else:
+                context_factory = WebClientContextFactory()
+            self.agent = _get_agent(
+                self.endpoint.scheme, self.endpoint.get_host(), reactor,
+                context_factory, pool=HTTPConnectionPool(reactor),
+            )
+        return self.agent
+
+    def _query(self, **kwargs):
+        return _EC2Query(
+            agent=self._get_agent(), reactor=self._get_reactor(), **kwargs
+        )
+
+    def _wait(self, d, timeout):
+        if timeout is not None:
+            d.addTimeout(timeout, self._get_reactor())
+        return d
+
+    @property
+    def waiters(self):
+        """
+        The L{Waiters} shared by the C{wait_for_*} methods of this client,
+        created on first use.
+        """
+        if self._waiters is None:
+            self._waiters = Waiters(self, clock=self._get_reactor())
+        return self._waiters
+
+    def wait_for_instance_state(self, instance_id, state="running",
+                                timeout=None):
+        """Wait for an instance to reach a state.
+
+        All of the waits of a client share one poll per kind of resource.
+        See L{Waiters}.
+
+        @param timeout: The number of seconds after which to give up with
+            L{TimeoutError}, or C{None} to wait indefinitely.
+        @return: A L{Deferred} that fires with the L{model.Instance}.
+        """
+        return self._wait(
+            self.waiters.wait_for_instance_state(instance_id, state), timeout,
+        )
+
+    def wait_for_volume_available(self, volume_id, timeout=None):
+        """Wait for a volume to become available.
+
+        See L{EC2Client.wait_for_instance_state}.
+
+        @return: A L{Deferred} that fires with the L{model.Volume}.
+        """
+        return self._wait(
+            self.waiters.wait_for_volume_available(volume_id), timeout,
+        )
+
+    def wait_for_snapshot_completed(self, snapshot_id, timeout=None):
+        """Wait for a snapshot to complete.
+
+        See L{EC2Client.wait_for_instance_state}.
+
+        @return: A L{Deferred} that fires with the L{model.Snapshot}.
+        """
+        return self._wait(
+            self.waiters.wait_for_snapshot_completed(snapshot_id), timeout,
+        )
 
     def describe_instances(self, *instance_ids):
         """Describe current instances."""
@@ -50,9 +248,14 @@ class EC2Client(BaseClient):
     def run_instances(self, image_id, min_count, max_count,
         security_groups=None, key_name=None, instance_type=None,
         user_data=None, availability_zone=None, kernel_id=None,
-        ramdisk_id=None, subnet_id=None, security_group_ids=None):
+        ramdisk_id=None, subnet_id=None, security_group_ids=None,
+        client_token=None):
         """Run new instances.
 
+        @param client_token: A unique string identifying this launch, so
+            that if the request is made again EC2 returns the instances of
+            the first one instead of launching more.
+
         TODO: blockDeviceMapping, monitoring, subnetId
         """
         params = {"ImageId": image_id, "MinCount": str(min_count),
@@ -84,6 +287,8 @@ class EC2Client(BaseClient):
             params["KernelId"] = kernel_id
         if ramdisk_id is not None:
             params["RamdiskId"] = ramdisk_id
+        if client_token is not None:
+            params["ClientToken"] = client_token
         query = self.query_factory(
             action="RunInstances", creds=self.creds, endpoint=self.endpoint,
             other_params=params)
@@ -352,6 +557,48 @@ class EC2Client(BaseClient):
             cidr_ip=cidr_ip)
         return d
 
+    def _ip_permissions(self, action, permissions, group_name, group_id):
+        if group_id:
+            parameters = {"GroupId": group_id}
+        elif group_name:
+            parameters = {"GroupName": group_name}
+        else:
+            raise ValueError(
+                "You must specify either the group name or the group id.")
+        parameters.update(_ip_permissions_params(permissions))
+        query = self.query_factory(
+            action=action, creds=self.creds, endpoint=self.endpoint,
+            other_params=parameters)
+        d = query.submit()
+        return d.addCallback(self.parser.truth_return)
+
+    def authorize_ip_permissions(self, permissions, group_name=None,
+                                 group_id=None):
+        """Authorize several IP permissions with one request.
+
+        Permissions with the same protocol and ports are sent as one
+        C{IpPermissions.N} entry with several CIDR ranges.
+
+        @param permissions: An iterable of L{model.IPPermission}.
+        @param group_name: The name of the group to modify.
+        @param group_id: The id of the group to modify, which is used instead
+            of C{group_name} if both are given.
+        @return: A C{Deferred} that will fire with a truth value for the
+            success of the operation.
+        """
+        return self._ip_permissions(
+            "AuthorizeSecurityGroupIngress", permissions, group_name,
+            group_id)
+
+    def revoke_ip_permissions(self, permissions, group_name=None,
+                              group_id=None):
+        """Revoke several IP permissions with one request.
+
+        See L{EC2Client.authorize_ip_permissions}.
+        """
+        return self._ip_permissions(
+            "RevokeSecurityGroupIngress", permissions, group_name, group_id)
+
     def describe_volumes(self, *volume_ids):
         """Describe available volumes."""
         volumeset = {}
@@ -428,6 +675,26 @@ class EC2Client(BaseClient):
         d = query.submit()
         return d.addCallback(self.parser.attach_volume)
 
+    def detach_volume(self, volume_id, instance_id=None, device=None,
+                      force=False):
+        """Detach the given volume from the instance it is attached to.
+
+        @param force: Whether to force the detachment if the instance does
+            not release the volume.
+        """
+        params = {"VolumeId": volume_id}
+        if instance_id is not None:
+            params["InstanceId"] = instance_id
+        if device is not None:
+            params["Device"] = device
+        if force:
+            params["Force"] = "true"
+        query = self.query_factory(
+            action="DetachVolume", creds=self.creds, endpoint=self.endpoint,
+            other_params=params)
+        d = query.submit()
+        return d.addCallback(self.parser.detach_volume)
+
     def describe_keypairs(self, *keypair_names):
         """Returns information about key pairs available."""
         keypairs = {}
@@ -552,6 +819,106 @@ class EC2Client(BaseClient):
         d = query.submit()
         return d.addCallback(self.parser.describe_addresses)
 
+    def _describe_page(self, action, kind, id_param, ids, filters,
+                       max_results, next_token):
+        params = {}
+        for pos, id in enumerate(ids):
+            params["%s.%d" % (id_param, pos + 1)] = id
+        params.update(_filter_params(filters))
+        if max_results is not None:
+            params["MaxResults"] = str(max_results)
+        if next_token is not None:
+            params["NextToken"] = next_token
+        query = self.query_factory(
+            action=action, creds=self.creds, endpoint=self.endpoint,
+            other_params=params)
+        d = query.submit()
+        return d.addCallback(self.parser.page, kind)
+
+    def describe_instances_page(self, instance_ids=(), filters=None,
+                                max_results=None, next_token=None):
+        """Describe one page of instances.
+
+        @param instance_ids: If given, the ids of the instances to describe.
+        @param filters: If given, a C{dict} mapping filter names, such as
+            C{"instance-state-name"} or C{"tag:Name"}, to a value or a
+            C{list} of values, any of which may match.
+        @param max_results: If given, the largest number of results to
+            include in the page.
+        @param next_token: The C{next_token} of the previous L{Page}, or
+            C{None} for the first page.
+        @return: A C{Deferred} that fires with a L{Page} of L{Instance}s.
+
+        @see: L{walk_pages}
+        """
+        return self._describe_page(
+            "DescribeInstances", "instances", "InstanceId", instance_ids,
+            filters, max_results, next_token,
+        )
+
+    def describe_security_groups_page(self, group_ids=(), filters=None,
+                                      max_results=None, next_token=None):
+        """Describe one page of security groups.
+
+        @param group_ids: If given, the ids of the security groups to
+            describe.
+        @return: A C{Deferred} that fires with a L{Page} of
+            L{SecurityGroup}s.
+
+        @see: L{describe_instances_page} for the other parameters.
+        """
+        return self._describe_page(
+            "DescribeSecurityGroups", "security_groups", "GroupId",
+            group_ids, filters, max_results, next_token,
+        )
+
+    def describe_volumes_page(self, volume_ids=(), filters=None,
+                              max_results=None, next_token=None):
+        """Describe one page of volumes.
+
+        @param volume_ids: If given, the ids of the volumes to describe.
+        @return: A C{Deferred} that fires with a L{Page} of L{Volume}s.
+
+        @see: L{describe_instances_page} for the other parameters.
+        """
+        return self._describe_page(
+            "DescribeVolumes", "volumes", "VolumeId", volume_ids, filters,
+            max_results, next_token,
+        )
+
+    def describe_snapshots_page(self, snapshot_ids=(), filters=None,
+                                max_results=None, next_token=None):
+        """Describe one page of snapshots.
+
+        @param snapshot_ids: If given, the ids of the snapshots to describe.
+        @return: A C{Deferred} that fires with a L{Page} of L{Snapshot}s.
+
+        @see: L{describe_instances_page} for the other parameters.
+        """
+        return self._describe_page(
+            "DescribeSnapshots", "snapshots", "SnapshotId", snapshot_ids,
+            filters, max_results, next_token,
+        )
+
+    def describe_addresses_page(self, addresses=(), filters=None,
+                                max_results=None, next_token=None):
+        """Describe the elastic IPs allocated in this account.
+
+        I{DescribeAddresses} is not paginated by EC2, so C{max_results} and
+        C{next_token} should be left as C{None} and the one L{Page} holds all
+        of the matching addresses.
+
+        @param addresses: If given, the addresses to describe.
+        @return: A C{Deferred} that fires with a L{Page} of C{tuple}s of
+            (address, instance_id).
+
+        @see: L{describe_instances_page} for the other parameters.
+        """
+        return self._describe_page(
+            "DescribeAddresses", "addresses", "PublicIp", addresses,
+            filters, max_results, next_token,
+        )
+
     def describe_availability_zones(self, names=None):
         zone_names = None
         if names:
@@ -564,8 +931,64 @@ class EC2Client(BaseClient):
         return d.addCallback(self.parser.describe_availability_zones)
 
 
+def _child_texts(element):
+    """
+    Get the text of each child of an element in one pass over them.
+
+    @return: A C{dict} mapping the tag of each child to its text.  As with
+        C{findtext}, a child with no text maps to C{""} and the first of
+        several children with the same tag wins.
+    """
+    texts = {}
+    for child in reversed(element):
+        texts[child.tag] = child.text or ""
+    return texts
+
+
+def _parse_time(text):
+    """
+    Parse the date and time of an ISO 8601 timestamp to the second, like
+    C{datetime.strptime(text[:19], "%Y-%m-%dT%H:%M:%S")} but several times
+    faster.
+    """
+    return datetime(
+        int(text[0:4]), int(text[5:7]), int(text[8:10]),
+        int(text[11:13]), int(text[14:16]), int(text[17:19]),
+    )
+
+
 class Parser(object):
-    """A parser for EC2 responses"""
+    """A parser for EC2 responses.
+
+    The parsers for I{Describe} responses read each item's fields with one
+    pass over its children rather than a search per field, so their cost is
+    linear in the size of the response.
+    """
+
+    _page_parsers = {
+        "instances": "_describe_instances",
+        "security_groups": "_describe_security_groups",
+        "volumes": "_describe_volumes",
+        "snapshots": "_snapshots",
+        "addresses": "_describe_addresses",
+    }
+
+    def page(self, xml_bytes, kind):
+        """Parse one page of the XML returned by a I{Describe} function.
+
+        @param xml_bytes: XML bytes of the response.
+        @param kind: The kind of models in the response: one of
+            C{"instances"}, C{"security_groups"}, C{"volumes"},
+            C{"snapshots"} or C{"addresses"}.
+        @return: A L{Page} of the models parsed by the corresponding
+            C{describe_*} method.
+        """
+        root = XML(xml_bytes)
+        next_token = root.findtext("nextToken") or None
+        return model.Page(
+            items=getattr(self, self._page_parsers[kind])(root),
+            next_token=next_token,
+        )
 
     def instances_set(self, root, reservation):
         """Parse instance data out of an XML payload.
@@ -591,36 +1014,32 @@ class Parser(object):
               ipAddress, stateReason, architecture, rootDeviceName,
               blockDeviceMapping, instanceLifecycle, spotInstanceRequestId.
         """
-        for group_data in instance_data.find("groupSet"):
-            group_id = group_data.findtext("groupId")
-            group_name = group_data.findtext("groupName")
-            reservation.groups.append((group_id, group_name))
-        instance_id = instance_data.findtext("instanceId")
-        instance_state = instance_data.find(
-            "instanceState").findtext("name")
-        private_dns_name = instance_data.findtext("privateDnsName")
-        dns_name = instance_data.findtext("dnsName")
-        private_ip_address = instance_data.findtext("privateIpAddress")
-        ip_address = instance_data.findtext("ipAddress")
-        key_name = instance_data.findtext("keyName")
-        ami_launch_index = instance_data.findtext("amiLaunchIndex")
+        children = {}
+        for child in reversed(instance_data):
+            children[child.tag] = child
+        text = _child_texts(instance_data).get
+        for group_data in children["groupSet"]:
+            group = _child_texts(group_data)
+            reservation.groups.append(
+                (group.get("groupId"), group.get("groupName")),
+            )
         products = []
-        product_codes = instance_data.find("productCodes")
+        product_codes = children.get("productCodes")
         if product_codes is not None:
-            for product_data in instance_data.find("productCodes"):
+            for product_data in product_codes:
                 products.append(product_data.text)
-        instance_type = instance_data.findtext("instanceType")
-        launch_time = instance_data.findtext("launchTime")
-        placement = instance_data.find("placement").findtext(
-            "availabilityZone")
-        kernel_id = instance_data.findtext("kernelId")
-        ramdisk_id = instance_data.findtext("ramdiskId")
-        image_id = instance_data.findtext("imageId")
         instance = model.Instance(
-            instance_id, instance_state, instance_type, image_id,
-            private_dns_name, dns_name, private_ip_address, ip_address,
-            key_name, ami_launch_index, launch_time, placement, products,
-            kernel_id, ramdisk_id, reservation=reservation)
+            text("instanceId"),
+            intern_text(children["instanceState"].findtext("name")),
+            intern_text(text("instanceType")),
+            intern_text(text("imageId")),
+            text("privateDnsName"), text("dnsName"),
+            text("privateIpAddress"), text("ipAddress"), text("keyName"),
+            text("amiLaunchIndex"), text("launchTime"),
+            intern_text(children["placement"].findtext("availabilityZone")),
+            products,
+            intern_text(text("kernelId")), intern_text(text("ramdiskId")),
+            reservation=reservation)
         return instance
 
     def describe_instances(self, xml_bytes):
@@ -643,14 +1062,17 @@ class Parser(object):
 
         @param xml_bytes: raw XML payload from AWS.
         """
-        root = XML(xml_bytes)
+        return self._describe_instances(XML(xml_bytes))
+
+    def _describe_instances(self, root):
         results = []
         # May be a more elegant way to do this:
         for reservation_data in root.find("reservationSet"):
             # Create a reservation object with the parsed data.
+            fields = _child_texts(reservation_data)
             reservation = model.Reservation(
-                reservation_id=reservation_data.findtext("reservationId"),
-                owner_id=reservation_data.findtext("ownerId"))
+                reservation_id=fields.get("reservationId"),
+                owner_id=fields.get("ownerId"))
             # Get the list of instances.
             instances = self.instances_set(
                 reservation_data, reservation)
@@ -721,14 +1143,16 @@ class Parser(object):
             root element.
         @return: A list of L{SecurityGroup} instances.
         """
-        root = XML(xml_bytes)
+        return self._describe_security_groups(XML(xml_bytes))
+
+    def _describe_security_groups(self, root):
         result = []
         for group_info in root.findall("securityGroupInfo/item"):
-            id = group_info.findtext("groupId")
-            name = group_info.findtext("groupName")
-            description = group_info.findtext("groupDescription")
-            owner_id = group_info.findtext("ownerId")
+            fields = _child_texts(group_info)
             allowed_groups = []
+            # The pairs already in allowed_groups, which keeps them in the
+            # order they were first seen.
+            seen_groups = set()
             allowed_ips = []
             ip_permissions = group_info.find("ipPermissions")
             if ip_permissions is None:
@@ -738,9 +1162,19 @@ class Parser(object):
                 # openstack doesn't handle self authorized groups properly
                 # XXX this is an upstream problem and should be addressed there
                 # lp bug #829609
-                ip_protocol = ip_permission.findtext("ipProtocol")
-                from_port = ip_permission.findtext("fromPort")
-                to_port = ip_permission.findtext("toPort")
+                groups = ip_ranges = ()
+                permission = {}
+                for child in reversed(ip_permission):
+                    tag = child.tag
+                    if tag == "groups":
+                        groups = child
+                    elif tag == "ipRanges":
+                        ip_ranges = child
+                    else:
+                        permission[tag] = child.text or ""
+                ip_protocol = intern_text(permission.get("ipProtocol"))
+                from_port = permission.get("fromPort")
+                to_port = permission.get("toPort")
 
                 if from_port:
                     from_port = int(from_port)
@@ -748,23 +1182,26 @@ class Parser(object):
                 if to_port:
                     to_port = int(to_port)
 
-                for groups in ip_permission.findall("groups/item") or ():
-                    user_id = groups.findtext("userId")
-                    group_name = groups.findtext("groupName")
+                for pair in groups:
+                    pair = _child_texts(pair)
+                    user_id = pair.get("userId")
+                    group_name = pair.get("groupName")
                     if user_id and group_name:
-                        if (user_id, group_name) not in allowed_groups:
-                            allowed_groups.append((user_id, group_name))
-                for ip_ranges in ip_permission.findall("ipRanges/item") or ():
-                    cidr_ip = ip_ranges.findtext("cidrIp")
+                        key = (user_id, group_name)
+                        if key not in seen_groups:
+                            seen_groups.add(key)
+                            allowed_groups.append(
+                                model.UserIDGroupPair(user_id, group_name))
+                for ip_range in ip_ranges:
                     allowed_ips.append(
                         model.IPPermission(
-                            ip_protocol, from_port, to_port, cidr_ip))
-
-            allowed_groups = [model.UserIDGroupPair(user_id, group_name)
-                              for user_id, group_name in allowed_groups]
+                            ip_protocol, from_port, to_port,
+                            ip_range.findtext("cidrIp")))
 
             security_group = model.SecurityGroup(
-                id, name, description, owner_id=owner_id,
+                fields.get("groupId"), fields.get("groupName"),
+                fields.get("groupDescription"),
+                owner_id=fields.get("ownerId"),
                 groups=allowed_groups, ips=allowed_ips)
             result.append(security_group)
         return result
@@ -791,31 +1228,31 @@ class Parser(object):
 
         TODO: attachementSetItemResponseType#deleteOnTermination
         """
-        root = XML(xml_bytes)
+        return self._describe_volumes(XML(xml_bytes))
+
+    def _describe_volumes(self, root):
         result = []
         for volume_data in root.find("volumeSet"):
-            volume_id = volume_data.findtext("volumeId")
-            size = int(volume_data.findtext("size"))
-            snapshot_id = volume_data.findtext("snapshotId")
-            availability_zone = volume_data.findtext("availabilityZone")
-            status = volume_data.findtext("status")
-            create_time = volume_data.findtext("createTime")
-            create_time = datetime.strptime(
-                create_time[:19], "%Y-%m-%dT%H:%M:%S")
+            attachments = ()
+            fields = {}
+            for child in reversed(volume_data):
+                if child.tag == "attachmentSet":
+                    attachments = child
+                else:
+                    fields[child.tag] = child.text or ""
             volume = model.Volume(
-                volume_id, size, status, create_time, availability_zone,
-                snapshot_id)
+                fields.get("volumeId"), int(fields.get("size")),
+                intern_text(fields.get("status")),
+                _parse_time(fields.get("createTime")),
+                intern_text(fields.get("availabilityZone")),
+                fields.get("snapshotId"))
             result.append(volume)
-            for attachment_data in volume_data.find("attachmentSet"):
-                instance_id = attachment_data.findtext("instanceId")
-                device = attachment_data.findtext("device")
-                status = attachment_data.findtext("status")
-                attach_time = attachment_data.findtext("attachTime")
-                attach_time = datetime.strptime(
-                    attach_time[:19], "%Y-%m-%dT%H:%M:%S")
-                attachment = model.Attachment(
-                    instance_id, device, status, attach_time)
-                volume.attachments.append(attachment)
+            for attachment_data in attachments:
+                attachment = _child_texts(attachment_data)
+                volume.attachments.append(model.Attachment(
+                    attachment.get("instanceId"), attachment.get("device"),
+                    intern_text(attachment.get("status")),
+                    _parse_time(attachment.get("attachTime"))))
         return result
 
     def create_volume(self, xml_bytes):
@@ -849,20 +1286,18 @@ class Parser(object):
         TODO: ownersSet, restorableBySet, ownerId, volumeSize, description,
               ownerAlias.
         """
-        root = XML(xml_bytes)
+        return self._snapshots(XML(xml_bytes))
+
+    def _snapshots(self, root):
         result = []
         for snapshot_data in root.find("snapshotSet"):
-            snapshot_id = snapshot_data.findtext("snapshotId")
-            volume_id = snapshot_data.findtext("volumeId")
-            status = snapshot_data.findtext("status")
-            start_time = snapshot_data.findtext("startTime")
-            start_time = datetime.strptime(
-                start_time[:19], "%Y-%m-%dT%H:%M:%S")
-            progress = snapshot_data.findtext("progress")[:-1]
-            progress = float(progress or "0") / 100.
-            snapshot = model.Snapshot(
-                snapshot_id, volume_id, status, start_time, progress)
-            result.append(snapshot)
+            fields = _child_texts(snapshot_data)
+            progress = fields.get("progress")[:-1]
+            result.append(model.Snapshot(
+                fields.get("snapshotId"), fields.get("volumeId"),
+                intern_text(fields.get("status")),
+                _parse_time(fields.get("startTime")),
+                float(progress or "0") / 100.))
         return result
 
     def create_snapshot(self, xml_bytes):
@@ -902,6 +1337,16 @@ class Parser(object):
             attach_time[:19], "%Y-%m-%dT%H:%M:%S")
         return {"status": status, "attach_time": attach_time}
 
+    def detach_volume(self, xml_bytes):
+        """Parse the XML returned by the C{DetachVolume} function.
+
+        @param xml_bytes: XML bytes with a C{DetachVolumeResponse} root
+            element.
+        @return: a C{dict} with status and attach_time keys, like
+            L{attach_volume}.
+        """
+        return self.attach_volume(xml_bytes)
+
     def describe_keypairs(self, xml_bytes):
         """Parse the XML returned by the C{DescribeKeyPairs} function.
 
@@ -960,12 +1405,13 @@ class Parser(object):
             element.
         @return: a C{list} of L{tuple} of (publicIp, instancId).
         """
+        return self._describe_addresses(XML(xml_bytes))
+
+    def _describe_addresses(self, root):
         results = []
-        root = XML(xml_bytes)
         for address_data in root.find("addressesSet"):
-            address = address_data.findtext("publicIp")
-            instance_id = address_data.findtext("instanceId")
-            results.append((address, instance_id))
+            fields = _child_texts(address_data)
+            results.append((fields.get("publicIp"), fields.get("instanceId")))
         return results
 
     def describe_availability_zones(self, xml_bytes):
@@ -986,8 +1432,121 @@ class Parser(object):
         return results
 
 
+def _endpoint_region(endpoint):
+    """
+    Determine the region of an EC2 endpoint from its host name.
+
+    Both I{ec2.REGION.amazonaws.com} and I{REGION.ec2.amazonaws.com} forms
+    are recognized.  Any other host is assumed to be in I{us-east-1}.
+
+    @type endpoint: L{AWSServiceEndpoint}
+
+    @rtype: L{bytes}
+    """
+    labels = endpoint.get_host().lower().split(".")
+    if len(labels) == 4 and labels[2:] == ["amazonaws", "com"]:
+        if labels[0] == "ec2":
+            return labels[1]
+        if labels[1] == "ec2":
+            return labels[0]
+    return REGION_US_EAST_1
+
+
+class _EC2Query(object):
+    """
+    A query to EC2, described by L{RequestDetails} and signed with AWS
+    Signature Version 4.
+
+    This takes the same arguments as L{Query} so it can be used as the
+    C{query_factory} of L{EC2Client}.
+    """
+
+    timeout = 30
+
+    def __init__(self, action, creds, endpoint, other_params=None,
+                 api_version=None, agent=None, reactor=None):
+        if api_version is None:
+            api_version = version.ec2_api
+        self.action = action
+        self.creds = creds
+        self.endpoint = endpoint
+        self.params = {"Version": api_version, "Action": action}
+        if other_params:
+            self.params.update(other_params)
+        self.agent = agent
+        self.reactor = reactor
+
+    def _encoded_params(self):
+        def text(value):
+            if isinstance(value, bytes):
+                return value.decode("utf-8")
+            return unicode(value)
+        return sorted(
+            (text(key), text(value)) for (key, value) in self.params.items()
+        )
+
+    def details(self):
+        """
+        @return: The L{RequestDetails} describing this query.
+        """
+        endpoint = self.endpoint
+        params = self._encoded_params()
+        headers = Headers()
+        if endpoint.method == "POST":
+            body = urlencode(list(
+                (key.encode("utf-8"), value.encode("utf-8"))
+                for (key, value) in params
+            ))
+            headers.setRawHeaders(
+                b"content-type", [b"application/x-www-form-urlencoded"],
+            )
+            params = []
+        else:
+            body = b""
+        return RequestDetails(
+            region=_endpoint_region(endpoint),
+            service=b"ec2",
+            method=endpoint.method,
+            url_context=url_context(
+                scheme=endpoint.scheme.decode("ascii"),
+                host=endpoint.get_host().decode("ascii"),
+                port=endpoint.port,
+                path=list(
+                    segment.decode("utf-8")
+                    for segment in endpoint.path.split("/")[1:]
+                ),
+                query=params,
+            ),
+            headers=headers,
+            body_producer=FileBodyProducer(BytesIO(body)) if body else None,
+            content_sha256=sha256(body).hexdigest().decode("ascii"),
+        )
+
+    def submit(self):
+        """
+        Submit this query.
+
+        @return: A L{Deferred} that fires with the response body.
+        """
+        q = query(
+            credentials=self.creds, details=self.details(),
+            reactor=self.reactor,
+        )
+        d = q.submit(self.agent)
+        if self.timeout:
+            d.addTimeout(self.timeout, self.reactor)
+        d.addErrback(ec2_error_wrapper)
+        d.addCallback(itemgetter(1))
+        return d
+
+
 class Query(BaseQuery):
-    """A query that may be submitted to EC2."""
+    """A query that may be submitted to EC2.
+
+    This signs requests with AWS Signature Version 2 and is kept for
+    compatibility.  L{EC2Client} uses Signature Version 4 unless it is given
+    this as its C{query_factory}.
+    """
 
     timeout = 30
 
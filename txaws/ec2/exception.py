@@ -1,6 +1,8 @@
 # Copyright (c) 2009 Canonical Ltd <duncan.mcgreggor@canonical.com>
 # Licenced under the txaws licence available at /LICENSE in the txaws source.
 
+import re
+
 from txaws.exception import AWSError
 
 
@@ -15,3 +17,72 @@ class EC2Error(AWSError):
                 data = self._node_to_dict(error)
                 if data:
                     self.errors.append(data)
+
+
+# EC2 error codes which mean a request may succeed if it is made again later.
+TRANSIENT_CODES = frozenset([
+    "RequestLimitExceeded", "Unavailable", "InternalError",
+    "ServiceUnavailable", "InsufficientInstanceCapacity",
+])
+
+
+def _codes(reason):
+    if not reason.check(EC2Error):
+        return []
+    return list(error.get("Code", "") for error in reason.value.errors)
+
+
+def transient(reason):
+    """
+    Determine whether a failed request may succeed if it is made again.
+
+    Errors reported by EC2 are transient only if they have one of the codes
+    in L{TRANSIENT_CODES}.  Any other error, such as a lost connection or a
+    timeout, is assumed to be transient.
+
+    @type reason: L{Failure}
+    """
+    if not reason.check(EC2Error):
+        return True
+    return any(code in TRANSIENT_CODES for code in _codes(reason))
+
+
+def not_found(reason):
+    """
+    Determine whether a request failed because a resource it named does not
+    exist, as reported by codes such as I{InvalidInstanceID.NotFound}.
+
+    @type reason: L{Failure}
+    """
+    return any(code.endswith(".NotFound") for code in _codes(reason))
+
+
+def bad_id(reason):
+    """
+    Determine whether a request failed because of some of the resource ids
+    it named, which either do not exist or are malformed.
+
+    @type reason: L{Failure}
+    """
+    return any(
+        code.endswith((".NotFound", ".Malformed")) for code in _codes(reason)
+    )
+
+
+def named_ids(reason, ids):
+    """
+    Find which of the ids in a failed request the messages of its
+    L{EC2Error} name, such as I{i-1} in I{The instance ID 'i-1' does not
+    exist}.
+
+    @type reason: L{Failure}
+    @param ids: The ids the request was made with.
+
+    @return: A L{set} of those of C{ids} which are named.
+    """
+    if not reason.check(EC2Error):
+        return set()
+    words = set()
+    for error in reason.value.errors:
+        words.update(re.findall(r"[\w-]+", error.get("Message", "")))
+    return set(ids) & words
@@ -49,6 +49,13 @@ class Instance(object):
     @attrib kernel_id: Optional. Kernel associated with this instance.
     @attrib ramdisk_id: Optional. RAM disk associated with this instance.
     """
+    __slots__ = (
+        "instance_id", "instance_state", "instance_type", "image_id",
+        "private_dns_name", "dns_name", "private_ip_address", "ip_address",
+        "key_name", "ami_launch_index", "launch_time", "placement",
+        "product_codes", "kernel_id", "ramdisk_id", "reservation",
+    )
+
     def __init__(self, instance_id, instance_state, instance_type="",
                  image_id="", private_dns_name="", dns_name="",
                  private_ip_address="", ip_address="", key_name="",
@@ -181,3 +188,17 @@ class AvailabilityZone(object):
     def __init__(self, name, state):
         self.name = name
         self.state = state
+
+
+@attr.s(frozen=True)
+class Page(object):
+    """One page of the results of a I{Describe} call.
+
+    @ivar items: The models described in this page.
+    @type items: L{list}
+
+    @ivar next_token: The token with which to request the next page, or
+        C{None} if this is the last page.
+    """
+    items = attr.ib()
+    next_token = attr.ib(default=None)
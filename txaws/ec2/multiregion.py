@@ -0,0 +1,176 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Concurrent EC2 requests across regions.
+
+Every L{EC2Client} talks to one endpoint, so an inventory of several regions
+made with them one after another takes the sum of their latencies.  A
+L{MultiRegionEC2Client} makes the same call in each region at once, over one
+pool of persistent connections, and reports each region's result as soon as
+it arrives.
+"""
+
+__all__ = [
+    "MultiRegionEC2Client", "RegionResult",
+]
+
+import attr
+
+from twisted.internet.defer import DeferredList, maybeDeferred
+from twisted.web.client import HTTPConnectionPool
+
+from txaws.client.base import _get_agent
+from txaws.ec2.client import EC2Client, _endpoint_region
+from txaws.regions import EC2_ALL_REGIONS
+from txaws.service import AWSServiceEndpoint
+
+
+@attr.s(frozen=True)
+class RegionResult(object):
+    """
+    The outcome of a call in one region.
+
+    @ivar region: The name of the region, such as C{"us-west-2"}.
+    @ivar value: The result of the call, or C{None} if it failed.
+    @ivar failure: The L{Failure} of the call, or C{None} if it succeeded.
+    """
+    region = attr.ib()
+    value = attr.ib(default=None)
+    failure = attr.ib(default=None)
+
+
+def _region_endpoints(regions):
+    """
+    Map region names to EC2 endpoint URIs.
+
+    @param regions: An iterable of region names, of C{dict}s like those in
+        L{EC2_ALL_REGIONS}, or C{None} for all of those.
+    """
+    if regions is None:
+        regions = EC2_ALL_REGIONS
+    endpoints = {}
+    for region in regions:
+        if isinstance(region, dict):
+            uri = region["endpoint"]
+            region = _endpoint_region(AWSServiceEndpoint(uri=uri))
+        else:
+            uri = "https://ec2.%s.amazonaws.com/" % (region,)
+        endpoints[region] = uri
+    return endpoints
+
+
+class MultiRegionEC2Client(object):
+    """
+    Make the same EC2 call in several regions concurrently.
+
+    Each call fires with a L{list} of L{RegionResult} in the order the regions
+    completed.  A region which fails, or does not respond within C{timeout}
+    seconds, is reported with its failure rather than failing the whole
+    call.  The per-region L{EC2Client}s share one connection pool.
+
+    @ivar clients: A C{dict} mapping region names to the L{EC2Client} for
+        each.
+    """
+    def __init__(self, creds=None, regions=None, timeout=30.0, method="GET",
+                 reactor=None):
+        """
+        @param creds: The L{AWSCredentials} to use in every region.
+        @param regions: The regions to call, as an iterable of region names
+            such as C{"eu-west-1"} or of C{dict}s like those in
+            L{EC2_ALL_REGIONS}.  By default, all of L{EC2_ALL_REGIONS}.
+        @param timeout: The number of seconds to wait for each region.
+        @param method: The HTTP method of the requests.
+        @param reactor: The reactor to use, or C{None} for the global reactor.
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+        self.timeout = timeout
+        self._pool = HTTPConnectionPool(reactor)
+        self.clients = {}
+        for region, uri in _region_endpoints(regions).iteritems():
+            endpoint = AWSServiceEndpoint(uri=uri, method=method)
+            agent = _get_agent(
+                endpoint.scheme, endpoint.get_host(), reactor,
+                pool=self._pool,
+            )
+            self.clients[region] = EC2Client(
+                creds=creds, endpoint=endpoint, agent=agent, reactor=reactor,
+            )
+
+    def call(self, method, args=(), kwargs=None, regions=None,
+             result_received=None):
+        """
+        Call an L{EC2Client} method in several regions at once.
+
+        @param method: The name of the method, such as
+            C{"describe_instances"}.
+        @param args: The positional arguments for the method.
+        @param kwargs: The keyword arguments for the method.
+        @param regions: The names of the regions to call it in, or C{None} for
+            all of this client's regions.
+        @param result_received: A one-argument callable which is called with
+            the L{RegionResult} of each region as soon as it completes.
+
+        @return: A L{Deferred} that fires with a L{list} of L{RegionResult}
+            once every region has completed.
+        """
+        if kwargs is None:
+            kwargs = {}
+        if regions is None:
+            regions = sorted(self.clients)
+        results = []
+
+        def completed(result):
+            results.append(result)
+            if result_received is not None:
+                result_received(result)
+
+        calls = []
+        for region in regions:
+            client = self.clients[region]
+            d = maybeDeferred(getattr(client, method), *args, **kwargs)
+            d.addTimeout(self.timeout, self._reactor)
+            d.addCallbacks(
+                lambda value, region=region: RegionResult(region, value=value),
+                lambda reason, region=region: RegionResult(
+                    region, failure=reason,
+                ),
+            )
+            d.addCallback(completed)
+            calls.append(d)
+        d = DeferredList(calls, consumeErrors=True)
+        d.addCallback(lambda ignored: results)
+        return d
+
+    def describe_instances(self, *instance_ids, **kwargs):
+        """
+        Describe instances in several regions at once.
+
+        @param kwargs: C{regions} and C{result_received}, as for L{call}.
+        """
+        return self.call("describe_instances", instance_ids, **kwargs)
+
+    def describe_volumes(self, *volume_ids, **kwargs):
+        """
+        Describe volumes in several regions at once.
+
+        @param kwargs: C{regions} and C{result_received}, as for L{call}.
+        """
+        return self.call("describe_volumes", volume_ids, **kwargs)
+
+    def describe_snapshots(self, *snapshot_ids, **kwargs):
+        """
+        Describe snapshots in several regions at once.
+
+        @param kwargs: C{regions} and C{result_received}, as for L{call}.
+        """
+        return self.call("describe_snapshots", snapshot_ids, **kwargs)
+
+    def close(self):
+        """
+        Close the pooled connections.
+
+        @return: A L{Deferred} that fires once they are closed.
+        """
+        return self._pool.closeCachedConnections()
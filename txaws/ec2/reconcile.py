@@ -0,0 +1,122 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Bringing the IP permissions of a security group to a desired state.
+
+L{reconcile_security_group} describes a group, works out which of its IP
+permissions to authorize and which to revoke to match the desired ones and
+makes those changes with at most one I{AuthorizeSecurityGroupIngress} and one
+I{RevokeSecurityGroupIngress} request, however many permissions change.
+"""
+
+__all__ = [
+    "PermissionChanges", "diff_ip_permissions", "reconcile_security_group",
+]
+
+import attr
+
+from twisted.internet.defer import succeed
+
+from txaws.ec2.model import IPPermission
+
+
+@attr.s(frozen=True)
+class PermissionChanges(object):
+    """
+    The changes which bring a group's IP permissions to a desired state.
+
+    @ivar authorize: The L{IPPermission}s to authorize, in a stable order.
+    @type authorize: L{list}
+    @ivar revoke: The L{IPPermission}s to revoke, in a stable order.
+    @type revoke: L{list}
+    """
+    authorize = attr.ib()
+    revoke = attr.ib()
+
+    def __nonzero__(self):
+        return bool(self.authorize or self.revoke)
+
+
+def _port(port):
+    if port in (None, ""):
+        return None
+    return int(port)
+
+
+def _key(permission):
+    """
+    Make a hashable key identifying an L{IPPermission}, so that permissions
+    given with ports as strings and those parsed with them as integers
+    compare equal.
+    """
+    return (
+        permission.ip_protocol, _port(permission.from_port),
+        _port(permission.to_port), permission.cidr_ip,
+    )
+
+
+def diff_ip_permissions(current, desired):
+    """
+    Work out how to get from one set of IP permissions to another.
+
+    @param current: An iterable of the L{IPPermission}s a group has.
+    @param desired: An iterable of the L{IPPermission}s it should have.
+
+    @rtype: L{PermissionChanges}
+    """
+    current_keys = set(_key(permission) for permission in current)
+    desired_keys = set(_key(permission) for permission in desired)
+    return PermissionChanges(
+        authorize=list(
+            IPPermission(*key) for key in sorted(desired_keys - current_keys)
+        ),
+        revoke=list(
+            IPPermission(*key) for key in sorted(current_keys - desired_keys)
+        ),
+    )
+
+
+def reconcile_security_group(client, group_name, desired, revoke=True):
+    """
+    Make the IP permissions of a security group match the desired ones.
+
+    Missing permissions are authorized before extra ones are revoked, so
+    traffic which is allowed both before and after is never interrupted.
+    Permissions granted to other security groups are left alone.
+
+    @param client: An L{EC2Client}.
+    @param group_name: The name of the group.
+    @param desired: An iterable of the L{IPPermission}s the group should
+        have.
+    @param revoke: If C{False}, only authorize missing permissions and leave
+        extra ones in place.
+
+    @return: A L{Deferred} that fires with the L{PermissionChanges} made.
+    """
+    desired = list(desired)
+
+    def described(groups):
+        [group] = groups
+        changes = diff_ip_permissions(group.allowed_ips, desired)
+        if not revoke:
+            changes = attr.assoc(changes, revoke=[])
+        d = succeed(None)
+        if changes.authorize:
+            d.addCallback(
+                lambda ignored: client.authorize_ip_permissions(
+                    changes.authorize, group_id=group.id,
+                    group_name=group_name,
+                )
+            )
+        if changes.revoke:
+            d.addCallback(
+                lambda ignored: client.revoke_ip_permissions(
+                    changes.revoke, group_id=group.id, group_name=group_name,
+                )
+            )
+        d.addCallback(lambda ignored: changes)
+        return d
+
+    d = client.describe_security_groups(group_name)
+    d.addCallback(described)
+    return d
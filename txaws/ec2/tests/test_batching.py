@@ -0,0 +1,138 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.ec2.batching}.
+"""
+
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from txaws.ec2.batching import DescribeBatcher
+from txaws.ec2.exception import EC2Error
+from txaws.ec2.model import Instance, Volume
+from txaws.testing import payload
+from txaws.testing.ec2 import RecordingDescribeClient
+
+
+def _ec2_error(code, message=None):
+    text = payload.sample_ec2_error_message
+    if message is not None:
+        text = text.replace("Message for Error.Code", message)
+    return EC2Error(text.replace("Error.Code", code), 400)
+
+
+class DescribeBatcherTestCase(TestCase):
+    """
+    Tests for L{DescribeBatcher}.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.client = RecordingDescribeClient()
+        self.batcher = DescribeBatcher(
+            self.client, window=0.01, max_batch_size=3, clock=self.clock,
+        )
+
+    def test_window(self):
+        """
+        Lookups made within the window are described in one request and each
+        fires with the model for its id.  Repeated ids are only asked for
+        once.
+        """
+        a = self.batcher.describe_instance("i-a")
+        b = self.batcher.describe_instance("i-b")
+        a2 = self.batcher.describe_instance("i-a")
+        self.assertEqual([], self.client.calls)
+        self.clock.advance(0.01)
+
+        [(kind, ids, d)] = self.client.calls
+        self.assertEqual(("instances", ["i-a", "i-b"]), (kind, ids))
+        instances = [Instance("i-b", "running"), Instance("i-a", "pending")]
+        d.callback(instances)
+        self.assertIdentical(instances[1], self.successResultOf(a))
+        self.assertIdentical(instances[1], self.successResultOf(a2))
+        self.assertIdentical(instances[0], self.successResultOf(b))
+        self.assertEqual(1, self.batcher.requests)
+
+    def test_max_batch_size(self):
+        """
+        A batch is sent as soon as it has C{max_batch_size} distinct ids.
+        """
+        for i in range(4):
+            self.batcher.describe_volume("vol-%d" % (i,))
+        [(kind, ids, _)] = self.client.calls
+        self.assertEqual(("volumes", ["vol-0", "vol-1", "vol-2"]), (kind, ids))
+        self.clock.advance(0.01)
+        self.assertEqual(["vol-3"], self.client.calls[1][1])
+
+    def test_missing(self):
+        """
+        A lookup for an id which is not in the response fires with C{None}.
+        """
+        d = self.batcher.describe_snapshot("snap-a")
+        self.batcher.flush()
+        [(_, _, result)] = self.client.calls
+        result.callback([])
+        self.assertIdentical(None, self.successResultOf(d))
+
+    def test_bad_ids(self):
+        """
+        If a batched request fails because of ids which do not exist, only
+        their lookups see the error and the other ids are described again
+        in one request.
+        """
+        a = self.batcher.describe_volume("vol-a")
+        b = self.batcher.describe_volume("vol-b")
+        c = self.batcher.describe_volume("vol-c")
+        self.batcher.flush()
+        [(_, _, batch)] = self.client.calls
+        batch.errback(_ec2_error(
+            "InvalidVolume.NotFound", "The volume 'vol-b' does not exist.",
+        ))
+        self.failureResultOf(b, EC2Error)
+
+        [(_, ids, retry)] = self.client.calls[1:]
+        self.assertEqual(["vol-a", "vol-c"], ids)
+        volume = Volume("vol-a", 1, "available", None, "us-east-1a", None)
+        retry.callback([volume])
+        self.assertIdentical(volume, self.successResultOf(a))
+        self.assertIdentical(None, self.successResultOf(c))
+
+    def test_unnamed_bad_ids(self):
+        """
+        If EC2 does not name the ids at fault, a failed batch is described
+        again in halves.
+        """
+        for id in ["vol-a", "vol-b", "vol-c"]:
+            self.batcher.describe_volume(id)
+        self.batcher.flush()
+        self.client.calls[0][2].errback(_ec2_error("InvalidVolume.NotFound"))
+        self.assertEqual(
+            [["vol-a"], ["vol-b", "vol-c"]],
+            list(ids for _, ids, _ in self.client.calls[1:]),
+        )
+
+    def test_other_error(self):
+        """
+        If a batched request fails with an error which does not concern its
+        ids, such as throttling, every lookup in it gets the error and the
+        batch is not split.
+        """
+        a = self.batcher.describe_volume("vol-a")
+        b = self.batcher.describe_volume("vol-b")
+        self.batcher.flush()
+        self.client.calls[0][2].errback(_ec2_error("RequestLimitExceeded"))
+        self.failureResultOf(a, EC2Error)
+        self.failureResultOf(b, EC2Error)
+        self.assertEqual(1, len(self.client.calls))
+
+    def test_kinds_batched_separately(self):
+        """
+        Lookups of different kinds of resource are batched separately.
+        """
+        self.batcher.describe_instance("i-a")
+        self.batcher.describe_snapshot("snap-a")
+        self.clock.advance(0.01)
+        self.assertEqual(
+            [("instances", ["i-a"]), ("snapshots", ["snap-a"])],
+            sorted((kind, ids) for (kind, ids, _) in self.client.calls),
+        )
@@ -0,0 +1,218 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.ec2.bulk}.
+"""
+
+from twisted.internet.defer import Deferred, TimeoutError, succeed, fail
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from txaws.ec2.bulk import BulkExecutor
+from txaws.ec2.exception import EC2Error
+from txaws.ec2.model import Instance
+from txaws.testing import payload
+
+
+def _ec2_error(code):
+    return EC2Error(
+        payload.sample_ec2_error_message.replace("Error.Code", code), 400,
+    )
+
+
+class _Client(object):
+    """
+    Record requests and let the test decide their results.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def terminate_instances(self, *ids):
+        d = Deferred()
+        self.calls.append((ids, d))
+        return d
+
+    def run_instances(self, image_id, min_count, max_count, **kwargs):
+        d = Deferred()
+        self.calls.append(((image_id, min_count, max_count, kwargs), d))
+        return d
+
+
+class _TerminatingClient(object):
+    """
+    Terminate any instance except those which do not exist.
+    """
+    def __init__(self, missing):
+        self.missing = missing
+        self.calls = []
+
+    def terminate_instances(self, *ids):
+        self.calls.append(ids)
+        if self.missing.intersection(ids):
+            return fail(_ec2_error("InvalidInstanceID.NotFound"))
+        return succeed(list((id, "running", "shutting-down") for id in ids))
+
+
+class BulkExecutorTestCase(TestCase):
+    """
+    Tests for L{BulkExecutor}.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.client = _Client()
+
+    def executor(self, **kwargs):
+        kwargs.setdefault("clock", self.clock)
+        return BulkExecutor(self.client, **kwargs)
+
+    def test_terminate_chunks(self):
+        """
+        Ids are sent in requests of at most C{max_ids}, no more than
+        C{concurrency} at once, and the results of all of them are combined.
+        """
+        executor = self.executor(max_ids=2, concurrency=2)
+        d = executor.terminate_instances(["i-1", "i-2", "i-3", "i-4", "i-5"])
+        self.assertEqual(
+            [("i-1", "i-2"), ("i-3", "i-4")],
+            list(ids for ids, _ in self.client.calls),
+        )
+        self.client.calls[1][1].callback([("i-3", "running", "shutting-down")])
+        self.assertEqual(("i-5",), self.client.calls[2][0])
+        self.client.calls[0][1].callback([("i-1", "running", "shutting-down")])
+        self.client.calls[2][1].callback([("i-5", "running", "shutting-down")])
+        result = self.successResultOf(d)
+        self.assertEqual(
+            ["i-3", "i-1", "i-5"], list(id for id, _, _ in result.succeeded),
+        )
+        self.assertEqual([], result.failed)
+
+    def test_rate(self):
+        """
+        No more than C{rate} requests are started per second.
+        """
+        executor = self.executor(max_ids=1, concurrency=10, rate=2)
+        executor.terminate_instances(["i-1", "i-2", "i-3"])
+        self.assertEqual(1, len(self.client.calls))
+        self.clock.advance(0.5)
+        self.assertEqual(2, len(self.client.calls))
+        self.clock.advance(0.5)
+        self.assertEqual(3, len(self.client.calls))
+
+    def test_retry_transient(self):
+        """
+        A request which fails with a transient error is retried after a
+        delay which doubles each time, up to C{retries} times, and then
+        reported as failed.
+        """
+        executor = self.executor(retries=2, retry_delay=1)
+        d = executor.terminate_instances(["i-1", "i-2"])
+        self.client.calls[0][1].errback(_ec2_error("RequestLimitExceeded"))
+        self.clock.advance(1)
+        self.assertEqual(2, len(self.client.calls))
+        self.client.calls[1][1].errback(_ec2_error("RequestLimitExceeded"))
+        self.clock.advance(1)
+        self.assertEqual(2, len(self.client.calls))
+        self.clock.advance(1)
+        self.client.calls[2][1].errback(_ec2_error("RequestLimitExceeded"))
+        result = self.successResultOf(d)
+        self.assertEqual(
+            ["i-1", "i-2"], list(id for id, _ in result.failed),
+        )
+        self.assertTrue(result.failed[0][1].check(EC2Error))
+
+    def test_split_on_error(self):
+        """
+        When a termination request fails with an error which is not
+        transient, its ids are split and retried until the failing ids are
+        isolated.
+        """
+        self.client = _TerminatingClient(set(["i-3"]))
+        executor = self.executor()
+        result = self.successResultOf(executor.terminate_instances(
+            ["i-1", "i-2", "i-3", "i-4"],
+        ))
+        self.assertEqual(
+            ["i-1", "i-2", "i-4"], list(id for id, _, _ in result.succeeded),
+        )
+        [(id, reason)] = result.failed
+        self.assertEqual("i-3", id)
+        self.assertTrue(reason.check(EC2Error))
+        self.assertEqual(
+            [("i-1", "i-2", "i-3", "i-4"), ("i-1", "i-2"), ("i-3", "i-4"),
+             ("i-3",), ("i-4",)],
+            self.client.calls,
+        )
+
+    def test_run_instances(self):
+        """
+        Launches are split into requests for at most C{max_launch} instances
+        each, with the other arguments passed through, and the instances
+        launched are combined.
+        """
+        executor = self.executor(max_launch=2)
+        d = executor.run_instances(
+            "ami-1", 3, security_groups=["default"],
+        )
+        tokens = list(
+            args[3].pop("client_token") for args, _ in self.client.calls
+        )
+        self.assertEqual(
+            [("ami-1", 2, 2, {"security_groups": ["default"]}),
+             ("ami-1", 1, 1, {"security_groups": ["default"]})],
+            list(args for args, _ in self.client.calls),
+        )
+        self.assertNotEqual(tokens[0], tokens[1])
+        launched = [Instance("i-1", "pending"), Instance("i-2", "pending")]
+        self.client.calls[0][1].callback(launched)
+        self.client.calls[1][1].errback(_ec2_error("InvalidAMIID.NotFound"))
+        result = self.successResultOf(d)
+        self.assertEqual(launched, result.succeeded)
+        self.assertEqual([1], list(count for count, _ in result.failed))
+
+    def test_retry_run_instances_same_token(self):
+        """
+        A launch request which is retried is made again with the same client
+        token, so that EC2 does not launch its instances twice if the first
+        attempt succeeded.
+        """
+        executor = self.executor(retry_delay=1)
+        d = executor.run_instances("ami-1", 1, security_groups=["default"])
+        self.client.calls[0][1].errback(TimeoutError())
+        self.clock.advance(1)
+        self.assertEqual(2, len(self.client.calls))
+        [first, second] = list(args[3] for args, _ in self.client.calls)
+        self.assertEqual(first, second)
+        self.assertIsInstance(first["client_token"], unicode)
+        launched = [Instance("i-1", "pending")]
+        self.client.calls[1][1].callback(launched)
+        self.assertEqual(launched, self.successResultOf(d).succeeded)
+
+    def test_no_split_on_other_errors(self):
+        """
+        A termination request which fails with an error that is not about
+        its instance ids, such as one for missing permissions, is reported
+        as failed for all of its ids without being split.
+        """
+        executor = self.executor()
+        d = executor.terminate_instances(["i-1", "i-2"])
+        self.client.calls[0][1].errback(_ec2_error("UnauthorizedOperation"))
+        result = self.successResultOf(d)
+        self.assertEqual(
+            ["i-1", "i-2"], list(id for id, _ in result.failed),
+        )
+        self.assertEqual(1, len(self.client.calls))
+
+    def test_split_on_malformed(self):
+        """
+        A termination request which fails because one of its ids is
+        malformed is split like one for an id which does not exist.
+        """
+        executor = self.executor()
+        executor.terminate_instances(["i-1", "bad"])
+        self.client.calls[0][1].errback(
+            _ec2_error("InvalidInstanceID.Malformed"),
+        )
+        self.assertEqual(
+            [("i-1",), ("bad",)],
+            list(ids for ids, _ in self.client.calls[1:]),
+        )
@@ -0,0 +1,350 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.ec2.cache}.
+"""
+
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from twisted.trial.unittest import TestCase
+
+from txaws.ec2.cache import CachingEC2Client, CacheStats
+from txaws.ec2.exception import EC2Error
+from txaws.ec2.model import Instance, Volume
+from txaws.testing import payload
+
+
+def _not_found_error(code="InvalidInstanceID.NotFound"):
+    return EC2Error(
+        payload.sample_ec2_error_message.replace("Error.Code", code), 400,
+    )
+
+
+class _Client(object):
+    """
+    Record calls and let the test decide their results.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def _call(self, name, *args):
+        d = Deferred()
+        self.calls.append((name, args, d))
+        return d
+
+    def describe_instances(self, *ids):
+        return self._call("describe_instances", *ids)
+
+    def describe_volumes(self, *ids):
+        return self._call("describe_volumes", *ids)
+
+    def run_instances(self, image_id, min_count, max_count):
+        return self._call("run_instances", image_id, min_count, max_count)
+
+    def terminate_instances(self, *ids):
+        return self._call("terminate_instances", *ids)
+
+    def create_volume(self, availability_zone, size=None, snapshot_id=None):
+        return self._call("create_volume", availability_zone, size)
+
+    def delete_volume(self, volume_id):
+        return self._call("delete_volume", volume_id)
+
+    def attach_volume(self, volume_id, instance_id, device):
+        return self._call("attach_volume", volume_id, instance_id, device)
+
+    def detach_volume(self, volume_id, instance_id=None, device=None,
+                      force=False):
+        return self._call("detach_volume", volume_id, instance_id)
+
+    def associate_address(self, instance_id, address):
+        return self._call("associate_address", instance_id, address)
+
+    def disassociate_address(self, address):
+        return self._call("disassociate_address", address)
+
+    def describe_keypairs(self, *names):
+        return self._call("describe_keypairs", *names)
+
+
+class CachingEC2ClientTestCase(TestCase):
+    """
+    Tests for L{CachingEC2Client}.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.client = _Client()
+        self.cache = CachingEC2Client(
+            self.client, ttl=30, negative_ttl=5, clock=self.clock,
+        )
+
+    def describe(self, *ids):
+        """
+        Describe instances through the cache, answering any request it makes
+        with instances in the running state.
+        """
+        calls = len(self.client.calls)
+        d = self.cache.describe_instances(*ids)
+        for name, args, request in self.client.calls[calls:]:
+            request.callback(list(
+                Instance(instance_id, "running") for instance_id in args
+            ))
+        return self.successResultOf(d)
+
+    def test_hit(self):
+        """
+        An instance described within C{ttl} seconds is not requested again.
+        """
+        [first] = self.describe("i-a")
+        self.clock.advance(29)
+        [second] = self.describe("i-a")
+        self.assertIdentical(first, second)
+        self.assertEqual(1, len(self.client.calls))
+        self.assertEqual(
+            CacheStats(hits=1, misses=1), self.cache.stats,
+        )
+
+    def test_expired(self):
+        """
+        An instance described C{ttl} seconds ago or longer is requested
+        again.
+        """
+        self.describe("i-a")
+        self.clock.advance(30)
+        self.describe("i-a")
+        self.assertEqual(2, len(self.client.calls))
+
+    def test_partial_hit(self):
+        """
+        Only the ids which are not cached are requested, and the result lists
+        the models in the order the ids were given.
+        """
+        self.describe("i-a")
+        instances = self.describe("i-b", "i-a", "i-c")
+        self.assertEqual(
+            ["i-b", "i-a", "i-c"],
+            list(instance.instance_id for instance in instances),
+        )
+        self.assertEqual(("i-b", "i-c"), self.client.calls[1][1])
+        self.assertEqual(CacheStats(hits=1, misses=3), self.cache.stats)
+
+    def test_describe_all(self):
+        """
+        A description of all instances is cached as a whole and also caches
+        each instance in it.
+        """
+        d = self.cache.describe_instances()
+        [(_, args, request)] = self.client.calls
+        self.assertEqual((), args)
+        request.callback([Instance("i-a", "running")])
+        self.successResultOf(d)
+        self.assertEqual(1, len(self.describe()))
+        self.describe("i-a")
+        self.assertEqual(1, len(self.client.calls))
+        self.assertEqual(CacheStats(hits=2, misses=1), self.cache.stats)
+
+    def test_volumes(self):
+        """
+        Volumes are cached by id like instances.
+        """
+        d = self.cache.describe_volumes("vol-a")
+        [(name, args, request)] = self.client.calls
+        volume = Volume("vol-a", 10, "available", None, "us-east-1a", None)
+        request.callback([volume])
+        self.assertEqual([volume], self.successResultOf(d))
+        d = self.cache.describe_volumes("vol-a")
+        self.assertEqual([volume], self.successResultOf(d))
+        self.assertEqual(1, len(self.client.calls))
+
+    def test_not_found(self):
+        """
+        When EC2 reports that an id looked up on its own does not exist, the
+        error is cached for C{negative_ttl} seconds.
+        """
+        d = self.cache.describe_instances("i-gone")
+        self.client.calls[0][2].errback(_not_found_error())
+        self.failureResultOf(d, EC2Error)
+
+        self.clock.advance(4)
+        self.failureResultOf(self.cache.describe_instances("i-gone"), EC2Error)
+        self.assertEqual(1, len(self.client.calls))
+        self.assertEqual(1, self.cache.stats.negative_hits)
+
+        self.clock.advance(1)
+        self.cache.describe_instances("i-gone")
+        self.assertEqual(2, len(self.client.calls))
+
+    def test_other_errors_not_cached(self):
+        """
+        Errors other than one reporting that a resource does not exist are
+        not cached.
+        """
+        d = self.cache.describe_instances("i-a")
+        self.client.calls[0][2].errback(Failure(
+            _not_found_error("RequestLimitExceeded")
+        ))
+        self.failureResultOf(d, EC2Error)
+        self.cache.describe_instances("i-a")
+        self.assertEqual(2, len(self.client.calls))
+
+    def test_negative_ttl_zero(self):
+        """
+        With a C{negative_ttl} of C{0}, no errors are cached.
+        """
+        self.cache = CachingEC2Client(
+            self.client, negative_ttl=0, clock=self.clock,
+        )
+        d = self.cache.describe_instances("i-gone")
+        self.client.calls[0][2].errback(_not_found_error())
+        self.failureResultOf(d, EC2Error)
+        self.cache.describe_instances("i-gone")
+        self.assertEqual(2, len(self.client.calls))
+
+    def test_terminate_invalidates(self):
+        """
+        Terminating instances discards their entries once the request
+        completes.
+        """
+        self.describe("i-a", "i-b")
+        d = self.cache.terminate_instances("i-a")
+        self.describe("i-a")
+        self.assertEqual(2, len(self.client.calls))
+        self.client.calls[1][2].callback(True)
+        self.assertEqual(True, self.successResultOf(d))
+        self.describe("i-a", "i-b")
+        self.assertEqual(("i-a",), self.client.calls[2][1])
+        self.assertEqual(1, self.cache.stats.invalidations)
+
+    def test_run_instances_invalidates(self):
+        """
+        Running instances discards the description of all instances and any
+        negative entries, even when the request fails.
+        """
+        self.describe()
+        self.cache.describe_instances("i-new")
+        self.client.calls[1][2].errback(_not_found_error())
+        d = self.cache.run_instances("ami-a", 1, 1)
+        self.client.calls[2][2].errback(Exception("boom"))
+        self.failureResultOf(d, Exception)
+        self.describe()
+        self.describe("i-new")
+        self.assertEqual(5, len(self.client.calls))
+
+    def test_attach_volume_invalidates(self):
+        """
+        Attaching a volume discards the entries for the volume and for the
+        instance.
+        """
+        self.describe("i-a")
+        self.cache.describe_volumes("vol-a")
+        self.client.calls[1][2].callback([
+            Volume("vol-a", 10, "available", None, "us-east-1a", None),
+        ])
+        self.cache.attach_volume("vol-a", "i-a", "/dev/sdh")
+        self.client.calls[2][2].callback(True)
+        self.describe("i-a")
+        self.cache.describe_volumes("vol-a")
+        self.assertEqual(
+            ["describe_instances", "describe_volumes", "attach_volume",
+             "describe_instances", "describe_volumes"],
+            list(name for name, _, _ in self.client.calls),
+        )
+
+    def test_detach_volume_invalidates(self):
+        """
+        Detaching a volume discards the entry for the volume and, since the
+        instance it was attached to is not known, those for all instances.
+        """
+        self.describe("i-a")
+        self.cache.describe_volumes("vol-a")
+        self.client.calls[1][2].callback([
+            Volume("vol-a", 10, "in-use", None, "us-east-1a", None),
+        ])
+        self.cache.detach_volume("vol-a")
+        self.client.calls[2][2].callback({"status": "detaching"})
+        self.describe("i-a")
+        self.cache.describe_volumes("vol-a")
+        self.assertEqual(
+            ["describe_instances", "describe_volumes", "detach_volume",
+             "describe_instances", "describe_volumes"],
+            list(name for name, _, _ in self.client.calls),
+        )
+
+    def test_address_changes_invalidate(self):
+        """
+        Associating an address with an instance discards the entry for the
+        instance, and disassociating one discards those of all instances.
+        """
+        self.describe("i-a", "i-b")
+        self.cache.associate_address("i-a", "10.0.0.1")
+        self.client.calls[-1][2].callback(True)
+        self.describe("i-a", "i-b")
+        self.cache.disassociate_address("10.0.0.1")
+        self.client.calls[-1][2].callback(True)
+        self.describe("i-a", "i-b")
+        self.assertEqual(
+            [("describe_instances", ("i-a", "i-b")),
+             ("associate_address", ("i-a", "10.0.0.1")),
+             ("describe_instances", ("i-a",)),
+             ("disassociate_address", ("10.0.0.1",)),
+             ("describe_instances", ("i-a", "i-b"))],
+            list((name, args) for name, args, _ in self.client.calls),
+        )
+
+    def test_stale_response(self):
+        """
+        A description requested before an invalidation is returned to its
+        caller but not cached, since it may predate the change.
+        """
+        d = self.cache.describe_instances("i-a")
+        self.cache.terminate_instances("i-b")
+        self.client.calls[1][2].callback([])
+        instance = Instance("i-a", "running")
+        self.client.calls[0][2].callback([instance])
+        self.assertEqual([instance], self.successResultOf(d))
+        self.describe("i-a")
+        self.assertEqual(
+            ["describe_instances", "terminate_instances",
+             "describe_instances"],
+            list(name for name, _, _ in self.client.calls),
+        )
+
+    def test_stale_describe_all(self):
+        """
+        A description of all resources requested before an invalidation is
+        not cached either.
+        """
+        d = self.cache.describe_volumes()
+        self.cache.delete_volume("vol-a")
+        self.client.calls[1][2].callback(True)
+        self.client.calls[0][2].callback([
+            Volume("vol-a", 10, "available", None, "us-east-1a", None),
+        ])
+        self.successResultOf(d)
+        self.cache.describe_volumes()
+        self.cache.describe_volumes("vol-a")
+        self.assertEqual(
+            ["describe_volumes", "delete_volume", "describe_volumes",
+             "describe_volumes"],
+            list(name for name, _, _ in self.client.calls),
+        )
+
+    def test_invalidate(self):
+        """
+        L{CachingEC2Client.invalidate} discards every entry.
+        """
+        self.describe("i-a")
+        self.cache.invalidate()
+        self.describe("i-a")
+        self.assertEqual(2, len(self.client.calls))
+
+    def test_delegation(self):
+        """
+        Other methods are those of the wrapped client.
+        """
+        self.cache.describe_keypairs("key")
+        self.assertEqual(
+            [("describe_keypairs", ("key",))],
+            list((name, args) for name, args, _ in self.client.calls),
+        )
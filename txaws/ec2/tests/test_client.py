@@ -9,15 +9,23 @@ import os
 from dateutil.zoneinfo import gettz
 
 from twisted.internet import reactor
-from twisted.internet.defer import succeed, fail
+from zope.interface import implementer
+
+from twisted.internet.defer import Deferred, TimeoutError, succeed, fail
 from twisted.internet.error import ConnectionRefusedError
+from twisted.internet.task import Clock
 from twisted.protocols.policies import WrappingFactory
 from twisted.python.failure import Failure
 from twisted.python.filepath import FilePath
+from twisted.test.proto_helpers import StringTransport
 from twisted.trial.unittest import TestCase
 from twisted.web import server, static, util
+from twisted.web.client import ResponseDone
 from twisted.web.error import Error as TwistedWebError
+from twisted.web.http_headers import Headers
+from twisted.web.iweb import IAgent
 
+from txaws import version
 from txaws.util import iso8601time
 from txaws.credentials import ENV_ACCESS_KEY, ENV_SECRET_KEY, AWSCredentials
 from txaws.ec2 import client
@@ -29,6 +37,30 @@ from txaws.testing import payload
 from txaws.testing.ec2 import FakePageGetter
 
 
+@implementer(IAgent)
+class StubAgent(object):
+    def __init__(self):
+        self.requests = []
+
+    def request(self, method, url, headers, bodyProducer):
+        result = Deferred()
+        self.requests.append((method, url, headers, bodyProducer, result))
+        return result
+
+
+class StubResponse(object):
+    def __init__(self, code, body):
+        self.code = code
+        self.headers = Headers()
+        self.length = len(body)
+        self._body = body
+
+    def deliverBody(self, protocol):
+        protocol.makeConnection(StringTransport())
+        protocol.dataReceived(self._body)
+        protocol.connectionLost(Failure(ResponseDone()))
+
+
 class ReservationTestCase(TestCase):
 
     def test_reservation_creation(self):
@@ -81,25 +113,152 @@ class EC2ClientTestCase(TestCase):
         If the method of the endpoint is POST, the parameters are passed in the
         body.
         """
-        self.addCleanup(setattr, client.Query, "get_page",
-                        client.Query.get_page)
+        agent = StubAgent()
+        creds = AWSCredentials("foo", "bar")
+        endpoint = AWSServiceEndpoint(uri=EC2_ENDPOINT_US, method="POST")
+        ec2 = client.EC2Client(
+            creds=creds, endpoint=endpoint, agent=agent, reactor=Clock(),
+        )
+        ec2.describe_instances("i-1")
+        [(method, url, headers, body_producer, _)] = agent.requests
+        self.assertEqual("POST", method)
+        self.assertEqual(b"https://us-east-1.ec2.amazonaws.com/", url)
+        self.assertEqual(
+            [b"application/x-www-form-urlencoded"],
+            headers.getRawHeaders(b"content-type"),
+        )
+        self.assertEqual(
+            b"Action=DescribeInstances&InstanceId.1=i-1&Version=" +
+            version.ec2_api,
+            body_producer._inputFile.read(),
+        )
 
-        def get_page(query, url, *args, **kwargs):
-            self.assertEquals(args, ())
-            self.assertEquals(
-                kwargs["headers"],
-                {"Content-Type": "application/x-www-form-urlencoded"})
-            self.assertIn("postdata", kwargs)
-            self.assertEquals(kwargs["method"], "POST")
-            self.assertEquals(kwargs["timeout"], 30)
-            return succeed(payload.sample_describe_instances_result)
+    def test_get_method(self):
+        """
+        If the method of the endpoint is GET, the parameters are passed in the
+        query string and the request is signed with Signature Version 4 for
+        the endpoint's region.
+        """
+        agent = StubAgent()
+        creds = AWSCredentials("foo", "bar")
+        endpoint = AWSServiceEndpoint(uri="https://ec2.eu-west-1.amazonaws.com/")
+        ec2 = client.EC2Client(
+            creds=creds, endpoint=endpoint, agent=agent, reactor=Clock(),
+        )
+        ec2.describe_instances("i-1")
+        [(method, url, headers, _, _)] = agent.requests
+        self.assertEqual("GET", method)
+        self.assertEqual(
+            b"https://ec2.eu-west-1.amazonaws.com/"
+            b"?Action=DescribeInstances&InstanceId.1=i-1&Version=" +
+            version.ec2_api,
+            url,
+        )
+        [authorization] = headers.getRawHeaders(b"authorization")
+        self.assertTrue(authorization.startswith(b"AWS4-HMAC-SHA256 "))
+        self.assertIn(b"/eu-west-1/ec2/aws4_request", authorization)
 
-        client.Query.get_page = get_page
+    def test_response(self):
+        """
+        The body of a successful response is parsed by the client.
+        """
+        agent = StubAgent()
+        creds = AWSCredentials("foo", "bar")
+        ec2 = client.EC2Client(creds=creds, agent=agent, reactor=Clock())
+        d = ec2.describe_instances()
+        [(_, _, _, _, response)] = agent.requests
+        response.callback(StubResponse(
+            200, payload.sample_describe_instances_result,
+        ))
+        [instance] = self.successResultOf(d)
+        self.assertEqual("i-abcdef01", instance.instance_id)
 
+    def test_error_response(self):
+        """
+        An error response is reported as an L{EC2Error}.
+        """
+        agent = StubAgent()
         creds = AWSCredentials("foo", "bar")
-        endpoint = AWSServiceEndpoint(uri=EC2_ENDPOINT_US, method="POST")
-        ec2 = client.EC2Client(creds=creds, endpoint=endpoint)
-        return ec2.describe_instances()
+        ec2 = client.EC2Client(creds=creds, agent=agent, reactor=Clock())
+        d = ec2.describe_instances()
+        [(_, _, _, _, response)] = agent.requests
+        response.callback(StubResponse(400, payload.sample_ec2_error_message))
+        self.failureResultOf(d, EC2Error)
+
+    def test_timeout(self):
+        """
+        A request which has not completed after the query's timeout fails with
+        L{TimeoutError}.
+        """
+        clock = Clock()
+        creds = AWSCredentials("foo", "bar")
+        ec2 = client.EC2Client(creds=creds, agent=StubAgent(), reactor=clock)
+        d = ec2.describe_instances()
+        clock.advance(29)
+        self.assertNoResult(d)
+        clock.advance(1)
+        self.failureResultOf(d, TimeoutError)
+
+    def test_default_agent(self):
+        """
+        If no agent is given, L{EC2Client} creates one on first use which
+        keeps connections open for reuse and uses it for every request.
+        """
+        creds = AWSCredentials("foo", "bar")
+        ec2 = client.EC2Client(creds=creds, reactor=Clock())
+        self.assertIdentical(None, ec2.agent)
+        agent = ec2._get_agent()
+        self.assertTrue(agent._pool.persistent)
+        self.assertIdentical(agent, ec2._get_agent())
+
+    def test_wait_for_volume_available(self):
+        """
+        L{EC2Client.wait_for_volume_available} polls with I{DescribeVolumes}
+        using the client's L{Waiters}, which is shared by every wait.
+        """
+        clock = Clock()
+        creds = AWSCredentials("foo", "bar")
+        query_factory = make_query_factory(
+            payload.sample_describe_volumes_result.replace(
+                "<status>in-use</status>", "<status>available</status>"),
+            "DescribeVolumes", "foo", "bar", {"VolumeId.1": "vol-4282672b"},
+        )
+        ec2 = client.EC2Client(
+            creds=creds, query_factory=query_factory, reactor=clock,
+        )
+        d = ec2.wait_for_volume_available("vol-4282672b")
+        self.assertIdentical(ec2.waiters, ec2.waiters)
+        clock.advance(1)
+        self.assertEqual("vol-4282672b", self.successResultOf(d).id)
+
+    def test_wait_timeout(self):
+        """
+        A wait which has not completed after C{timeout} seconds fails with
+        L{TimeoutError} and is no longer polled for.
+        """
+        clock = Clock()
+        creds = AWSCredentials("foo", "bar")
+        ec2 = client.EC2Client(creds=creds, agent=StubAgent(), reactor=clock)
+        d = ec2.wait_for_snapshot_completed("snap-a", timeout=0.5)
+        clock.advance(0.5)
+        self.failureResultOf(d, TimeoutError)
+        self.assertEqual([], clock.getDelayedCalls())
+
+    def test_endpoint_region(self):
+        """
+        The region requests are signed for is taken from the endpoint's host
+        name, defaulting to I{us-east-1}.
+        """
+        for uri, region in [
+                ("https://ec2.us-west-2.amazonaws.com/", "us-west-2"),
+                ("https://eu-west-1.ec2.amazonaws.com/", "eu-west-1"),
+                ("https://ec2.amazonaws.com/", "us-east-1"),
+                ("http://localhost:8773/services/Cloud", "us-east-1"),
+        ]:
+            self.assertEqual(
+                region,
+                client._endpoint_region(AWSServiceEndpoint(uri=uri)),
+            )
 
     def test_init_no_creds_non_available_errors(self):
         self.assertRaises(CredentialsNotFoundError, client.EC2Client)
@@ -347,6 +506,25 @@ class EC2ClientInstancesTestCase(TestCase):
             ramdisk_id=u"r-1234")
         d.addCallback(self.check_parsed_run_instances)
 
+    def test_run_instances_with_client_token(self):
+        """
+        L{EC2Client.run_instances} sends the client token it is given as the
+        C{ClientToken} parameter.
+        """
+        factory = make_query_factory(
+            payload.sample_run_instances_result,
+            "RunInstances",
+            "foo",
+            "bar",
+            {"ImageId": "ami-1234", "MaxCount": "1", "MinCount": "1",
+             "SecurityGroup.1": u"group1", "ClientToken": u"token-1"},
+        )
+        creds = AWSCredentials("foo", "bar")
+        ec2 = client.EC2Client(creds, query_factory=factory)
+        d = ec2.run_instances("ami-1234", 1, 1, security_groups=[u"group1"],
+            client_token=u"token-1")
+        self.assertTrue(self.successResultOf(d))
+
     def test_run_instances_with_subnet(self):
         factory = make_query_factory(
             payload.sample_run_instances_result,
@@ -936,6 +1114,92 @@ class EC2ClientSecurityGroupsTestCase(TestCase):
             cidr_ip="0.0.0.0/0")
         return self.assertTrue(d)
 
+    def test_authorize_ip_permissions(self):
+        """
+        L{EC2Client.authorize_ip_permissions} authorizes several permissions
+        with one request, combining the ranges of permissions with the same
+        protocol and ports into one C{IpPermissions.N} entry.
+        """
+        factory = make_query_factory(
+            payload.sample_authorize_security_group,
+            "AuthorizeSecurityGroupIngress",
+            "foo",
+            "bar",
+            {
+                "GroupId": "sg-1",
+                "IpPermissions.1.IpProtocol": "tcp",
+                "IpPermissions.1.FromPort": "22",
+                "IpPermissions.1.ToPort": "22",
+                "IpPermissions.1.IpRanges.1.CidrIp": "10.0.0.0/8",
+                "IpPermissions.2.IpProtocol": "tcp",
+                "IpPermissions.2.FromPort": "80",
+                "IpPermissions.2.ToPort": "80",
+                "IpPermissions.2.IpRanges.1.CidrIp": "10.0.0.0/8",
+                "IpPermissions.2.IpRanges.2.CidrIp": "192.168.0.0/16",
+            },
+        )
+        creds = AWSCredentials("foo", "bar")
+        ec2 = client.EC2Client(creds, query_factory=factory)
+        d = ec2.authorize_ip_permissions(
+            [
+                model.IPPermission("tcp", 80, 80, "10.0.0.0/8"),
+                model.IPPermission("tcp", "22", "22", "10.0.0.0/8"),
+                model.IPPermission("tcp", 80, 80, "192.168.0.0/16"),
+            ],
+            group_name="WebServers", group_id="sg-1",
+        )
+        self.assertTrue(self.successResultOf(d))
+
+    def test_revoke_ip_permissions(self):
+        """
+        L{EC2Client.revoke_ip_permissions} revokes several permissions with
+        one request.
+        """
+        factory = make_query_factory(
+            payload.sample_revoke_security_group,
+            "RevokeSecurityGroupIngress",
+            "foo",
+            "bar",
+            {
+                "GroupName": "WebServers",
+                "IpPermissions.1.IpProtocol": "udp",
+                "IpPermissions.1.FromPort": "53",
+                "IpPermissions.1.ToPort": "53",
+                "IpPermissions.1.IpRanges.1.CidrIp": "0.0.0.0/0",
+            },
+        )
+        creds = AWSCredentials("foo", "bar")
+        ec2 = client.EC2Client(creds, query_factory=factory)
+        d = ec2.revoke_ip_permissions(
+            [model.IPPermission("udp", 53, 53, "0.0.0.0/0")],
+            group_name="WebServers",
+        )
+        self.assertTrue(self.successResultOf(d))
+
+    def test_revoke_ip_permissions_all_protocols(self):
+        """
+        L{EC2Client.revoke_ip_permissions} leaves out the ports of a
+        permission for protocol C{-1}, which has none.
+        """
+        factory = make_query_factory(
+            payload.sample_revoke_security_group,
+            "RevokeSecurityGroupIngress",
+            "foo",
+            "bar",
+            {
+                "GroupName": "WebServers",
+                "IpPermissions.1.IpProtocol": "-1",
+                "IpPermissions.1.IpRanges.1.CidrIp": "10.0.0.0/8",
+            },
+        )
+        creds = AWSCredentials("foo", "bar")
+        ec2 = client.EC2Client(creds, query_factory=factory)
+        d = ec2.revoke_ip_permissions(
+            [model.IPPermission("-1", None, None, "10.0.0.0/8")],
+            group_name="WebServers",
+        )
+        self.assertTrue(self.successResultOf(d))
+
     def test_revoke_security_group_with_user_group_pair(self):
         """
         L{EC2Client.revoke_security_group} returns a C{Deferred} that
@@ -1326,6 +1590,28 @@ class EC2ClientEBSTestCase(TestCase):
         d.addCallback(check_parsed_response)
         return d
 
+    def test_detach_volume(self):
+        """
+        L{EC2Client.detach_volume} detaches a volume and fires with the
+        status of its attachment.
+        """
+        factory = make_query_factory(
+            payload.sample_detach_volume_result,
+            "DetachVolume",
+            "foo",
+            "bar",
+            {"VolumeId": "vol-4d826724", "InstanceId": "i-6058a509",
+             "Force": "true"},
+        )
+        ec2 = client.EC2Client(creds=self.creds, endpoint=self.endpoint,
+                               query_factory=factory)
+        d = ec2.detach_volume("vol-4d826724", "i-6058a509", force=True)
+        self.assertEqual(
+            {"status": "detaching",
+             "attach_time": datetime(2008, 05, 07, 11, 51, 50)},
+            self.successResultOf(d),
+        )
+
     def check_parsed_keypairs(self, results):
         self.assertEquals(len(results), 1)
         keypair = results[0]
@@ -2079,3 +2365,181 @@ class EC2ParserTestCase(TestCase):
             '<return>true</return></TerminateInstancesResponse>')
         nova_response = self.parser.terminate_instances(nova_xml)
         self.assertEquals([], nova_response)
+
+    def test_security_group_pairs_deduplicated(self):
+        """
+        A user and group pair granted by several rules is listed once in
+        C{allowed_groups}, in the order of the first rule granting it.
+        """
+        pair = (
+            "<item><userId>%s</userId><groupName>%s</groupName></item>"
+        )
+        rule = (
+            "<item><ipProtocol>tcp</ipProtocol><fromPort>%d</fromPort>"
+            "<toPort>%d</toPort><groups>%s</groups><ipRanges/></item>"
+        )
+        rules = "".join(
+            rule % (port, port, "".join(
+                pair % ("123", "group-%d" % (n,)) for n in pairs
+            ))
+            for port, pairs in [(22, [2, 1]), (80, [1, 3, 2]), (443, [3])]
+        )
+        xml_bytes = (
+            "<DescribeSecurityGroupsResponse><securityGroupInfo><item>"
+            "<ownerId>123</ownerId><groupId>sg-1</groupId>"
+            "<groupName>web</groupName><groupDescription>Web"
+            "</groupDescription><ipPermissions>%s</ipPermissions>"
+            "</item></securityGroupInfo></DescribeSecurityGroupsResponse>"
+        ) % (rules,)
+        [group] = self.parser.describe_security_groups(xml_bytes)
+        self.assertEqual(
+            [("123", "group-2"), ("123", "group-1"), ("123", "group-3")],
+            list((pair.user_id, pair.group_name)
+                 for pair in group.allowed_groups),
+        )
+
+    def test_parse_time(self):
+        """
+        L{client._parse_time} parses timestamps to the second, like
+        C{datetime.strptime} with the format EC2 uses.
+        """
+        for text in ["2008-05-07T12:51:50.000Z", "2017-12-31T23:59:59Z"]:
+            self.assertEqual(
+                datetime.strptime(text[:19], "%Y-%m-%dT%H:%M:%S"),
+                client._parse_time(text),
+            )
+        self.assertRaises(ValueError, client._parse_time, "yesterday")
+
+
+class EC2ClientPaginationTestCase(TestCase):
+    """
+    Tests for the C{describe_*_page} methods of L{EC2Client} and
+    L{walk_pages}.
+    """
+    def setUp(self):
+        self.creds = AWSCredentials("foo", "bar")
+
+    def snapshots_page(self, snapshot_id, next_token=None):
+        result = payload.sample_describe_snapshots_result.replace(
+            "snap-78a54011", snapshot_id,
+        )
+        if next_token is not None:
+            result = result.replace(
+                "</snapshotSet>",
+                "</snapshotSet>\n  <nextToken>%s</nextToken>" % (next_token,),
+            )
+        return result
+
+    def test_filter_params(self):
+        """
+        Filters are encoded as numbered C{Filter.N.Name} and
+        C{Filter.N.Value.M} parameters, in name order.
+        """
+        self.assertEqual(
+            {
+                "Filter.1.Name": "status",
+                "Filter.1.Value.1": "completed",
+                "Filter.2.Name": "tag:Name",
+                "Filter.2.Value.1": "a",
+                "Filter.2.Value.2": "b",
+            },
+            client._filter_params({
+                "tag:Name": ["a", "b"], "status": "completed",
+            }),
+        )
+        self.assertEqual({}, client._filter_params(None))
+
+    def test_describe_snapshots_page(self):
+        """
+        L{EC2Client.describe_snapshots_page} requests a page of snapshots
+        with the given ids, filters, page size and token and fires with a
+        L{Page} of them with the token for the next page.
+        """
+        factory = make_query_factory(
+            self.snapshots_page("snap-1", "token-2"),
+            "DescribeSnapshots", "foo", "bar",
+            {
+                "SnapshotId.1": "snap-1",
+                "Filter.1.Name": "status",
+                "Filter.1.Value.1": "pending",
+                "MaxResults": "5",
+                "NextToken": "token-1",
+            },
+        )
+        ec2 = client.EC2Client(creds=self.creds, query_factory=factory)
+        page = self.successResultOf(ec2.describe_snapshots_page(
+            ["snap-1"], filters={"status": "pending"}, max_results=5,
+            next_token="token-1",
+        ))
+        self.assertEqual(["snap-1"], list(s.id for s in page.items))
+        self.assertEqual("token-2", page.next_token)
+
+    def test_describe_instances_page_last(self):
+        """
+        The L{Page} from L{EC2Client.describe_instances_page} has no
+        C{next_token} if the response has none.
+        """
+        factory = make_query_factory(
+            payload.sample_describe_instances_result,
+            "DescribeInstances", "foo", "bar",
+            {"Filter.1.Name": "instance-state-name",
+             "Filter.1.Value.1": "running"},
+        )
+        ec2 = client.EC2Client(creds=self.creds, query_factory=factory)
+        page = self.successResultOf(ec2.describe_instances_page(
+            filters={"instance-state-name": "running"},
+        ))
+        self.assertEqual(
+            ["i-abcdef01"], list(i.instance_id for i in page.items),
+        )
+        self.assertIdentical(None, page.next_token)
+
+    def test_walk_pages(self):
+        """
+        L{walk_pages} requests each page with the token from the previous one
+        and passes the items of each to C{page_received}, waiting for any
+        L{Deferred} it returns before requesting the next.
+        """
+        pages = {
+            None: self.snapshots_page("snap-1", "token-2"),
+            "token-2": self.snapshots_page("snap-2", "token-3"),
+            "token-3": self.snapshots_page("snap-3"),
+        }
+        requests = []
+
+        class PageQuery(object):
+            def __init__(self, action, creds, endpoint, other_params):
+                self.params = other_params
+
+            def submit(self):
+                requests.append(self.params)
+                return succeed(pages[self.params.get("NextToken")])
+
+        ec2 = client.EC2Client(creds=self.creds, query_factory=PageQuery)
+        received = []
+        waiting = []
+
+        def page_received(items):
+            received.append(list(s.id for s in items))
+            waiting.append(Deferred())
+            return waiting[-1]
+
+        d = client.walk_pages(
+            ec2.describe_snapshots_page, page_received, page_size=1,
+            filters={"status": "pending"},
+        )
+        self.assertEqual([["snap-1"]], received)
+        waiting[-1].callback(None)
+        waiting[-1].callback(None)
+        self.assertNoResult(d)
+        waiting[-1].callback(None)
+        self.assertIdentical(None, self.successResultOf(d))
+        self.assertEqual([["snap-1"], ["snap-2"], ["snap-3"]], received)
+        self.assertEqual(
+            [None, "token-2", "token-3"],
+            list(params.get("NextToken") for params in requests),
+        )
+        self.assertEqual(
+            ["1", "1", "1"],
+            list(params["MaxResults"] for params in requests),
+        )
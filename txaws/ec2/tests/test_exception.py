@@ -1,9 +1,12 @@
 # Copyright (c) 2009 Canonical Ltd <duncan.mcgreggor@canonical.com>
 # Licenced under the txaws licence available at /LICENSE in the txaws source.
 
+from twisted.python.failure import Failure
 from twisted.trial.unittest import TestCase
 
-from txaws.ec2.exception import EC2Error
+from txaws.ec2.exception import (
+    EC2Error, bad_id, named_ids, not_found, transient,
+)
 from txaws.testing import payload
 from txaws.util import XML
 
@@ -84,3 +87,51 @@ class EC2ErrorTestCase(TestCase):
         self.assertEquals(
             error.get_error_messages(),
             "Unauthorized attempt to access restricted resource")
+
+
+class ErrorClassificationTestCase(TestCase):
+    """
+    Tests for L{transient}, L{not_found}, L{bad_id} and L{named_ids}.
+    """
+    def error(self, code, message="Message"):
+        xml = payload.sample_ec2_error_message.replace(
+            "Message for Error.Code", message,
+        ).replace("Error.Code", code)
+        return Failure(EC2Error(xml, 400))
+
+    def test_transient(self):
+        """
+        Throttling and errors which are not L{EC2Error}s are transient;
+        other L{EC2Error}s are not.
+        """
+        self.assertTrue(transient(self.error("RequestLimitExceeded")))
+        self.assertTrue(transient(Failure(ValueError())))
+        self.assertFalse(transient(self.error("InvalidAMIID.NotFound")))
+
+    def test_bad_id(self):
+        """
+        L{not_found} recognizes ids which do not exist and L{bad_id} also
+        recognizes malformed ones.
+        """
+        missing = self.error("InvalidVolume.NotFound")
+        malformed = self.error("InvalidInstanceID.Malformed")
+        self.assertEqual(
+            (True, True, False, True),
+            (not_found(missing), bad_id(missing), not_found(malformed),
+             bad_id(malformed)),
+        )
+        self.assertFalse(bad_id(Failure(ValueError())))
+
+    def test_named_ids(self):
+        """
+        L{named_ids} finds the ids of a request which the error messages
+        name, without matching ids which are only prefixes of those.
+        """
+        reason = self.error(
+            "InvalidInstanceID.NotFound",
+            "The instance IDs 'i-12, i-3' do not exist",
+        )
+        self.assertEqual(
+            set(["i-12", "i-3"]),
+            named_ids(reason, ["i-1", "i-12", "i-2", "i-3"]),
+        )
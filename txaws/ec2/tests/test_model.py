@@ -46,3 +46,15 @@ class UserIDGroupPairTestCase(TestCase):
         user_group_pair = model.UserIDGroupPair(user_id, group_name)
         self.assertEquals(user_group_pair.user_id, "cowboy22")
         self.assertEquals(user_group_pair.group_name, "Rough Riders")
+
+
+class InstanceTestCase(TestCase):
+
+    def test_slots(self):
+        """
+        L{model.Instance} stores its attributes in slots rather than in a
+        per-instance dictionary.
+        """
+        instance = model.Instance("i-1234", "running")
+        self.assertFalse(hasattr(instance, "__dict__"))
+        self.assertEqual(None, instance.reservation)
@@ -0,0 +1,120 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.ec2.multiregion}.
+"""
+
+from twisted.internet.defer import Deferred, TimeoutError
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from txaws.credentials import AWSCredentials
+from txaws.ec2.multiregion import MultiRegionEC2Client, RegionResult
+from txaws.regions import EC2_ALL_REGIONS
+
+
+class MultiRegionEC2ClientTestCase(TestCase):
+    """
+    Tests for L{MultiRegionEC2Client}.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.client = MultiRegionEC2Client(
+            creds=AWSCredentials("foo", "bar"),
+            regions=["us-east-1", "eu-west-1", "ap-northeast-1"],
+            timeout=10, reactor=self.clock,
+        )
+        self.calls = {}
+        for region, client in self.client.clients.items():
+            client.describe_instances = self._describer(region)
+
+    def _describer(self, region):
+        def describe_instances(*instance_ids):
+            d = Deferred()
+            self.calls[region] = (instance_ids, d)
+            return d
+        return describe_instances
+
+    def test_default_regions(self):
+        """
+        By default, there is a client for each region in
+        L{EC2_ALL_REGIONS}, each with the endpoint for its region.
+        """
+        client = MultiRegionEC2Client(
+            creds=AWSCredentials("foo", "bar"), reactor=self.clock,
+        )
+        self.assertEqual(len(EC2_ALL_REGIONS), len(client.clients))
+        self.assertEqual(
+            "ec2.us-west-2.amazonaws.com",
+            client.clients["us-west-2"].endpoint.get_host(),
+        )
+
+    def test_shared_pool(self):
+        """
+        The clients for all of the regions share one connection pool.
+        """
+        pools = set(
+            id(client.agent._pool)
+            for client in self.client.clients.values()
+        )
+        self.assertEqual(1, len(pools))
+
+    def test_concurrent(self):
+        """
+        The call is made in every region before any has completed, and the
+        result lists each region's result in the order they completed.  Each
+        is also passed to C{result_received} as it arrives.
+        """
+        received = []
+        d = self.client.describe_instances(
+            "i-1", result_received=received.append,
+        )
+        self.assertEqual(
+            set(["us-east-1", "eu-west-1", "ap-northeast-1"]),
+            set(self.calls),
+        )
+        self.assertEqual(("i-1",), self.calls["eu-west-1"][0])
+
+        self.calls["eu-west-1"][1].callback(["eu"])
+        self.assertEqual([RegionResult("eu-west-1", value=["eu"])], received)
+        self.assertNoResult(d)
+        self.calls["us-east-1"][1].callback(["us"])
+        error = ValueError("boom")
+        self.calls["ap-northeast-1"][1].errback(error)
+
+        results = self.successResultOf(d)
+        self.assertEqual(results, received)
+        self.assertEqual(
+            ["eu-west-1", "us-east-1", "ap-northeast-1"],
+            list(result.region for result in results),
+        )
+        self.assertIdentical(error, results[2].failure.value)
+        self.assertIdentical(None, results[2].value)
+
+    def test_timeout(self):
+        """
+        A region which has not completed within C{timeout} seconds is
+        reported with a L{TimeoutError} failure without holding up the
+        others.
+        """
+        d = self.client.describe_instances()
+        self.calls["eu-west-1"][1].callback([])
+        self.calls["us-east-1"][1].callback([])
+        self.clock.advance(10)
+        results = self.successResultOf(d)
+        self.assertTrue(results[2].failure.check(TimeoutError))
+        self.assertEqual("ap-northeast-1", results[2].region)
+
+    def test_selected_regions(self):
+        """
+        Only the regions given are called.
+        """
+        d = self.client.call(
+            "describe_instances", ("i-1",), regions=["us-east-1"],
+        )
+        self.assertEqual(["us-east-1"], list(self.calls))
+        self.calls["us-east-1"][1].callback(["us"])
+        self.assertEqual(
+            [RegionResult("us-east-1", value=["us"])],
+            self.successResultOf(d),
+        )
@@ -0,0 +1,143 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.ec2.reconcile}.
+"""
+
+from twisted.internet.defer import succeed
+from twisted.trial.unittest import TestCase
+
+from txaws.ec2.model import IPPermission, SecurityGroup
+from txaws.ec2.reconcile import (
+    PermissionChanges, diff_ip_permissions, reconcile_security_group,
+)
+
+
+def _keys(permissions):
+    return list(
+        (p.ip_protocol, p.from_port, p.to_port, p.cidr_ip)
+        for p in permissions
+    )
+
+
+class _Client(object):
+    """
+    Describe one group and record the changes requested.
+    """
+    def __init__(self, group):
+        self.group = group
+        self.calls = []
+
+    def describe_security_groups(self, *names):
+        self.calls.append(("describe", names))
+        return succeed([self.group])
+
+    def authorize_ip_permissions(self, permissions, group_name=None,
+                                 group_id=None):
+        self.calls.append(("authorize", _keys(permissions), group_id))
+        return succeed(True)
+
+    def revoke_ip_permissions(self, permissions, group_name=None,
+                              group_id=None):
+        self.calls.append(("revoke", _keys(permissions), group_id))
+        return succeed(True)
+
+
+class DiffIPPermissionsTestCase(TestCase):
+    """
+    Tests for L{diff_ip_permissions}.
+    """
+    def test_diff(self):
+        """
+        Permissions only in the desired set are authorized and those only in
+        the current set are revoked.  Ports given as strings match the same
+        ports given as integers.
+        """
+        changes = diff_ip_permissions(
+            [
+                IPPermission("tcp", 22, 22, "0.0.0.0/0"),
+                IPPermission("tcp", 80, 80, "0.0.0.0/0"),
+            ],
+            [
+                IPPermission("tcp", "80", "80", "0.0.0.0/0"),
+                IPPermission("tcp", "443", "443", "0.0.0.0/0"),
+                IPPermission("tcp", "22", "22", "10.0.0.0/8"),
+            ],
+        )
+        self.assertEqual(
+            [("tcp", 22, 22, "10.0.0.0/8"), ("tcp", 443, 443, "0.0.0.0/0")],
+            _keys(changes.authorize),
+        )
+        self.assertEqual(
+            [("tcp", 22, 22, "0.0.0.0/0")], _keys(changes.revoke),
+        )
+
+    def test_no_changes(self):
+        """
+        Matching sets need no changes, and the result is false.
+        """
+        changes = diff_ip_permissions(
+            [IPPermission("udp", 53, 53, "0.0.0.0/0")],
+            [IPPermission("udp", "53", "53", "0.0.0.0/0")],
+        )
+        self.assertEqual(PermissionChanges([], []), changes)
+        self.assertFalse(changes)
+
+
+class ReconcileSecurityGroupTestCase(TestCase):
+    """
+    Tests for L{reconcile_security_group}.
+    """
+    def setUp(self):
+        self.client = _Client(SecurityGroup(
+            "sg-1", "web", "Web servers",
+            ips=[
+                IPPermission("tcp", 22, 22, "0.0.0.0/0"),
+                IPPermission("tcp", 80, 80, "0.0.0.0/0"),
+            ],
+        ))
+        self.desired = [
+            IPPermission("tcp", 80, 80, "0.0.0.0/0"),
+            IPPermission("tcp", 443, 443, "0.0.0.0/0"),
+            IPPermission("tcp", 22, 22, "10.0.0.0/8"),
+        ]
+
+    def test_reconcile(self):
+        """
+        All of the missing permissions are authorized with one request and
+        then all of the extra ones revoked with another.
+        """
+        d = reconcile_security_group(self.client, "web", self.desired)
+        changes = self.successResultOf(d)
+        self.assertEqual(
+            [
+                ("describe", ("web",)),
+                ("authorize", _keys(changes.authorize), "sg-1"),
+                ("revoke", [("tcp", 22, 22, "0.0.0.0/0")], "sg-1"),
+            ],
+            self.client.calls,
+        )
+        self.assertEqual(2, len(changes.authorize))
+
+    def test_no_revoke(self):
+        """
+        With C{revoke=False}, extra permissions are left in place.
+        """
+        d = reconcile_security_group(
+            self.client, "web", self.desired, revoke=False,
+        )
+        self.assertEqual([], self.successResultOf(d).revoke)
+        self.assertEqual(
+            ["describe", "authorize"],
+            list(call[0] for call in self.client.calls),
+        )
+
+    def test_up_to_date(self):
+        """
+        No changes are requested for a group which already matches.
+        """
+        d = reconcile_security_group(
+            self.client, "web", self.client.group.allowed_ips,
+        )
+        self.assertFalse(self.successResultOf(d))
+        self.assertEqual(["describe"], list(c[0] for c in self.client.calls))
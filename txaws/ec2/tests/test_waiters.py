@@ -0,0 +1,211 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.ec2.waiters}.
+"""
+
+from twisted.internet.defer import CancelledError, TimeoutError
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from txaws.ec2.exception import EC2Error
+from txaws.ec2.model import Instance, Volume, Snapshot
+from txaws.ec2.waiters import Waiters, UnexpectedState
+from txaws.testing import payload
+from txaws.testing.ec2 import RecordingDescribeClient
+
+
+def _ec2_error(code, message=None):
+    text = payload.sample_ec2_error_message
+    if message is not None:
+        text = text.replace("Message for Error.Code", message)
+    return EC2Error(text.replace("Error.Code", code), 400)
+
+
+def _volume(id, status):
+    return Volume(id, 10, status, None, "us-east-1a", None)
+
+
+class WaitersTestCase(TestCase):
+    """
+    Tests for L{Waiters}.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.client = RecordingDescribeClient()
+        self.waiters = Waiters(
+            self.client, min_interval=1, max_interval=8, backoff=2,
+            max_batch_size=3, clock=self.clock,
+        )
+
+    def test_shared_poll(self):
+        """
+        All of the waits for one kind of resource are checked with one
+        describe request, and each fires with its model once it is in the
+        state waited for.
+        """
+        a = self.waiters.wait_for_volume_available("vol-a")
+        b = self.waiters.wait_for_volume_available("vol-b")
+        self.assertEqual([], self.client.calls)
+        self.clock.advance(1)
+
+        [(kind, ids, d)] = self.client.calls
+        self.assertEqual(("volumes", ["vol-a", "vol-b"]), (kind, ids))
+        volume_a = _volume("vol-a", "available")
+        d.callback([volume_a, _volume("vol-b", "creating")])
+        self.assertIdentical(volume_a, self.successResultOf(a))
+        self.assertNoResult(b)
+
+        self.clock.advance(1)
+        [_, (_, ids, d)] = self.client.calls
+        self.assertEqual(["vol-b"], ids)
+        volume_b = _volume("vol-b", "available")
+        d.callback([volume_b])
+        self.assertIdentical(volume_b, self.successResultOf(b))
+        self.assertEqual(2, self.waiters.requests)
+
+        self.clock.advance(10)
+        self.assertEqual(2, len(self.client.calls))
+
+    def test_backoff(self):
+        """
+        The interval between polls grows by C{backoff} after each poll in
+        which no wait completed, up to C{max_interval}, and drops back to
+        C{min_interval} when a new wait begins.
+        """
+        self.waiters.wait_for_snapshot_completed("snap-a")
+        times = []
+        for i in range(6):
+            self.clock.advance(self.clock.getDelayedCalls()[0].getTime() -
+                               self.clock.seconds())
+            times.append(self.clock.seconds())
+            self.client.calls[-1][2].callback([
+                Snapshot("snap-a", "vol-a", "pending", None, "10%"),
+            ])
+        self.assertEqual([1, 3, 7, 15, 23, 31], times)
+
+        self.waiters.wait_for_snapshot_completed("snap-b")
+        [delayed] = self.clock.getDelayedCalls()
+        self.assertEqual(32, delayed.getTime())
+
+    def test_batches(self):
+        """
+        No more than C{max_batch_size} ids are described in one request.
+        """
+        for i in range(4):
+            self.waiters.wait_for_instance_state("i-%d" % (i,))
+        self.clock.advance(1)
+        self.assertEqual(
+            [["i-0", "i-1", "i-2"], ["i-3"]],
+            list(ids for _, ids, _ in self.client.calls),
+        )
+
+    def test_unexpected_state(self):
+        """
+        A wait fails with L{UnexpectedState} if the resource reaches a state
+        from which the one waited for cannot be reached.
+        """
+        d = self.waiters.wait_for_instance_state("i-a", "running")
+        self.clock.advance(1)
+        self.client.calls[0][2].callback([Instance("i-a", "terminated")])
+        error = self.failureResultOf(d, UnexpectedState).value
+        self.assertEqual(
+            ("i-a", "terminated"), (error.resource_id, error.state),
+        )
+
+    def test_not_visible_yet(self):
+        """
+        A resource which is missing from the response, or which EC2 reports
+        does not exist, is polled for again.  When a batch fails because of
+        ids which do not exist, the other ids are described again at once
+        in one request.
+        """
+        a = self.waiters.wait_for_instance_state("i-a")
+        b = self.waiters.wait_for_instance_state("i-b")
+        c = self.waiters.wait_for_instance_state("i-c")
+        self.clock.advance(1)
+        self.client.calls[0][2].errback(_ec2_error(
+            "InvalidInstanceID.NotFound",
+            "The instance ID 'i-a' does not exist",
+        ))
+        [(_, ids, d)] = self.client.calls[1:]
+        self.assertEqual(["i-b", "i-c"], ids)
+        d.callback([])
+        self.assertNoResult(a)
+        self.assertNoResult(b)
+        self.assertNoResult(c)
+
+        self.clock.advance(2)
+        self.assertEqual(["i-a", "i-b", "i-c"], self.client.calls[2][1])
+
+    def test_unnamed_not_found(self):
+        """
+        If EC2 does not name the ids which do not exist, a failed batch is
+        described again in halves.
+        """
+        for id in ["i-a", "i-b", "i-c"]:
+            self.waiters.wait_for_instance_state(id)
+        self.clock.advance(1)
+        self.client.calls[0][2].errback(
+            _ec2_error("InvalidInstanceID.NotFound"),
+        )
+        self.assertEqual(
+            [["i-a"], ["i-b", "i-c"]],
+            list(ids for _, ids, _ in self.client.calls[1:]),
+        )
+
+    def test_malformed(self):
+        """
+        A wait for a resource whose id EC2 reports is malformed fails, and
+        the other ids in the batch are described again.
+        """
+        a = self.waiters.wait_for_instance_state("i-a")
+        bad = self.waiters.wait_for_instance_state("bad")
+        self.clock.advance(1)
+        self.client.calls[0][2].errback(_ec2_error(
+            "InvalidInstanceID.Malformed", 'Invalid id: "bad"',
+        ))
+        self.failureResultOf(bad, EC2Error)
+        self.assertNoResult(a)
+        self.assertEqual(["i-a"], self.client.calls[1][1])
+
+    def test_transient_error(self):
+        """
+        If describing a resource fails with a transient error, such as
+        throttling or a timeout, it is polled for again on the next tick.
+        """
+        d = self.waiters.wait_for_volume_available("vol-a")
+        self.clock.advance(1)
+        self.client.calls[0][2].errback(_ec2_error("RequestLimitExceeded"))
+        self.assertNoResult(d)
+        self.assertEqual(1, len(self.client.calls))
+        self.clock.advance(2)
+        self.client.calls[1][2].errback(TimeoutError())
+        self.assertNoResult(d)
+        self.clock.advance(4)
+        volume = _volume("vol-a", "available")
+        self.client.calls[2][2].callback([volume])
+        self.assertIdentical(volume, self.successResultOf(d))
+
+    def test_other_error(self):
+        """
+        If describing resources fails with an error which is neither
+        transient nor about their ids, their waits fail with that error.
+        """
+        a = self.waiters.wait_for_volume_available("vol-a")
+        b = self.waiters.wait_for_volume_available("vol-b")
+        self.clock.advance(1)
+        self.client.calls[0][2].errback(_ec2_error("UnauthorizedOperation"))
+        self.failureResultOf(a, EC2Error)
+        self.failureResultOf(b, EC2Error)
+        self.assertEqual(1, len(self.client.calls))
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def test_cancel(self):
+        """
+        A cancelled wait is no longer polled for.
+        """
+        d = self.waiters.wait_for_volume_available("vol-a")
+        d.cancel()
+        self.failureResultOf(d, CancelledError)
+        self.assertEqual([], self.clock.getDelayedCalls())
@@ -0,0 +1,267 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Waiting for EC2 resources to reach a state.
+
+A L{Waiters} polls for the state of every resource being waited for with one
+describe request per kind of resource each time it polls, however many
+callers are waiting.  The interval between polls starts short, grows while
+nothing changes and shrinks again as soon as a wait completes or a new one
+begins.
+"""
+
+__all__ = [
+    "Waiters", "UnexpectedState",
+]
+
+from twisted.internet.defer import Deferred
+
+from txaws.ec2.exception import bad_id, named_ids, not_found, transient
+
+
+class UnexpectedState(Exception):
+    """
+    A resource reached a state from which the state waited for cannot be
+    reached.
+
+    @ivar resource_id: The id of the resource.
+    @ivar state: The state it reached.
+    """
+    def __init__(self, resource_id, state):
+        super(UnexpectedState, self).__init__(
+            "%s reached state %s" % (resource_id, state),
+        )
+        self.resource_id = resource_id
+        self.state = state
+
+
+class _Wait(object):
+    """
+    One caller waiting for one resource.
+    """
+    def __init__(self, states, failed_states):
+        self.states = states
+        self.failed_states = failed_states
+        self.deferred = None
+
+
+class _Poller(object):
+    """
+    Poll for the states of one kind of resource.
+
+    @ivar requests: The number of describe requests made.
+    """
+    def __init__(self, describe, key, state, clock, min_interval,
+                 max_interval, backoff, max_batch_size):
+        """
+        @param describe: A callable like L{EC2Client.describe_volumes}, taking
+            ids as positional arguments.
+        @param key: A one-argument callable returning the id of a model.
+        @param state: A one-argument callable returning the state of a model.
+        """
+        self._describe = describe
+        self._key = key
+        self._state = state
+        self._clock = clock
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._backoff = backoff
+        self._max_batch_size = max_batch_size
+        self._interval = min_interval
+        self._waits = {}
+        self._delayed_poll = None
+        self._polling = False
+        self._progress = False
+        self._outstanding = 0
+        self.requests = 0
+
+    def wait(self, id, states, failed_states=()):
+        wait = _Wait(frozenset(states), frozenset(failed_states))
+        wait.deferred = Deferred(lambda d: self._cancel(id, wait))
+        self._waits.setdefault(id, []).append(wait)
+        # Newly created resources change state soonest, so poll sooner.
+        self._interval = self._min_interval
+        self._progress = True
+        self._schedule()
+        return wait.deferred
+
+    def _cancel(self, id, wait):
+        waits = self._waits.get(id, [])
+        if wait in waits:
+            waits.remove(wait)
+            if not waits:
+                del self._waits[id]
+        if not self._waits and self._delayed_poll is not None:
+            self._delayed_poll.cancel()
+            self._delayed_poll = None
+
+    def _schedule(self):
+        if self._polling or not self._waits:
+            return
+        if self._delayed_poll is not None:
+            remaining = self._delayed_poll.getTime() - self._clock.seconds()
+            if remaining <= self._interval:
+                return
+            self._delayed_poll.cancel()
+        self._delayed_poll = self._clock.callLater(self._interval, self._poll)
+
+    def _poll(self):
+        self._delayed_poll = None
+        self._polling = True
+        ids = sorted(self._waits)
+        self._progress = False
+        # Count the poll itself as outstanding so that requests which
+        # complete synchronously do not end it before all are made.
+        self._outstanding += 1
+        for start in xrange(0, len(ids), self._max_batch_size):
+            self._request(ids[start:start + self._max_batch_size])
+        self._request_done(None)
+
+    def _request(self, ids):
+        self.requests += 1
+        self._outstanding += 1
+        d = self._describe(*ids)
+        d.addCallbacks(self._described, self._failed, (ids,), {}, (ids,), {})
+        d.addBoth(self._request_done)
+
+    def _request_done(self, ignored):
+        self._outstanding -= 1
+        if self._outstanding:
+            return
+        self._polling = False
+        if self._progress:
+            self._interval = self._min_interval
+        else:
+            self._interval = min(
+                self._interval * self._backoff, self._max_interval,
+            )
+        self._schedule()
+
+    def _described(self, models, ids):
+        for model in models:
+            id = self._key(model)
+            state = self._state(model)
+            for wait in list(self._waits.get(id, ())):
+                if state in wait.states:
+                    self._finish(id, wait)
+                    wait.deferred.callback(model)
+                elif state in wait.failed_states:
+                    self._finish(id, wait)
+                    wait.deferred.errback(UnexpectedState(id, state))
+        # Resources missing from the response have not become visible yet
+        # and are polled for again.
+
+    def _failed(self, reason, ids):
+        if transient(reason):
+            # Throttling, timeouts and the like: the ids are polled for again
+            # on the next tick.
+            return
+        if bad_id(reason):
+            # EC2 fails the whole request if any one of the ids does not
+            # exist or is malformed, and names those ids in its message.
+            named = named_ids(reason, ids)
+            if not named and len(ids) == 1:
+                named = set(ids)
+            if not named:
+                # The ids at fault are unknown, so find them by halves.
+                middle = len(ids) // 2
+                self._request(ids[:middle])
+                self._request(ids[middle:])
+                return
+            if not not_found(reason):
+                self._fail(named, reason)
+            # Resources which were only just created may not be visible yet
+            # and are polled for again on the next tick.  The others are
+            # described again now.
+            rest = list(id for id in ids if id not in named)
+            if rest:
+                self._request(rest)
+            return
+        self._fail(ids, reason)
+
+    def _fail(self, ids, reason):
+        for id in ids:
+            for wait in list(self._waits.get(id, ())):
+                self._finish(id, wait)
+                wait.deferred.errback(reason)
+
+    def _finish(self, id, wait):
+        self._progress = True
+        self._cancel(id, wait)
+
+
+class Waiters(object):
+    """
+    Wait for instances, volumes and snapshots to reach a state, sharing one
+    poll between all of the callers waiting for each kind of resource.
+
+    Each wait fires with the model of the resource once it has reached the
+    state, or fails with L{UnexpectedState} if it reached a state from which
+    it never will.  Resources which EC2 does not report yet are polled for
+    until they appear, and so are those whose request failed with a
+    transient error such as throttling.  Waits can be cancelled, and so can
+    be limited with L{Deferred.addTimeout}.
+    """
+    def __init__(self, client, min_interval=1.0, max_interval=30.0,
+                 backoff=1.5, max_batch_size=200, clock=None):
+        """
+        @param client: An L{EC2Client} or another object with the same
+            interface.
+        @param min_interval: The number of seconds between polls while
+            resources are changing state.
+        @param max_interval: The largest number of seconds between polls.
+        @param backoff: The factor by which the interval grows after each
+            poll in which no wait completed.
+        @param max_batch_size: The largest number of ids to describe in one
+            request.
+        @param clock: An L{IReactorTime} provider, or C{None} for the global
+            reactor.
+        """
+        if clock is None:
+            from twisted.internet import reactor as clock
+        args = (clock, min_interval, max_interval, backoff, max_batch_size)
+        self._instances = _Poller(
+            client.describe_instances, lambda instance: instance.instance_id,
+            lambda instance: instance.instance_state, *args
+        )
+        self._volumes = _Poller(
+            client.describe_volumes, lambda volume: volume.id,
+            lambda volume: volume.status, *args
+        )
+        self._snapshots = _Poller(
+            client.describe_snapshots, lambda snapshot: snapshot.id,
+            lambda snapshot: snapshot.status, *args
+        )
+
+    @property
+    def requests(self):
+        """
+        The number of describe requests made so far.
+        """
+        return (
+            self._instances.requests + self._volumes.requests +
+            self._snapshots.requests
+        )
+
+    def wait_for_instance_state(self, instance_id, state="running"):
+        """
+        @return: A L{Deferred} that fires with the L{Instance} once it is in
+            C{state}.  It fails if the instance is terminated first, unless
+            that is the state waited for.
+        """
+        failed = set(["shutting-down", "terminated"]) - set([state])
+        return self._instances.wait(instance_id, [state], failed)
+
+    def wait_for_volume_available(self, volume_id):
+        """
+        @return: A L{Deferred} that fires with the L{Volume} once it is
+            available.
+        """
+        return self._volumes.wait(volume_id, ["available"], ["error"])
+
+    def wait_for_snapshot_completed(self, snapshot_id):
+        """
+        @return: A L{Deferred} that fires with the L{Snapshot} once it has
+            completed.
+        """
+        return self._snapshots.wait(snapshot_id, ["completed"], ["error"])
@@ -0,0 +1,312 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Submitting Route53 resource record set changes in as few requests as
+possible.
+
+L{_Route53Client.change_resource_record_sets} sends the changes it is given
+as one I{ChangeBatch}.  Route53 rejects batches with more than 1000
+resource records or more than 32000 characters of record values, and allows
+only five requests per second per account.  A L{ChangeSubmitter} splits
+large change sets into batches within those limits and combines the small
+change sets submitted for the same zone within a short window into one
+batch.
+"""
+
+__all__ = [
+    "ChangeSubmitter",
+]
+
+import attr
+
+from twisted.internet.defer import (
+    Deferred, DeferredList, gatherResults, maybeDeferred,
+)
+from twisted.internet.task import deferLater
+
+from txaws.client.throttle import TokenBucket
+
+from .exception import Route53Error, transient
+from .model import AliasRRSet, RRSetKey
+
+
+# The largest batch Route53 accepts.
+# http://docs.aws.amazon.com/Route53/latest/DeveloperGuide/DNSLimitations.html#limits-api-requests-changeresourcerecordsets
+MAX_RECORDS = 1000
+MAX_CHARACTERS = 32000
+
+
+def _key(change):
+    return RRSetKey(change.rrset.label, change.rrset.type)
+
+
+def _size(change):
+    """
+    Measure a change the way Route53 counts it against the batch limits.
+
+    An I{UPSERT} counts twice.  An alias counts as one record with no
+    characters.
+
+    @param change: An L{IRRSetChange} provider.
+
+    @return: A two-tuple of the number of resource records and the number of
+        characters in their values.
+    """
+    factor = 2 if change.action == u"UPSERT" else 1
+    if isinstance(change.rrset, AliasRRSet):
+        return factor, 0
+    records = change.rrset.records
+    characters = sum(len(record.to_text()) for record in records)
+    return factor * len(records), factor * characters
+
+
+def _rejected(reason):
+    """
+    Determine whether a failed batch was rejected because of its content, so
+    that its changes may be accepted if they are submitted separately.
+    """
+    return reason.check(Route53Error) is not None and not transient(reason)
+
+
+@attr.s
+class _Batch(object):
+    """
+    Changes to one zone waiting to be submitted together.
+
+    @ivar parts: C{(changes, Deferred)} tuples, one for each part of a
+        submission included in this batch.
+    @ivar keys: The L{RRSetKey}s of the rrsets changed by this batch.
+    @ivar records: The number of resource records counted against the limit.
+    @ivar characters: The number of characters counted against the limit.
+    @ivar delayed: The L{IDelayedCall} which will send this batch when the
+        window closes.
+    """
+    parts = attr.ib(default=attr.Factory(list))
+    keys = attr.ib(default=attr.Factory(set))
+    records = attr.ib(default=0)
+    characters = attr.ib(default=0)
+    delayed = attr.ib(default=None)
+
+
+class _InFlight(object):
+    """
+    A batch which has been sent, for later batches changing the same rrsets
+    to wait for.
+    """
+    def __init__(self):
+        self._observers = []
+
+    def observe(self):
+        """
+        @return: A L{Deferred} that fires with C{None} once the batch and any
+            parts of it sent again on their own have completed.
+        """
+        d = Deferred()
+        self._observers.append(d)
+        return d
+
+    def done(self):
+        observers, self._observers = self._observers, []
+        for d in observers:
+            d.callback(None)
+
+
+class ChangeSubmitter(object):
+    """
+    Submit resource record set changes with a Route53 client.
+
+    Changes submitted for a zone are held for C{window} seconds and then
+    sent with any others submitted for the same zone in the meantime.  A
+    batch is sent early if the next changes would take it over the limits
+    or would change an rrset it already changes.  A batch which changes an
+    rrset changed by one sent earlier is only sent once that one has
+    completed, so that changes to an rrset are applied in the order they
+    were submitted.  Each submission gets the result of the batches its own
+    changes were part of.  If Route53 rejects a batch combining several
+    submissions, each of them is sent again on its own so that one invalid
+    change does not fail the others.
+
+    A submission too large for one batch is split into several, and so is
+    not applied atomically.
+    """
+    def __init__(self, client, window=0.1, rate=5, max_records=MAX_RECORDS,
+                 max_characters=MAX_CHARACTERS, clock=None):
+        """
+        @param client: A Route53 client, as returned by
+            L{get_route53_client}.
+        @param window: The number of seconds to wait for other changes to a
+            zone before sending a batch.
+        @param rate: The largest number of requests to start per second, or
+            C{None} for no limit.
+        @param max_records: The largest number of resource records to send
+            in one batch.
+        @param max_characters: The largest number of characters of record
+            values to send in one batch.
+        @param clock: An L{IReactorTime} provider, or C{None} for the global
+            reactor.
+        """
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self._client = client
+        self._window = window
+        self._bucket = TokenBucket(rate, burst=1, clock=clock)
+        self._max_records = max_records
+        self._max_characters = max_characters
+        self._clock = clock
+        self._pending = {}
+        # Maps (zone_id, RRSetKey) to the _InFlight for the last batch sent
+        # which changes that rrset, until it completes.
+        self._in_flight = {}
+
+    def submit(self, zone_id, changes):
+        """
+        Submit some changes to a zone.
+
+        @type zone_id: L{unicode}
+        @param changes: An iterable of L{IRRSetChange} providers.
+
+        @return: A L{Deferred} that fires with a L{list} of the
+            L{ChangeInfo}s of the requests which included these changes, or
+            with the L{Failure} of the first of them to fail.
+        """
+        d = gatherResults(
+            list(
+                self._add(zone_id, part)
+                for part in self._split(list(changes))
+            ),
+            consumeErrors=True,
+        )
+        d.addErrback(lambda reason: reason.value.subFailure)
+        return d
+
+    def flush(self):
+        """
+        Send all of the batches waiting for their window to close now.
+        """
+        for zone_id in list(self._pending):
+            self._send_pending(zone_id)
+
+    def _split(self, changes):
+        """
+        Split changes into parts each small enough for one batch.
+        """
+        part = []
+        records = characters = 0
+        for change in changes:
+            change_records, change_characters = _size(change)
+            if part and (
+                records + change_records > self._max_records or
+                characters + change_characters > self._max_characters
+            ):
+                yield part
+                part = []
+                records = characters = 0
+            part.append(change)
+            records += change_records
+            characters += change_characters
+        if part:
+            yield part
+
+    def _add(self, zone_id, changes):
+        """
+        Add part of a submission to the batch waiting for a zone.
+        """
+        records = characters = 0
+        for change in changes:
+            change_records, change_characters = _size(change)
+            records += change_records
+            characters += change_characters
+        keys = set(_key(change) for change in changes)
+
+        batch = self._pending.get(zone_id)
+        if batch is not None and (
+            batch.records + records > self._max_records or
+            batch.characters + characters > self._max_characters or
+            not batch.keys.isdisjoint(keys)
+        ):
+            self._send_pending(zone_id)
+            batch = None
+        if batch is None:
+            batch = self._pending[zone_id] = _Batch()
+            batch.delayed = self._clock.callLater(
+                self._window, self._send_pending, zone_id,
+            )
+
+        d = Deferred()
+        batch.parts.append((changes, d))
+        batch.keys.update(keys)
+        batch.records += records
+        batch.characters += characters
+        return d
+
+    def _send_pending(self, zone_id):
+        batch = self._pending.pop(zone_id)
+        if batch.delayed.active():
+            batch.delayed.cancel()
+        self._send(zone_id, batch.parts)
+
+    def _request(self, zone_id, changes):
+        """
+        Send one batch once the rate limit allows.
+        """
+        delay = self._bucket.consume(1)
+        f = self._client.change_resource_record_sets
+        if delay > 0:
+            return deferLater(self._clock, delay, f, zone_id, changes)
+        return maybeDeferred(f, zone_id, changes)
+
+    def _send(self, zone_id, parts):
+        """
+        Send the changes of some parts as one batch once every earlier batch
+        changing the same rrsets has completed, and give each part the
+        outcome.
+        """
+        keys = set(
+            (zone_id, _key(change))
+            for changes, _ in parts for change in changes
+        )
+        earlier = []
+        for key in keys:
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None and in_flight not in earlier:
+                earlier.append(in_flight)
+        in_flight = _InFlight()
+        for key in keys:
+            self._in_flight[key] = in_flight
+
+        def completed(ignored):
+            for key in keys:
+                if self._in_flight.get(key) is in_flight:
+                    del self._in_flight[key]
+            in_flight.done()
+
+        d = DeferredList(list(batch.observe() for batch in earlier))
+        d.addCallback(lambda ignored: self._attempt(zone_id, parts))
+        d.addCallback(completed)
+
+    def _attempt(self, zone_id, parts):
+        """
+        Send the changes of some parts as one batch and give each part the
+        outcome.
+
+        @return: A L{Deferred} that fires once every part has its outcome,
+            including parts sent again on their own after the batch was
+            rejected.
+        """
+        def sent(result):
+            for _, d in parts:
+                d.callback(result)
+
+        def failed(reason):
+            if len(parts) > 1 and _rejected(reason):
+                return DeferredList(
+                    list(self._attempt(zone_id, [part]) for part in parts)
+                )
+            for _, d in parts:
+                d.errback(reason)
+
+        d = self._request(
+            zone_id, list(change for changes, _ in parts for change in changes)
+        )
+        d.addCallbacks(sent, failed)
+        return d
@@ -7,10 +7,11 @@ Client wrapper for Amazon's Route53 (domain service).
 from __future__ import print_function, unicode_literals
 
 __all__ = [
-    "get_route53_client",
+    "get_route53_client", "walk_resource_record_sets",
 ]
 
 from io import BytesIO
+from datetime import datetime
 from hashlib import sha256
 from operator import itemgetter
 
@@ -19,17 +20,20 @@ import attr
 from twisted.python.log import msg
 from twisted.web.http import OK, CREATED
 from twisted.web.client import FileBodyProducer
-from twisted.internet.defer import succeed
+from twisted.internet.defer import (
+    succeed, maybeDeferred, inlineCallbacks, returnValue,
+)
 from twisted.internet import task
 
-from txaws.exception import AWSError
 from txaws.client.base import RequestDetails, url_context, query, error_wrapper
 from txaws.service import REGION_US_EAST_1, AWSServiceEndpoint
-from txaws.util import XML
+from txaws.util import intern_text, XML
 
 from ._util import maybe_bytes_to_unicode, to_xml, tags
+from .exception import Route53Error
+from .waiters import ChangeWaiters
 from .model import (
-    HostedZone, RRSetType, RRSetKey, RRSet, AliasRRSet, Name, SOA, NS, A, CNAME,
+    ChangeInfo, HostedZone, RRSetKey, RRSet, AliasRRSet, RRSetPage, Name, SOA, NS, A, CNAME,
     AAAA, MX, NAPTR, PTR, SPF, SRV, TXT, UnknownRecordType,
 )
 
@@ -40,19 +44,6 @@ _OTHER_ENDPOINT = "https://route53.amazonaws.com/"
 
 _NS = "https://route53.amazonaws.com/doc/2013-04-01/"
 
-class Route53Error(AWSError):
-    """
-    L{Route53Error} is the base exception type for all errors returned from
-    the AWS Route53 service.
-    """
-    def _set_400_error(self, tree):
-        error = tree.find(".//Error")
-        if error is not None:
-            data = self._node_to_dict(error)
-            if data:
-                self.errors.append(data)
-
-
 def route53_error_wrapper(error):
     error_wrapper(error, Route53Error)
 
@@ -107,12 +98,19 @@ class _Route53Client(object):
 
     @ivar cooperator: The scheduler to use for streaming large request bodies.
     @type cooperator: L{twisted.internet.task.Cooperator}
+
+    @ivar _waiters: The L{ChangeWaiters} shared by all calls to
+        C{wait_for_change}.
     """
     agent = attr.ib()
     creds = attr.ib()
     region = attr.ib()
     endpoint = attr.ib()
     cooperator = attr.ib()
+    _waiters = attr.ib(
+        default=attr.Factory(lambda self: ChangeWaiters(self), takes_self=True),
+        init=False, repr=False, cmp=False,
+    )
 
     def _details(self, op):
         content_sha256 = sha256(op.body).hexdigest().decode("ascii")
@@ -207,6 +205,9 @@ class _Route53Client(object):
         @type zone_id: L{unicode}
 
         @param changes: An iterable of L{txaws.route53.interface.IRRSetChange} providers.
+
+        @return: A L{Deferred} that fires with a L{ChangeInfo} describing the
+            submitted change.
         """
         d = _route53_op(
             method=b"POST",
@@ -219,14 +220,55 @@ class _Route53Client(object):
                     ))
                 )
             ),
+            extract_result=self._handle_change_info_response,
+        )
+        d.addCallback(self._op)
+        return d
+
+    def _handle_change_info_response(self, document):
+        return changeinfo_from_element(document.find("./ChangeInfo"))
+
+    def get_change(self, change_id):
+        """
+        http://docs.aws.amazon.com/Route53/latest/APIReference/API_GetChange.html
+
+        @type change_id: L{unicode}
+
+        @return: A L{Deferred} that fires with a L{ChangeInfo} giving the
+            current status of the change.
+        """
+        d = _route53_op(
+            method=b"GET",
+            path=[u"2013-04-01", u"change", change_id],
+            extract_result=self._handle_change_info_response,
         )
         d.addCallback(self._op)
         return d
 
+    def wait_for_change(self, change_id, timeout=None):
+        """
+        Wait for a change to reach all of the Route53 DNS servers.
+
+        All of the waits of a client share one poll per change.  See
+        L{ChangeWaiters}.
+
+        @type change_id: L{unicode}
+
+        @param timeout: The number of seconds after which to give up with
+            L{TimeoutError}, or C{None} to wait indefinitely.
+
+        @return: A L{Deferred} that fires with the L{ChangeInfo} of the
+            change once its status is I{INSYNC}.
+        """
+        return self._waiters.wait_for_change(change_id, timeout)
+
     def list_resource_record_sets(self, zone_id, maxitems=None, name=None, type=None):
         """
         http://docs.aws.amazon.com/Route53/latest/APIReference/API_ListResourceRecordSets.html
 
+        Only a single page of results is retrieved.  See
+        L{walk_resource_record_sets} to retrieve all of them.
+
         @type zone_id: L{unicode}
         @type maxitems: L{int}
         @type name: L{Name}
@@ -235,6 +277,22 @@ class _Route53Client(object):
         @return: A L{Deferred} that fires with a L{dict} mapping
             L{RRSetKey} instances to corresponding L{RRSet} instances.
         """
+        d = self.list_resource_record_sets_page(zone_id, maxitems, name, type)
+        d.addCallback(lambda page: dict(page.rrsets))
+        return d
+
+    def list_resource_record_sets_page(self, zone_id, maxitems=None, name=None, type=None):
+        """
+        http://docs.aws.amazon.com/Route53/latest/APIReference/API_ListResourceRecordSets.html
+
+        @type zone_id: L{unicode}
+        @type maxitems: L{int}
+        @type name: L{Name}
+        @type type: L{unicode}
+
+        @return: A L{Deferred} that fires with an L{RRSetPage} holding the
+            resource record sets and saying where the next page starts.
+        """
         args = []
         if maxitems:
             args.append((u"maxitems", u"{}".format(maxitems)))
@@ -252,19 +310,75 @@ class _Route53Client(object):
         d.addCallback(self._op)
         return d
 
+    def walk_resource_record_sets(self, zone_id, rrsets_received, maxitems=None, prefetch=True):
+        """
+        Retrieve every resource record set in a hosted zone, one page at a
+        time.
+
+        @see: L{walk_resource_record_sets}
+        """
+        return walk_resource_record_sets(
+            self.list_resource_record_sets_page, zone_id, rrsets_received,
+            maxitems, prefetch,
+        )
+
     def _handle_list_resource_record_sets_response(self, document):
-        result = {}
+        # Names repeat within a response (one label for each of its types,
+        # the same alias and CNAME targets, and so on), so decode each one
+        # once.  The same goes for the values of records.
+        labels = {}
+        targets = {}
+        values = {}
+        result = []
         rrsets = document.iterfind("./ResourceRecordSets/ResourceRecordSet")
         for rrset in rrsets:
-            label = Name(maybe_bytes_to_unicode(rrset.find("Name").text).encode("ascii").decode("idna"))
-            type = maybe_bytes_to_unicode(rrset.find("Type").text)
-
-            for kind in RRSetType.iterconstants():
-                value = self._get_rrset(kind, label, type, rrset)
-                if value is not None:
-                    key = RRSetKey(label, type)
-                    result[key] = value
-                    break
+            fields = {}
+            resourcerecords = aliastarget = None
+            for child in rrset:
+                tag = child.tag
+                if tag == "ResourceRecords":
+                    resourcerecords = child
+                elif tag == "AliasTarget":
+                    aliastarget = child
+                else:
+                    fields[tag] = child.text
+            label = _decode_name(fields["Name"], labels)
+            type = intern_text(maybe_bytes_to_unicode(fields["Type"]))
+
+            if resourcerecords is not None:
+                # http://docs.aws.amazon.com/Route53/latest/APIReference/API_ResourceRecord.html
+                value = RRSet(
+                    label=label,
+                    type=type,
+                    # The docs say TTL is optional but I think that means
+                    # rrsets that contain something other than
+                    # ResourceRecord may not have it.  Hopefully it's
+                    # always present for ResourceRecord-tyle
+                    # ResourceRecordSets?
+                    ttl=int(fields["TTL"]),
+                    records=_records(type, resourcerecords, values),
+                )
+            elif aliastarget is not None:
+                # http://docs.aws.amazon.com/Route53/latest/APIReference/API_AliasTarget.html
+                target = _child_texts(aliastarget)
+                dns_name = target["DNSName"]
+                try:
+                    dns_name = targets[dns_name]
+                except KeyError:
+                    dns_name = targets[dns_name] = Name(
+                        maybe_bytes_to_unicode(dns_name),
+                    )
+                value = AliasRRSet(
+                    label=label,
+                    type=type,
+                    dns_name=dns_name,
+                    evaluate_target_health={
+                        "true": True, "false": False,
+                    }.get(target["EvaluateTargetHealth"]),
+                    hosted_zone_id=intern_text(
+                        maybe_bytes_to_unicode(target["HostedZoneId"]),
+                    ),
+                )
             else:
                 # We didn't find anything we recognize.
                 msg(
@@ -275,51 +389,14 @@ class _Route53Client(object):
                     ),
                     children=rrset.getchildren(),
                 )
-        return result
-
-    def _get_rrset(self, kind, label, type, rrset):
-        return getattr(self, "_get_rrset_" + kind.name)(label, type, rrset)
-
-
-    def _get_rrset_RESOURCE(self, label, type, rrset):
-        # http://docs.aws.amazon.com/Route53/latest/APIReference/API_ResourceRecord.html
-        resourcerecords = rrset.find("./ResourceRecords")
-        if resourcerecords is None:
-            return None
-        records = resourcerecords.iterfind("./ResourceRecord")
-        # The docs say TTL is optional but I think that means rrsets that
-        # contain something other than ResourceRecord may not have it.
-        # Hopefully it's always present for ResourceRecord-tyle
-        # ResourceRecordSets?
-        ttl = int(rrset.find("TTL").text)
-        return RRSet(
-            label=label,
-            type=type,
-            ttl=ttl,
-            records={
-                RECORD_TYPES.get(
-                    type, UnknownRecordType,
-                ).basic_from_element(element)
-                for element
-                in records
-            },
-        )
-
+                continue
+            result.append((RRSetKey(label, type), value))
 
-    def _get_rrset_ALIAS(self, label, type, rrset):
-        # http://docs.aws.amazon.com/Route53/latest/APIReference/API_AliasTarget.html
-        aliastarget = rrset.find("./AliasTarget")
-        if aliastarget is None:
-            return None
-        return AliasRRSet(
-            label=label,
-            type=type,
-            dns_name=Name(maybe_bytes_to_unicode(aliastarget.find("DNSName").text)),
-            evaluate_target_health={
-                "true": True, "false": False,
-            }.get(aliastarget.find("EvaluateTargetHealth").text),
-            hosted_zone_id=maybe_bytes_to_unicode(aliastarget.find("HostedZoneId").text),
-        )
+        next_name = next_type = None
+        if document.findtext("IsTruncated") == u"true":
+            next_name = _decode_name(document.findtext("NextRecordName"), {})
+            next_type = maybe_bytes_to_unicode(document.findtext("NextRecordType"))
+        return RRSetPage(rrsets=result, next_name=next_name, next_type=next_type)
 
 
     def delete_hosted_zone(self, zone_id):
@@ -337,6 +414,73 @@ class _Route53Client(object):
         d.addCallback(self._op)
         return d
 
+def walk_resource_record_sets(list_page, zone_id, rrsets_received, maxitems=None, prefetch=True):
+    """
+    Retrieve every resource record set in a hosted zone by following the
+    I{NextRecordName} and I{NextRecordType} markers from one page to the
+    next.
+
+    Each page is passed to C{rrsets_received} as soon as it arrives so that
+    large zones need not be held in memory all at once.  If
+    C{rrsets_received} returns a L{Deferred}, the next page is not passed to
+    it until that L{Deferred} fires.
+
+    @param list_page: A callable like
+        L{_Route53Client.list_resource_record_sets_page} to retrieve one
+        page.
+
+    @type zone_id: L{unicode}
+
+    @param rrsets_received: A one-argument callable which is passed a
+        L{list} of L{RRSetKey} and L{RRSet} (or L{AliasRRSet}) pairs for each
+        page, in order.
+
+    @param maxitems: The largest number of resource record sets to request
+        per page, or L{None} for the Route53 default.
+    @type maxitems: L{int}
+
+    @param prefetch: If C{True}, request the next page as soon as a page
+        arrives rather than after C{rrsets_received} has handled it.
+    @type prefetch: L{bool}
+
+    @return: A L{Deferred} that fires with the number of resource record
+        sets retrieved once the last page has been handled, or with a
+        L{Failure} if any page cannot be retrieved or handled.
+    """
+    def fetch(page):
+        return list_page(
+            zone_id, maxitems=maxitems, name=page.next_name,
+            type=page.next_type,
+        )
+
+    # A loop rather than a callback per page, so that pages which arrive
+    # already fired do not deepen the stack.
+    @inlineCallbacks
+    def walk():
+        seen = 0
+        page = yield list_page(zone_id, maxitems=maxitems)
+        while True:
+            seen += len(page.rrsets)
+            following = None
+            if prefetch and page.truncated:
+                # Nothing waits on this Deferred until the current page has
+                # been handled, so pages are delivered in order.
+                following = fetch(page)
+            try:
+                yield maybeDeferred(rrsets_received, page.rrsets)
+            except:
+                if following is not None:
+                    following.addErrback(lambda ignored: None)
+                raise
+            if not page.truncated:
+                returnValue(seen)
+            if following is None:
+                following = fetch(page)
+            page = yield following
+
+    return walk()
+
+
 def _route53_op(body=None, **kw):
     """
     Construct an L{_Operation} representing a I{Route53} service API call.
@@ -385,6 +529,54 @@ class _Operation(object):
     extract_result = attr.ib(default=lambda document: None)
 
 
+def _child_texts(element):
+    """
+    Map the tags of the children of an element to their text.
+    """
+    return dict((child.tag, child.text) for child in element)
+
+
+def _decode_name(text, cache):
+    """
+    Construct a L{Name} from a domain name as Route53 sends it, in which
+    internationalized labels are IDNA-encoded.
+
+    @param cache: A L{dict} of names already decoded, which is updated.
+    """
+    try:
+        return cache[text]
+    except KeyError:
+        pass
+    name = maybe_bytes_to_unicode(text)
+    # Decoding IDNA is slow and leaves names without an encoded label
+    # unchanged.
+    if u"xn--" in name.lower():
+        name = name.encode("ascii").decode("idna")
+    cache[text] = result = Name(name)
+    return result
+
+
+def _records(type, resourcerecords, cache):
+    """
+    Construct the records of an rrset from a I{ResourceRecords} element.
+
+    @param cache: A L{dict} of the records already constructed, keyed by
+        their type and text, which is updated.
+
+    @return: A L{set} of L{IBasicResourceRecord} providers.
+    """
+    loader = RECORD_TYPES.get(type, UnknownRecordType)
+    records = set()
+    for element in resourcerecords:
+        key = (type, element.findtext("Value"))
+        try:
+            record = cache[key]
+        except KeyError:
+            record = cache[key] = loader.basic_from_element(element)
+        records.add(record)
+    return records
+
+
 def hostedzone_from_element(zone):
     """
     Construct a L{HostedZone} instance from a I{HostedZone} XML element.
@@ -397,13 +589,58 @@ def hostedzone_from_element(zone):
     )
 
 
+def changeinfo_from_element(change):
+    """
+    Construct a L{ChangeInfo} instance from a I{ChangeInfo} XML element.
+    """
+    comment = change.findtext("Comment")
+    if comment is not None:
+        comment = maybe_bytes_to_unicode(comment)
+    return ChangeInfo(
+        id=maybe_bytes_to_unicode(change.find("Id").text).replace(u"/change/", u""),
+        status=maybe_bytes_to_unicode(change.find("Status").text),
+        submitted_at=datetime.strptime(
+            change.find("SubmittedAt").text[:19], "%Y-%m-%dT%H:%M:%S",
+        ),
+        comment=comment,
+    )
+
+
 def to_element(change):
     """
-    @param change: An L{txaws.route53.interface.IRRSetChange} provider.
+    @param change: An L{txaws.route53.interface.IRRSetChange} provider
+        changing an L{RRSet} or an L{AliasRRSet}.
 
     @return: The L{twisted.web.template} element which describes this
         change.
     """
+    if isinstance(change.rrset, AliasRRSet):
+        # http://docs.aws.amazon.com/Route53/latest/APIReference/API_AliasTarget.html
+        details = [
+            tags.AliasTarget(
+                tags.HostedZoneId(
+                    change.rrset.hosted_zone_id,
+                ),
+                tags.DNSName(
+                    unicode(change.rrset.dns_name),
+                ),
+                tags.EvaluateTargetHealth(
+                    u"true" if change.rrset.evaluate_target_health
+                    else u"false",
+                ),
+            ),
+        ]
+    else:
+        details = [
+            tags.TTL(
+                u"{}".format(change.rrset.ttl),
+            ),
+            tags.ResourceRecords(list(
+                tags.ResourceRecord(tags.Value(rr.to_text()))
+                for rr
+                in sorted(change.rrset.records)
+            )),
+        ]
     return tags.Change(
         tags.Action(
             change.action,
@@ -415,13 +652,6 @@ def to_element(change):
             tags.Type(
                 change.rrset.type,
             ),
-            tags.TTL(
-                u"{}".format(change.rrset.ttl),
-            ),
-            tags.ResourceRecords(list(
-                tags.ResourceRecord(tags.Value(rr.to_text()))
-                for rr
-                in sorted(change.rrset.records)
-            ))
+            *details
         ),
     )
@@ -0,0 +1,37 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+from txaws.exception import AWSError
+
+
+class Route53Error(AWSError):
+    """
+    L{Route53Error} is the base exception type for all errors returned from
+    the AWS Route53 service.
+    """
+    def _set_400_error(self, tree):
+        error = tree.find(".//Error")
+        if error is not None:
+            data = self._node_to_dict(error)
+            if data:
+                self.errors.append(data)
+
+
+# Route53 error codes which mean a request may succeed if it is made again
+# later.
+TRANSIENT_CODES = frozenset([
+    u"Throttling", u"PriorRequestNotComplete", u"ServiceUnavailable",
+])
+
+
+def transient(reason):
+    """
+    Determine whether a request failed with a L{Route53Error} which means it
+    may succeed if it is made again later, such as I{Throttling}.
+
+    @type reason: L{Failure}
+    """
+    if not reason.check(Route53Error):
+        return False
+    return any(
+        error.get("Code") in TRANSIENT_CODES for error in reason.value.errors
+    )
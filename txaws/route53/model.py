@@ -6,9 +6,11 @@ Simple model objects related to Route53 interactions.
 
 __all__ = [
     "Name", "SOA", "NS", "A", "CNAME",
-    "HostedZone",
+    "HostedZone", "normalize_name",
 ]
 
+import re
+
 from ipaddress import IPv4Address, IPv6Address
 
 from zope.interface import implementer, provider
@@ -22,7 +24,7 @@ from ._util import maybe_bytes_to_unicode
 from .interface import IResourceRecordLoader, IBasicResourceRecord, IRRSetChange
 from ..client._validators import set_of
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class Name(object):
     text = attr.ib(
         convert=lambda v: v + u"." if not v.endswith(u".") else v,
@@ -33,7 +35,25 @@ class Name(object):
         return self.text.encode("idna")
 
 
-@attr.s(frozen=True)
+def normalize_name(name):
+    """
+    Put a name in the form used to compare names which Route53 treats as the
+    same: lowercase, with the three-digit octal escapes Route53 uses for
+    characters such as C{*} in the names it lists (C{\\052}) decoded.
+
+    @type name: L{Name}
+    @rtype: L{Name}
+    """
+    text = re.sub(
+        r"\\([0-7]{3})", lambda match: unichr(int(match.group(1), 8)),
+        name.text,
+    ).lower()
+    if text == name.text:
+        return name
+    return Name(text)
+
+
+@attr.s(frozen=True, slots=True)
 class RRSetKey(object):
     label = attr.ib()
     type = attr.ib()
@@ -46,7 +66,7 @@ class RRSetType(Names):
 
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class RRSet(object):
     """
     https://tools.ietf.org/html/rfc2181#section-5
@@ -73,7 +93,7 @@ class RRSet(object):
 
 
 
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class AliasRRSet(object):
     """
     http://docs.aws.amazon.com/Route53/latest/APIReference/API_AliasTarget.html
@@ -99,11 +119,69 @@ class AliasRRSet(object):
 
 
 
+@attr.s(frozen=True, slots=True)
+class RRSetPage(object):
+    """
+    One page of the resource record sets in a hosted zone.
+
+    http://docs.aws.amazon.com/Route53/latest/APIReference/API_ListResourceRecordSets.html
+
+    @ivar rrsets: The resource record sets on this page, in the order Route53
+        returned them.
+    @type rrsets: L{list} of L{tuple} of L{RRSetKey} and L{RRSet} or
+        L{AliasRRSet}
+
+    @ivar next_name: The label of the first resource record set on the next
+        page, or L{None} if this is the last page.
+    @type next_name: L{Name}
+
+    @ivar next_type: The type of the first resource record set on the next
+        page, or L{None} if this is the last page.
+    @type next_type: L{unicode}
+    """
+    rrsets = attr.ib()
+    next_name = attr.ib(default=None)
+    next_type = attr.ib(default=None)
+
+    @property
+    def truncated(self):
+        """
+        Whether there are more resource record sets after this page.
+        """
+        return self.next_name is not None
+
+
+
+@attr.s(frozen=True, slots=True)
+class ChangeInfo(object):
+    """
+    http://docs.aws.amazon.com/Route53/latest/APIReference/API_ChangeInfo.html
+
+    @ivar id: The identifier of the change, without the I{/change/} prefix.
+    @type id: L{unicode}
+
+    @ivar status: C{u"PENDING"} until the change has reached all of the
+        Route53 DNS servers, then C{u"INSYNC"}.
+    @type status: L{unicode}
+
+    @ivar submitted_at: When the change was submitted, in UTC.
+    @type submitted_at: L{datetime.datetime}
+
+    @ivar comment: The comment given with the change, if any.
+    @type comment: L{unicode} or L{None}
+    """
+    id = attr.ib(validator=validators.instance_of(unicode))
+    status = attr.ib(validator=validators.instance_of(unicode))
+    submitted_at = attr.ib()
+    comment = attr.ib(default=None)
+
+
+
 @implementer(IRRSetChange)
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class _ChangeRRSet(object):
     action = attr.ib()
-    rrset = attr.ib(validator=validators.instance_of(RRSet))
+    rrset = attr.ib(validator=validators.instance_of((RRSet, AliasRRSet)))
 
 
 
@@ -121,7 +199,7 @@ def upsert_rrset(rrset):
 
 @provider(IResourceRecordLoader)
 @implementer(IBasicResourceRecord)
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class NS(object):
     nameserver = attr.ib(validator=validators.instance_of(Name))
 
@@ -137,7 +215,7 @@ class NS(object):
 
 @provider(IResourceRecordLoader)
 @implementer(IBasicResourceRecord)
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class A(object):
     address = attr.ib(validator=validators.instance_of(IPv4Address))
 
@@ -153,7 +231,7 @@ class A(object):
 
 @provider(IResourceRecordLoader)
 @implementer(IBasicResourceRecord)
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class AAAA(object):
     address = attr.ib(validator=validators.instance_of(IPv6Address))
 
@@ -169,7 +247,7 @@ class AAAA(object):
 
 @provider(IResourceRecordLoader)
 @implementer(IBasicResourceRecord)
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class MX(object):
     name = attr.ib(validator=validators.instance_of(Name))
     preference = attr.ib(validator=validators.instance_of(int))
@@ -189,7 +267,7 @@ class MX(object):
 
 @provider(IResourceRecordLoader)
 @implementer(IBasicResourceRecord)
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class CNAME(object):
     canonical_name = attr.ib(validator=validators.instance_of(Name))
 
@@ -251,7 +329,7 @@ def _quote(text):
 
 @provider(IResourceRecordLoader)
 @implementer(IBasicResourceRecord)
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class NAPTR(object):
     """
     Represent a Name Authority Pointer record.
@@ -299,7 +377,7 @@ class NAPTR(object):
 
 @provider(IResourceRecordLoader)
 @implementer(IBasicResourceRecord)
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class PTR(object):
     name = attr.ib(validator=validators.instance_of(Name))
 
@@ -315,7 +393,7 @@ class PTR(object):
 
 @provider(IResourceRecordLoader)
 @implementer(IBasicResourceRecord)
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class SPF(object):
     value = attr.ib(validator=validators.instance_of(unicode))
 
@@ -337,7 +415,7 @@ class SPF(object):
 
 @provider(IResourceRecordLoader)
 @implementer(IBasicResourceRecord)
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class SRV(object):
     priority = attr.ib(validator=validators.instance_of(int))
     weight = attr.ib(validator=validators.instance_of(int))
@@ -362,7 +440,7 @@ class SRV(object):
 
 @provider(IResourceRecordLoader)
 @implementer(IBasicResourceRecord)
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class TXT(object):
     texts = attr.ib(
         convert=tuple,
@@ -390,7 +468,7 @@ class TXT(object):
 
 @provider(IResourceRecordLoader)
 @implementer(IBasicResourceRecord)
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class SOA(object):
     mname = attr.ib(validator=validators.instance_of(Name))
     rname = attr.ib(validator=validators.instance_of(Name))
@@ -424,7 +502,7 @@ _SOA_FIELDS = list(field.name for field in attr.fields(SOA))
 
 @provider(IResourceRecordLoader)
 @implementer(IBasicResourceRecord)
-@attr.s(frozen=True)
+@attr.s(frozen=True, slots=True)
 class UnknownRecordType(object):
     value = attr.ib(validator=validators.instance_of(unicode))
 
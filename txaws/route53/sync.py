@@ -0,0 +1,155 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Bringing a Route53 hosted zone to a desired state.
+
+L{sync_zone} lists the current resource record sets of a zone a page at a
+time, works out which to create, delete and replace with set operations on
+their L{RRSetKey}s and submits those changes with a L{ChangeSubmitter}, so a
+zone of thousands of records is synchronized with a handful of requests.
+"""
+
+__all__ = [
+    "diff_rrsets", "sync_zone",
+]
+
+import attr
+
+from .batch import ChangeSubmitter
+from .model import (
+    RRSetKey, create_rrset, delete_rrset, normalize_name, upsert_rrset,
+)
+
+# The largest page of rrsets Route53 will return.
+_PAGE_SIZE = 300
+
+# The rrsets at the apex of a zone which Route53 manages itself.
+_APEX_TYPES = frozenset([u"SOA", u"NS"])
+
+
+def _normalized(rrset):
+    """
+    Give an rrset its label in the form returned by L{normalize_name}, so
+    that it compares equal to the same rrset as Route53 lists it.
+    """
+    label = normalize_name(rrset.label)
+    if label is rrset.label:
+        return rrset
+    return attr.assoc(rrset, label=label)
+
+
+def _by_key(rrsets):
+    """
+    Index some rrsets by their L{RRSetKey}, with their labels normalized.
+
+    @raise ValueError: If two of them have the same label and type.
+    """
+    result = {}
+    for rrset in rrsets:
+        rrset = _normalized(rrset)
+        key = RRSetKey(rrset.label, rrset.type)
+        if key in result:
+            raise ValueError(
+                u"More than one rrset for {} {}".format(key.label, key.type)
+            )
+        result[key] = rrset
+    return result
+
+
+def _apex(rrsets):
+    """
+    Find the keys of the rrsets at the apex of a zone which are left alone
+    by L{diff_rrsets}: its I{SOA} and its I{NS}.
+    """
+    apex = set(
+        key.label for key in rrsets if key.type == u"SOA"
+    )
+    return set(
+        key for key in rrsets
+        if key.type in _APEX_TYPES and key.label in apex
+    )
+
+
+def diff_rrsets(current, desired):
+    """
+    Work out the changes which turn one set of rrsets into another.
+
+    The I{SOA} and I{NS} rrsets at the apex of the zone, which is where its
+    I{SOA} rrset is, are never changed.  Deletions come first, so that if
+    the changes are split over several batches a name is freed before
+    another type of rrset is created there.  Labels are compared as
+    normalized by L{normalize_name} on both sides, and the changes use the
+    normalized labels.
+
+    @param current: A L{dict} mapping L{RRSetKey}s to the L{RRSet}s and
+        L{AliasRRSet}s a zone has, as listed by
+        L{_Route53Client.walk_resource_record_sets}.
+    @param desired: An iterable of the L{RRSet}s and L{AliasRRSet}s it
+        should have.
+
+    @raise ValueError: If C{desired} has more than one rrset with the same
+        label and type.
+
+    @return: A L{list} of L{IRRSetChange} providers.
+    """
+    current = _by_key(current.itervalues())
+    desired = _by_key(desired)
+    skipped = _apex(current) | _apex(desired)
+    current_keys = set(current) - skipped
+    desired_keys = set(desired) - skipped
+
+    def order(keys):
+        return sorted(keys, key=lambda key: (key.label.text, key.type))
+
+    return (
+        list(
+            delete_rrset(current[key])
+            for key in order(current_keys - desired_keys)
+        ) +
+        list(
+            upsert_rrset(desired[key])
+            for key in order(current_keys & desired_keys)
+            if current[key] != desired[key]
+        ) +
+        list(
+            create_rrset(desired[key])
+            for key in order(desired_keys - current_keys)
+        )
+    )
+
+
+def sync_zone(client, zone_id, desired, submitter=None):
+    """
+    Make the rrsets of a hosted zone match the desired ones.
+
+    @param client: A Route53 client, as returned by L{get_route53_client}.
+    @type zone_id: L{unicode}
+    @param desired: An iterable of the L{RRSet}s and L{AliasRRSet}s the zone
+        should have, for example from L{parse_zone_file}.
+    @param submitter: The L{ChangeSubmitter} to submit the changes with, or
+        L{None} to use a new one with the default limits.
+
+    @return: A L{Deferred} that fires with a L{list} of the L{ChangeInfo}s
+        of the requests made, which is empty if the zone already matched.
+        Changes which need more than one request are not applied
+        atomically.
+    """
+    desired = list(desired)
+    if submitter is None:
+        submitter = ChangeSubmitter(client)
+    current = {}
+
+    def listed(ignored):
+        changes = diff_rrsets(current, desired)
+        if not changes:
+            return []
+        d = submitter.submit(zone_id, changes)
+        # Nothing else is waiting to join these batches.
+        submitter.flush()
+        return d
+
+    d = client.walk_resource_record_sets(
+        zone_id, current.update, maxitems=_PAGE_SIZE,
+    )
+    d.addCallback(listed)
+    return d
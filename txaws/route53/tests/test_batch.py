@@ -0,0 +1,252 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.route53.batch}.
+"""
+
+from ipaddress import IPv4Address
+
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+from twisted.web.http import BAD_REQUEST
+
+from txaws.route53.batch import ChangeSubmitter
+from txaws.route53.client import Route53Error
+from txaws.route53.model import (
+    A, TXT, Name, RRSet, create_rrset, upsert_rrset,
+)
+
+
+def _a(label, *addresses):
+    return RRSet(
+        Name(label), u"A", 60,
+        set(A(IPv4Address(address)) for address in addresses),
+    )
+
+
+def _route53_error(code):
+    return Route53Error(
+        b"<?xml version=\"1.0\"?>\n<ErrorResponse><Error><Type>Sender</Type>"
+        b"<Code>" + code + b"</Code><Message>No.</Message></Error>"
+        b"</ErrorResponse>",
+        BAD_REQUEST,
+    )
+
+
+class _Client(object):
+    """
+    Record the batches sent and let the test decide their results.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def change_resource_record_sets(self, zone_id, changes):
+        d = Deferred()
+        self.calls.append((zone_id, changes, d))
+        return d
+
+
+class ChangeSubmitterTestCase(TestCase):
+    """
+    Tests for L{ChangeSubmitter}.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.client = _Client()
+
+    def submitter(self, **kwargs):
+        kwargs.setdefault("clock", self.clock)
+        kwargs.setdefault("rate", None)
+        return ChangeSubmitter(self.client, **kwargs)
+
+    def test_coalesce(self):
+        """
+        Changes submitted for a zone within the window are sent as one batch
+        whose result is given to each submission, while changes for another
+        zone are sent separately.
+        """
+        submitter = self.submitter(window=0.5)
+        first = create_rrset(_a(u"a.example.invalid.", u"10.0.0.1"))
+        second = create_rrset(_a(u"b.example.invalid.", u"10.0.0.2"))
+        other = create_rrset(_a(u"c.example.invalid.", u"10.0.0.3"))
+        d1 = submitter.submit(u"Z1", [first])
+        self.clock.advance(0.25)
+        d2 = submitter.submit(u"Z1", [second])
+        d3 = submitter.submit(u"Z2", [other])
+        self.assertEqual([], self.client.calls)
+
+        self.clock.advance(0.25)
+        self.assertEqual(
+            [(u"Z1", [first, second])],
+            list((zone, changes) for zone, changes, _ in self.client.calls),
+        )
+        self.client.calls[0][2].callback("change-1")
+        self.assertEqual(["change-1"], self.successResultOf(d1))
+        self.assertEqual(["change-1"], self.successResultOf(d2))
+        self.assertNoResult(d3)
+
+        self.clock.advance(0.25)
+        self.assertEqual(u"Z2", self.client.calls[1][0])
+
+    def test_split(self):
+        """
+        A submission with more records than one batch may hold is split into
+        several batches, with an I{UPSERT} counting twice, and fires with the
+        results of all of them.
+        """
+        submitter = self.submitter(max_records=4)
+        changes = [
+            create_rrset(_a(u"a.example.invalid.", u"10.0.0.1", u"10.0.0.2")),
+            upsert_rrset(_a(u"b.example.invalid.", u"10.0.0.3")),
+            upsert_rrset(_a(u"c.example.invalid.", u"10.0.0.4")),
+        ]
+        d = submitter.submit(u"Z1", changes)
+        submitter.flush()
+        self.assertEqual(
+            [changes[:2], changes[2:]],
+            list(changes for _, changes, _ in self.client.calls),
+        )
+        self.client.calls[0][2].callback("change-1")
+        self.client.calls[1][2].callback("change-2")
+        self.assertEqual(["change-1", "change-2"], self.successResultOf(d))
+
+    def test_split_characters(self):
+        """
+        A batch is also limited by the number of characters in the values of
+        its records.
+        """
+        submitter = self.submitter(window=1, max_characters=30)
+        txt = lambda label: create_rrset(RRSet(
+            Name(label), u"TXT", 60, {TXT(texts=(u"x" * 16,))},
+        ))
+        submitter.submit(u"Z1", [txt(u"a.example.invalid.")])
+        submitter.submit(u"Z1", [txt(u"b.example.invalid.")])
+        self.assertEqual(1, len(self.client.calls))
+        self.clock.advance(1)
+        self.assertEqual(2, len(self.client.calls))
+
+    def test_same_rrset(self):
+        """
+        A batch is sent early rather than including two changes to the same
+        rrset, and the batch with the later change is only sent once the
+        first has completed, even if its window has closed before.
+        """
+        submitter = self.submitter()
+        first = create_rrset(_a(u"a.example.invalid.", u"10.0.0.1"))
+        second = upsert_rrset(_a(u"a.example.invalid.", u"10.0.0.2"))
+        d1 = submitter.submit(u"Z1", [first])
+        d2 = submitter.submit(u"Z1", [second])
+        self.assertEqual(1, len(self.client.calls))
+        submitter.flush()
+        self.clock.advance(1)
+        self.assertEqual(1, len(self.client.calls))
+
+        self.client.calls[0][2].callback("change-1")
+        self.assertEqual(["change-1"], self.successResultOf(d1))
+        self.assertEqual(
+            [[first], [second]],
+            list(changes for _, changes, _ in self.client.calls),
+        )
+        self.client.calls[1][2].callback("change-2")
+        self.assertEqual(["change-2"], self.successResultOf(d2))
+
+    def test_same_rrset_after_failure(self):
+        """
+        A batch waiting for an earlier one changing the same rrset is sent
+        once that one has failed, too.
+        """
+        submitter = self.submitter()
+        d1 = submitter.submit(
+            u"Z1", [create_rrset(_a(u"a.example.invalid.", u"10.0.0.1"))],
+        )
+        submitter.submit(
+            u"Z1", [upsert_rrset(_a(u"a.example.invalid.", u"10.0.0.2"))],
+        )
+        submitter.flush()
+        self.client.calls[0][2].errback(_route53_error(b"Throttling"))
+        self.failureResultOf(d1, Route53Error)
+        self.assertEqual(2, len(self.client.calls))
+
+    def test_same_rrset_as_resent_part(self):
+        """
+        A batch changing an rrset which is part of a rejected batch waits
+        for that part to be sent again on its own and to complete.
+        """
+        submitter = self.submitter()
+        a = create_rrset(_a(u"a.example.invalid.", u"10.0.0.1"))
+        b = create_rrset(_a(u"b.example.invalid.", u"10.0.0.2"))
+        later = upsert_rrset(_a(u"a.example.invalid.", u"10.0.0.3"))
+        submitter.submit(u"Z1", [a])
+        d = submitter.submit(u"Z1", [b])
+        submitter.flush()
+        submitter.submit(u"Z1", [later])
+        submitter.flush()
+        self.assertEqual(1, len(self.client.calls))
+
+        self.client.calls[0][2].errback(_route53_error(b"InvalidChangeBatch"))
+        self.assertEqual(
+            [[a], [b]],
+            list(changes for _, changes, _ in self.client.calls[1:]),
+        )
+        self.client.calls[1][2].callback("change-a")
+        self.assertEqual(3, len(self.client.calls))
+        self.client.calls[2][2].errback(_route53_error(b"InvalidChangeBatch"))
+        self.failureResultOf(d, Route53Error)
+        self.assertEqual([later], self.client.calls[3][1])
+
+    def test_rejected(self):
+        """
+        If Route53 rejects a batch combining several submissions, each is
+        sent again on its own and gets its own result.
+        """
+        submitter = self.submitter()
+        good = create_rrset(_a(u"a.example.invalid.", u"10.0.0.1"))
+        bad = create_rrset(_a(u"b.example.invalid.", u"10.0.0.2"))
+        d1 = submitter.submit(u"Z1", [good])
+        d2 = submitter.submit(u"Z1", [bad])
+        submitter.flush()
+        self.client.calls[0][2].errback(_route53_error(b"InvalidChangeBatch"))
+        self.assertEqual(
+            [[good], [bad]],
+            list(changes for _, changes, _ in self.client.calls[1:]),
+        )
+        self.client.calls[1][2].callback("change-2")
+        self.client.calls[2][2].errback(_route53_error(b"InvalidChangeBatch"))
+        self.assertEqual(["change-2"], self.successResultOf(d1))
+        self.failureResultOf(d2, Route53Error)
+
+    def test_throttled(self):
+        """
+        If a combined batch fails because of throttling, every submission in
+        it fails without sending more requests.
+        """
+        submitter = self.submitter()
+        d1 = submitter.submit(
+            u"Z1", [create_rrset(_a(u"a.example.invalid.", u"10.0.0.1"))],
+        )
+        d2 = submitter.submit(
+            u"Z1", [create_rrset(_a(u"b.example.invalid.", u"10.0.0.2"))],
+        )
+        submitter.flush()
+        self.client.calls[0][2].errback(_route53_error(b"Throttling"))
+        self.assertEqual(1, len(self.client.calls))
+        self.failureResultOf(d1, Route53Error)
+        self.failureResultOf(d2, Route53Error)
+
+    def test_rate(self):
+        """
+        No more than C{rate} batches are sent per second.
+        """
+        submitter = self.submitter(window=0, rate=2)
+        for zone_id in [u"Z1", u"Z2", u"Z3"]:
+            submitter.submit(
+                zone_id,
+                [create_rrset(_a(u"a.example.invalid.", u"10.0.0.1"))],
+            )
+        self.clock.advance(0)
+        self.assertEqual(1, len(self.client.calls))
+        self.clock.advance(0.5)
+        self.assertEqual(2, len(self.client.calls))
+        self.clock.advance(0.5)
+        self.assertEqual(3, len(self.client.calls))
@@ -9,7 +9,7 @@ from ipaddress import IPv4Address
 from twisted.trial.unittest import TestCase
 
 from txaws.route53.model import (
-    Name, SOA, NS, CNAME, A,
+    Name, RRSet, RRSetKey, SOA, NS, CNAME, A,
 )
 from txaws.util import XML
 
@@ -106,3 +106,45 @@ class BasicResourceRecordTestCase(TestCase):
             A(address=IPv4Address(u"1.2.3.4")),
             XML(self._a_xml),
         )
+
+
+
+class SlotsTestCase(TestCase):
+    """
+    Tests for the memory layout of the model objects.
+    """
+    def test_no_dict(self):
+        """
+        The model objects, of which large numbers may be held at once, store
+        their attributes in slots rather than a per-instance dictionary.
+        """
+        label = Name(u"example.invalid")
+        a = A(IPv4Address(u"192.0.2.1"))
+        objects = [
+            label,
+            a,
+            RRSetKey(label, u"A"),
+            RRSet(label, u"A", 60, {a}),
+        ]
+        self.assertEqual(
+            [],
+            [o for o in objects if hasattr(o, "__dict__")],
+        )
+
+
+
+class RRSetTestCase(TestCase):
+    """
+    Tests for L{RRSet}.
+    """
+    def test_invalid_record(self):
+        """
+        A record which is not an L{IBasicResourceRecord} provider is refused
+        with an error identifying its position among the sorted records.
+        """
+        label = Name(u"example.invalid")
+        e = self.assertRaises(
+            TypeError,
+            RRSet, label, u"A", 60, {A(IPv4Address(u"192.0.2.1")), u"bogus"},
+        )
+        self.assertIn(u"sorted(records)[1]", unicode(e))
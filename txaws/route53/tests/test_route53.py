@@ -4,8 +4,12 @@
 Tests for ``txaws.route53``.
 """
 
+from datetime import datetime
 from ipaddress import IPv4Address, IPv6Address
 
+import attr
+
+from twisted.internet.defer import Deferred, succeed
 from twisted.internet.task import Cooperator
 from twisted.trial.unittest import TestCase
 from twisted.web.http import OK, BAD_REQUEST
@@ -17,13 +21,13 @@ from txaws.testing.integration import get_live_service
 from txaws.testing.route53_tests import route53_integration_tests
 
 from txaws.route53.model import (
-    HostedZone, RRSetKey, RRSet, AliasRRSet,
+    ChangeInfo, HostedZone, RRSetKey, RRSet, AliasRRSet, RRSetPage,
     create_rrset, delete_rrset, upsert_rrset,
 )
 from txaws.route53.client import (
     A, AAAA, NAPTR, PTR, SPF, SRV, TXT, MX, NS, SOA, CNAME,
     UnknownRecordType,
-    Name, get_route53_client,
+    Name, get_route53_client, walk_resource_record_sets,
     Route53Error,
 )
 
@@ -140,12 +144,18 @@ class sample_change_resource_record_sets_result(object):
 <ChangeResourceRecordSetsResponse>
    <ChangeInfo>
       <Comment>string</Comment>
-      <Id>string</Id>
-      <Status>string</Status>
-      <SubmittedAt>timestamp</SubmittedAt>
+      <Id>/change/C2682N5HXP0BZ4</Id>
+      <Status>PENDING</Status>
+      <SubmittedAt>2017-03-10T01:36:41.958Z</SubmittedAt>
    </ChangeInfo>
 </ChangeResourceRecordSetsResponse>
 """
+    change_info = ChangeInfo(
+        id=u"C2682N5HXP0BZ4",
+        status=u"PENDING",
+        submitted_at=datetime(2017, 3, 10, 1, 36, 41),
+        comment=u"string",
+    )
 
 class sample_list_hosted_zones_result(object):
     details = dict(
@@ -509,6 +519,39 @@ class ListResourceRecordSetsTestCase(TestCase):
         self.assertEquals(rrsets, expected)
 
 
+    def test_names(self):
+        """
+        Internationalized labels are decoded, and the label shared by several
+        rrsets is decoded only once.
+        """
+        zone_id = b"ABCDEF1234"
+        rrset = (
+            u"<ResourceRecordSet><Name>xn--bcher-kva.example.invalid.</Name>"
+            u"<Type>{type}</Type><TTL>60</TTL><ResourceRecords>"
+            u"<ResourceRecord><Value>{value}</Value></ResourceRecord>"
+            u"</ResourceRecords></ResourceRecordSet>"
+        )
+        client = self._client_for_rrsets(zone_id, (
+            u'<?xml version="1.0"?>\n'
+            u'<ListResourceRecordSetsResponse xmlns="https://route53.amazonaws.com/doc/2013-04-01/">'
+            u"<ResourceRecordSets>{}{}</ResourceRecordSets>"
+            u"<IsTruncated>false</IsTruncated><MaxItems>100</MaxItems>"
+            u"</ListResourceRecordSetsResponse>"
+        ).format(
+            rrset.format(type=u"A", value=u"10.0.0.1"),
+            rrset.format(type=u"TXT", value=u'"hello"'),
+        ).encode("utf-8"))
+        rrsets = self.successResultOf(client.list_resource_record_sets(
+            zone_id=zone_id,
+        ))
+        label = Name(u"b\N{LATIN SMALL LETTER U WITH DIAERESIS}cher.example.invalid.")
+        self.assertEqual(
+            {RRSetKey(label, u"A"), RRSetKey(label, u"TXT")}, set(rrsets),
+        )
+        [first, second] = rrsets.values()
+        self.assertIdentical(first.label, second.label)
+
+
     def test_unsupported_records(self):
         """
         If there are resource record sets of unsupported type in the response,
@@ -529,6 +572,211 @@ class ListResourceRecordSetsTestCase(TestCase):
 
 
 
+class _PagedRRSets(Resource):
+    """
+    Serve a zone's rrsets a page at a time, keyed by the I{name} and
+    I{type} query arguments, and record the arguments of each request.
+    """
+    isLeaf = True
+
+    def __init__(self, pages):
+        Resource.__init__(self)
+        self.pages = pages
+        self.requested = []
+
+    def render_GET(self, request):
+        start = (
+            request.args.get(b"name", [None])[0],
+            request.args.get(b"type", [None])[0],
+        )
+        self.requested.append(start)
+        request.setHeader(b"content-type", b"text/xml")
+        return self.pages[start]
+
+
+class WalkResourceRecordSetsTestCase(TestCase):
+    """
+    Tests for C{walk_resource_record_sets}.
+    """
+    template = u"""\
+<?xml version="1.0"?>
+<ListResourceRecordSetsResponse xmlns="https://route53.amazonaws.com/doc/2013-04-01/">
+  <ResourceRecordSets>
+    <ResourceRecordSet>
+      <Name>{label}</Name>
+      <Type>A</Type>
+      <TTL>60</TTL>
+      <ResourceRecords>
+        <ResourceRecord><Value>{address}</Value></ResourceRecord>
+      </ResourceRecords>
+    </ResourceRecordSet>
+  </ResourceRecordSets>
+  {markers}
+  <MaxItems>1</MaxItems>
+</ListResourceRecordSetsResponse>
+"""
+
+    def _page(self, label, address, next_label=None):
+        if next_label is None:
+            markers = u"<IsTruncated>false</IsTruncated>"
+        else:
+            markers = (
+                u"<IsTruncated>true</IsTruncated>"
+                u"<NextRecordName>{}</NextRecordName>"
+                u"<NextRecordType>A</NextRecordType>"
+            ).format(next_label)
+        return self.template.format(
+            label=label, address=address, markers=markers,
+        ).encode("utf-8")
+
+    def test_follow_markers(self):
+        """
+        The client requests each page starting at the name and type given by
+        the previous one until a page is not truncated, passing each page's
+        rrsets to the callback in turn.
+        """
+        zone_id = b"ABCDEF1234"
+        resource = _PagedRRSets({
+            (None, None): self._page(
+                u"a.example.invalid.", u"10.0.0.1", u"b.example.invalid.",
+            ),
+            (b"b.example.invalid.", b"A"): self._page(
+                u"b.example.invalid.", u"10.0.0.2",
+            ),
+        })
+        agent = RequestTraversalAgent(static_resource({
+            b"2013-04-01": {
+                b"hostedzone": {
+                    zone_id: {
+                        b"rrset": resource,
+                    },
+                },
+            },
+        }))
+        aws = AWSServiceRegion(access_key="abc", secret_key="def")
+        client = get_route53_client(agent, aws, uncooperator())
+
+        pages = []
+        count = self.successResultOf(client.walk_resource_record_sets(
+            zone_id, pages.append, maxitems=1,
+        ))
+        self.assertEqual(2, count)
+        self.assertEqual(
+            [(None, None), (b"b.example.invalid.", b"A")],
+            resource.requested,
+        )
+        label = Name(u"b.example.invalid.")
+        self.assertEqual(
+            [(
+                RRSetKey(label, u"A"),
+                RRSet(label, u"A", 60, {A(IPv4Address(u"10.0.0.2"))}),
+            )],
+            pages[1],
+        )
+
+    def _walk(self, prefetch):
+        """
+        Walk three pages which are all available at once, with a callback
+        which does not finish handling a page until the test says so.
+        """
+        pages = {
+            None: RRSetPage([1], Name(u"b.example.invalid."), u"A"),
+            Name(u"b.example.invalid."): RRSetPage(
+                [2], Name(u"c.example.invalid."), u"A",
+            ),
+            Name(u"c.example.invalid."): RRSetPage([3]),
+        }
+        self.requested = []
+        def list_page(zone_id, maxitems=None, name=None, type=None):
+            self.requested.append(name)
+            return succeed(pages[name])
+
+        self.handling = []
+        def rrsets_received(rrsets):
+            d = Deferred()
+            self.handling.append((rrsets, d))
+            return d
+
+        return walk_resource_record_sets(
+            list_page, u"ABCDEF1234", rrsets_received, prefetch=prefetch,
+        )
+
+    def test_prefetch(self):
+        """
+        With C{prefetch}, the next page is requested while the callback is
+        still handling the current one, but pages are passed to the callback
+        one at a time and in order.
+        """
+        d = self._walk(prefetch=True)
+        self.assertEqual(2, len(self.requested))
+        self.assertEqual([[1]], list(rrsets for rrsets, _ in self.handling))
+        self.handling[0][1].callback(None)
+        self.assertEqual(3, len(self.requested))
+        self.assertEqual(
+            [[1], [2]], list(rrsets for rrsets, _ in self.handling),
+        )
+        self.handling[1][1].callback(None)
+        self.handling[2][1].callback(None)
+        self.assertEqual(3, self.successResultOf(d))
+
+    def test_no_prefetch(self):
+        """
+        Without C{prefetch}, the next page is not requested until the
+        callback has handled the current one.
+        """
+        d = self._walk(prefetch=False)
+        self.assertEqual(1, len(self.requested))
+        self.handling[0][1].callback(None)
+        self.assertEqual(2, len(self.requested))
+        self.handling[1][1].callback(None)
+        self.handling[2][1].callback(None)
+        self.assertEqual(3, self.successResultOf(d))
+
+    def test_callback_error(self):
+        """
+        If the callback fails, the walk stops and its L{Deferred} fires with
+        that failure.
+        """
+        d = self._walk(prefetch=True)
+        self.handling[0][1].errback(ValueError("boom"))
+        self.failureResultOf(d, ValueError)
+        self.assertEqual(1, len(self.handling))
+
+    def _walk_synchronous(self, prefetch):
+        """
+        Walk many pages which are each available at once and handled at once.
+        """
+        count = 500
+        def list_page(zone_id, maxitems=None, name=None, type=None):
+            n = 0 if name is None else int(name.text.split(u".")[0])
+            if n + 1 == count:
+                return succeed(RRSetPage([n]))
+            return succeed(RRSetPage(
+                [n], Name(u"{}.example.invalid.".format(n + 1)), u"A",
+            ))
+
+        received = []
+        d = walk_resource_record_sets(
+            list_page, u"ABCDEF1234", received.extend, prefetch=prefetch,
+        )
+        self.assertEqual(count, self.successResultOf(d))
+        self.assertEqual(range(count), received)
+
+    def test_many_synchronous_pages(self):
+        """
+        Pages which are retrieved and handled synchronously do not deepen
+        the stack, however many of them there are.
+        """
+        self._walk_synchronous(prefetch=True)
+
+    def test_many_synchronous_pages_no_prefetch(self):
+        """
+        The same holds without C{prefetch}.
+        """
+        self._walk_synchronous(prefetch=False)
+
+
+
 class ChangeResourceRecordSetsTestCase(TestCase):
     """
     Tests for C{change_resource_record_sets}.
@@ -581,7 +829,7 @@ class ChangeResourceRecordSetsTestCase(TestCase):
         }))
         aws = AWSServiceRegion(access_key="abc", secret_key="def")
         client = get_route53_client(agent, aws, uncooperator())
-        self.successResultOf(client.change_resource_record_sets(
+        change = self.successResultOf(client.change_resource_record_sets(
             zone_id=zone_id,
             changes=[
                 create_rrset(sample_change_resource_record_sets_result.rrset),
@@ -589,6 +837,9 @@ class ChangeResourceRecordSetsTestCase(TestCase):
                 upsert_rrset(sample_change_resource_record_sets_result.rrset),
             ],
         ))
+        self.assertEqual(
+            sample_change_resource_record_sets_result.change_info, change,
+        )
         # Ack, what a pathetic assertion.
         change_template = u"<Change><Action>{action}</Action><ResourceRecordSet><Name>example.invalid.</Name><Type>NS</Type><TTL>86400</TTL><ResourceRecords><ResourceRecord><Value>ns1.example.invalid.</Value></ResourceRecord><ResourceRecord><Value>ns2.example.invalid.</Value></ResourceRecord></ResourceRecords></ResourceRecordSet></Change>"
         changes = [
@@ -602,6 +853,77 @@ class ChangeResourceRecordSetsTestCase(TestCase):
         self.assertEqual((expected,), change_resource.posted)
 
 
+    def test_alias_change(self):
+        """
+        A change to an alias rrset is sent with its I{AliasTarget} in place
+        of a TTL and records.
+        """
+        change_resource = POSTableData(
+            sample_change_resource_record_sets_result.xml,
+            b"text/xml",
+        )
+        zone_id = u"ABCDEF1234"
+        agent = RequestTraversalAgent(static_resource({
+            b"2013-04-01": {
+                b"hostedzone": {
+                    zone_id.encode("ascii"): {
+                        b"rrset": change_resource,
+                    }
+                },
+            },
+        }))
+        aws = AWSServiceRegion(access_key="abc", secret_key="def")
+        client = get_route53_client(agent, aws, uncooperator())
+        alias = sample_list_resource_records_with_alias_result.alias
+        self.successResultOf(client.change_resource_record_sets(
+            zone_id=zone_id, changes=[upsert_rrset(alias)],
+        ))
+        expected = (
+            u"<Change><Action>UPSERT</Action><ResourceRecordSet>"
+            u"<Name>{label}</Name><Type>{type}</Type><AliasTarget>"
+            u"<HostedZoneId>{zone}</HostedZoneId><DNSName>{dns}</DNSName>"
+            u"<EvaluateTargetHealth>{health}</EvaluateTargetHealth>"
+            u"</AliasTarget></ResourceRecordSet></Change>"
+        ).format(
+            label=alias.label, type=alias.type, zone=alias.hosted_zone_id,
+            dns=alias.dns_name,
+            health=u"true" if alias.evaluate_target_health else u"false",
+        ).encode("utf-8")
+        [posted] = change_resource.posted
+        self.assertIn(expected, posted)
+
+
+
+class GetChangeTestCase(TestCase):
+    """
+    Tests for C{get_change}.
+    """
+    def test_change(self):
+        """
+        The status of a change is retrieved by its identifier.
+        """
+        xml = sample_change_resource_record_sets_result.xml.replace(
+            b"ChangeResourceRecordSetsResponse", b"GetChangeResponse",
+        ).replace(b"PENDING", b"INSYNC")
+        agent = RequestTraversalAgent(static_resource({
+            b"2013-04-01": {
+                b"change": {
+                    b"C2682N5HXP0BZ4": Data(xml, b"text/xml"),
+                },
+            },
+        }))
+        aws = AWSServiceRegion(access_key="abc", secret_key="def")
+        client = get_route53_client(agent, aws, uncooperator())
+        change = self.successResultOf(client.get_change(u"C2682N5HXP0BZ4"))
+        self.assertEqual(
+            attr.assoc(
+                sample_change_resource_record_sets_result.change_info,
+                status=u"INSYNC",
+            ),
+            change,
+        )
+
+
 
 def get_live_client(case):
     return get_live_service(case).get_route53_client()
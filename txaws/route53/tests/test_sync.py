@@ -0,0 +1,220 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.route53.sync}.
+"""
+
+from ipaddress import IPv4Address
+
+import attr
+
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from txaws.route53.batch import ChangeSubmitter
+from txaws.route53.model import (
+    A, CNAME, NS, AliasRRSet, Name, RRSet, RRSetKey,
+    create_rrset, delete_rrset, upsert_rrset,
+)
+from txaws.route53.sync import diff_rrsets, sync_zone
+from txaws.testing.integration import get_memory_service
+
+
+ZONE = u"example.invalid."
+
+
+def _a(label, address, ttl=60):
+    return RRSet(
+        Name(label + ZONE), u"A", ttl, {A(IPv4Address(address))},
+    )
+
+
+_cname = RRSet(
+    Name(u"b." + ZONE), u"CNAME", 60, {CNAME(Name(u"a." + ZONE))},
+)
+
+_alias = AliasRRSet(
+    label=Name(u"www." + ZONE), type=u"A",
+    dns_name=Name(u"lb.elb.example.invalid."),
+    evaluate_target_health=False, hosted_zone_id=u"Z35SXDOTRQ7X7K",
+)
+
+
+def _keyed(rrsets):
+    return dict((RRSetKey(r.label, r.type), r) for r in rrsets)
+
+
+def _as_listed(rrset):
+    """
+    Give an rrset its label as Route53 lists it: lowercase, with C{*}
+    escaped.
+    """
+    return attr.assoc(rrset, label=Name(
+        rrset.label.text.lower().replace(u"*", u"\\052"),
+    ))
+
+
+class _ListingClient(object):
+    """
+    Wrap a memory Route53 client so that it lists rrsets the way Route53
+    does.
+    """
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def walk_resource_record_sets(self, zone_id, rrsets_received, **kwargs):
+        def received(page):
+            rrsets_received(_keyed(
+                _as_listed(rrset) for _, rrset in page
+            ).items())
+        return self._client.walk_resource_record_sets(
+            zone_id, received, **kwargs
+        )
+
+
+class DiffRRSetsTestCase(TestCase):
+    """
+    Tests for L{diff_rrsets}.
+    """
+    def test_diff(self):
+        """
+        Rrsets only in the zone are deleted, those which differ are replaced
+        and those which are missing are created, in that order.  The SOA and
+        NS rrsets at the apex are left alone.
+        """
+        apex_ns = RRSet(
+            Name(ZONE), u"NS", 60, {NS(Name(u"ns." + ZONE))},
+        )
+        current = _keyed([
+            _a(u"a.", u"10.0.0.1"), _cname, _alias, apex_ns,
+            RRSet(Name(ZONE), u"SOA", 60, set()),
+        ])
+        desired = [
+            _a(u"a.", u"10.0.0.2"), _alias, _a(u"c.", u"10.0.0.3"),
+            RRSet(Name(ZONE), u"NS", 60, set()),
+        ]
+        self.assertEqual(
+            [
+                delete_rrset(_cname),
+                upsert_rrset(_a(u"a.", u"10.0.0.2")),
+                create_rrset(_a(u"c.", u"10.0.0.3")),
+            ],
+            diff_rrsets(current, desired),
+        )
+
+    def test_normalized_names(self):
+        """
+        Labels are compared without regard to case or to Route53's escaping
+        of C{*}.
+        """
+        current = _keyed([_as_listed(_a(u"*.", u"10.0.0.1"))])
+        self.assertEqual(
+            u"\\052." + ZONE, list(current)[0].label.text,
+        )
+        self.assertEqual([], diff_rrsets(current, [
+            _a(u"*.", u"10.0.0.1"),
+        ]))
+        self.assertEqual([], diff_rrsets(current, [
+            RRSet(Name(u"*.EXAMPLE.invalid."), u"A", 60,
+                  {A(IPv4Address(u"10.0.0.1"))}),
+        ]))
+
+    def test_duplicates(self):
+        """
+        Two desired rrsets with the same label and type are refused.
+        """
+        self.assertRaises(
+            ValueError, diff_rrsets, {},
+            [_a(u"a.", u"10.0.0.1"), _a(u"a.", u"10.0.0.2")],
+        )
+
+
+class SyncZoneTestCase(TestCase):
+    """
+    Tests for L{sync_zone}.
+    """
+    def setUp(self):
+        self.client = get_memory_service(self).get_route53_client()
+        self.zone = self.successResultOf(
+            self.client.create_hosted_zone(u"reference", ZONE),
+        )
+        self.successResultOf(self.client.change_resource_record_sets(
+            self.zone.identifier, [
+                create_rrset(_a(u"a.", u"10.0.0.1")),
+                create_rrset(_cname),
+            ],
+        ))
+
+    def _rrsets(self):
+        pages = []
+        self.successResultOf(self.client.walk_resource_record_sets(
+            self.zone.identifier, pages.append,
+        ))
+        return dict(pair for page in pages for pair in page)
+
+    def test_sync(self):
+        """
+        The zone is changed to match the desired rrsets, including aliases,
+        with one request, and its SOA and NS rrsets are kept.
+        """
+        apex = dict(
+            (key, rrset) for (key, rrset) in self._rrsets().items()
+            if key.label == Name(ZONE)
+        )
+        desired = [_a(u"a.", u"10.0.0.2"), _alias]
+        submitter = ChangeSubmitter(self.client, rate=None, clock=Clock())
+        changes = self.successResultOf(sync_zone(
+            self.client, self.zone.identifier, desired, submitter,
+        ))
+        self.assertEqual(1, len(changes))
+        expected = _keyed(desired)
+        expected.update(apex)
+        self.assertEqual(expected, self._rrsets())
+
+        self.assertEqual([], self.successResultOf(sync_zone(
+            self.client, self.zone.identifier, desired, submitter,
+        )))
+
+    def test_sync_twice(self):
+        """
+        Syncing a zone a second time to rrsets whose names Route53 lists in
+        another form makes no changes.
+        """
+        client = _ListingClient(self.client)
+        desired = [
+            RRSet(Name(u"WWW." + ZONE), u"A", 60,
+                  {A(IPv4Address(u"10.0.0.1"))}),
+            _a(u"*.", u"10.0.0.2"),
+        ]
+        submitter = ChangeSubmitter(client, rate=None, clock=Clock())
+        self.assertEqual(1, len(self.successResultOf(sync_zone(
+            client, self.zone.identifier, desired, submitter,
+        ))))
+        self.assertEqual([], self.successResultOf(sync_zone(
+            client, self.zone.identifier, desired, submitter,
+        )))
+
+    def test_batches(self):
+        """
+        Changes too large for one request are split over several.
+        """
+        desired = list(
+            _a(u"host{}.".format(n), u"10.0.1.{}".format(n))
+            for n in range(5)
+        )
+        submitter = ChangeSubmitter(
+            self.client, rate=None, max_records=2, clock=Clock(),
+        )
+        changes = self.successResultOf(sync_zone(
+            self.client, self.zone.identifier, desired, submitter,
+        ))
+        # Two deletions and five creations.
+        self.assertEqual(4, len(changes))
+        rrsets = self._rrsets()
+        self.assertEqual(_keyed(desired), dict(
+            (key, rrsets[key]) for key in rrsets
+            if key.label != Name(ZONE)
+        ))
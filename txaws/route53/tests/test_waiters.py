@@ -0,0 +1,173 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.route53.waiters}.
+"""
+
+from datetime import datetime
+
+from twisted.internet.defer import Deferred, CancelledError, TimeoutError
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+from twisted.web.http import BAD_REQUEST
+
+from txaws.route53.client import Route53Error
+from txaws.route53.model import ChangeInfo
+from txaws.route53.waiters import ChangeWaiters
+
+
+def _change(status):
+    return ChangeInfo(
+        id=u"C1", status=status, submitted_at=datetime(2017, 3, 10),
+    )
+
+
+def _route53_error(code):
+    return Route53Error(
+        b"<?xml version=\"1.0\"?>\n<ErrorResponse><Error><Type>Sender</Type>"
+        b"<Code>" + code + b"</Code><Message>No.</Message></Error>"
+        b"</ErrorResponse>",
+        BAD_REQUEST,
+    )
+
+
+class _Client(object):
+    """
+    Record I{GetChange} requests and let the test decide their results.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def get_change(self, change_id):
+        d = Deferred()
+        self.calls.append((change_id, d))
+        return d
+
+
+class ChangeWaitersTestCase(TestCase):
+    """
+    Tests for L{ChangeWaiters}.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.client = _Client()
+        self.waiters = ChangeWaiters(
+            self.client, min_interval=2, max_interval=5, backoff=2,
+            clock=self.clock,
+        )
+
+    def test_shared_poll(self):
+        """
+        Callers waiting for the same change share its requests, which are
+        made at growing intervals while the change is pending, and all of
+        them get the change once it is I{INSYNC}.
+        """
+        d1 = self.waiters.wait_for_change(u"C1")
+        d2 = self.waiters.wait_for_change(u"C1")
+        self.assertEqual([u"C1"], list(id for id, _ in self.client.calls))
+        self.client.calls[0][1].callback(_change(u"PENDING"))
+
+        self.clock.advance(2)
+        self.assertEqual(2, len(self.client.calls))
+        self.client.calls[1][1].callback(_change(u"PENDING"))
+        self.clock.advance(3)
+        self.assertEqual(2, len(self.client.calls))
+        self.clock.advance(1)
+        self.assertEqual(3, len(self.client.calls))
+        self.client.calls[2][1].callback(_change(u"PENDING"))
+        self.clock.advance(5)
+        self.client.calls[3][1].callback(_change(u"INSYNC"))
+
+        self.assertEqual(_change(u"INSYNC"), self.successResultOf(d1))
+        self.assertEqual(_change(u"INSYNC"), self.successResultOf(d2))
+        self.assertEqual(4, self.waiters.requests)
+        self.clock.advance(60)
+        self.assertEqual(4, len(self.client.calls))
+
+    def test_separate_changes(self):
+        """
+        Each change is polled for separately.
+        """
+        self.waiters.wait_for_change(u"C1")
+        self.waiters.wait_for_change(u"C2")
+        self.assertEqual(
+            [u"C1", u"C2"], list(id for id, _ in self.client.calls),
+        )
+
+    def test_failure(self):
+        """
+        If a request fails, every caller waiting for the change gets the
+        failure.
+        """
+        d1 = self.waiters.wait_for_change(u"C1")
+        d2 = self.waiters.wait_for_change(u"C1")
+        self.client.calls[0][1].errback(ValueError("boom"))
+        self.failureResultOf(d1, ValueError)
+        self.failureResultOf(d2, ValueError)
+
+    def test_transient_failure(self):
+        """
+        If a request is throttled or fails with another transient error, the
+        status of the change is requested again at the next interval.
+        """
+        d = self.waiters.wait_for_change(u"C1")
+        self.client.calls[0][1].errback(_route53_error(b"Throttling"))
+        self.assertNoResult(d)
+        self.clock.advance(2)
+        self.client.calls[1][1].errback(
+            _route53_error(b"PriorRequestNotComplete"),
+        )
+        self.clock.advance(4)
+        self.client.calls[2][1].callback(_change(u"INSYNC"))
+        self.assertEqual(_change(u"INSYNC"), self.successResultOf(d))
+
+    def test_route53_failure(self):
+        """
+        If a request fails with a Route53 error which is not transient, such
+        as I{NoSuchChange}, the waits fail with it.
+        """
+        d = self.waiters.wait_for_change(u"C1")
+        self.client.calls[0][1].errback(_route53_error(b"NoSuchChange"))
+        self.failureResultOf(d, Route53Error)
+        self.clock.advance(60)
+        self.assertEqual(1, len(self.client.calls))
+
+    def test_failure_after_cancel(self):
+        """
+        A request which fails after every wait for its change was cancelled
+        does not end a poll started for the change since.
+        """
+        d1 = self.waiters.wait_for_change(u"C1")
+        d1.cancel()
+        self.failureResultOf(d1, CancelledError)
+        d2 = self.waiters.wait_for_change(u"C1")
+        self.client.calls[0][1].errback(ValueError("boom"))
+        d3 = self.waiters.wait_for_change(u"C1")
+        self.assertEqual(2, len(self.client.calls))
+        self.client.calls[1][1].callback(_change(u"INSYNC"))
+        self.assertEqual(_change(u"INSYNC"), self.successResultOf(d2))
+        self.assertEqual(_change(u"INSYNC"), self.successResultOf(d3))
+
+    def test_cancel(self):
+        """
+        Once every wait for a change has been cancelled, no more requests are
+        made for it.
+        """
+        d = self.waiters.wait_for_change(u"C1")
+        self.client.calls[0][1].callback(_change(u"PENDING"))
+        d.cancel()
+        self.failureResultOf(d, CancelledError)
+        self.clock.advance(60)
+        self.assertEqual(1, len(self.client.calls))
+
+    def test_timeout(self):
+        """
+        A wait with a timeout fails with L{TimeoutError} if the change is
+        still pending when it expires.
+        """
+        d = self.waiters.wait_for_change(u"C1", timeout=3)
+        self.client.calls[0][1].callback(_change(u"PENDING"))
+        self.clock.advance(2)
+        self.client.calls[1][1].callback(_change(u"PENDING"))
+        self.clock.advance(1)
+        self.failureResultOf(d, TimeoutError)
@@ -0,0 +1,101 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.route53.zonefile}.
+"""
+
+from ipaddress import IPv4Address
+
+from twisted.trial.unittest import TestCase
+
+from txaws.route53.model import A, CNAME, MX, NS, SOA, TXT, Name, RRSet
+from txaws.route53.zonefile import ZoneFileError, parse_zone_file
+
+
+class ParseZoneFileTestCase(TestCase):
+    """
+    Tests for L{parse_zone_file}.
+    """
+    def test_zone(self):
+        """
+        Records are grouped into rrsets by name and type, with relative names
+        made absolute, the owner, TTL and class optional and parentheses
+        continuing a record over several lines.
+        """
+        rrsets = parse_zone_file(u"""\
+$ORIGIN example.invalid.
+$TTL 1h
+@   IN  SOA ns1 hostmaster (
+        2017031001 ; serial
+        7200 900 1209600 86400 )
+    IN  NS  ns1
+www 300 IN A 10.0.0.1
+        IN 300 A 10.0.0.2 ; same rrset
+mail    MX  10 mx.example.net.
+txt     TXT "hello world" "again"
+alias   1d  CNAME www
+""")
+        origin = Name(u"example.invalid.")
+        www = Name(u"www.example.invalid.")
+        self.assertEqual([
+            RRSet(origin, u"SOA", 3600, {SOA(
+                Name(u"ns1.example.invalid."),
+                Name(u"hostmaster.example.invalid."),
+                2017031001, 7200, 900, 1209600, 86400,
+            )}),
+            RRSet(origin, u"NS", 3600, {NS(Name(u"ns1.example.invalid."))}),
+            RRSet(www, u"A", 300, {
+                A(IPv4Address(u"10.0.0.1")), A(IPv4Address(u"10.0.0.2")),
+            }),
+            RRSet(Name(u"mail.example.invalid."), u"MX", 3600, {
+                MX(Name(u"mx.example.net."), 10),
+            }),
+            RRSet(Name(u"txt.example.invalid."), u"TXT", 3600, {
+                TXT((u"hello world", u"again")),
+            }),
+            RRSet(Name(u"alias.example.invalid."), u"CNAME", 86400, {
+                CNAME(www),
+            }),
+        ], rrsets)
+
+    def test_origin_argument(self):
+        """
+        Relative names before any C{$ORIGIN} are relative to C{origin}.
+        """
+        [rrset] = parse_zone_file(
+            u"www A 10.0.0.1\n", origin=Name(u"example.invalid."), ttl=60,
+        )
+        self.assertEqual(
+            RRSet(
+                Name(u"www.example.invalid."), u"A", 60,
+                {A(IPv4Address(u"10.0.0.1"))},
+            ),
+            rrset,
+        )
+
+    def test_normalized_names(self):
+        """
+        Owner names are normalized, so that names differing only in case
+        make up one rrset.
+        """
+        [rrset] = parse_zone_file(u"""\
+$ORIGIN Example.Invalid.
+WWW A 10.0.0.1
+www A 10.0.0.2
+""")
+        self.assertEqual(Name(u"www.example.invalid."), rrset.label)
+        self.assertEqual(2, len(rrset.records))
+
+    def test_errors(self):
+        """
+        L{ZoneFileError} reports the line of a record which cannot be parsed.
+        """
+        for text, line in [
+                (u"www A 10.0.0.1\n", 1),
+                (u"$ORIGIN example.invalid.\n\nwww A 10.0.0.x\n", 3),
+                (u"$INCLUDE other.zone\n", 1),
+                (u"$ORIGIN example.invalid.\n@ SOA ns1 hostmaster ( 1\n", 2),
+                (u"$ORIGIN example.invalid.\n\nv CH TXT \"1\"\n", 3),
+        ]:
+            e = self.assertRaises(ZoneFileError, parse_zone_file, text)
+            self.assertEqual(line, e.line)
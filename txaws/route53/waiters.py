@@ -0,0 +1,161 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Waiting for Route53 changes to propagate.
+
+A change to a hosted zone is I{PENDING} until it has reached all of the
+Route53 DNS servers and then I{INSYNC}.  L{ChangeWaiters} polls for the
+status of each change with one I{GetChange} request at a time, however many
+callers are waiting for it, and lengthens the interval between requests
+while the change stays pending.
+"""
+
+__all__ = [
+    "ChangeWaiters",
+]
+
+from twisted.internet.defer import Deferred
+
+from .exception import transient
+
+
+class _ChangePoll(object):
+    """
+    Poll for the status of one change on behalf of all of its waiters.
+    """
+    def __init__(self, waiters, change_id):
+        self._waiters = waiters
+        self._change_id = change_id
+        self._interval = waiters._min_interval
+        self._delayed_poll = None
+        self._polling = False
+        self.deferreds = []
+
+    def wait(self):
+        d = Deferred(self._cancel)
+        self.deferreds.append(d)
+        if not self._polling and self._delayed_poll is None:
+            self._poll()
+        return d
+
+    def _cancel(self, d):
+        self.deferreds.remove(d)
+        if not self.deferreds:
+            self._stop()
+
+    def _stop(self):
+        self._waiters._finished(self._change_id, self)
+        if self._delayed_poll is not None:
+            self._delayed_poll.cancel()
+            self._delayed_poll = None
+
+    def _poll(self):
+        self._delayed_poll = None
+        self._polling = True
+        self._waiters.requests += 1
+        d = self._waiters._client.get_change(self._change_id)
+        d.addCallbacks(self._got_change, self._failed)
+
+    def _got_change(self, change):
+        self._polling = False
+        if not self.deferreds:
+            return
+        if change.status == u"INSYNC":
+            self._finish(lambda d: d.callback(change))
+            return
+        self._schedule()
+
+    def _failed(self, reason):
+        self._polling = False
+        if not self.deferreds:
+            return
+        if transient(reason):
+            # Throttled or the like: ask again later.
+            self._schedule()
+            return
+        self._finish(lambda d: d.errback(reason))
+
+    def _schedule(self):
+        self._delayed_poll = self._waiters._get_clock().callLater(
+            self._interval, self._poll,
+        )
+        self._interval = min(
+            self._interval * self._waiters._backoff,
+            self._waiters._max_interval,
+        )
+
+    def _finish(self, fire):
+        deferreds, self.deferreds = self.deferreds, []
+        self._stop()
+        for d in deferreds:
+            fire(d)
+
+
+class ChangeWaiters(object):
+    """
+    Wait for Route53 changes to become I{INSYNC}, sharing one poll between
+    all of the callers waiting for each change.
+
+    The status of a change is requested as soon as the first caller starts
+    waiting for it, after C{min_interval} seconds if it is still pending and
+    then at intervals growing by C{backoff} up to C{max_interval}.  A
+    request which is throttled or fails with another transient error is
+    made again at the next interval; any other error fails the waits.  Waits
+    can be cancelled, and the poll stops once no one is waiting.
+
+    @ivar requests: The number of I{GetChange} requests made.
+    """
+    def __init__(self, client, min_interval=2.0, max_interval=30.0,
+                 backoff=1.5, clock=None):
+        """
+        @param client: A Route53 client, as returned by
+            L{get_route53_client}.
+        @param min_interval: The number of seconds to wait before requesting
+            the status of a pending change again.
+        @param max_interval: The largest number of seconds between requests
+            for the status of a change.
+        @param backoff: The factor by which the interval grows after each
+            request which finds the change still pending.
+        @param clock: An L{IReactorTime} provider, or C{None} for the global
+            reactor.
+        """
+        self._client = client
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._backoff = backoff
+        self._clock = clock
+        self._polls = {}
+        self.requests = 0
+
+    def wait_for_change(self, change_id, timeout=None):
+        """
+        Wait for a change to become I{INSYNC}.
+
+        @type change_id: L{unicode}
+
+        @param timeout: The number of seconds after which to give up with
+            L{TimeoutError}, or C{None} to wait indefinitely.
+
+        @return: A L{Deferred} that fires with the L{ChangeInfo} of the
+            change once it is I{INSYNC}.
+        """
+        poll = self._polls.get(change_id)
+        if poll is None:
+            poll = self._polls[change_id] = _ChangePoll(self, change_id)
+        d = poll.wait()
+        if timeout is not None:
+            d.addTimeout(timeout, self._get_clock())
+        return d
+
+    def _get_clock(self):
+        # The global reactor is only imported once it is needed, so that
+        # creating a client does not install one.
+        if self._clock is None:
+            from twisted.internet import reactor
+            self._clock = reactor
+        return self._clock
+
+    def _finished(self, change_id, poll):
+        # A new poll may have started for the change since this one ended.
+        if self._polls.get(change_id) is poll:
+            del self._polls[change_id]
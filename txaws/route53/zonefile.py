@@ -0,0 +1,209 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Reading resource record sets from a BIND master file.
+
+Only what is commonly found in files exported from other DNS services is
+supported: C{$ORIGIN} and C{$TTL}, comments, parentheses continuing a record
+over several lines, C{@}, relative names and records with the owner, TTL or
+class left out.  C{$INCLUDE}, C{$GENERATE} and classes other than I{IN} are
+not.
+
+https://tools.ietf.org/html/rfc1035#section-5
+"""
+
+__all__ = [
+    "ZoneFileError", "parse_zone_file",
+]
+
+import re
+from xml.etree.ElementTree import Element, SubElement
+
+from .client import RECORD_TYPES
+from .model import Name, RRSet, RRSetKey, UnknownRecordType, normalize_name
+
+
+class ZoneFileError(ValueError):
+    """
+    A zone file could not be parsed.
+
+    @ivar line: The number of the line at which the problem was found.
+    """
+    def __init__(self, line, message):
+        super(ZoneFileError, self).__init__(
+            u"line {}: {}".format(line, message),
+        )
+        self.line = line
+
+
+_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[()]|;.*|[^\s();"]+')
+
+_TTL_UNITS = {u"s": 1, u"m": 60, u"h": 3600, u"d": 86400, u"w": 604800}
+
+_CLASSES = frozenset([u"IN", u"CH", u"HS", u"CS"])
+
+# For each record type with domain names in its data, the positions of those
+# names, which are made absolute if they are relative.
+_NAME_FIELDS = {
+    u"CNAME": (0,),
+    u"NS": (0,),
+    u"PTR": (0,),
+    u"MX": (1,),
+    u"SRV": (3,),
+    u"SOA": (0, 1),
+}
+
+
+def _logical_lines(text):
+    """
+    Split a zone file into records.
+
+    @return: An iterator of three-tuples of the line number a record starts
+        on, whether it starts with whitespace (and so has no owner) and its
+        tokens.
+    """
+    depth = 0
+    tokens = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if depth == 0:
+            start = number
+            blank_owner = line[:1] in (u" ", u"\t")
+        for token in _TOKEN.findall(line):
+            if token.startswith(u";"):
+                break
+            elif token == u"(":
+                depth += 1
+            elif token == u")":
+                depth -= 1
+                if depth < 0:
+                    raise ZoneFileError(number, u"unbalanced parentheses")
+            else:
+                tokens.append(token)
+        if depth == 0 and tokens:
+            yield start, blank_owner, tokens
+            tokens = []
+    if depth:
+        raise ZoneFileError(start, u"unbalanced parentheses")
+
+
+def _ttl(text):
+    """
+    Parse a TTL, either in seconds or in BIND's units such as C{1h30m}.
+    """
+    if text.isdigit():
+        return int(text)
+    total = 0
+    for amount, unit in re.findall(r"(\d+)([smhdw])", text.lower()):
+        total += int(amount) * _TTL_UNITS[unit]
+    return total
+
+
+def _is_ttl(text):
+    return re.match(r"^(\d+|(\d+[smhdwSMHDW])+)$", text) is not None
+
+
+def _record(type, value):
+    """
+    Build a record from its text as Route53 would return it.
+    """
+    element = Element("ResourceRecord")
+    SubElement(element, "Value").text = value
+    return RECORD_TYPES.get(type, UnknownRecordType).basic_from_element(
+        element,
+    )
+
+
+def parse_zone_file(text, origin=None, ttl=3600):
+    """
+    Read the resource record sets from a zone file.
+
+    @param text: The contents of the zone file.
+    @type text: L{unicode}
+
+    @param origin: The name relative names are relative to until a
+        C{$ORIGIN} directive, or L{None} if the file begins with one.
+    @type origin: L{Name}
+
+    @param ttl: The TTL of records which have none until a C{$TTL}
+        directive.
+    @type ttl: L{int}
+
+    @raise ZoneFileError: If the file cannot be parsed.
+
+    @return: A L{list} of L{RRSet}s, in the order in which each first
+        appears in the file.  The records of one name and type make up one
+        rrset, with the TTL of the first of them.  Owner names are
+        normalized by L{normalize_name}.
+    """
+    default_ttl = ttl
+    owner = None
+    rrsets = {}
+    order = []
+
+    def absolute(name):
+        if name == u"@":
+            name = u""
+        elif name.endswith(u"."):
+            return Name(name)
+        if origin is None:
+            raise ZoneFileError(number, u"relative name without $ORIGIN")
+        if not name:
+            return origin
+        return Name(u"{}.{}".format(name, origin))
+
+    for number, blank_owner, tokens in _logical_lines(text):
+        if tokens[0].startswith(u"$"):
+            directive = tokens[0].upper()
+            if directive == u"$ORIGIN":
+                origin = Name(tokens[1])
+            elif directive == u"$TTL":
+                default_ttl = _ttl(tokens[1])
+            else:
+                raise ZoneFileError(
+                    number, u"unsupported directive {}".format(tokens[0]),
+                )
+            continue
+
+        if not blank_owner:
+            owner = normalize_name(absolute(tokens.pop(0)))
+        elif owner is None:
+            raise ZoneFileError(number, u"record without an owner")
+
+        record_ttl = default_ttl
+        while tokens and (
+            _is_ttl(tokens[0]) or tokens[0].upper() in _CLASSES
+        ):
+            token = tokens.pop(0)
+            if token.upper() == u"IN":
+                continue
+            elif token.upper() in _CLASSES:
+                raise ZoneFileError(
+                    number, u"unsupported class {}".format(token),
+                )
+            record_ttl = _ttl(token)
+        if len(tokens) < 2:
+            raise ZoneFileError(number, u"record without a type or data")
+        type = tokens.pop(0).upper()
+        for position in _NAME_FIELDS.get(type, ()):
+            if position < len(tokens):
+                tokens[position] = unicode(absolute(tokens[position]))
+
+        try:
+            record = _record(type, u" ".join(tokens))
+        except (ValueError, KeyError, TypeError) as e:
+            raise ZoneFileError(
+                number, u"bad {} record: {}".format(type, e),
+            )
+
+        key = RRSetKey(owner, type)
+        if key in rrsets:
+            rrsets[key][1].add(record)
+        else:
+            order.append(key)
+            rrsets[key] = (record_ttl, {record})
+
+    return list(
+        RRSet(label=key.label, type=key.type, ttl=rrsets[key][0],
+              records=rrsets[key][1])
+        for key in order
+    )
@@ -0,0 +1,219 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+A client-side Bloom filter of the keys in a bucket.
+
+Checking whether an object exists with C{head_object} costs a request even
+when, as is often the case, the answer is no.  A L{BucketKeyFilter} answers
+"definitely not" for most keys which do not exist without any request at all,
+so the request only needs to be made when the filter says the key might
+exist.
+"""
+
+__all__ = [
+    "BloomFilter", "BucketKeyFilter",
+]
+
+from hashlib import md5
+from math import ceil, log
+from struct import Struct
+
+from txaws.s3.client import walk_bucket
+
+
+_HEADER = Struct(">4sIQ")
+_MAGIC = b"TXBF"
+_HASHES = Struct(">QQ")
+
+
+class BloomFilter(object):
+    """
+    A Bloom filter of strings.
+
+    Membership tests may give false positives, at a rate which depends on
+    the size of the filter and the number of strings added, but never false
+    negatives.  Strings cannot be removed.
+
+    @ivar size: The number of bits in the filter.
+    @type size: L{int}
+
+    @ivar hash_count: The number of bits set for each string.
+    @type hash_count: L{int}
+    """
+    def __init__(self, size, hash_count, bits=None):
+        """
+        @param size: See L{BloomFilter.size}.
+        @param hash_count: See L{BloomFilter.hash_count}.
+        @param bits: The bits of an existing filter of the same size, as
+            returned by L{to_bytes}, or C{None} for an empty filter.
+        """
+        if bits is None:
+            bits = bytearray((size + 7) // 8)
+        elif len(bits) != (size + 7) // 8:
+            raise ValueError(
+                "Expected %d bytes of bits, got %d" % (
+                    (size + 7) // 8, len(bits),
+                )
+            )
+        self.size = size
+        self.hash_count = hash_count
+        self._bits = bytearray(bits)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.01):
+        """
+        Create an empty filter sized to hold a number of strings.
+
+        @param capacity: The number of strings expected to be added.
+        @type capacity: L{int}
+
+        @param error_rate: The acceptable rate of false positives once
+            C{capacity} strings have been added.
+        @type error_rate: L{float}
+
+        @return: A new L{BloomFilter}.
+        """
+        capacity = max(capacity, 1)
+        size = int(ceil(-capacity * log(error_rate) / (log(2) ** 2)))
+        hash_count = max(1, int(round(size / float(capacity) * log(2))))
+        return cls(size, hash_count)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Load a filter saved by L{to_bytes}.
+
+        @param data: The saved filter.
+        @type data: L{bytes}
+
+        @raise ValueError: If C{data} is not a saved filter.
+
+        @return: A new L{BloomFilter}.
+        """
+        try:
+            magic, hash_count, size = _HEADER.unpack_from(data)
+        except Exception:
+            raise ValueError("Not a saved Bloom filter")
+        if magic != _MAGIC:
+            raise ValueError("Not a saved Bloom filter")
+        return cls(size, hash_count, data[_HEADER.size:])
+
+    def to_bytes(self):
+        """
+        @return: The filter, as L{bytes} which can be passed to
+            L{from_bytes}.
+        """
+        return _HEADER.pack(_MAGIC, self.hash_count, self.size) + bytes(
+            self._bits
+        )
+
+    def _positions(self, value):
+        if isinstance(value, unicode):
+            value = value.encode("utf-8")
+        # Two independent hashes combined as h1 + i * h2 give as many hashes
+        # as needed for the cost of one digest.
+        first, second = _HASHES.unpack(md5(value).digest())
+        size = self.size
+        return (
+            (first + i * second) % size
+            for i in xrange(self.hash_count)
+        )
+
+    def add(self, value):
+        """
+        Add a string to the filter.
+
+        @type value: L{bytes} or L{unicode}
+        """
+        bits = self._bits
+        for position in self._positions(value):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        bits = self._bits
+        for position in self._positions(value):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class BucketKeyFilter(object):
+    """
+    A L{BloomFilter} of the keys in one bucket, kept up to date with the
+    writes made through it.
+
+    Deleted keys cannot be removed from the filter so they continue to
+    I{might exist} until the filter is rebuilt.
+    """
+    def __init__(self, client, bucket, bloom, prefix=None):
+        """
+        @param client: An L{S3Client} or another object with the same
+            interface.
+        @param bucket: The name of the bucket.
+        @param bloom: The L{BloomFilter} of the keys in the bucket.
+        @param prefix: If given, C{bloom} only holds the keys beginning with
+            this value and any other key might exist.
+        """
+        self._client = client
+        self._bucket = bucket
+        self._prefix = prefix
+        self.bloom = bloom
+
+    @classmethod
+    def build(cls, client, bucket, capacity, error_rate=0.01, prefix=None,
+              page_size=None):
+        """
+        Create a filter of the keys in a bucket by listing all of them.
+
+        @param capacity: The number of keys the filter should be sized for,
+            allowing for those which will be added later.
+        @param error_rate: The acceptable rate of false positives.
+        @param prefix: If given, only add keys beginning with this value.
+            L{might_exist} then answers C{True} for any other key.
+        @param page_size: If given, the maximum number of keys to request in
+            each page of the listing.
+
+        @return: A L{Deferred} that fires with the new L{BucketKeyFilter}.
+        """
+        key_filter = cls(
+            client, bucket, BloomFilter.for_capacity(capacity, error_rate),
+            prefix,
+        )
+        d = walk_bucket(
+            client, bucket, lambda item: key_filter.bloom.add(item.key),
+            prefix=prefix, page_size=page_size,
+        )
+        d.addCallback(lambda ignored: key_filter)
+        return d
+
+    def might_exist(self, object_name):
+        """
+        @param object_name: The name of an object.
+
+        @return: C{False} if the object definitely does not exist, C{True}
+            if it might.
+        """
+        if self._prefix is not None and not object_name.startswith(
+            self._prefix
+        ):
+            # Keys outside the prefix were never added.
+            return True
+        return object_name in self.bloom
+
+    def put_object(self, object_name, *args, **kwargs):
+        """
+        Put an object in the bucket with L{S3Client.put_object} and add it to
+        the filter.
+        """
+        # Add the key first so that the filter never misses an object which
+        # exists, even while the request is in progress.
+        self.bloom.add(object_name)
+        return self._client.put_object(
+            self._bucket, object_name, *args, **kwargs
+        )
+
+    def delete_object(self, object_name):
+        """
+        Delete an object from the bucket with L{S3Client.delete_object}.
+        """
+        return self._client.delete_object(self._bucket, object_name)
@@ -14,29 +14,36 @@ functionality in this wrapper.
 """
 
 from io import BytesIO
+from tempfile import SpooledTemporaryFile
 import datetime
 import mimetypes
 import warnings
 from operator import itemgetter
+from functools import partial
 
 from incremental import Version
 
 from twisted.python.deprecate import deprecatedModuleAttribute
-from twisted.web.http import datetimeToString
+from twisted.web.http import OK, PARTIAL_CONTENT, datetimeToString
 from twisted.web.http_headers import Headers
 from twisted.web.client import FileBodyProducer
 from twisted.internet import task
+from twisted.internet.defer import inlineCallbacks
 
-import hashlib
-from hashlib import sha256
+from hashlib import md5, sha256
 
 from urllib import urlencode, unquote
 from dateutil.parser import parse as parseTime
 
 from txaws.client.base import (
     _URLContext, BaseClient, BaseQuery, error_wrapper,
-    RequestDetails, query,
+    RequestDetails, StreamingBodyReceiver, StreamingXMLReceiver, query,
 )
+from txaws.client.checksum import (
+    ChecksumMismatch, HashingBodyProducer, VerifyingReceiver, etag_md5,
+)
+from txaws.client.producers import GzipBodyProducer, gzip_compress
+from txaws.client.throttle import ThrottledBodyProducer, ThrottledReceiver
 from txaws.s3.acls import AccessControlPolicy
 from txaws.s3.model import (
     Bucket, BucketItem, BucketListing, ItemOwner, LifecycleConfiguration,
@@ -46,22 +53,59 @@ from txaws.s3.model import (
 from txaws import _auth_v4
 from txaws.s3.exception import S3Error
 from txaws.service import AWSServiceEndpoint, REGION_US_EAST_1, S3_ENDPOINT
-from txaws.util import XML
+from txaws.util import intern_text, XML
 
 
 def _to_dict(headers):
     return {k: vs[0] for (k, vs) in headers.getAllRawHeaders()}
 
+
+def _response_etag_md5(response):
+    return etag_md5((response.headers.getRawHeaders(b"etag") or [None])[0])
+
+
+def _verify_etag(result, md5_of):
+    """
+    Check that the ETag of an upload response is the MD5 digest of the data
+    which was sent, if it is an MD5 digest at all.
+
+    @param result: The two-tuple of response and body from the query.
+    @param md5_of: A no-argument callable returning the hex digest of the
+        data which was sent.
+
+    @raise ChecksumMismatch: If the digests differ.
+    """
+    response, body = result
+    etag = _response_etag_md5(response)
+    if etag is not None and etag != md5_of():
+        raise ChecksumMismatch(md5_of(), etag)
+    return result
+
+
 def s3_error_wrapper(error):
     error_wrapper(error, S3Error)
 
 
 class S3Client(BaseClient):
-    """A client for S3."""
+    """
+    A client for S3.
+
+    @ivar upload_throttle: A L{TokenBucket} limiting the rate at which object
+        data is sent, or C{None} for no limit.
+
+    @ivar download_throttle: A L{TokenBucket} limiting the rate at which
+        object data is received, or C{None} for no limit.
+
+    @ivar decode_content: Whether to ask for responses to be compressed with
+        gzip and transparently decompress them.  This also decompresses
+        objects which were stored compressed, such as those put with
+        C{compress=True}.
+    """
 
     def __init__(self, creds=None, endpoint=None, query_factory=None,
                  receiver_factory=None, agent=None, utcnow=None,
-                 cooperator=None):
+                 cooperator=None, upload_throttle=None,
+                 download_throttle=None, decode_content=False):
         if query_factory is None:
             query_factory = query
         self.agent = agent
@@ -69,6 +113,9 @@ class S3Client(BaseClient):
         if cooperator is None:
             cooperator = task
         self._cooperator = cooperator
+        self.upload_throttle = upload_throttle
+        self.download_throttle = download_throttle
+        self.decode_content = decode_content
         super(S3Client, self).__init__(creds, endpoint, query_factory,
                                        receiver_factory=receiver_factory)
 
@@ -79,6 +126,8 @@ class S3Client(BaseClient):
 
 
     def _query_factory(self, details, **kw):
+        if self.decode_content:
+            kw["decode_content"] = True
         return self.query_factory(credentials=self.creds, details=details, **kw)
 
 
@@ -86,6 +135,7 @@ class S3Client(BaseClient):
         body = kw.pop("body", None)
         body_producer = kw.pop("body_producer", None)
         amz_headers = kw.pop("amz_headers", {})
+        throttle = kw.pop("throttle", None)
 
         # It makes no sense to specify both.  That makes it ambiguous
         # what data should make up the request body.
@@ -117,6 +167,9 @@ class S3Client(BaseClient):
             # Tell AWS we're not trying to sign the payload.
             content_sha256 = None
 
+        if throttle is not None and body_producer is not None:
+            body_producer = ThrottledBodyProducer(body_producer, throttle)
+
         return RequestDetails(
             region=REGION_US_EAST_1,
             service=b"s3",
@@ -191,7 +244,8 @@ class S3Client(BaseClient):
         query = self._query_factory(details)
         return self._submit(query)
 
-    def get_bucket(self, bucket, marker=None, max_keys=None, prefix=None):
+    def get_bucket(self, bucket, marker=None, max_keys=None, prefix=None,
+                   item_received=None):
         """
         Get a list of all the objects in a bucket.
 
@@ -212,6 +266,12 @@ class S3Client(BaseClient):
             beginning with this value should be returned.
         @type prefix: L{bytes} or L{NoneType}
 
+        @param item_received: If given, a one-argument callable which is
+            called with each L{BucketItem} as soon as it has been parsed from
+            the response, while the rest of the response is still being
+            received.  In this case the items are not collected and the
+            resulting listing has empty C{contents}.
+
         @return: A L{Deferred} that fires with a L{BucketListing}
             describing the result.
 
@@ -232,12 +292,27 @@ class S3Client(BaseClient):
             method=b"GET",
             url_context=self._url_context(bucket=bucket, object_name=object_name),
         )
-        d = self._submit(self._query_factory(details))
-        d.addCallback(self._parse_get_bucket)
+        if item_received is None:
+            d = self._submit(self._query_factory(details))
+            d.addCallback(self._parse_get_bucket)
+        else:
+            def element_received(content_data):
+                item_received(self._parse_bucket_item(content_data))
+            d = self._submit(self._query_factory(
+                details,
+                receiver_factory=lambda response: StreamingXMLReceiver(
+                    "Contents", element_received,
+                ),
+            ))
+            d.addCallback(
+                lambda (response, root): self._parse_bucket_listing(root)
+            )
         return d
 
     def _parse_get_bucket(self, (response, xml_bytes)):
-        root = XML(xml_bytes)
+        return self._parse_bucket_listing(XML(xml_bytes))
+
+    def _parse_bucket_listing(self, root):
         name = root.findtext("Name")
         prefix = root.findtext("Prefix")
         marker = root.findtext("Marker")
@@ -246,18 +321,7 @@ class S3Client(BaseClient):
         contents = []
 
         for content_data in root.findall("Contents"):
-            key = content_data.findtext("Key")
-            date_text = content_data.findtext("LastModified")
-            modification_date = parseTime(date_text)
-            etag = content_data.findtext("ETag")
-            size = content_data.findtext("Size")
-            storage_class = content_data.findtext("StorageClass")
-            owner_id = content_data.findtext("Owner/ID")
-            owner_display_name = content_data.findtext("Owner/DisplayName")
-            owner = ItemOwner(owner_id, owner_display_name)
-            content_item = BucketItem(key, modification_date, etag, size,
-                                      storage_class, owner)
-            contents.append(content_item)
+            contents.append(self._parse_bucket_item(content_data))
 
         common_prefixes = []
         for prefix_data in root.findall("CommonPrefixes"):
@@ -266,6 +330,20 @@ class S3Client(BaseClient):
         return BucketListing(name, prefix, marker, max_keys, is_truncated,
                              contents, common_prefixes)
 
+    def _parse_bucket_item(self, content_data):
+        key = content_data.findtext("Key")
+        date_text = content_data.findtext("LastModified")
+        modification_date = parseTime(date_text)
+        etag = content_data.findtext("ETag")
+        size = content_data.findtext("Size")
+        storage_class = intern_text(content_data.findtext("StorageClass"))
+        owner_id = intern_text(content_data.findtext("Owner/ID"))
+        owner_display_name = intern_text(
+            content_data.findtext("Owner/DisplayName"))
+        owner = ItemOwner(owner_id, owner_display_name)
+        return BucketItem(key, modification_date, etag, size,
+                          storage_class, owner)
+
     def get_bucket_location(self, bucket):
         """
         Get the location (region) of a bucket.
@@ -422,7 +500,8 @@ class S3Client(BaseClient):
         return AccessControlPolicy.from_xml(xml_bytes)
 
     def put_object(self, bucket, object_name, data=None, content_type=None,
-                   metadata={}, amz_headers={}, body_producer=None):
+                   metadata={}, amz_headers={}, body_producer=None,
+                   throttle=None, compress=False, verify=False):
         """
         Put an object in a bucket.
 
@@ -435,19 +514,104 @@ class S3Client(BaseClient):
         @param content_type: The type of data being written.
         @param metadata: A C{dict} used to build C{x-amz-meta-*} headers.
         @param amz_headers: A C{dict} used to build C{x-amz-*} headers.
+        @param body_producer: An L{IBodyProducer} of the data to write, if
+            C{data} is not given.
+        @param throttle: A L{TokenBucket} limiting the rate at which the data
+            is sent, or C{None} to use the client's C{upload_throttle}.
+        @param compress: If C{True}, store the data compressed with gzip and
+            with a I{Content-Encoding} of C{gzip}.  S3 requires the length of
+            the body in advance, so the compressed output of
+            C{body_producer} is spooled to a temporary file before it is
+            sent.
+        @param verify: If C{True}, hash the data as it is sent and fail with
+            L{ChecksumMismatch} if the ETag of the new object is an MD5
+            digest other than that of the data.
         @return: A C{Deferred} that will fire with the result of request.
         """
-        details = self._details(
-            method=b"PUT",
-            url_context=self._url_context(bucket=bucket, object_name=object_name),
-            headers=self._headers(content_type),
-            metadata=metadata,
-            amz_headers=amz_headers,
-            body=data,
-            body_producer=body_producer,
-        )
-        d = self._submit(self._query_factory(details))
-        d.addCallback(itemgetter(1))
+        headers = self._headers(content_type)
+
+        def put(data, body_producer):
+            if verify:
+                body_producer, md5_of = self._hashing(data, body_producer)
+            details = self._details(
+                method=b"PUT",
+                url_context=self._url_context(
+                    bucket=bucket, object_name=object_name,
+                ),
+                headers=headers,
+                metadata=metadata,
+                amz_headers=amz_headers,
+                body=data,
+                body_producer=body_producer,
+                throttle=throttle or self.upload_throttle,
+            )
+            d = self._submit(self._query_factory(details))
+            if verify:
+                d.addCallback(_verify_etag, md5_of)
+            d.addCallback(itemgetter(1))
+            return d
+
+        if compress:
+            if data is not None and body_producer is not None:
+                raise ValueError(
+                    "data and body_producer are mutually exclusive"
+                )
+            headers.setRawHeaders(u"content-encoding", [u"gzip"])
+            if body_producer is not None:
+                d = self._spool(GzipBodyProducer(body_producer))
+                d.addCallback(lambda producer: put(None, producer))
+                return d
+            data = gzip_compress(data or b"")
+        return put(data, body_producer)
+
+    def _hashing(self, data, body_producer):
+        """
+        Arrange to compute the MD5 digest of a request body.
+
+        @return: A two-tuple of the body producer to send instead of
+            C{body_producer} and a no-argument callable returning the hex
+            digest of the body once it has been sent.
+        """
+        if body_producer is not None:
+            body_producer = HashingBodyProducer(body_producer, ("md5",))
+            return body_producer, body_producer.hexdigest
+        digest = md5(data or b"").hexdigest()
+        return None, lambda: digest
+
+    def _object_receiver(self, verify, throttle, response):
+        """
+        Create the protocol to receive object data with.
+        """
+        receiver = StreamingBodyReceiver()
+        if verify and response.code == OK:
+            expected = _response_etag_md5(response)
+            decoded = self.decode_content and response.headers.hasHeader(
+                b"content-encoding"
+            )
+            if expected is not None and not decoded:
+                receiver = VerifyingReceiver(receiver, expected)
+        if throttle is not None:
+            receiver = ThrottledReceiver(receiver, throttle)
+        return receiver
+
+    def _spool(self, producer):
+        """
+        Write all of the output of a producer to a temporary file.
+
+        @return: A L{Deferred} that fires with a L{FileBodyProducer} of the
+            file.
+        """
+        spool = SpooledTemporaryFile(max_size=2 ** 22)
+        d = producer.startProducing(spool)
+
+        def spooled(ignored):
+            spool.seek(0)
+            return FileBodyProducer(spool, cooperator=self._cooperator)
+
+        def failed(reason):
+            spool.close()
+            return reason
+        d.addCallbacks(spooled, failed)
         return d
 
     def copy_object(self, source_bucket, source_object_name, dest_bucket=None,
@@ -481,15 +645,40 @@ class S3Client(BaseClient):
         d = self._submit(self._query_factory(details))
         return d
 
-    def get_object(self, bucket, object_name):
+    def get_object(self, bucket, object_name, byte_range=None, throttle=None,
+                   verify=False):
         """
         Get an object from a bucket.
+
+        @param bucket: The name of the bucket.
+        @param object_name: The name of the object.
+        @param byte_range: If given, a two-tuple of the offsets of the first
+            and the last (inclusive) bytes of the object to retrieve.
+        @param throttle: A L{TokenBucket} limiting the rate at which the data
+            is received, or C{None} to use the client's C{download_throttle}.
+        @param verify: If C{True}, hash the data as it is received and fail
+            with L{ChecksumMismatch} if the object's ETag is an MD5 digest
+            other than that of the data.  Partial responses and responses
+            decompressed because of C{decode_content} are not checked.
+        @return: A C{Deferred} that will fire with the object's contents (or
+            the requested part of them).
         """
+        headers = Headers()
+        kw = {}
+        if byte_range is not None:
+            headers.setRawHeaders(u"range", [u"bytes=%d-%d" % byte_range])
+            kw["ok_status"] = (OK, PARTIAL_CONTENT)
+        throttle = throttle or self.download_throttle
+        if verify or throttle is not None:
+            kw["receiver_factory"] = partial(
+                self._object_receiver, verify, throttle,
+            )
         details = self._details(
             method=b"GET",
             url_context=self._url_context(bucket=bucket, object_name=object_name),
+            headers=headers,
         )
-        d = self._submit(self._query_factory(details))
+        d = self._submit(self._query_factory(details, **kw))
         d.addCallback(itemgetter(1))
         return d
 
@@ -502,7 +691,7 @@ class S3Client(BaseClient):
             url_context=self._url_context(bucket=bucket, object_name=object_name),
         )
         d = self._submit(self._query_factory(details))
-        d.addCallback(lambda (response, body): _to_dict(response.responseHeaders))
+        d.addCallback(lambda (response, body): _to_dict(response.headers))
         return d
 
     def delete_object(self, bucket, object_name):
@@ -614,7 +803,7 @@ class S3Client(BaseClient):
 
     def upload_part(self, bucket, object_name, upload_id, part_number,
                     data=None, content_type=None, metadata={},
-                    body_producer=None):
+                    body_producer=None, throttle=None, verify=False):
         """
         Upload a part of data corresponding to a multipart upload.
 
@@ -627,19 +816,30 @@ class S3Client(BaseClient):
         @param metadata: Additional metadata
         @param body_producer: an C{IBodyProducer} (optional, requires data if
             not specified)
+        @param throttle: A L{TokenBucket} limiting the rate at which the data
+            is sent, or C{None} to use the client's C{upload_throttle}.
+        @param verify: If C{True}, hash the data as it is sent and fail with
+            L{ChecksumMismatch} if the ETag of the part is an MD5 digest other
+            than that of the data.
         @return: the C{Deferred} from underlying query.submit() call
         """
         parms = 'partNumber=%s&uploadId=%s' % (str(part_number), upload_id)
         objectname_plus = '%s?%s' % (object_name, parms)
+        if verify:
+            body_producer, md5_of = self._hashing(data, body_producer)
         details = self._details(
             method=b"PUT",
             url_context=self._url_context(bucket=bucket, object_name=objectname_plus),
             headers=self._headers(content_type),
             metadata=metadata,
             body=data,
+            body_producer=body_producer,
+            throttle=throttle or self.upload_throttle,
         )
         d = self._submit(self._query_factory(details))
-        d.addCallback(lambda (response, data): _to_dict(response.responseHeaders))
+        if verify:
+            d.addCallback(_verify_etag, md5_of)
+        d.addCallback(lambda (response, data): _to_dict(response.headers))
         return d
 
     def complete_multipart_upload(self, bucket, object_name, upload_id,
@@ -687,6 +887,62 @@ class S3Client(BaseClient):
         return '\n'.join(xml)
 
 
+def walk_bucket(client, bucket, item_received, prefix=None, marker=None,
+                page_size=None):
+    """
+    Visit every object in a bucket, requesting as many pages of the listing
+    as are necessary.
+
+    Pages are requested one after another, each starting after the last key
+    received so far, until a page which is not truncated is received.
+
+    @param client: An L{S3Client} or another object with the same
+        C{get_bucket} method.
+
+    @param bucket: The name of the bucket from which to list objects.
+    @type bucket: L{unicode}
+
+    @param item_received: A one-argument callable which is called with each
+        L{BucketItem}, in key order.
+
+    @param prefix: If given, only visit objects with keys beginning with this
+        value.
+    @type prefix: L{bytes} or L{NoneType}
+
+    @param marker: If given, only visit objects with keys which sort after
+        this value.
+    @type marker: L{bytes} or L{NoneType}
+
+    @param page_size: If given, the maximum number of objects to request in
+        each page.
+    @type page_size: L{int} or L{NoneType}
+
+    @return: A L{Deferred} that fires with C{None} after all of the objects
+        have been visited.
+    """
+    position = [marker]
+
+    def received(item):
+        position[0] = item.key
+        item_received(item)
+
+    # A loop rather than a callback per page, so that pages which arrive
+    # already fired do not deepen the stack.
+    @inlineCallbacks
+    def walk():
+        while True:
+            start = position[0]
+            listing = yield client.get_bucket(
+                bucket, marker=start, max_keys=page_size, prefix=prefix,
+                item_received=received,
+            )
+            truncated = listing.is_truncated.lower() == u"true"
+            if not truncated or position[0] == start:
+                return
+
+    return walk()
+
+
 class Query(BaseQuery):
     """A query for submission to the S3 service."""
 
@@ -751,7 +1007,7 @@ class Query(BaseQuery):
             data = self.data
             if data is None:
                 data = b""
-            headers["x-amz-content-sha256"] = hashlib.sha256(data).hexdigest()
+            headers["x-amz-content-sha256"] = sha256(data).hexdigest()
         else:
             data = None
             headers["x-amz-content-sha256"] = b"UNSIGNED-PAYLOAD"
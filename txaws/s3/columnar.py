@@ -0,0 +1,243 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+A compact, column-oriented representation of bucket listings.
+
+A L{BucketItem} per object is convenient but costs hundreds of bytes per key.
+L{BucketColumns} instead keeps one array per attribute, so whole-bucket
+reports over tens of millions of keys fit in one process.
+"""
+
+__all__ = [
+    "BucketColumns", "get_bucket_columns",
+]
+
+from array import array
+from itertools import compress
+
+from txaws.s3.client import walk_bucket
+from txaws.util import epoch_seconds
+
+
+class BucketColumns(object):
+    """
+    The keys, sizes, modification times and storage classes of many bucket
+    items, stored in parallel arrays.
+
+    Keys are kept UTF-8 encoded in a single string table with an array of
+    offsets into it.  Storage classes are kept as indexes into a table of the
+    distinct values seen.
+
+    @ivar sizes: The size in bytes of each item.
+    @type sizes: L{array} of unsigned longs
+
+    @ivar mtimes: The modification time of each item, in seconds since the
+        epoch.
+    @type mtimes: L{array} of longs
+    """
+    def __init__(self):
+        self._keys = bytearray()
+        self._key_offsets = array("L", [0])
+        self.sizes = array("L")
+        self.mtimes = array("l")
+        self._storage_classes = array("B")
+        self._storage_class_names = []
+        self._storage_class_indexes = {}
+
+    @classmethod
+    def from_items(cls, items):
+        """
+        Build columns from some L{BucketItem}s, such as the C{contents} of a
+        L{BucketListing}.
+        """
+        columns = cls()
+        columns.extend(items)
+        return columns
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def append(self, item):
+        """
+        Add a L{BucketItem} to the end of the columns.
+
+        This can be used as the C{item_received} callable of
+        L{S3Client.get_bucket} or L{walk_bucket}.
+        """
+        key = item.key
+        if isinstance(key, unicode):
+            key = key.encode("utf-8")
+        self._append(
+            key, int(item.size), epoch_seconds(item.modification_date),
+            item.storage_class,
+        )
+
+    def extend(self, items):
+        """
+        Add each of some L{BucketItem}s to the end of the columns.
+        """
+        for item in items:
+            self.append(item)
+
+    def _append(self, key, size, mtime, storage_class):
+        self._keys.extend(key)
+        self._key_offsets.append(len(self._keys))
+        self.sizes.append(size)
+        self.mtimes.append(mtime)
+        index = self._storage_class_indexes.get(storage_class)
+        if index is None:
+            index = len(self._storage_class_names)
+            self._storage_class_names.append(storage_class)
+            self._storage_class_indexes[storage_class] = index
+        self._storage_classes.append(index)
+
+    def _key_bytes(self, index):
+        return bytes(
+            self._keys[self._key_offsets[index]:self._key_offsets[index + 1]]
+        )
+
+    def key(self, index):
+        """
+        @return: The key of the item at C{index}.
+        @rtype: L{unicode}
+        """
+        return self._key_bytes(index).decode("utf-8")
+
+    def keys(self):
+        """
+        @return: An iterator of the keys of all of the items, in order.
+        """
+        return (self.key(index) for index in xrange(len(self)))
+
+    def storage_class(self, index):
+        """
+        @return: The storage class of the item at C{index}.
+        """
+        return self._storage_class_names[self._storage_classes[index]]
+
+    def total_size(self):
+        """
+        @return: The sum of the sizes of all of the items.
+        @rtype: L{int}
+        """
+        return sum(self.sizes)
+
+    def select(self, mask):
+        """
+        Make new columns holding only some of the items.
+
+        @param mask: An iterable of booleans, one per item, true for the items
+            to keep.
+
+        @return: A new L{BucketColumns}.
+        """
+        selected = BucketColumns()
+        for index in compress(xrange(len(self)), mask):
+            selected._append(
+                self._key_bytes(index), self.sizes[index], self.mtimes[index],
+                self.storage_class(index),
+            )
+        return selected
+
+    def with_prefix(self, prefix):
+        """
+        @param prefix: The key prefix to match.
+        @type prefix: L{unicode} or L{bytes}
+
+        @return: New L{BucketColumns} holding only the items with keys
+            beginning with C{prefix}.
+        """
+        if isinstance(prefix, unicode):
+            prefix = prefix.encode("utf-8")
+        keys = self._keys
+        offsets = self._key_offsets
+        return self.select(
+            keys.startswith(prefix, offsets[index], offsets[index + 1])
+            for index in xrange(len(self))
+        )
+
+    def modified_before(self, when):
+        """
+        @param when: The cut-off time.
+        @type when: L{datetime}
+
+        @return: New L{BucketColumns} holding only the items last modified
+            before C{when}.
+        """
+        cutoff = epoch_seconds(when)
+        return self.select(mtime < cutoff for mtime in self.mtimes)
+
+    def modified_since(self, when):
+        """
+        @param when: The cut-off time.
+        @type when: L{datetime}
+
+        @return: New L{BucketColumns} holding only the items last modified
+            at or after C{when}.
+        """
+        cutoff = epoch_seconds(when)
+        return self.select(mtime >= cutoff for mtime in self.mtimes)
+
+    def group_by_prefix(self, delimiter=u"/", depth=1):
+        """
+        Roll the items up by the leading components of their keys.
+
+        @param delimiter: The string which separates key components.
+        @type delimiter: L{unicode}
+
+        @param depth: The number of leading components which make up the
+            prefix of each group.
+        @type depth: L{int}
+
+        @return: A L{dict} mapping each prefix (including its trailing
+            delimiter, or the whole key for keys with fewer components) to a
+            two-tuple of the number of items and their total size.
+        """
+        separator = delimiter.encode("utf-8")
+        groups = {}
+        for index in xrange(len(self)):
+            key = self._key_bytes(index)
+            end = -1
+            for ignored in xrange(depth):
+                end = key.find(separator, end + 1)
+                if end == -1:
+                    break
+            if end == -1:
+                prefix = key
+            else:
+                prefix = key[:end + len(separator)]
+            count, size = groups.get(prefix, (0, 0))
+            groups[prefix] = (count + 1, size + self.sizes[index])
+        return {
+            prefix.decode("utf-8"): value
+            for (prefix, value)
+            in groups.iteritems()
+        }
+
+
+def get_bucket_columns(client, bucket, prefix=None, page_size=None):
+    """
+    List all of the objects in a bucket into a L{BucketColumns}.
+
+    @param client: An L{S3Client} or another object with the same
+        C{get_bucket} method.
+
+    @param bucket: The name of the bucket from which to list objects.
+    @type bucket: L{unicode}
+
+    @param prefix: If given, only list objects with keys beginning with this
+        value.
+    @type prefix: L{bytes} or L{NoneType}
+
+    @param page_size: If given, the maximum number of objects to request in
+        each page of the listing.
+    @type page_size: L{int} or L{NoneType}
+
+    @return: A L{Deferred} that fires with the L{BucketColumns}.
+    """
+    columns = BucketColumns()
+    d = walk_bucket(
+        client, bucket, columns.append, prefix=prefix, page_size=page_size,
+    )
+    d.addCallback(lambda ignored: columns)
+    return d
@@ -0,0 +1,359 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+A persistent local inventory of the objects in a bucket.
+
+Listing a large bucket takes many requests.  L{BucketInventory} records the
+results of a listing in an SQLite database so they can be queried locally,
+and later brought up to date without listing the whole bucket again.
+
+The first L{BucketInventory.refresh} lists the whole bucket.  Each page is
+committed to the database together with the marker for the next one, so if
+the process stops part way through, the next refresh resumes where it left
+off.  Once a full listing has completed, refreshes only re-list the prefixes
+which were marked dirty, either explicitly with L{BucketInventory.mark_dirty}
+or by writes made through L{BucketInventory.put_object} and
+L{BucketInventory.delete_object}.
+
+Each listing pass stamps the rows it writes with a new generation number, and
+once the pass is complete any older rows in the range it covered belong to
+objects which no longer exist and are removed.
+"""
+
+__all__ = [
+    "BucketInventory",
+]
+
+import sqlite3
+from datetime import datetime
+
+from dateutil.tz import tzutc
+
+from twisted.internet.defer import succeed
+
+from txaws.s3.model import BucketItem
+from txaws.util import epoch_seconds
+
+
+_SCHEMA = u"""
+CREATE TABLE IF NOT EXISTS objects (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    mtime INTEGER NOT NULL,
+    storage_class TEXT,
+    generation INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS dirty (
+    prefix TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+
+def _prefix_range(prefix):
+    """
+    @return: A two-tuple of the lowest key with C{prefix} and the lowest key
+        greater than all keys with C{prefix}, or C{None} if there is no such
+        key.
+    """
+    prefix = unicode(prefix)
+    while prefix and prefix[-1] == u"\U0010ffff":
+        prefix = prefix[:-1]
+    if not prefix:
+        return (u"", None)
+    return (prefix, prefix[:-1] + unichr(ord(prefix[-1]) + 1))
+
+
+def _key_prefix(key, delimiter=u"/"):
+    """
+    @return: The part of C{key} up to and including the last C{delimiter}.
+    """
+    return key[:key.rfind(delimiter) + 1]
+
+
+class BucketInventory(object):
+    """
+    An SQLite-backed record of the objects in one bucket.
+
+    Database operations are local and run synchronously.
+    """
+    def __init__(self, client, bucket, path=u":memory:"):
+        """
+        @param client: An L{S3Client} or another object with the same
+            interface.
+        @param bucket: The name of the bucket.
+        @param path: The path of the SQLite database file.  It is created if
+            it does not exist.  The default keeps the inventory in memory.
+        """
+        self._client = client
+        self._bucket = bucket
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        """
+        Close the database.
+        """
+        self._db.close()
+
+    def _get_state(self, name, default=None):
+        row = self._db.execute(
+            u"SELECT value FROM state WHERE name = ?", (name,),
+        ).fetchone()
+        if row is None:
+            return default
+        return row[0]
+
+    def _set_state(self, name, value):
+        self._db.execute(
+            u"INSERT OR REPLACE INTO state (name, value) VALUES (?, ?)",
+            (name, value),
+        )
+
+    def _next_generation(self):
+        generation = int(self._get_state(u"generation", 0)) + 1
+        self._set_state(u"generation", generation)
+        return generation
+
+    @property
+    def complete(self):
+        """
+        Whether a full listing of the bucket has been recorded.
+        """
+        return self._get_state(u"complete") == u"1"
+
+    def refresh(self, page_size=None):
+        """
+        Bring the inventory up to date.
+
+        If no full listing has completed yet, one is started or resumed from
+        the last recorded page.  Otherwise the dirty prefixes are re-listed.
+
+        @param page_size: If given, the maximum number of objects to request
+            in each page of a listing.
+
+        @return: A L{Deferred} that fires with C{None} when the inventory is
+            up to date.
+        """
+        if self.complete:
+            return self._list_dirty(page_size)
+        return self._list_all(page_size)
+
+    def rebuild(self, page_size=None):
+        """
+        Start a new full listing of the bucket, replacing the current
+        inventory once it completes.
+
+        @return: A L{Deferred} like the one returned by L{refresh}.
+        """
+        with self._db:
+            self._set_state(u"complete", u"0")
+            self._set_state(u"marker", None)
+        return self._list_all(page_size)
+
+    def _list_all(self, page_size):
+        with self._db:
+            generation = self._get_state(u"full_generation")
+            if generation is None or self._get_state(u"marker") is None:
+                generation = self._next_generation()
+                self._set_state(u"full_generation", generation)
+        generation = int(generation)
+        d = self._list(
+            None, self._get_state(u"marker"), generation, page_size, True,
+        )
+
+        def listed(ignored):
+            with self._db:
+                self._db.execute(
+                    u"DELETE FROM objects WHERE generation < ?",
+                    (generation,),
+                )
+                self._set_state(u"marker", None)
+                self._set_state(u"complete", u"1")
+        d.addCallback(listed)
+        return d
+
+    def _list_dirty(self, page_size):
+        dirty = self._db.execute(
+            u"SELECT prefix, version FROM dirty ORDER BY prefix",
+        ).fetchall()
+
+        def list_next(ignored):
+            if not dirty:
+                return None
+            prefix, version = dirty.pop(0)
+            with self._db:
+                generation = self._next_generation()
+            d = self._list(prefix, None, generation, page_size, False)
+            d.addCallback(listed, prefix, version, generation)
+            d.addCallback(list_next)
+            return d
+
+        def listed(ignored, prefix, version, generation):
+            low, high = _prefix_range(prefix)
+            with self._db:
+                if high is None:
+                    self._db.execute(
+                        u"DELETE FROM objects "
+                        u"WHERE key >= ? AND generation < ?",
+                        (low, generation),
+                    )
+                else:
+                    self._db.execute(
+                        u"DELETE FROM objects "
+                        u"WHERE key >= ? AND key < ? AND generation < ?",
+                        (low, high, generation),
+                    )
+                # Leave the prefix dirty if it was written to again while it
+                # was being listed.
+                self._db.execute(
+                    u"DELETE FROM dirty WHERE prefix = ? AND version = ?",
+                    (prefix, version),
+                )
+
+        d = succeed(None)
+        d.addCallback(list_next)
+        return d
+
+    def _list(self, prefix, marker, generation, page_size, save_marker):
+        """
+        Record every object after C{marker} with C{prefix}, one page at a
+        time.
+        """
+        def get_page(marker):
+            d = self._client.get_bucket(
+                self._bucket, marker=marker, max_keys=page_size,
+                prefix=prefix,
+            )
+            d.addCallback(got_page)
+            return d
+
+        def got_page(listing):
+            items = listing.contents or []
+            with self._db:
+                self._db.executemany(
+                    u"INSERT OR REPLACE INTO objects "
+                    u"(key, size, etag, mtime, storage_class, generation) "
+                    u"VALUES (?, ?, ?, ?, ?, ?)",
+                    list(
+                        (item.key, int(item.size), item.etag,
+                         epoch_seconds(item.modification_date),
+                         item.storage_class, generation)
+                        for item in items
+                    ),
+                )
+                if items and save_marker:
+                    self._set_state(u"marker", items[-1].key)
+            truncated = listing.is_truncated.lower() == u"true"
+            if truncated and items:
+                return get_page(items[-1].key)
+            return None
+
+        return get_page(marker)
+
+    def mark_dirty(self, prefix):
+        """
+        Record that objects with keys beginning with C{prefix} have changed,
+        so the next L{refresh} re-lists them.
+
+        @type prefix: L{unicode}
+        """
+        with self._db:
+            self._db.execute(
+                u"INSERT OR REPLACE INTO dirty (prefix, version) VALUES "
+                u"(?, COALESCE((SELECT version FROM dirty WHERE prefix = ?), 0)"
+                u" + 1)",
+                (prefix, prefix),
+            )
+
+    def put_object(self, object_name, *args, **kwargs):
+        """
+        Put an object in the bucket with L{S3Client.put_object} and mark the
+        prefix it is in dirty.
+        """
+        d = self._client.put_object(
+            self._bucket, object_name, *args, **kwargs
+        )
+        d.addCallback(self._written, object_name)
+        return d
+
+    def delete_object(self, object_name):
+        """
+        Delete an object from the bucket with L{S3Client.delete_object} and
+        mark the prefix it was in dirty.
+        """
+        d = self._client.delete_object(self._bucket, object_name)
+        d.addCallback(self._written, object_name)
+        return d
+
+    def _written(self, result, object_name):
+        self.mark_dirty(_key_prefix(object_name))
+        return result
+
+    def _item(self, row):
+        key, size, etag, mtime, storage_class = row
+        return BucketItem(
+            key=key,
+            modification_date=datetime.fromtimestamp(mtime, tz=tzutc()),
+            etag=etag,
+            size=b"%d" % (size,),
+            storage_class=storage_class,
+        )
+
+    def get(self, key):
+        """
+        @return: A L{BucketItem} for the object with the given key, without
+            an owner, or C{None} if there is no such object in the inventory.
+        """
+        row = self._db.execute(
+            u"SELECT key, size, etag, mtime, storage_class FROM objects "
+            u"WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        return self._item(row)
+
+    def items(self, prefix=None, start_after=None, end_before=None,
+              limit=None):
+        """
+        Query the inventory.
+
+        @param prefix: If given, only include objects with keys beginning
+            with this value.
+        @param start_after: If given, only include objects with keys which
+            sort after this value.
+        @param end_before: If given, only include objects with keys which
+            sort before this value.
+        @param limit: If given, the maximum number of objects to include.
+
+        @return: A L{list} of L{BucketItem}s, without owners, in key order.
+        """
+        where = []
+        args = []
+        if prefix is not None:
+            low, high = _prefix_range(prefix)
+            where.append(u"key >= ?")
+            args.append(low)
+            if high is not None:
+                where.append(u"key < ?")
+                args.append(high)
+        if start_after is not None:
+            where.append(u"key > ?")
+            args.append(start_after)
+        if end_before is not None:
+            where.append(u"key < ?")
+            args.append(end_before)
+        query = u"SELECT key, size, etag, mtime, storage_class FROM objects"
+        if where:
+            query += u" WHERE " + u" AND ".join(where)
+        query += u" ORDER BY key"
+        if limit is not None:
+            query += u" LIMIT ?"
+            args.append(limit)
+        return list(self._item(row) for row in self._db.execute(query, args))
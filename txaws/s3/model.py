@@ -21,7 +21,7 @@ class Bucket(object):
     creation_date = attr.ib()
 
 
-@attr.s
+@attr.s(slots=True)
 class ItemOwner(object):
     """
     The owner of a content item.
@@ -30,7 +30,7 @@ class ItemOwner(object):
     display_name = attr.ib()
 
 
-@attr.s
+@attr.s(slots=True)
 class BucketItem(object):
     """
     The contents of an Amazon S3 bucket.
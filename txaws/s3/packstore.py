@@ -0,0 +1,275 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Storage of many small blobs packed together into larger S3 objects.
+
+Storing each small blob as its own object costs one request per blob.
+L{PackStore} instead buffers blobs in memory and writes them out together as
+one I{pack} object followed by an I{index} object recording where in the pack
+each blob is.  Blobs are read back with a ranged GET of the pack.
+
+Packs and indexes are never modified after they are written.  An index is
+only written after its pack has been written completely, and a pack is only
+used once its index exists, so a crash part way through a flush leaves at
+worst an unreferenced pack object behind.  Pack names sort in the order they
+were written and later packs take precedence over earlier ones, so writing a
+blob again replaces it.
+"""
+
+__all__ = [
+    "PackStore",
+]
+
+import json
+from uuid import uuid4
+
+from twisted.internet.defer import Deferred, succeed, fail
+
+from txaws.s3.client import walk_bucket
+
+
+class PackStore(object):
+    """
+    A key/value store of small blobs kept in pack objects in an S3 bucket.
+
+    @ivar flush_size: The number of buffered bytes at which a flush is
+        started.
+    @type flush_size: L{int}
+
+    @ivar flush_delay: The longest time, in seconds, that a blob is buffered
+        before a flush is started.
+    @type flush_delay: L{float}
+    """
+    def __init__(self, client, bucket, prefix=u"", flush_size=2 ** 23,
+                 flush_delay=5.0, reactor=None):
+        """
+        @param client: An L{S3Client} or another object with the same
+            interface.
+        @param bucket: The name of the bucket to keep the packs in.
+        @param prefix: A prefix for the names of the pack and index objects.
+        @param flush_size: See L{PackStore.flush_size}.
+        @param flush_delay: See L{PackStore.flush_delay}.
+        @param reactor: An L{IReactorTime} provider used to schedule flushes,
+            or C{None} for the global reactor.
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        self._client = client
+        self._bucket = bucket
+        self._prefix = prefix
+        self._reactor = reactor
+        self.flush_size = flush_size
+        self.flush_delay = flush_delay
+
+        # Blobs waiting to be flushed, in the order they were put.
+        self._buffer = []
+        self._buffered = {}
+        self._buffer_size = 0
+        self._waiting = []
+        self._delayed_flush = None
+
+        # Blobs which are being flushed, so they can still be read.
+        self._flushing = {}
+
+        # Maps keys to (pack name, offset, length) for every blob in every
+        # pack whose index has been loaded.
+        self._index = {}
+        self._loaded_packs = set()
+
+        # The number of packs this store has named.
+        self._sequence = 0
+
+    def _pack_object_name(self, pack):
+        return u"%spacks/%s" % (self._prefix, pack)
+
+    def _index_object_name(self, pack):
+        return u"%sindex/%s" % (self._prefix, pack)
+
+    def _new_pack_name(self):
+        # Zero-padded milliseconds sort in time order and the sequence number
+        # orders the packs this store writes within one millisecond; the
+        # random part keeps names from concurrent writers apart.
+        self._sequence += 1
+        return u"%015d-%08d-%s" % (
+            int(self._reactor.seconds() * 1000), self._sequence, uuid4().hex,
+        )
+
+    def put(self, key, data):
+        """
+        Store a blob.
+
+        The blob is buffered and written out with others on the next flush.
+        Until then it can still be read back with L{get}.
+
+        @param key: The name of the blob.
+        @type key: L{unicode}
+
+        @param data: The contents of the blob.
+        @type data: L{bytes}
+
+        @return: A L{Deferred} that fires with C{None} once the blob has been
+            written to a pack and the pack's index has been written.
+        """
+        self._buffer.append((key, data))
+        self._buffered[key] = data
+        self._buffer_size += len(data)
+        waiting = Deferred()
+        self._waiting.append(waiting)
+        if self._buffer_size >= self.flush_size:
+            d = self.flush()
+            # Failures are delivered to the Deferreds returned by put.
+            d.addErrback(lambda reason: None)
+        elif self._delayed_flush is None:
+            self._delayed_flush = self._reactor.callLater(
+                self.flush_delay, self._timed_flush,
+            )
+        return waiting
+
+    def flush(self):
+        """
+        Write all of the buffered blobs to a new pack now.
+
+        @return: A L{Deferred} that fires with C{None} once the pack and its
+            index have been written, or fails if either could not be.  The
+            L{Deferred}s returned by L{put} for the blobs in the pack fire at
+            the same time.
+        """
+        if self._delayed_flush is not None:
+            self._delayed_flush.cancel()
+            self._delayed_flush = None
+        if not self._buffer:
+            return succeed(None)
+
+        blobs = self._buffer
+        flushing = self._buffered
+        waiting = self._waiting
+        self._buffer = []
+        self._buffered = {}
+        self._buffer_size = 0
+        self._waiting = []
+        self._flushing.update(flushing)
+
+        # Only the last blob put for each key makes it into the pack.
+        entries = {}
+        chunks = []
+        offset = 0
+        for key, data in blobs:
+            if key in entries:
+                continue
+            data = flushing[key]
+            entries[key] = [offset, len(data)]
+            chunks.append(data)
+            offset += len(data)
+
+        pack = self._new_pack_name()
+        index = json.dumps({u"pack": pack, u"entries": entries})
+        d = self._client.put_object(
+            self._bucket, self._pack_object_name(pack), b"".join(chunks),
+            content_type=b"application/octet-stream",
+        )
+        d.addCallback(
+            lambda ignored: self._client.put_object(
+                self._bucket, self._index_object_name(pack), index,
+                content_type=b"application/json",
+            )
+        )
+
+        def finished(reason):
+            for key, data in flushing.iteritems():
+                if self._flushing.get(key) is data:
+                    del self._flushing[key]
+            for d in waiting:
+                if reason is None:
+                    d.callback(None)
+                else:
+                    d.errback(reason)
+
+        def succeeded(ignored):
+            self._add_index(pack, entries)
+            finished(None)
+
+        def failed(reason):
+            finished(reason)
+            return reason
+
+        d.addCallbacks(succeeded, failed)
+        return d
+
+    def _timed_flush(self):
+        self._delayed_flush = None
+        d = self.flush()
+        # Failures are delivered to the Deferreds returned by put.
+        d.addErrback(lambda reason: None)
+
+    def _add_index(self, pack, entries):
+        for key, (offset, length) in entries.iteritems():
+            current = self._index.get(key)
+            if current is None or current[0] < pack:
+                self._index[key] = (pack, offset, length)
+        self._loaded_packs.add(pack)
+
+    def load_index(self):
+        """
+        Read the indexes of any packs in the bucket which have not been read
+        yet, such as those written by other L{PackStore}s.
+
+        @return: A L{Deferred} that fires with C{None} once the indexes have
+            been read.
+        """
+        index_prefix = self._index_object_name(u"")
+        packs = []
+
+        def index_found(item):
+            pack = item.key[len(index_prefix):]
+            if pack not in self._loaded_packs:
+                packs.append(pack)
+
+        d = walk_bucket(
+            self._client, self._bucket, index_found, prefix=index_prefix,
+        )
+
+        def read_indexes(ignored):
+            if not packs:
+                return None
+            d = self._client.get_object(
+                self._bucket, self._index_object_name(packs.pop(0)),
+            )
+            d.addCallback(read_index)
+            d.addCallback(read_indexes)
+            return d
+
+        def read_index(data):
+            index = json.loads(data)
+            self._add_index(index[u"pack"], index[u"entries"])
+
+        d.addCallback(read_indexes)
+        return d
+
+    def get(self, key):
+        """
+        Retrieve a blob.
+
+        Blobs which have not been flushed yet are read from memory.  Others
+        are read with a ranged GET of the pack they are in, using the index
+        loaded by L{load_index} or built up by this store's own flushes.
+
+        @param key: The name of the blob.
+        @type key: L{unicode}
+
+        @return: A L{Deferred} that fires with the contents of the blob or
+            fails with L{KeyError} if there is no such blob in any known
+            pack.
+        """
+        for pending in (self._buffered, self._flushing):
+            if key in pending:
+                return succeed(pending[key])
+        try:
+            pack, offset, length = self._index[key]
+        except KeyError:
+            return fail(KeyError(key))
+        if length == 0:
+            return succeed(b"")
+        return self._client.get_object(
+            self._bucket, self._pack_object_name(pack),
+            byte_range=(offset, offset + length - 1),
+        )
@@ -0,0 +1,111 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.s3.bloom}.
+"""
+
+from twisted.trial.unittest import TestCase
+
+from txaws.s3.bloom import BloomFilter, BucketKeyFilter
+from txaws.testing.integration import get_memory_service
+
+
+class BloomFilterTestCase(TestCase):
+    """
+    Tests for L{BloomFilter}.
+    """
+    def test_no_false_negatives(self):
+        """
+        Every string added to the filter is reported as present.
+        """
+        bloom = BloomFilter.for_capacity(1000)
+        keys = list(u"key-%d" % (i,) for i in range(1000))
+        for key in keys:
+            bloom.add(key)
+        self.assertEqual([], list(key for key in keys if key not in bloom))
+
+    def test_error_rate(self):
+        """
+        When the filter holds as many strings as it was sized for, the rate
+        of false positives is close to the requested rate.
+        """
+        bloom = BloomFilter.for_capacity(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(u"present-%d" % (i,))
+        false_positives = sum(
+            u"absent-%d" % (i,) in bloom for i in range(10000)
+        )
+        self.assertTrue(false_positives < 300, false_positives)
+
+    def test_roundtrip(self):
+        """
+        A filter loaded by L{BloomFilter.from_bytes} from the result of
+        L{BloomFilter.to_bytes} is the same as the original.
+        """
+        bloom = BloomFilter.for_capacity(100)
+        bloom.add(b"a")
+        bloom.add(u"\N{SNOWMAN}")
+        loaded = BloomFilter.from_bytes(bloom.to_bytes())
+        self.assertEqual(
+            (bloom.size, bloom.hash_count, bloom.to_bytes()),
+            (loaded.size, loaded.hash_count, loaded.to_bytes()),
+        )
+        self.assertIn(u"\N{SNOWMAN}", loaded)
+
+    def test_from_bytes_invalid(self):
+        """
+        L{BloomFilter.from_bytes} raises L{ValueError} if it is not given a
+        saved filter.
+        """
+        self.assertRaises(ValueError, BloomFilter.from_bytes, b"junk")
+        data = BloomFilter.for_capacity(100).to_bytes()
+        self.assertRaises(ValueError, BloomFilter.from_bytes, data[:-1])
+
+
+class BucketKeyFilterTestCase(TestCase):
+    """
+    Tests for L{BucketKeyFilter}.
+    """
+    def test_build_and_update(self):
+        """
+        L{BucketKeyFilter.build} adds the keys of the objects already in the
+        bucket and L{BucketKeyFilter.put_object} adds the keys of new
+        objects.
+        """
+        client = get_memory_service(self).get_s3_client()
+        self.successResultOf(client.create_bucket(u"bucket"))
+        for i in range(5):
+            self.successResultOf(client.put_object(u"bucket", u"old-%d" % (i,)))
+        key_filter = self.successResultOf(
+            BucketKeyFilter.build(client, u"bucket", 100, page_size=2),
+        )
+        self.assertTrue(all(
+            key_filter.might_exist(u"old-%d" % (i,)) for i in range(5)
+        ))
+        self.assertFalse(key_filter.might_exist(u"new"))
+
+        self.successResultOf(key_filter.put_object(u"new", b"data"))
+        self.assertTrue(key_filter.might_exist(u"new"))
+        self.assertEqual(
+            b"data", self.successResultOf(client.get_object(u"bucket", u"new")),
+        )
+
+        self.successResultOf(key_filter.delete_object(u"new"))
+        listing = self.successResultOf(client.get_bucket(u"bucket"))
+        self.assertNotIn(u"new", list(item.key for item in listing.contents))
+
+    def test_build_prefix(self):
+        """
+        A filter built from the keys under a prefix reports that keys
+        outside the prefix might exist, since it never saw them.
+        """
+        client = get_memory_service(self).get_s3_client()
+        self.successResultOf(client.create_bucket(u"bucket"))
+        self.successResultOf(client.put_object(u"bucket", u"a/1"))
+        self.successResultOf(client.put_object(u"bucket", u"b/1"))
+        key_filter = self.successResultOf(
+            BucketKeyFilter.build(client, u"bucket", 100, prefix=u"a/"),
+        )
+        self.assertTrue(key_filter.might_exist(u"a/1"))
+        self.assertFalse(key_filter.might_exist(u"a/2"))
+        self.assertTrue(key_filter.might_exist(u"b/1"))
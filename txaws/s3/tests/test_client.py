@@ -1,20 +1,30 @@
 import datetime
-from hashlib import sha256
+from hashlib import md5, sha256
 import warnings
+import zlib
 from urllib import quote
 
 from attr import assoc
 
-from twisted.internet.defer import succeed
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
 from twisted.trial.unittest import TestCase
+from twisted.web.client import ResponseDone
+from twisted.web.http import OK, PARTIAL_CONTENT
 from twisted.web.http_headers import Headers
 
 from txaws.credentials import AWSCredentials
 from txaws.client.base import RequestDetails
+from txaws.client.checksum import ChecksumMismatch
+from txaws.client.throttle import (
+    TokenBucket, ThrottledBodyProducer, ThrottledReceiver,
+)
 from txaws.s3 import client
 from txaws.s3.acls import AccessControlPolicy
 from txaws.s3.model import (RequestPayment, MultipartInitiationResponse,
-                            MultipartCompletionResponse)
+                            MultipartCompletionResponse, BucketItem,
+                            BucketListing)
 from txaws.testing.producers import StringBodyProducer
 from txaws.testing.s3_tests import s3_integration_tests
 from txaws.service import AWSServiceEndpoint, REGION_US_EAST_1
@@ -147,20 +157,76 @@ class S3URLContextTestCase(TestCase):
             url,
         )
 
-def mock_query_factory(response_body):
+def mock_query_factory(response_body, headers=None):
     class Response(object):
-        responseHeaders = Headers()
+        pass
+    Response.headers = Headers(headers or {})
 
     class MockQuery(object):
-        def __init__(self, credentials, details):
+        def __init__(self, credentials, details, **kw):
             self.__class__.credentials = credentials
             self.__class__.details = details
+            self.__class__.kw = kw
 
         def submit(self, agent, receiver_factory, utcnow):
             return succeed((Response(), response_body))
     return MockQuery
 
 
+def producing_query_factory(response_body, headers=None):
+    """
+    Create a query factory like L{mock_query_factory} but which consumes the
+    request body before responding.  The body producer must produce
+    synchronously, as L{StringBodyProducer} does.
+    """
+    base = mock_query_factory(response_body, headers)
+
+    class Consumer(object):
+        def __init__(self):
+            self.chunks = []
+
+        def write(self, data):
+            self.chunks.append(data)
+
+    class ProducingQuery(base):
+        def submit(self, agent, receiver_factory, utcnow):
+            consumer = Consumer()
+            self.details.body_producer.startProducing(consumer)
+            self.__class__.body = b"".join(consumer.chunks)
+            return base.submit(self, agent, receiver_factory, utcnow)
+    return ProducingQuery
+
+
+def streaming_query_factory(response_body, chunk_size=16, headers=None):
+    """
+    Create a query factory like L{mock_query_factory} but which delivers
+    C{response_body} a piece at a time to the receiver created by the
+    C{receiver_factory} it is given.
+    """
+    class Response(object):
+        code = OK
+        length = len(response_body)
+    Response.headers = Headers(headers or {})
+
+    class StreamingQuery(object):
+        def __init__(self, credentials, details, receiver_factory):
+            self.__class__.details = details
+            self.receiver_factory = receiver_factory
+
+        def submit(self, agent, receiver_factory, utcnow):
+            response = Response()
+            receiver = self.receiver_factory(response)
+            receiver.finished = d = Deferred()
+            receiver.content_length = response.length
+            for i in range(0, len(response_body), chunk_size):
+                receiver.dataReceived(response_body[i:i + chunk_size])
+                self.__class__.chunks_delivered = i // chunk_size + 1
+            receiver.connectionLost(Failure(ResponseDone()))
+            d.addCallback(lambda result: (response, result))
+            return d
+    return StreamingQuery
+
+
 class S3ClientTestCase(TestCase):
 
     def setUp(self):
@@ -273,6 +339,22 @@ class S3ClientTestCase(TestCase):
         d.addCallback(check_results)
         return d
 
+    def test_get_bucket_shares_repeated_values(self):
+        """
+        The L{BucketItem}s parsed by L{S3Client.get_bucket} share storage for
+        values which repeat from item to item and have no per-instance
+        dictionary.
+        """
+        query_factory = mock_query_factory(payload.sample_get_bucket_result)
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        listing = self.successResultOf(s3.get_bucket("mybucket"))
+        first, second = listing.contents
+        self.assertIdentical(first.storage_class, second.storage_class)
+        self.assertIdentical(first.owner.id, second.owner.id)
+        self.assertFalse(hasattr(first, "__dict__"))
+        self.assertFalse(hasattr(first.owner, "__dict__"))
+
     def test_get_bucket_pagination(self):
         """
         L{S3Client.get_bucket} accepts C{marker} and C{max_keys} arguments
@@ -311,6 +393,41 @@ class S3ClientTestCase(TestCase):
         d.addCallback(check_query_args)
         return d
 
+    def test_get_bucket_item_received(self):
+        """
+        If L{S3Client.get_bucket} is given an C{item_received} callable, it is
+        called with each L{BucketItem} as soon as that item has been received,
+        before the rest of the response is received.
+        """
+        query_factory = streaming_query_factory(
+            payload.sample_get_bucket_result,
+        )
+        received = []
+        def item_received(item):
+            received.append((item, query_factory.chunks_delivered))
+
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        listing = self.successResultOf(
+            s3.get_bucket("mybucket", item_received=item_received),
+        )
+        self.assertEqual(
+            (u"mybucket", u"N", u"Ned", []),
+            (listing.name, listing.prefix, listing.marker, listing.contents),
+        )
+        self.assertEqual(
+            [u"Nelson", u"Neo"],
+            list(item.key for (item, chunks) in received),
+        )
+        self.assertEqual(
+            u"bcaf1ffd86f41caff1a493dc2ad8c2c281e37522a640e161ca5fb16fd081034f",
+            received[0][0].owner.id,
+        )
+        # The first item was delivered before the whole body was.
+        self.assertTrue(
+            received[0][1] < len(payload.sample_get_bucket_result) // 16,
+        )
+
     def test_get_bucket_location(self):
         """
         L{S3Client.get_bucket_location} creates a L{Query} to get a bucket's
@@ -931,6 +1048,68 @@ class S3ClientTestCase(TestCase):
         d.addCallback(check_query_args)
         return d
 
+    def test_get_object_byte_range(self):
+        """
+        L{S3Client.get_object} requests only part of an object if it is given
+        C{byte_range} and accepts the partial content response.
+        """
+        query_factory = mock_query_factory(b"cd")
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        data = self.successResultOf(
+            s3.get_object("mybucket", "objectname", byte_range=(2, 3)),
+        )
+        self.assertEqual(b"cd", data)
+        self.assertEqual(
+            [b"bytes=2-3"],
+            query_factory.details.headers.getRawHeaders(b"range"),
+        )
+        self.assertEqual(
+            {"ok_status": (OK, PARTIAL_CONTENT)},
+            query_factory.kw,
+        )
+
+    def test_get_object_throttle(self):
+        """
+        If the client has a C{download_throttle}, L{S3Client.get_object}
+        receives the object data with a L{ThrottledReceiver} using it.
+        """
+        query_factory = mock_query_factory(b"data")
+        bucket = TokenBucket(100, clock=Clock())
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(
+            creds, query_factory=query_factory, download_throttle=bucket,
+        )
+        self.successResultOf(s3.get_object("mybucket", "objectname"))
+        receiver = query_factory.kw["receiver_factory"](None)
+        self.assertIsInstance(receiver, ThrottledReceiver)
+        self.assertIdentical(bucket, receiver._bucket)
+
+    def test_put_object_throttle(self):
+        """
+        L{S3Client.put_object} sends the object data with a
+        L{ThrottledBodyProducer} using the C{throttle} it is given or else the
+        client's C{upload_throttle}.
+        """
+        query_factory = mock_query_factory(None)
+        default = TokenBucket(100, clock=Clock())
+        specific = TokenBucket(10, clock=Clock())
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(
+            creds, query_factory=query_factory, upload_throttle=default,
+        )
+        self.successResultOf(s3.put_object("mybucket", "objectname", b"data"))
+        producer = query_factory.details.body_producer
+        self.assertIsInstance(producer, ThrottledBodyProducer)
+        self.assertIdentical(default, producer._bucket)
+
+        self.successResultOf(s3.put_object(
+            "mybucket", "objectname", b"data", throttle=specific,
+        ))
+        self.assertIdentical(
+            specific, query_factory.details.body_producer._bucket,
+        )
+
     def test_head_object(self):
         query_factory = mock_query_factory(None)
         def check_query_args(passthrough):
@@ -977,6 +1156,167 @@ class S3ClientTestCase(TestCase):
         d.addCallback(check_query_args)
         return d
 
+    def test_put_object_compress(self):
+        """
+        L{S3Client.put_object} with C{compress=True} sends the data compressed
+        with gzip, signs the compressed data and sets the
+        I{Content-Encoding}.
+        """
+        query_factory = mock_query_factory(None)
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        data = b"some data " * 100
+        self.successResultOf(s3.put_object(
+            "mybucket", "objectname", data, content_type="text/plain",
+            compress=True,
+        ))
+        details = query_factory.details
+        self.assertEqual(
+            Headers({
+                u"content-type": [u"text/plain"],
+                u"content-encoding": [u"gzip"],
+            }),
+            details.headers,
+        )
+        compressed = details.body_producer._inputFile.read()
+        self.assertEqual(data, zlib.decompress(compressed, 16 + zlib.MAX_WBITS))
+        self.assertEqual(
+            sha256(compressed).hexdigest().decode("ascii"),
+            details.content_sha256,
+        )
+
+    def test_put_object_compress_body_producer(self):
+        """
+        L{S3Client.put_object} with C{compress=True} and a C{body_producer}
+        sends the compressed output of the producer with a known length.
+        """
+        query_factory = mock_query_factory(None)
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        data = b"some data " * 100
+        self.successResultOf(s3.put_object(
+            "mybucket", "objectname", body_producer=StringBodyProducer(data),
+            compress=True,
+        ))
+        details = query_factory.details
+        self.assertEqual(
+            [u"gzip"], details.headers.getRawHeaders(u"content-encoding"),
+        )
+        producer = details.body_producer
+        compressed = producer._inputFile.read()
+        self.assertEqual(len(compressed), producer.length)
+        self.assertEqual(data, zlib.decompress(compressed, 16 + zlib.MAX_WBITS))
+
+    def test_decode_content(self):
+        """
+        An L{S3Client} created with C{decode_content=True} creates queries
+        which decode compressed responses.
+        """
+        query_factory = mock_query_factory(b"data")
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(
+            creds, query_factory=query_factory, decode_content=True,
+        )
+        self.successResultOf(s3.get_object("mybucket", "objectname"))
+        self.assertEqual({"decode_content": True}, query_factory.kw)
+
+    def test_put_object_verify(self):
+        """
+        L{S3Client.put_object} with C{verify=True} succeeds if the ETag of the
+        new object is the MD5 digest of the data sent.
+        """
+        etag = {b"etag": [b'"%s"' % (md5(b"some data").hexdigest(),)]}
+        for factory, data, producer in [
+                (mock_query_factory, b"some data", None),
+                (producing_query_factory, None,
+                 StringBodyProducer(b"some data")),
+        ]:
+            query_factory = factory(None, etag)
+            creds = AWSCredentials("foo", "bar")
+            s3 = client.S3Client(creds, query_factory=query_factory)
+            self.successResultOf(s3.put_object(
+                "mybucket", "objectname", data, body_producer=producer,
+                verify=True,
+            ))
+
+    def test_put_object_verify_mismatch(self):
+        """
+        L{S3Client.put_object} with C{verify=True} fails with
+        L{ChecksumMismatch} if the ETag of the new object is the MD5 digest
+        of something other than the data sent.
+        """
+        query_factory = producing_query_factory(
+            None, {b"etag": [b'"%s"' % (md5(b"other data").hexdigest(),)]},
+        )
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        d = s3.put_object(
+            "mybucket", "objectname",
+            body_producer=StringBodyProducer(b"some data"), verify=True,
+        )
+        self.failureResultOf(d, ChecksumMismatch)
+
+    def test_upload_part_verify(self):
+        """
+        L{S3Client.upload_part} with C{verify=True} hashes the part as it is
+        produced and fails with L{ChecksumMismatch} if the ETag of the part is
+        the MD5 digest of something else.
+        """
+        query_factory = producing_query_factory(
+            None, {b"etag": [b'"%s"' % (md5(b"other data").hexdigest(),)]},
+        )
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        d = s3.upload_part(
+            "example-bucket", "example-object", "testid", 3,
+            body_producer=StringBodyProducer(b"some data"), verify=True,
+        )
+        self.failureResultOf(d, ChecksumMismatch)
+
+    def test_get_object_verify(self):
+        """
+        L{S3Client.get_object} with C{verify=True} fails with
+        L{ChecksumMismatch} if the data received is not the data the ETag of
+        the object is the MD5 digest of.
+        """
+        etag = b'"%s"' % (md5(b"some data").hexdigest(),)
+        creds = AWSCredentials("foo", "bar")
+
+        s3 = client.S3Client(creds, query_factory=streaming_query_factory(
+            b"some data", chunk_size=4, headers={b"etag": [etag]},
+        ))
+        self.assertEqual(
+            b"some data",
+            self.successResultOf(
+                s3.get_object("mybucket", "objectname", verify=True),
+            ),
+        )
+
+        s3 = client.S3Client(creds, query_factory=streaming_query_factory(
+            b"some dat4", chunk_size=4, headers={b"etag": [etag]},
+        ))
+        self.failureResultOf(
+            s3.get_object("mybucket", "objectname", verify=True),
+            ChecksumMismatch,
+        )
+
+    def test_get_object_verify_multipart(self):
+        """
+        L{S3Client.get_object} with C{verify=True} does not check data
+        against the ETag of an object uploaded in several parts, which is not
+        an MD5 digest of the data.
+        """
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=streaming_query_factory(
+            b"some data", headers={b"etag": [b'"%s-2"' % (b"a" * 32,)]},
+        ))
+        self.assertEqual(
+            b"some data",
+            self.successResultOf(
+                s3.get_object("mybucket", "objectname", verify=True),
+            ),
+        )
+
     def test_put_object_acl(self):
         query_factory = mock_query_factory(payload.sample_access_control_policy_result)
         def check_query_args(passthrough):
@@ -1098,6 +1438,21 @@ class S3ClientTestCase(TestCase):
         d.addCallback(check_query_args)
         return d
 
+    def test_upload_part_body_producer(self):
+        """
+        L{S3Client.upload_part} sends the body produced by C{body_producer}
+        if it is given one.
+        """
+        query_factory = mock_query_factory(None)
+        producer = StringBodyProducer(b"some data")
+        creds = AWSCredentials("foo", "bar")
+        s3 = client.S3Client(creds, query_factory=query_factory)
+        self.successResultOf(s3.upload_part(
+            "example-bucket", "example-object", "testid", 3,
+            body_producer=producer,
+        ))
+        self.assertIdentical(producer, query_factory.details.body_producer)
+
     def test_complete_multipart_upload(self):
         query_factory = mock_query_factory(payload.sample_s3_complete_multipart_upload_result)
         def check_query_args(passthrough):
@@ -1350,6 +1705,40 @@ class MiscellaneousTestCase(TestCase):
         self.assertRaises(ValueError, RequestPayment, "Bob")
 
 
+class WalkBucketTestCase(TestCase):
+    """
+    Tests for L{client.walk_bucket}.
+    """
+    def test_many_synchronous_pages(self):
+        """
+        Pages which are retrieved synchronously do not deepen the stack,
+        however many of them there are.
+        """
+        count = 3000
+
+        class PagedClient(object):
+            def get_bucket(self, bucket, marker=None, max_keys=None,
+                           prefix=None, item_received=None):
+                n = 0 if marker is None else int(marker) + 1
+                item_received(BucketItem(
+                    u"%05d" % (n,), datetime.datetime(2017, 1, 1),
+                    u"etag", b"1", u"STANDARD",
+                ))
+                return succeed(BucketListing(
+                    bucket, prefix, marker, max_keys,
+                    u"true" if n + 1 < count else u"false",
+                ))
+
+        keys = []
+        d = client.walk_bucket(
+            PagedClient(), u"bucket", lambda item: keys.append(item.key),
+        )
+        self.assertIdentical(None, self.successResultOf(d))
+        self.assertEqual(
+            list(u"%05d" % (n,) for n in range(count)), keys,
+        )
+
+
 
 def get_live_client(case):
     return get_live_service(case).get_s3_client()
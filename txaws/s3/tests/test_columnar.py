@@ -0,0 +1,125 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.s3.columnar}.
+"""
+
+from datetime import datetime
+
+from dateutil.tz import tzutc
+
+from twisted.trial.unittest import TestCase
+
+from txaws.s3.columnar import BucketColumns, get_bucket_columns
+from txaws.s3.model import BucketItem
+from txaws.testing.integration import get_memory_service
+
+
+def item(key, size, day, storage_class=u"STANDARD"):
+    return BucketItem(
+        key=key,
+        modification_date=datetime(2017, 1, day, tzinfo=tzutc()),
+        etag=b'"%032x"' % (size,),
+        size=b"%d" % (size,),
+        storage_class=storage_class,
+    )
+
+
+class BucketColumnsTestCase(TestCase):
+    """
+    Tests for L{BucketColumns}.
+    """
+    def setUp(self):
+        self.columns = BucketColumns.from_items([
+            item(u"logs/2017/a", 10, 1),
+            item(u"logs/2017/b", 20, 2, u"GLACIER"),
+            item(u"logs/2018/c", 30, 3),
+            item(u"photos/\N{SNOWMAN}", 40, 4),
+            item(u"readme", 50, 5),
+        ])
+
+    def test_columns(self):
+        """
+        The keys, sizes, modification times and storage classes of the items
+        are available by index.
+        """
+        self.assertEqual(5, len(self.columns))
+        self.assertEqual(
+            [u"logs/2017/a", u"logs/2017/b", u"logs/2018/c",
+             u"photos/\N{SNOWMAN}", u"readme"],
+            list(self.columns.keys()),
+        )
+        self.assertEqual([10, 20, 30, 40, 50], list(self.columns.sizes))
+        self.assertEqual(1483228800 + 86400, self.columns.mtimes[1])
+        self.assertEqual(u"GLACIER", self.columns.storage_class(1))
+        self.assertEqual(u"STANDARD", self.columns.storage_class(2))
+
+    def test_total_size(self):
+        """
+        L{BucketColumns.total_size} sums the sizes of all of the items.
+        """
+        self.assertEqual(150, self.columns.total_size())
+
+    def test_with_prefix(self):
+        """
+        L{BucketColumns.with_prefix} keeps only the items with keys beginning
+        with the given prefix.
+        """
+        selected = self.columns.with_prefix(u"logs/2017/")
+        self.assertEqual(
+            ([u"logs/2017/a", u"logs/2017/b"], 30, u"GLACIER"),
+            (list(selected.keys()), selected.total_size(),
+             selected.storage_class(1)),
+        )
+
+    def test_modified(self):
+        """
+        L{BucketColumns.modified_before} and L{BucketColumns.modified_since}
+        partition the items by modification time.
+        """
+        when = datetime(2017, 1, 3, tzinfo=tzutc())
+        self.assertEqual(
+            ([u"logs/2017/a", u"logs/2017/b"],
+             [u"logs/2018/c", u"photos/\N{SNOWMAN}", u"readme"]),
+            (list(self.columns.modified_before(when).keys()),
+             list(self.columns.modified_since(when).keys())),
+        )
+
+    def test_group_by_prefix(self):
+        """
+        L{BucketColumns.group_by_prefix} counts and sums the sizes of the
+        items sharing leading key components.
+        """
+        self.assertEqual(
+            {u"logs/": (3, 60), u"photos/": (1, 40), u"readme": (1, 50)},
+            self.columns.group_by_prefix(),
+        )
+        self.assertEqual(
+            {u"logs/2017/": (2, 30), u"logs/2018/": (1, 30),
+             u"photos/\N{SNOWMAN}": (1, 40), u"readme": (1, 50)},
+            self.columns.group_by_prefix(depth=2),
+        )
+
+
+class GetBucketColumnsTestCase(TestCase):
+    """
+    Tests for L{get_bucket_columns}.
+    """
+    def test_all_pages(self):
+        """
+        L{get_bucket_columns} collects the items from every page of the bucket
+        listing.
+        """
+        client = get_memory_service(self).get_s3_client()
+        self.successResultOf(client.create_bucket(u"bucket"))
+        for i in range(5):
+            self.successResultOf(
+                client.put_object(u"bucket", u"%d" % (i,), b"x" * i),
+            )
+        columns = self.successResultOf(
+            get_bucket_columns(client, u"bucket", page_size=2),
+        )
+        self.assertEqual(
+            ([u"0", u"1", u"2", u"3", u"4"], 10),
+            (list(columns.keys()), columns.total_size()),
+        )
@@ -0,0 +1,119 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.s3.inventory}.
+"""
+
+from twisted.internet.defer import fail
+from twisted.trial.unittest import TestCase
+
+from txaws.s3.exception import S3Error
+from txaws.s3.inventory import BucketInventory
+from txaws.testing.integration import get_memory_service
+
+
+class BucketInventoryTestCase(TestCase):
+    """
+    Tests for L{BucketInventory}.
+    """
+    def setUp(self):
+        self.client = get_memory_service(self).get_s3_client()
+        self.successResultOf(self.client.create_bucket(u"bucket"))
+        for key in [u"a/1", u"a/2", u"b/1", u"b/2", u"c"]:
+            self.successResultOf(
+                self.client.put_object(u"bucket", key, key.encode("ascii")),
+            )
+        self.requests = []
+        get_bucket = self.client.get_bucket
+        def recording_get_bucket(bucket, **kw):
+            self.requests.append((kw["prefix"], kw["marker"]))
+            return get_bucket(bucket, **kw)
+        self.patch(self.client, "get_bucket", recording_get_bucket)
+
+    def keys(self, inventory, **kw):
+        return list(item.key for item in inventory.items(**kw))
+
+    def test_full_listing(self):
+        """
+        The first L{BucketInventory.refresh} records every object in the
+        bucket, which can then be queried by key, prefix and range.
+        """
+        inventory = BucketInventory(self.client, u"bucket")
+        self.successResultOf(inventory.refresh(page_size=2))
+        self.assertTrue(inventory.complete)
+        self.assertEqual(
+            [(None, None), (None, u"a/2"), (None, u"b/2")], self.requests,
+        )
+        self.assertEqual(
+            [u"a/1", u"a/2", u"b/1", u"b/2", u"c"], self.keys(inventory),
+        )
+        self.assertEqual([u"b/1", u"b/2"], self.keys(inventory, prefix=u"b/"))
+        self.assertEqual(
+            [u"a/2", u"b/1"],
+            self.keys(inventory, start_after=u"a/1", end_before=u"b/2"),
+        )
+        self.assertEqual([u"a/1"], self.keys(inventory, limit=1))
+        item = inventory.get(u"b/2")
+        self.assertEqual((u"b/2", b"3"), (item.key, item.size))
+        self.assertIdentical(None, inventory.get(u"d"))
+
+    def test_resume(self):
+        """
+        If a full listing is interrupted, the next
+        L{BucketInventory.refresh} resumes it after the last recorded page.
+        """
+        path = self.mktemp()
+        inventory = BucketInventory(self.client, u"bucket", path)
+        get_bucket = self.client.get_bucket
+        def failing_get_bucket(bucket, **kw):
+            if kw["marker"] is not None:
+                return fail(S3Error("<slowdown/>", 400))
+            return get_bucket(bucket, **kw)
+        self.patch(self.client, "get_bucket", failing_get_bucket)
+        self.failureResultOf(inventory.refresh(page_size=2), S3Error)
+        self.assertFalse(inventory.complete)
+        inventory.close()
+
+        self.patch(self.client, "get_bucket", get_bucket)
+        del self.requests[:]
+        inventory = BucketInventory(self.client, u"bucket", path)
+        self.successResultOf(inventory.refresh(page_size=2))
+        self.assertEqual([(None, u"a/2"), (None, u"b/2")], self.requests)
+        self.assertEqual(
+            [u"a/1", u"a/2", u"b/1", u"b/2", u"c"], self.keys(inventory),
+        )
+
+    def test_refresh_dirty(self):
+        """
+        Once a full listing has completed, L{BucketInventory.refresh} only
+        re-lists prefixes with writes made through the inventory or marked
+        dirty, picking up new and removed objects.
+        """
+        inventory = BucketInventory(self.client, u"bucket")
+        self.successResultOf(inventory.refresh())
+        self.successResultOf(inventory.put_object(u"a/3", b"new"))
+        self.successResultOf(self.client.delete_object(u"bucket", u"b/1"))
+        inventory.mark_dirty(u"b/")
+        del self.requests[:]
+        self.successResultOf(inventory.refresh())
+        self.assertEqual([(u"a/", None), (u"b/", None)], self.requests)
+        self.assertEqual(
+            [u"a/1", u"a/2", u"a/3", u"b/2", u"c"], self.keys(inventory),
+        )
+
+        del self.requests[:]
+        self.successResultOf(inventory.refresh())
+        self.assertEqual([], self.requests)
+
+    def test_rebuild(self):
+        """
+        L{BucketInventory.rebuild} lists the whole bucket again and drops
+        objects which no longer exist.
+        """
+        inventory = BucketInventory(self.client, u"bucket")
+        self.successResultOf(inventory.refresh())
+        self.successResultOf(self.client.delete_object(u"bucket", u"c"))
+        self.successResultOf(inventory.rebuild())
+        self.assertEqual(
+            [u"a/1", u"a/2", u"b/1", u"b/2"], self.keys(inventory),
+        )
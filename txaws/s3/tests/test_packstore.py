@@ -0,0 +1,163 @@
+# Licenced under the txaws licence available at /LICENSE in the txaws source.
+
+"""
+Tests for L{txaws.s3.packstore}.
+"""
+
+from uuid import UUID
+
+from twisted.internet.defer import fail
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from txaws.s3 import packstore
+from txaws.s3.exception import S3Error
+from txaws.s3.packstore import PackStore
+from txaws.testing.integration import get_memory_service
+
+
+class PackStoreTestCase(TestCase):
+    """
+    Tests for L{PackStore}.
+    """
+    def setUp(self):
+        self.clock = Clock()
+        self.clock.advance(1000)
+        self.client = get_memory_service(self).get_s3_client()
+        self.successResultOf(self.client.create_bucket(u"bucket"))
+
+    def store(self, **kw):
+        return PackStore(
+            self.client, u"bucket", prefix=u"blobs/", reactor=self.clock, **kw
+        )
+
+    def object_names(self):
+        listing = self.successResultOf(self.client.get_bucket(u"bucket"))
+        return sorted(item.key for item in listing.contents)
+
+    def test_buffered(self):
+        """
+        Blobs are not written until a flush but can be read back before that.
+        """
+        store = self.store()
+        d = store.put(u"a", b"alpha")
+        self.assertNoResult(d)
+        self.assertEqual([], self.object_names())
+        self.assertEqual(b"alpha", self.successResultOf(store.get(u"a")))
+
+    def test_flush_after_delay(self):
+        """
+        Buffered blobs are written as one pack and one index after
+        C{flush_delay} seconds, after which they are read back with ranged
+        GETs of the pack.
+        """
+        store = self.store(flush_delay=2)
+        puts = [store.put(u"a", b"alpha"), store.put(u"b", b"beta")]
+        self.clock.advance(2)
+        for d in puts:
+            self.assertIdentical(None, self.successResultOf(d))
+        [index, pack] = self.object_names()
+        self.assertTrue(index.startswith(u"blobs/index/"))
+        self.assertTrue(pack.startswith(u"blobs/packs/"))
+        self.assertEqual(
+            b"alphabeta", self.successResultOf(
+                self.client.get_object(u"bucket", pack),
+            ),
+        )
+        self.assertEqual(b"beta", self.successResultOf(store.get(u"b")))
+
+    def test_flush_size(self):
+        """
+        Buffered blobs are written as soon as there are at least
+        C{flush_size} bytes of them.
+        """
+        store = self.store(flush_size=8)
+        first = store.put(u"a", b"alpha")
+        self.assertNoResult(first)
+        self.successResultOf(store.put(u"b", b"beta"))
+        self.successResultOf(first)
+        self.assertEqual(2, len(self.object_names()))
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def test_replace(self):
+        """
+        A blob which is put again replaces the earlier version, both within a
+        pack and across packs.
+        """
+        store = self.store()
+        store.put(u"a", b"one")
+        store.put(u"a", b"two")
+        self.successResultOf(store.flush())
+        self.assertEqual(b"two", self.successResultOf(store.get(u"a")))
+        self.clock.advance(1)
+        store.put(u"a", b"three")
+        self.successResultOf(store.flush())
+        self.assertEqual(b"three", self.successResultOf(store.get(u"a")))
+
+    def test_replace_same_millisecond(self):
+        """
+        A blob written again in a pack flushed within the same millisecond
+        as the earlier one still replaces it, whatever the random parts of
+        the pack names.
+        """
+        uuids = iter([UUID(hex=u"f" * 32), UUID(hex=u"0" * 32)])
+        self.patch(packstore, "uuid4", lambda: next(uuids))
+        store = self.store()
+        store.put(u"a", b"old")
+        self.successResultOf(store.flush())
+        store.put(u"a", b"new")
+        self.successResultOf(store.flush())
+        self.assertEqual(b"new", self.successResultOf(store.get(u"a")))
+
+        reader = self.store()
+        self.successResultOf(reader.load_index())
+        self.assertEqual(b"new", self.successResultOf(reader.get(u"a")))
+
+    def test_load_index(self):
+        """
+        L{PackStore.load_index} reads the indexes of packs written by other
+        stores.
+        """
+        writer = self.store()
+        writer.put(u"a", b"alpha")
+        writer.put(u"empty", b"")
+        self.successResultOf(writer.flush())
+        self.clock.advance(1)
+        writer.put(u"a", b"again")
+        self.successResultOf(writer.flush())
+
+        reader = self.store()
+        self.failureResultOf(reader.get(u"a"), KeyError)
+        self.successResultOf(reader.load_index())
+        self.assertEqual(b"again", self.successResultOf(reader.get(u"a")))
+        self.assertEqual(b"", self.successResultOf(reader.get(u"empty")))
+
+    def test_failed_flush(self):
+        """
+        If a pack cannot be written, the L{Deferred}s for its blobs fail and
+        no index is written.
+        """
+        store = self.store()
+        d = store.put(u"a", b"alpha")
+        self.patch(
+            self.client, "put_object",
+            lambda *a, **kw: fail(S3Error("<slowdown/>", 400)),
+        )
+        self.failureResultOf(store.flush(), S3Error)
+        self.failureResultOf(d, S3Error)
+        self.assertEqual([], self.object_names())
+        self.failureResultOf(store.get(u"a"), KeyError)
+
+    def test_failed_size_flush(self):
+        """
+        If a flush started because the buffer reached C{flush_size} fails,
+        the failure is delivered to the L{Deferred}s returned by
+        L{PackStore.put} and is not left unhandled.
+        """
+        store = self.store(flush_size=4)
+        self.patch(
+            self.client, "put_object",
+            lambda *a, **kw: fail(S3Error("<slowdown/>", 400)),
+        )
+        self.failureResultOf(store.put(u"a", b"alpha"), S3Error)
+        self.assertEqual([], self.flushLoggedErrors(S3Error))
@@ -5,7 +5,7 @@
 from datetime import datetime
 from dateutil.zoneinfo import gettz
 
-from twisted.internet.defer import succeed, fail
+from twisted.internet.defer import Deferred, succeed, fail
 from twisted.python.failure import Failure
 from twisted.web.error import Error
 
@@ -47,7 +47,7 @@ class FakeEC2Client(object):
     def run_instances(self, image_id, min_count, max_count,
         security_groups=None, key_name=None, instance_type=None,
         user_data=None, availability_zone=None, kernel_id=None,
-        ramdisk_id=None):
+        ramdisk_id=None, client_token=None):
         return succeed(self.instances)
 
     def terminate_instances(self, *instance_ids):
@@ -94,6 +94,11 @@ class FakeEC2Client(object):
         return succeed({"status": u"attaching",
                         "attach_time": datetime(2007, 6, 6, 11, 10, 00)})
 
+    def detach_volume(self, volume_id, instance_id=None, device=None,
+                      force=False):
+        return succeed({"status": u"detaching",
+                        "attach_time": datetime(2007, 6, 6, 11, 10, 00)})
+
     def delete_volume(self, volume_id):
         self.volumes_deleted.append(volume_id)
         return succeed(True)
@@ -143,6 +148,33 @@ class FakeEC2Client(object):
         return succeed(self.availability_zones)
 
 
+class RecordingDescribeClient(object):
+    """
+    Record describe requests and let the test decide their results.
+
+    @ivar calls: C{(kind, ids, deferred)} tuples, one for each request, where
+        C{kind} is C{"instances"}, C{"volumes"} or C{"snapshots"}, C{ids}
+        is a sorted L{list} of the ids asked for and C{deferred} is the
+        L{Deferred} returned for it.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def _describe(self, kind, ids):
+        d = Deferred()
+        self.calls.append((kind, sorted(ids), d))
+        return d
+
+    def describe_instances(self, *ids):
+        return self._describe("instances", ids)
+
+    def describe_volumes(self, *ids):
+        return self._describe("volumes", ids)
+
+    def describe_snapshots(self, *ids):
+        return self._describe("snapshots", ids)
+
+
 class FakePageGetter(object):
 
     def __init__(self, status, payload):
@@ -658,6 +658,18 @@ sample_attach_volume_result = """\
 """ % (version.ec2_api,)
 
 
+sample_detach_volume_result = """\
+<?xml version="1.0"?>
+<DetachVolumeResponse xmlns="http://ec2.amazonaws.com/doc/%s/">
+  <volumeId>vol-4d826724</volumeId>
+  <instanceId>i-6058a509</instanceId>
+  <device>/dev/sdh</device>
+  <status>detaching</status>
+  <attachTime>2008-05-07T11:51:50.000Z</attachTime>
+</DetachVolumeResponse>
+""" % (version.ec2_api,)
+
+
 sample_ec2_error_message = """\
 <?xml version="1.0"?>
 <Response>
@@ -6,6 +6,7 @@ unit testing.
 """
 
 from itertools import count
+from datetime import datetime
 
 import attr
 
@@ -15,8 +16,11 @@ from twisted.internet.defer import succeed, fail
 from twisted.web.http import BAD_REQUEST, NOT_FOUND
 
 from txaws.testing.base import MemoryClient, MemoryService
-from txaws.route53.model import Name, RRSetKey, RRSet, SOA, NS, HostedZone, create_rrset
-from txaws.route53.client import Route53Error
+from txaws.route53.model import (
+    Name, RRSetKey, RRSet, RRSetPage, SOA, NS, HostedZone, ChangeInfo,
+    create_rrset,
+)
+from txaws.route53.client import Route53Error, walk_resource_record_sets
 
 
 class MemoryRoute53(MemoryService):
@@ -54,6 +58,10 @@ class Route53ClientState(object):
         instance and represent the rrsets belonging to the
         corresponding zone.
     @type rrsets: L{pyrsistent.PMap}
+
+    @ivar changes: A mapping from change identifiers to L{ChangeInfo}
+        instances describing the changes which have been made.
+    @type changes: L{pyrsistent.PMap}
     """
     soa_records = {
         SOA(
@@ -73,9 +81,11 @@ class Route53ClientState(object):
     }
 
     _id = attr.ib(default=attr.Factory(count), init=False)
+    _change_id = attr.ib(default=attr.Factory(count), init=False)
 
     zones = attr.ib(default=pvector())
     rrsets = attr.ib(default=pmap())
+    changes = attr.ib(default=pmap())
     def next_id(self):
         """
         Assign and return a new, unique hosted zone identifier.
@@ -85,6 +95,15 @@ class Route53ClientState(object):
         return u"/hostedzone/{:014d}".format(next(self._id))
 
 
+    def next_change_id(self):
+        """
+        Assign and return a new, unique change identifier.
+
+        @rtype: L{unicode}
+        """
+        return u"C{:013d}".format(next(self._change_id))
+
+
     def get_rrsets(self, zone_id):
         """
         Retrieve all the rrsets that belong to the given zone.
@@ -217,7 +236,29 @@ class _MemoryRoute53Client(MemoryClient):
         # sets, Amazon Route 53 either makes all or none of the
         # changes in a change batch request.
         self._state.set_rrsets(zone_id, rrsets)
-        return succeed(None)
+        # Changes to this fake take effect everywhere at once.
+        change = ChangeInfo(
+            id=self._state.next_change_id(),
+            status=u"INSYNC",
+            submitted_at=datetime.utcnow().replace(microsecond=0),
+        )
+        self._state.changes = self._state.changes.set(change.id, change)
+        return succeed(change)
+
+    def get_change(self, change_id):
+        """
+        @see: L{txaws.route53.client._Route53Client.get_change}
+        """
+        try:
+            return succeed(self._state.changes[change_id])
+        except KeyError:
+            return fail(_not_found)
+
+    def wait_for_change(self, change_id, timeout=None):
+        """
+        @see: L{txaws.route53.client._Route53Client.wait_for_change}
+        """
+        return self.get_change(change_id)
 
     def list_resource_record_sets(self, zone_id, maxitems=None, name=None, type=None):
         """
@@ -254,6 +295,55 @@ class _MemoryRoute53Client(MemoryClient):
         return succeed(pmap(results))
 
 
+    def list_resource_record_sets_page(self, zone_id, maxitems=None, name=None, type=None):
+        """
+        @see: L{txaws.route53.client._Route53Client.list_resource_record_sets_page}
+        """
+        if name is None and type is not None:
+            return fail(_error)
+
+        rrsets = self._state.get_rrsets(zone_id)
+        if rrsets is None:
+            return fail(_not_found)
+
+        if maxitems is None:
+            maxitems = _DEFAULT_MAXITEMS
+        start = None
+        if name is not None:
+            start = (_reverse_dns_labels(name), type or u"")
+
+        ordered = sorted(
+            ((_reverse_dns_labels(key.label), key.type), key, rrset)
+            for (key, rrset) in rrsets.items()
+        )
+        page = list(
+            (key, rrset)
+            for (order, key, rrset) in ordered
+            if start is None or order >= start
+        )
+        if len(page) > maxitems:
+            following = page[maxitems][0]
+            return succeed(RRSetPage(
+                rrsets=page[:maxitems],
+                next_name=following.label,
+                next_type=following.type,
+            ))
+        return succeed(RRSetPage(rrsets=page))
+
+    def walk_resource_record_sets(self, zone_id, rrsets_received, maxitems=None, prefetch=True):
+        """
+        @see: L{txaws.route53.client._Route53Client.walk_resource_record_sets}
+        """
+        return walk_resource_record_sets(
+            self.list_resource_record_sets_page, zone_id, rrsets_received,
+            maxitems, prefetch,
+        )
+
+
+# The number of rrsets Route53 returns per page if MaxItems is not given.
+_DEFAULT_MAXITEMS = 100
+
+
 def _reverse_dns_labels(name):
     """
     Helper to sort L{Name} instances according to the AWS Route53 rules.
@@ -338,4 +338,80 @@ def route53_integration_tests(get_client):
             d.addCallback(listed_rrsets)
             return d
 
+
+
+        @inlineCallbacks
+        def test_walk_resource_record_sets(self):
+            """
+            C{walk_resource_record_sets} passes every rrset in the zone to the
+            callback, a page at a time and in the order Route53 sorts them,
+            following the markers from one page to the next.
+            """
+            zone_name = u"{}.example.invalid.".format(uuid4())
+            client = get_client(self)
+            zone = yield client.create_hosted_zone(
+                u"{}".format(time()), zone_name,
+            )
+            self.addCleanup(lambda: self._cleanup(client, zone.identifier))
+
+            created = list(
+                RRSet(
+                    Name(u"{}.{}".format(label, zone_name)),
+                    u"A",
+                    60,
+                    {A(IPv4Address(u"10.0.0.{}".format(n)))},
+                )
+                for n, label in enumerate([u"b.y", u"a.z", u"c", u"a"])
+            )
+            yield client.change_resource_record_sets(
+                zone.identifier, list(create_rrset(r) for r in created),
+            )
+
+            pages = []
+            count = yield client.walk_resource_record_sets(
+                zone.identifier, pages.append, maxitems=2,
+            )
+            # The SOA and NS rrsets created with the zone come first.
+            self.assertEqual([2, 2, 2], list(len(page) for page in pages))
+            self.assertEqual(6, count)
+            self.assertEqual(
+                [u"a", u"c", u"b.y", u"a.z"],
+                list(
+                    unicode(key.label)[:-len(zone_name) - 1]
+                    for page in pages[1:]
+                    for (key, rrset) in page
+                ),
+            )
+            listed = dict(pair for page in pages for pair in page)
+            for rrset in created:
+                self.assertEqual(
+                    rrset, listed[RRSetKey(rrset.label, rrset.type)],
+                )
+
+
+        @inlineCallbacks
+        def test_wait_for_change(self):
+            """
+            C{change_resource_record_sets} fires with a L{ChangeInfo} whose
+            identifier can be used to wait for the change to become
+            I{INSYNC}.
+            """
+            zone_name = u"{}.example.invalid.".format(uuid4())
+            client = get_client(self)
+            zone = yield client.create_hosted_zone(
+                u"{}".format(time()), zone_name,
+            )
+            self.addCleanup(lambda: self._cleanup(client, zone.identifier))
+
+            change = yield client.change_resource_record_sets(
+                zone.identifier, [create_rrset(RRSet(
+                    Name(u"a.{}".format(zone_name)), u"A", 60,
+                    {A(IPv4Address(u"10.0.0.1"))},
+                ))],
+            )
+            self.assertIn(change.status, (u"PENDING", u"INSYNC"))
+            current = yield client.get_change(change.id)
+            self.assertEqual(change.id, current.id)
+            synced = yield client.wait_for_change(change.id, timeout=600)
+            self.assertEqual((change.id, u"INSYNC"), (synced.id, synced.status))
     return Route53IntegrationTests
@@ -16,6 +16,7 @@ from dateutil.tz import tzutc
 
 from twisted.internet.defer import succeed, fail
 
+from txaws.client.producers import GzipBodyProducer, gzip_compress
 from txaws.s3.model import Bucket, BucketListing, BucketItem
 from txaws.s3.exception import S3Error
 from txaws.testing.base import MemoryClient, MemoryService
@@ -95,7 +96,8 @@ class _MemoryS3Client(MemoryClient):
         return succeed(None)
 
     @_rate_limited
-    def get_bucket(self, bucket, marker=None, max_keys=None, prefix=None):
+    def get_bucket(self, bucket, marker=None, max_keys=None, prefix=None,
+                   item_received=None):
         try:
             pieces = self._state.buckets[bucket]
         except KeyError:
@@ -116,7 +118,7 @@ class _MemoryS3Client(MemoryClient):
         prefixed_contents = (
             content
             for content
-            in sorted(listing.contents, key=lambda item: item.key)
+            in sorted(listing.contents or (), key=lambda item: item.key)
             if content.key.startswith(prefix)
             and content.key > keys_after
         )
@@ -127,6 +129,11 @@ class _MemoryS3Client(MemoryClient):
             is_truncated = u"true"
             break
 
+        if item_received is not None:
+            for content in contents:
+                item_received(content)
+            contents = []
+
         listing = attr.assoc(
             listing,
             contents=contents,
@@ -145,10 +152,16 @@ class _MemoryS3Client(MemoryClient):
             self, bucket, object_name,
             data=None, content_type=None,
             metadata={}, amz_headers={},
-            body_producer=None,
+            body_producer=None, throttle=None, compress=False,
     ):
         if data is not None and body_producer is not None:
             raise ValueError("data and body_producer are mutually exclusive")
+        if compress:
+            # Like S3, keep the compressed bytes.
+            if body_producer is not None:
+                body_producer = GzipBodyProducer(body_producer)
+            else:
+                data = gzip_compress(data or b"")
 
         contents = self._state.buckets[bucket]["listing"].contents
         if contents is None:
@@ -186,8 +199,12 @@ class _MemoryS3Client(MemoryClient):
 
 
     @_rate_limited
-    def get_object(self, bucket, object_name):
-        return succeed(self._state.objects[bucket, object_name])
+    def get_object(self, bucket, object_name, byte_range=None, throttle=None):
+        data = self._state.objects[bucket, object_name]
+        if byte_range is not None:
+            first, last = byte_range
+            data = data[first:last + 1]
+        return succeed(data)
 
     @_rate_limited
     def delete_object(self, bucket, object_name):
@@ -4,6 +4,7 @@
 Integration tests for the S3 client(s).
 """
 
+import zlib
 from io import BytesIO
 from uuid import uuid4
 
@@ -13,6 +14,8 @@ from twisted.internet.defer import inlineCallbacks, gatherResults
 from twisted.internet.task import cooperate
 from twisted.web.client import FileBodyProducer
 
+from txaws.s3.client import walk_bucket
+
 def s3_integration_tests(get_client):
     class S3IntegrationTests(TestCase):
 
@@ -146,6 +149,29 @@ def s3_integration_tests(get_client):
             objects = yield client.get_bucket(bucket_name, prefix=b"a")
             self.assertEqual([b"a"], list(obj.key for obj in objects.contents))
 
+        @inlineCallbacks
+        def test_get_bucket_item_received(self):
+            """
+            If an ``item_received`` callable is passed to ``get_bucket``, it is
+            called with each object in the listing instead of the objects
+            being collected into the listing's ``contents``.
+            """
+            bucket_name = unicode(uuid4())
+            client = get_client(self)
+            yield client.create_bucket(bucket_name)
+            yield client.put_object(bucket_name, u"a", b"foo")
+            yield client.put_object(bucket_name, u"b", b"quux")
+
+            received = []
+            listing = yield client.get_bucket(
+                bucket_name, item_received=received.append,
+            )
+            self.assertEqual([], listing.contents)
+            self.assertEqual(
+                [(u"a", b"3"), (u"b", b"4")],
+                list((item.key, item.size) for item in received),
+            )
+
         def test_get_bucket_location_empty(self):
             """
             When called for a bucket with no explicit location,
@@ -216,6 +242,28 @@ def s3_integration_tests(get_client):
             return d
 
 
+        @inlineCallbacks
+        def test_walk_bucket(self):
+            """
+            L{walk_bucket} visits every object in a bucket, in key order,
+            requesting as many pages of the listing as necessary.
+            """
+            bucket_name = unicode(uuid4())
+            client = get_client(self)
+            yield client.create_bucket(bucket_name)
+            yield gatherResults(list(
+                client.put_object(bucket_name, u"%s/%d" % (prefix, i))
+                for prefix in (u"a", u"b")
+                for i in range(3)
+            ))
+            keys = []
+            yield walk_bucket(
+                client, bucket_name, lambda item: keys.append(item.key),
+                prefix=u"b/", page_size=2,
+            )
+            self.assertEqual([u"b/0", u"b/1", u"b/2"], keys)
+
+
         def test_get_bucket_default_max_keys(self):
             """
             C{get_bucket} returns a limited number of results even if C{max_keys} is
@@ -281,6 +329,25 @@ def s3_integration_tests(get_client):
             self.assertEqual(b"", retrieved)
 
 
+        @inlineCallbacks
+        def test_get_object_byte_range(self):
+            """
+            C{get_object} retrieves only the bytes from the first to the last
+            (inclusive) offsets given by C{byte_range}.
+            """
+            bucket_name = str(uuid4())
+            object_name = b"ranged_object"
+
+            client = get_client(self)
+            yield client.create_bucket(bucket_name)
+            yield client.put_object(bucket_name, object_name, b"abcdefgh")
+
+            retrieved = yield client.get_object(
+                bucket_name, object_name, byte_range=(2, 4),
+            )
+            self.assertEqual(b"cde", retrieved)
+
+
         @inlineCallbacks
         def test_put_object_body_producer(self):
             """
@@ -305,6 +372,35 @@ def s3_integration_tests(get_client):
             self.assertEqual(object_data, retrieved)
 
 
+        @inlineCallbacks
+        def test_put_object_compress(self):
+            """
+            C{put_object} with C{compress=True} stores the object's content
+            compressed with gzip, whether it is given as C{data} or by a
+            C{body_producer}.
+            """
+            bucket_name = str(uuid4())
+            object_data = b"some compressible bytes " * 100
+
+            client = get_client(self)
+            yield client.create_bucket(bucket_name)
+            yield client.put_object(
+                bucket_name, b"from_data", object_data, compress=True,
+            )
+            yield client.put_object(
+                bucket_name, b"from_producer",
+                body_producer=FileBodyProducer(BytesIO(object_data)),
+                compress=True,
+            )
+
+            for object_name in (b"from_data", b"from_producer"):
+                retrieved = yield client.get_object(bucket_name, object_name)
+                self.assertEqual(
+                    object_data,
+                    zlib.decompress(retrieved, 16 + zlib.MAX_WBITS),
+                )
+
+
         @inlineCallbacks
         def test_object_encoded_chars(self):
             """
@@ -1,8 +1,15 @@
+from datetime import datetime
 from urlparse import urlparse
 
+from xml.etree.ElementTree import ParseError
+
+from dateutil.tz import tzoffset
+
 from twisted.trial.unittest import TestCase
 
-from txaws.util import hmac_sha1, iso8601time, parse
+from txaws.util import (
+    XML, epoch_seconds, hmac_sha1, intern_text, iso8601time, parse,
+)
 
 
 class MiscellaneousTestCase(TestCase):
@@ -24,6 +31,52 @@ class MiscellaneousTestCase(TestCase):
         self.assertEqual("2006-07-07T15:04:56Z",
                          iso8601time((2006, 7, 7, 15, 4, 56, 0, 0, 0)))
 
+    def test_epoch_seconds(self):
+        """
+        L{epoch_seconds} converts a L{datetime} to seconds since the epoch,
+        taking naive values to be UTC.
+        """
+        self.assertEqual(86400, epoch_seconds(datetime(1970, 1, 2)))
+        self.assertEqual(86400, epoch_seconds(
+            datetime(1970, 1, 2, 1, tzinfo=tzoffset(None, 3600)),
+        ))
+
+    def test_intern_text(self):
+        """
+        L{intern_text} returns the same object for equal byte or unicode
+        strings and passes C{None} through.
+        """
+        self.assertIdentical(
+            intern_text("".join(["STAN", "DARD"])),
+            intern_text("".join(["STA", "NDARD"])),
+        )
+        self.assertIdentical(
+            intern_text(u"".join([u"us-east", u"-1a"])),
+            intern_text(u"".join([u"us-", u"east-1a"])),
+        )
+        self.assertIdentical(None, intern_text(None))
+
+    def test_XML(self):
+        """
+        L{XML} parses a document, dropping the namespaces of tags and
+        attribute names.
+        """
+        root = XML(
+            b'<Grant xmlns="http://s3.amazonaws.com/doc/2006-03-01/" '
+            b'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+            b'<Grantee xsi:type="Group"><URI>all</URI></Grantee></Grant>'
+        )
+        self.assertEqual("Grant", root.tag)
+        grantee = root.find("Grantee")
+        self.assertEqual({"type": "Group"}, grantee.attrib)
+        self.assertEqual("all", root.findtext("Grantee/URI"))
+
+    def test_XML_malformed(self):
+        """
+        L{XML} raises L{ParseError} for a malformed document.
+        """
+        self.assertRaises(ParseError, XML, b"<a>")
+
 
 class ParseUrlTestCase(TestCase):
     """